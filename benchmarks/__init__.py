@@ -0,0 +1,12 @@
+# benchmarks/__init__.py
+"""
+Benchmarks de las rutas calientes sobre una escuela sintética.
+
+- generador.py: datos sembrados (tutores, alumnos, grupos, artículos con tallas,
+  paquetes, conceptos de pago, ventas con líneas/pagos y planes con abonos).
+- run.py: mide cada caso a 1k/10k/100k ventas y guarda el resultado en JSON
+  (benchmarks/resultados/) para comparar entre versiones.
+
+    python -m benchmarks.run --escala 1000 --escala 10000
+    python -m benchmarks.run --escala 1000 --comparar benchmarks/resultados/<previo>.json
+"""
@@ -0,0 +1,268 @@
+# benchmarks/generador.py
+from __future__ import annotations
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+
+# ---------------------------------------------
+# Parámetros del catálogo sintético
+# ---------------------------------------------
+NOMBRES = ('Ana', 'Sofía', 'Valeria', 'Camila', 'Regina', 'Ximena', 'Renata', 'Lucía',
+           'María', 'Daniela', 'Paula', 'Emilia', 'Mateo', 'Diego', 'Santiago', 'Leonardo')
+APELLIDOS = ('García', 'Hernández', 'López', 'Martínez', 'González', 'Pérez', 'Rodríguez',
+             'Sánchez', 'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Jiménez')
+TALLAS_ROPA = ('CH', 'M', 'G', 'XG')
+TALLAS_NUMERO = ('20', '21', '22', '23', '24', '25')
+METODOS = ('efectivo', 'efectivo', 'tarjeta', 'transferencia', 'deposito', 'Efectivo', 'cash')
+CONDICIONES = (None, None, '', '["efectivo"]', '["efectivo", "transferencia"]', 'tarjeta')
+LOTE = 5000
+
+
+def _get_models():
+    """
+    Import lazy (igual que los *_utils): el módulo se puede importar sin app.
+    """
+    import models as m
+    from extensions import db
+    return db, m
+
+
+def _insertar(db, tabla, filas: List[Dict[str, Any]]) -> int:
+    """INSERT por lotes (executemany); sin eventos ORM, los acumulados se calculan aquí."""
+    for i in range(0, len(filas), LOTE):
+        db.session.execute(insert(tabla), filas[i:i + LOTE])
+    return len(filas)
+
+
+def _nombre(rnd: random.Random) -> Dict[str, str]:
+    return {'n': rnd.choice(NOMBRES), 'p': rnd.choice(APELLIDOS), 'm': rnd.choice(APELLIDOS)}
+
+
+def conteos_para(ventas: int) -> Dict[str, int]:
+    """Tamaño de cada entidad en función del número de ventas de mostrador."""
+    return {
+        'ventas': ventas,
+        'tutores': max(10, ventas // 20),
+        'estudiantes': max(20, ventas // 10),
+        'instructores': max(3, ventas // 2000),
+        'grupos': max(5, ventas // 500),
+        'articulos': min(300, max(30, ventas // 100)),
+        'paquetes': 20,
+        'pagos': 40,
+        'planes': max(10, ventas // 10),
+    }
+
+
+# ---------------------------------------------
+# Generador
+# ---------------------------------------------
+def generar(ventas: int, *, semilla: int = 42, hoy: Optional[date] = None, on_paso=None) -> Dict[str, int]:
+    """
+    Puebla la BD vacía de la app actual con una escuela sintética de `ventas` ventas
+    de mostrador (los abonos agregan una venta cada uno, como en registro_abonos).
+    Mismo `semilla` + `hoy` ⇒ mismos datos. Hace commit. Devuelve filas por tabla.
+
+    Los artículos con talla se siembran como JSON en Articulo_Tallas y se pasan a
+    articulo_variante con migrar_tallas_json (el mismo camino que una BD real).
+    `on_paso(nombre, segundos)` permite reportar avance.
+    """
+    db, m = _get_models()
+    from inventario_utils import migrar_tallas_json
+    from busqueda_utils import reindexar_nombres
+    from resumen_utils import reconstruir_resumen
+
+    rnd = random.Random(semilla)
+    hoy = hoy or date.today()
+    c = conteos_para(ventas)
+    filas: Dict[str, int] = {}
+    t0 = time.perf_counter()
+
+    def _paso(nombre):
+        nonlocal t0
+        if on_paso:
+            on_paso(nombre, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+
+    def _fecha(dias_max: int = 730) -> datetime:
+        return (datetime.combine(hoy, datetime.min.time())
+                - timedelta(days=rnd.randint(0, dias_max), minutes=rnd.randint(0, 60 * 12)))
+
+    # === Personas y grupos ===
+    tutores = []
+    for i in range(1, c['tutores'] + 1):
+        n = _nombre(rnd)
+        tutores.append({'Tutor_ID': i, 'Tutor_Nombre': n['n'], 'Tutor_ApellidoP': n['p'],
+                        'Tutor_ApellidoM': n['m'], 'Tutor_Celular': f"55{rnd.randint(10**7, 10**8 - 1)}",
+                        'Tutor_Parentesco': rnd.choice(('Madre', 'Padre', 'Tutor'))})
+    filas['tutor'] = _insertar(db, m.Tutor.__table__, tutores)
+
+    instructores = []
+    for i in range(1, c['instructores'] + 1):
+        n = _nombre(rnd)
+        instructores.append({'Instructor_ID': i, 'Instructor_Nombre': n['n'],
+                             'Instructor_ApellidoP': n['p'], 'Instructor_ApellidoM': n['m']})
+    filas['instructor'] = _insertar(db, m.Instructor.__table__, instructores)
+
+    niveles = ('Baby', 'Pre-ballet', 'Ballet I', 'Ballet II', 'Intermedio', 'Avanzado')
+    grupos = [{'Grupo_ID': i, 'Grupo_Nombre': f"{rnd.choice(niveles)} {i}",
+               'Grupo_Horario': f"{rnd.randint(15, 19)}:00", 'Grupo_Dias': rnd.choice(('L-M', 'M-J', 'V', 'S')),
+               'Grupo_Nivel': rnd.choice(niveles), 'Instructor_ID': rnd.randint(1, c['instructores'])}
+              for i in range(1, c['grupos'] + 1)]
+    filas['grupo'] = _insertar(db, m.Grupo.__table__, grupos)
+
+    estudiantes, inscripciones = [], []
+    for i in range(1, c['estudiantes'] + 1):
+        n = _nombre(rnd)
+        estudiantes.append({
+            'Est_ID': i, 'Est_Nombre': n['n'], 'Est_ApellidoP': n['p'], 'Est_ApellidoM': n['m'],
+            'Est_FechaNac': date(hoy.year - rnd.randint(4, 17), rnd.randint(1, 12), rnd.randint(1, 28)),
+            'Est_Sexo': rnd.choice('FFFM'), 'Tutor_ID': rnd.randint(1, c['tutores']),
+            'Est_FechaIngreso': _fecha(1500).date(),
+            'Est_Status': rnd.choice(('Activo', 'Activo', 'Activo', 'Inactivo')),
+            'Est_Colegio': f"Colegio {rnd.randint(1, 40)}",
+        })
+        for g in rnd.sample(range(1, c['grupos'] + 1), rnd.randint(1, min(2, c['grupos']))):
+            inscripciones.append({'Est_ID': i, 'Grupo_ID': g})
+    filas['estudiante'] = _insertar(db, m.Estudiante.__table__, estudiantes)
+    filas['estudiante_grupo'] = _insertar(db, m.estudiante_grupo, inscripciones)
+    _paso('personas')
+
+    # === Catálogo: artículos (tallas en JSON), conceptos de pago y paquetes ===
+    articulos, precios, tallas_de = [], {}, {}
+    for i in range(1, c['articulos'] + 1):
+        tipo = rnd.choice(('talla', 'numero', None, None))
+        precio = round(rnd.choice((89, 120, 150, 249.9, 380, 520)) + rnd.random(), 2)
+        tallas = TALLAS_ROPA if tipo == 'talla' else TALLAS_NUMERO if tipo == 'numero' else ()
+        precios[i], tallas_de[i] = precio, tallas
+        articulos.append({
+            'Articulo_ID': i, 'Articulo_Nombre': f"{rnd.choice(('Leotardo', 'Zapatilla', 'Malla', 'Falda', 'Chongo'))} {i}",
+            'Articulo_PrecioVenta': precio, 'Articulo_TipoTalla': tipo,
+            # Existencias holgadas: los POST del benchmark descuentan stock en cada repetición
+            'Articulo_Existencia': 0 if tallas else 10**6,
+            'Articulo_Tallas': json.dumps({t: 10**6 for t in tallas}) if tallas else None,
+        })
+    filas['articulo'] = _insertar(db, m.Articulo.__table__, articulos)
+
+    pagos, montos_pago = [], {}
+    for i in range(1, c['pagos'] + 1):
+        mensual = rnd.random() < 0.5
+        monto = float(rnd.choice((350, 500, 650, 900, 1200)))
+        montos_pago[i] = monto
+        pagos.append({
+            'Pago_ID': i, 'Pago_Monto': monto,
+            'Pago_Tipo': f"{'Mensualidad' if mensual else 'Inscripción'} {i}",
+            'Pago_Descuento_Tipo': rnd.choice((None, 'porcentaje', 'porcentaje')),
+            'Pago_Descuento_Porcentaje': rnd.choice((None, 0, 5, 10)),
+            'Pago_Condiciones': rnd.choice(CONDICIONES),
+            'Pago_Restricciones_Fecha': rnd.choice((None, hoy + timedelta(days=90), hoy - timedelta(days=30))),
+            'Pago_Es_Mensual': mensual, 'Pago_Tiene_Recargo': mensual,
+            'Pago_Recargo_Porcentaje': 10 if mensual else None,
+            'Pago_Recargo_DiaMes': 10 if mensual else None,
+            'Pago_Tiene_Expiracion': False,
+        })
+    filas['pago'] = _insertar(db, m.Pago.__table__, pagos)
+
+    paquetes, paquete_items = [], []
+    for i in range(1, c['paquetes'] + 1):
+        tipo = rnd.choice(('porcentaje', 'monto', 'ninguno'))
+        paquetes.append({'id': i, 'nombre': f"Paquete {i}", 'descuento_tipo': tipo,
+                         'descuento_valor': {'porcentaje': 10, 'monto': 50, 'ninguno': 0}[tipo], 'activo': True})
+        for a in rnd.sample(range(1, c['articulos'] + 1), rnd.randint(2, 4)):
+            paquete_items.append({'paquete_id': i, 'articulo_id': a, 'cantidad': rnd.randint(1, 2),
+                                  'talla_numero': rnd.choice(tallas_de[a]) if tallas_de[a] else None})
+    filas['paquete'] = _insertar(db, m.Paquete.__table__, paquetes)
+    filas['paquete_item'] = _insertar(db, m.PaqueteItem.__table__, paquete_items)
+    _paso('catalogo')
+
+    # === Ventas de mostrador (líneas + conceptos de pago) ===
+    ventas_f, lineas, venta_pago = [], [], []
+    for vid in range(1, c['ventas'] + 1):
+        es_est = rnd.random() < 0.85
+        pendiente = rnd.random() < 0.05
+        metodo = None if pendiente else rnd.choice(METODOS)
+        ventas_f.append({
+            'Venta_ID': vid,
+            'Est_ID': rnd.randint(1, c['estudiantes']) if es_est else None,
+            'Instructor_ID': None if es_est else rnd.randint(1, c['instructores']),
+            'Metodo_Pago': metodo, 'Fecha_Venta': _fecha(),
+            'Referencia_Pago': f"REF{vid:08d}" if metodo in ('tarjeta', 'transferencia', 'deposito') else None,
+        })
+        for a in rnd.sample(range(1, c['articulos'] + 1), rnd.randint(0 if es_est else 1, 3)):
+            lineas.append({'Venta_ID': vid, 'Articulo_ID': a,
+                           'Talla': rnd.choice(tallas_de[a]) if tallas_de[a] else None,
+                           'Cantidad': rnd.randint(1, 3), 'Precio_Unitario': precios[a]})
+        if es_est:
+            for p in rnd.sample(range(1, c['pagos'] + 1), rnd.randint(0, 2)):
+                venta_pago.append({'venta_id': vid, 'pago_id': p})
+
+    # === Planes de cobro con abonos (cada abono con su venta, como registro_abonos) ===
+    planes, abonos = [], []
+    vid = c['ventas']
+    for pid in range(1, c['planes'] + 1):
+        est = rnd.randint(1, c['estudiantes'])
+        cual = rnd.choice(('articulo', 'paquete', 'pago'))
+        item = {'Articulo_ID': None, 'Paquete_ID': None, 'Pago_ID': None}
+        if cual == 'articulo':
+            item['Articulo_ID'] = rnd.randint(1, c['articulos'])
+            base, desc = precios[item['Articulo_ID']], f"Artículo {item['Articulo_ID']}"
+        elif cual == 'paquete':
+            item['Paquete_ID'] = rnd.randint(1, c['paquetes'])
+            base, desc = 900.0, f"Paquete {item['Paquete_ID']}"
+        else:
+            item['Pago_ID'] = rnd.randint(1, c['pagos'])
+            base, desc = montos_pago[item['Pago_ID']], f"Concepto {item['Pago_ID']}"
+        qty = rnd.randint(1, 3)
+        total = round(base * qty, 2)
+        creado = _fecha(365)
+
+        saldo, abonado, ultimo = total, 0.0, None
+        for k in range(rnd.randint(0, 3)):
+            monto = round(min(saldo, rnd.uniform(50, total / 2)), 2)
+            if monto <= 0:
+                break
+            vid += 1
+            fecha = min(creado + timedelta(days=15 * (k + 1)), datetime.combine(hoy, datetime.min.time()))
+            metodo = rnd.choice(METODOS)
+            ventas_f.append({'Venta_ID': vid, 'Est_ID': est, 'Instructor_ID': None,
+                             'Metodo_Pago': metodo, 'Fecha_Venta': fecha, 'Referencia_Pago': None})
+            abonos.append({'Plan_ID': pid, 'Venta_ID': vid, 'Monto_Abonado': monto,
+                           'Saldo_Antes': saldo, 'Saldo_Despues': round(saldo - monto, 2),
+                           'Fecha_Abono': fecha, 'Metodo_Pago': metodo})
+            saldo, abonado, ultimo = round(saldo - monto, 2), round(abonado + monto, 2), fecha
+
+        planes.append(dict(item, **{
+            'Plan_ID': pid, 'Est_ID': est, 'Precio_Base_Snapshot': base,
+            'Descripcion_Resumen': f"{desc} x{qty}", 'Monto_Total_Original': total,
+            'Saldo_Actual': saldo, 'Abonado_Acumulado': abonado,
+            'Estado': 'abierto' if saldo > 0 else 'liquidado',
+            'Aplica_Desc_Al_Liquidar': True, 'Porc_Descuento': rnd.choice((None, 5, 10)),
+            'Vigencia_Inicio': creado.date(), 'Vigencia_Fin': (creado + timedelta(days=60)).date(),
+            'Fecha_Creacion': creado, 'Fecha_Ultimo_Abono': ultimo,
+        }))
+
+    filas['venta'] = _insertar(db, m.Venta.__table__, ventas_f)
+    filas['venta_linea'] = _insertar(db, m.VentaLinea.__table__, lineas)
+    filas['venta_pago'] = _insertar(db, m.venta_pago, venta_pago)
+    filas['plan_cobro'] = _insertar(db, m.PlanCobro.__table__, planes)
+    filas['abono'] = _insertar(db, m.Abono.__table__, abonos)
+    db.session.commit()
+    _paso('ventas')
+
+    # === Derivados (mismos comandos que una instalación real) ===
+    filas['articulo_variante'] = migrar_tallas_json()['variantes']
+    reindexar_nombres()
+    db.session.commit()
+    filas['venta_resumen_diario'] = reconstruir_resumen(dias_por_lote=366)
+    try:
+        from busqueda_utils import crear_fts
+        crear_fts()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()  # sin FTS5 (o no es SQLite): la búsqueda usa el índice por prefijo
+    _paso('derivados')
+    return filas
@@ -0,0 +1,277 @@
+# benchmarks/run.py
+"""
+Corre los benchmarks de rutas calientes y guarda el resultado en JSON.
+
+    python -m benchmarks.run --escala 1000 --escala 10000 --repeticiones 5
+    python -m benchmarks.run --escala 100000 --comparar benchmarks/resultados/abc1234-....json
+
+Cada escala corre en su propio proceso (cachés por proceso limpios: catálogo, FTS,
+has_table) sobre una COPIA de la BD sembrada, que se guarda en benchmarks/.datos/ y se
+reutiliza entre corridas con la misma escala/semilla (--regenerar para rehacerla).
+Si no hay plantillas, se renderiza una vacía: se mide la ruta (consultas + armado) sin
+el HTML, y el JSON lo registra en meta.plantillas para no comparar peras con manzanas.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_DATOS = os.path.join(RAIZ, 'benchmarks', '.datos')
+DIR_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+UMBRAL_REGRESION = 0.20   # +20% en la mediana se marca como regresión
+
+
+# ---------------------------------------------
+# App sobre una BD concreta
+# ---------------------------------------------
+def _crear_app(ruta_bd: str):
+    """create_app apuntando a `ruta_bd` (DATABASE_URL se lee en configurar_bd)."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + ruta_bd
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    from app import create_app
+    app = create_app({'WTF_CSRF_ENABLED': False, 'SQL_METRICAS': True, 'SQL_N1_UMBRAL': 0},
+                     migraciones=False)
+    plantillas = os.path.isdir(os.path.join(app.root_path, app.template_folder or 'templates'))
+    if not plantillas:
+        from jinja2 import BaseLoader, ChoiceLoader
+
+        class _PlantillaVacia(BaseLoader):
+            def get_source(self, environment, template):
+                return '', None, lambda: True
+
+        app.jinja_env.loader = ChoiceLoader([app.jinja_env.loader, _PlantillaVacia()])
+    app.extensions['bench_plantillas'] = 'reales' if plantillas else 'vacias'
+    return app
+
+
+def _bd_sembrada(escala: int, semilla: int, regenerar: bool) -> Tuple[str, Optional[Dict[str, int]], float]:
+    """Ruta de la BD sembrada para (escala, semilla); la genera si no existe."""
+    os.makedirs(DIR_DATOS, exist_ok=True)
+    ruta = os.path.join(DIR_DATOS, f'escuela_{escala}_s{semilla}.db')
+    if os.path.exists(ruta) and not regenerar:
+        return ruta, None, 0.0
+    for sufijo in ('', '-wal', '-shm'):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+    app = _crear_app(ruta)
+    from extensions import db
+    from benchmarks.generador import generar
+    t0 = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        filas = generar(escala, semilla=semilla,
+                        on_paso=lambda n, s: print(f"  [{escala}] {n}: {s:.1f}s", file=sys.stderr))
+        db.session.remove()
+        db.engine.dispose()
+    return ruta, filas, time.perf_counter() - t0
+
+
+# ---------------------------------------------
+# Casos
+# ---------------------------------------------
+def _casos(app) -> List[Tuple[str, Callable[[Any], Any]]]:
+    """Lista (nombre, fn(cliente) -> respuesta|None). Los IDs se eligen de los datos sembrados."""
+    from sqlalchemy import func
+    from sqlalchemy.orm import joinedload, selectinload
+    from extensions import db
+    from models import Venta, VentaLinea, PlanCobro, Articulo, Pago
+    from blueprints.comun import _armar_reporte
+
+    with app.app_context():
+        est_top = (db.session.query(Venta.Est_ID).filter(Venta.Est_ID.isnot(None))
+                   .group_by(Venta.Est_ID).order_by(func.count().desc()).limit(1).scalar())
+        plan = (PlanCobro.query.filter(PlanCobro.Estado == 'abierto', PlanCobro.Saldo_Actual > 100)
+                .order_by(PlanCobro.Plan_ID).first())
+        plan_id, plan_est = (plan.Plan_ID, plan.Est_ID) if plan else (None, None)
+        art_id = (db.session.query(Articulo.Articulo_ID)
+                  .filter(Articulo.Articulo_TipoTalla.is_(None)).order_by(Articulo.Articulo_ID).limit(1).scalar())
+        pago_id = (db.session.query(Pago.Pago_ID)
+                   .filter(Pago.Pago_Condiciones.is_(None), Pago.Pago_Restricciones_Fecha.is_(None))
+                   .order_by(Pago.Pago_ID).limit(1).scalar())
+
+    def armar_reporte(_cliente):
+        with app.app_context():
+            ventas = (Venta.query
+                      .options(joinedload(Venta.estudiante), joinedload(Venta.instructor),
+                               selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+                               selectinload(Venta.pagos))
+                      .order_by(Venta.Fecha_Venta.desc()).limit(500).all())
+            _armar_reporte(ventas)
+            db.session.remove()
+
+    def registro_venta(cliente):
+        return cliente.post('/registro/venta', data={
+            'form_id': uuid.uuid4().hex, 'tipo_cliente': 'estudiante', 'estudiante_id': est_top,
+            'metodo_pago': 'efectivo', 'articulos-0-id': str(art_id), 'articulos-0-qty': '1',
+            'pagos-0-id': str(pago_id),
+        })
+
+    def registro_abonos(cliente):
+        return cliente.post('/registro/abonos', data={
+            'form_id': uuid.uuid4().hex, 'estudiante_id': plan_est, 'metodo_pago': 'efectivo',
+            'planes-0-id': str(plan_id), 'planes-0-accion': 'abonar', 'planes-0-monto': '1.00',
+        })
+
+    return [
+        ('consulta_ventas', lambda c: c.get('/consulta/ventas')),
+        ('_armar_reporte[500]', armar_reporte),
+        ('registro_venta POST', registro_venta),
+        ('registro_abonos POST', registro_abonos),
+        ('consulta_abonos', lambda c: c.get('/consulta/abonos')),
+        ('consulta_planes', lambda c: c.get('/consulta/planes')),
+        ('consulta_articulos', lambda c: c.get('/consulta_articulos')),
+        ('historial_ventas_estudiante', lambda c: c.get(f'/estudiantes/{est_top}/historial-ventas')),
+    ]
+
+
+def _medir(fn, cliente, repeticiones: int) -> Dict[str, Any]:
+    fn(cliente)  # calentamiento (catálogo, sentencias preparadas, caché de páginas)
+    tiempos, consultas, status = [], [], set()
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resp = fn(cliente)
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+        if resp is not None:
+            status.add(resp.status_code)
+            consultas.append(int(resp.headers.get('X-SQL-Queries') or 0))
+    tiempos.sort()
+    return {
+        'n': repeticiones,
+        'min_ms': round(tiempos[0], 2),
+        'mediana_ms': round(statistics.median(tiempos), 2),
+        'p95_ms': round(tiempos[min(len(tiempos) - 1, int(0.95 * len(tiempos)))], 2),
+        'media_ms': round(statistics.fmean(tiempos), 2),
+        'consultas': max(consultas) if consultas else None,
+        'status': sorted(status),
+    }
+
+
+def correr_escala(escala: int, *, semilla: int, repeticiones: int, regenerar: bool,
+                  solo: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Mide todos los casos a una escala sobre una copia de la BD sembrada."""
+    ruta, filas, seg_gen = _bd_sembrada(escala, semilla, regenerar)
+    tmp = tempfile.mkdtemp(prefix='ballet-bench-')
+    try:
+        copia = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(ruta, copia)  # los POST escriben: nunca sobre la BD sembrada
+        app = _crear_app(copia)
+        cliente = app.test_client()
+        casos = {}
+        for nombre, fn in _casos(app):
+            if solo and not any(s in nombre for s in solo):
+                continue
+            print(f"  [{escala}] {nombre} ...", file=sys.stderr)
+            casos[nombre] = _medir(fn, cliente, repeticiones)
+        with app.app_context():
+            from extensions import db
+            db.engine.dispose()
+        return {'semilla': semilla, 'generacion_s': round(seg_gen, 1) if filas else None,
+                'filas': filas, 'plantillas': app.extensions['bench_plantillas'], 'casos': casos}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ---------------------------------------------
+# Resultados
+# ---------------------------------------------
+def _version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def comparar(actual: Dict[str, Any], previo: Dict[str, Any]) -> List[str]:
+    """Renglones de comparación por mediana; marca ⚠ lo que empeoró más de UMBRAL_REGRESION."""
+    salida = [f"Comparando {actual['meta'].get('version')} contra {previo['meta'].get('version')}"]
+    for escala, res in actual['escalas'].items():
+        prev = previo.get('escalas', {}).get(escala)
+        if not prev:
+            continue
+        for caso, m in res['casos'].items():
+            p = prev['casos'].get(caso)
+            if not p or not p.get('mediana_ms'):
+                continue
+            r = m['mediana_ms'] / p['mediana_ms'] - 1.0
+            marca = '⚠' if r > UMBRAL_REGRESION else ' '
+            salida.append(f"{marca} {escala:>7} {caso:<30} {p['mediana_ms']:>9.1f} → {m['mediana_ms']:>9.1f} ms "
+                          f"({r:+.0%})  consultas {p.get('consultas')} → {m.get('consultas')}")
+    return salida
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('--escala', type=int, action='append', help='Ventas sembradas (repetible). Default: 1000 10000')
+    ap.add_argument('--semilla', type=int, default=42)
+    ap.add_argument('--repeticiones', '-n', type=int, default=5)
+    ap.add_argument('--caso', action='append', help='Solo casos cuyo nombre contenga este texto (repetible).')
+    ap.add_argument('--regenerar', action='store_true', help='Vuelve a sembrar aunque exista la BD en caché.')
+    ap.add_argument('--salida', default=None, help='Archivo JSON (default: benchmarks/resultados/<git>-<fecha>.json)')
+    ap.add_argument('--comparar', default=None, help='JSON previo contra el cual comparar medianas.')
+    ap.add_argument('--_una-escala', dest='una_escala', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    escalas = args.escala or [1000, 10000]
+
+    if args.una_escala:
+        # Proceso hijo: una sola escala, JSON por stdout
+        res = correr_escala(escalas[0], semilla=args.semilla, repeticiones=args.repeticiones,
+                            regenerar=args.regenerar, solo=args.caso)
+        json.dump(res, sys.stdout)
+        return 0
+
+    resultado = {
+        'meta': {
+            'version': _version(),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'repeticiones': args.repeticiones,
+        },
+        'escalas': {},
+    }
+    for escala in escalas:
+        cmd = [sys.executable, '-m', 'benchmarks.run', '--_una-escala', '--escala', str(escala),
+               '--semilla', str(args.semilla), '--repeticiones', str(args.repeticiones)]
+        cmd += ['--regenerar'] if args.regenerar else []
+        for c in (args.caso or []):
+            cmd += ['--caso', c]
+        proc = subprocess.run(cmd, cwd=RAIZ, stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f"La escala {escala} falló (código {proc.returncode}).", file=sys.stderr)
+            return proc.returncode
+        res = json.loads(proc.stdout)
+        resultado['escalas'][str(escala)] = res
+        for caso, m in res['casos'].items():
+            print(f"{escala:>7} {caso:<30} mediana {m['mediana_ms']:>9.1f} ms  p95 {m['p95_ms']:>9.1f} ms  "
+                  f"consultas {m['consultas']}  status {m['status']}")
+
+    salida = args.salida or os.path.join(
+        DIR_RESULTADOS, f"{resultado['meta']['version'] or 'sin-git'}-{date.today():%Y%m%d}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultados: {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            for renglon in comparar(resultado, json.load(f)):
+                print(renglon)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
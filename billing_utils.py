@@ -3,20 +3,81 @@ from __future__ import annotations
 import json, re
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, date
-from typing import Any, Dict, Iterable, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # opcional: sin NumPy el cálculo por lote cae al escalar fila por fila
+    np = None
 
 # ---------- Redondeo consistente a 2 decimales ----------
-def money(value: Any) -> float:
+_CENT = Decimal("0.01")
+
+
+def _cents_decimal(value: Any) -> int:
+    """Camino exacto (lento): Decimal(str(x)) → centavos half-up."""
+    try:
+        q = value if isinstance(value, Decimal) else Decimal(str(value))
+        return int((q * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except Exception:
+        return 0
+
+
+def to_cents(value: Any) -> int:
     """
-    Redondeo “contable” (half-up) a 2 decimales. Acepta float/str/Decimal/None.
+    Centavos enteros con redondeo half-up (lejos de cero), igual que
+    Decimal(str(value)).quantize(0.01, ROUND_HALF_UP) pero sin pasar por str
+    salvo cuando el float cae a ~medio centavo (ahí sí se decide con Decimal).
     """
     if value is None:
-        return 0.0
+        return 0
+    if isinstance(value, bool):
+        return int(value) * 100
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        if value != value or value in (float('inf'), float('-inf')):
+            return 0
+        c = abs(value) * 100.0
+        base = int(c)
+        frac = c - base
+        if abs(frac - 0.5) < 1e-6:
+            return _cents_decimal(value)
+        r = base + (1 if frac > 0.5 else 0)
+        return -r if value < 0 else r
+    return _cents_decimal(value)
+
+
+def pct_cents(cents: int, pct: Any) -> int:
+    """`pct`% de un monto en centavos, half-up. Exacto con Decimal solo en empates."""
     try:
-        q = Decimal(str(value))
+        pct = float(pct or 0.0)
     except Exception:
-        q = Decimal("0")
-    return float(q.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+        return 0
+    if not pct or not cents:
+        return 0
+    c = cents * pct / 100.0
+    a = abs(c)
+    base = int(a)
+    frac = a - base
+    if abs(frac - 0.5) < 1e-6:
+        return _cents_decimal(Decimal(cents) * Decimal(repr(pct)) / 10000)
+    r = base + (1 if frac > 0.5 else 0)
+    return -r if c < 0 else r
+
+
+def money(value: Any) -> float:
+    """
+    Redondeo “contable” (half-up) a 2 decimales. Acepta float/str/Decimal/None.
+    """
+    return to_cents(value) / 100
+
+
+def sum_money(values: Iterable[Any]) -> float:
+    """Suma exacta en centavos (cada valor redondeado half-up); sin deriva de floats."""
+    return sum(to_cents(v) for v in values) / 100
+
 
 # ---------- Utilidades de método de pago ----------
 _METHOD_ALIASES = {
@@ -42,6 +103,38 @@ def requires_reference(method_norm: str) -> bool:
     return (method_norm or "") in {"transferencia", "tarjeta", "deposito"}
 
 # ---------- Parseo de condiciones (JSON/CSV/lista) ----------
+# Valores "vacíos" que se guardan en Pago_Condiciones (mismo criterio que _is_empty_meta)
+_EMPTY_CONDS = ("", "[]", "{}", "null", "None", "NULL")
+
+
+@lru_cache(maxsize=2048)
+def _conditions_from_text(s: str) -> tuple[str, ...]:
+    """
+    Parseo memoizado por texto: el valor de Pago_Condiciones ES su versión
+    (si el concepto cambia, cambia la llave), así que no hay nada que invalidar.
+    """
+    s = s.strip()
+    if s in _EMPTY_CONDS:
+        return ()
+    try:
+        data = json.loads(s)
+        if isinstance(data, (list, tuple)):
+            return tuple(str(c).strip().lower() for c in data if str(c).strip())
+        if isinstance(data, str):
+            s = data
+        elif data is None or isinstance(data, dict):
+            return ()
+    except Exception:
+        pass
+    parts = re.split(r'[,;|]+', s)
+    return tuple(p.strip().lower() for p in parts if p.strip())
+
+
+@lru_cache(maxsize=2048)
+def _conditions_set_from_text(s: str) -> frozenset:
+    return frozenset(_conditions_from_text(s))
+
+
 def parse_conditions(raw: Any) -> list[str]:
     """
     Acepta:
@@ -54,21 +147,34 @@ def parse_conditions(raw: Any) -> list[str]:
         return []
     if isinstance(raw, (list, tuple)):
         return [str(c).strip().lower() for c in raw if str(c).strip()]
-    s = str(raw).strip()
-    if not s:
-        return []
-    try:
-        data = json.loads(s)
-        if isinstance(data, (list, tuple)):
-            return [str(c).strip().lower() for c in data if str(c).strip()]
-        if isinstance(data, str):
-            s = data
-    except Exception:
-        pass
-    parts = re.split(r'[,;|]+', s)
-    return [p.strip().lower() for p in parts if p.strip()]
+    return list(_conditions_from_text(str(raw)))
+
+
+def conditions_set(raw: Any) -> frozenset:
+    """Condiciones como frozenset (cacheado por texto); para preguntar pertenencia en O(1)."""
+    if raw is None:
+        return frozenset()
+    if isinstance(raw, str) or not isinstance(raw, Iterable):
+        return _conditions_set_from_text(str(raw))
+    return frozenset(str(c).strip().lower() for c in raw if str(c).strip())
+
+
+def method_allowed(raw_conditions: Any, method_norm: str) -> bool:
+    """True si el método cumple las condiciones del concepto (sin condiciones = cualquiera)."""
+    conds = conditions_set(raw_conditions)
+    return (not conds) or ((method_norm or "").lower() in conds)
+
+# ---------- Helpers de montos y fechas ----------
+def _subtotal_cents(unit_price: Any, qty: int) -> int:
+    """Centavos de unit_price × qty redondeando el producto (no el unitario): money(unit*q)."""
+    if isinstance(unit_price, str):
+        try:
+            unit_price = Decimal(unit_price)
+        except Exception:
+            unit_price = 0
+    return to_cents((unit_price or 0.0) * qty)
+
 
-# ---------- Helper de fechas ----------
 def _as_date_or_none(d: Any) -> Optional[date]:
     if not d:
         return None
@@ -106,24 +212,27 @@ def compute_full_net(
     today = today or date.today()
     q = max(int(qty or 1), 1)
 
-    subtotal = money((unit_price or 0.0) * q)
+    # Todo en centavos; el subtotal se redondea una vez (unitario × cantidad), como antes
+    subtotal_c = _subtotal_cents(unit_price, q)
 
     # --- Descuento ---
-    d_methods = [str(m).strip().lower() for m in (discount_methods or [])]
     v_until = _as_date_or_none(discount_valid_until)
-    cond_ok = (not d_methods) or ((method_norm or "").lower() in d_methods)
+    cond_ok = method_allowed(discount_methods, method_norm)
     vig_ok = (v_until is None) or (today <= v_until)
     apply_disc = (float(discount_pct or 0.0) > 0.0) and cond_ok and vig_ok
 
-    disc_amount = money(subtotal * (float(discount_pct or 0.0) / 100.0)) if apply_disc else 0.0
-    base_post_disc = max(subtotal - disc_amount, 0.0)
+    disc_c = pct_cents(subtotal_c, discount_pct) if apply_disc else 0
+    base_post_disc_c = max(subtotal_c - disc_c, 0)
 
     # --- Recargo ---
     apply_surch = (float(surcharge_pct or 0.0) > 0.0) and int(surcharge_day_cut or 0) > 0 and today.day > int(surcharge_day_cut)
-    base_for_surch = subtotal if surcharge_on == "subtotal" else base_post_disc
-    surch_amount = money(base_for_surch * (float(surcharge_pct or 0.0) / 100.0)) if apply_surch else 0.0
+    base_for_surch_c = subtotal_c if surcharge_on == "subtotal" else base_post_disc_c
+    surch_c = pct_cents(base_for_surch_c, surcharge_pct) if apply_surch else 0
 
-    neto = money(base_post_disc + surch_amount)
+    subtotal = subtotal_c / 100
+    disc_amount = disc_c / 100
+    surch_amount = surch_c / 100
+    neto = (base_post_disc_c + surch_c) / 100
 
     return {
         "subtotal": subtotal,
@@ -165,7 +274,7 @@ def compute_full_net_from_pago(
         unit_price=float(unit),
         qty=qty,
         discount_pct=float(discount_pct),
-        discount_methods=parse_conditions(cond_raw),
+        discount_methods=conditions_set(cond_raw),
         discount_valid_until=valid_until,
         surcharge_pct=float(surcharge_pct),
         surcharge_day_cut=int(surcharge_day),
@@ -173,3 +282,137 @@ def compute_full_net_from_pago(
         today=today,
         surcharge_on=surcharge_on,
     )
+
+
+# ---------- Cálculo de NETO (FULL) por lote ----------
+def _columna(valor: Any, n: int) -> list:
+    """Escalar → columna de n; secuencia → lista (debe medir n)."""
+    if valor is None or isinstance(valor, (str, bytes, int, float, Decimal, date)):
+        return [valor] * n
+    col = list(valor)
+    if len(col) != n:
+        raise ValueError(f"Columna de longitud {len(col)} (se esperaban {n})")
+    return col
+
+
+def _redondear_cents_np(c, exacto):
+    """
+    Half-up (lejos de cero) de un arreglo float64 de centavos; las filas a ~medio
+    centavo se resuelven con `exacto(i)` (el mismo camino Decimal que el escalar).
+    """
+    a = np.abs(c)
+    base = np.floor(a)
+    frac = a - base
+    r = (base + (frac > 0.5)).astype(np.int64)
+    r = np.where(c < 0, -r, r)
+    for i in np.nonzero(np.abs(frac - 0.5) < 1e-6)[0]:
+        r[i] = exacto(int(i))
+    return r
+
+
+def _pct_cents_np(cents, pct):
+    c = cents * pct / 100.0
+    return _redondear_cents_np(c, lambda i: pct_cents(int(cents[i]), float(pct[i])))
+
+
+def compute_full_net_batch(
+    unit_prices: Sequence[Any],
+    qtys: Any = 1,
+    *,
+    discount_pcts: Any = 0.0,
+    discount_methods: Any = None,        # por fila: lista de métodos o Pago_Condiciones crudo
+    discount_valid_until: Any = None,    # por fila: date|datetime|iso str|None
+    surcharge_pcts: Any = 0.0,
+    surcharge_day_cuts: Any = 0,
+    method_norm: Any = "",               # un método para todo el lote o uno por fila
+    today: Optional[date] = None,
+    surcharge_on: str = "post_discount",
+) -> Dict[str, List[Any]]:
+    """
+    Igual que compute_full_net pero por columnas: cada argumento es una secuencia
+    (una fila por concepto) o un escalar que aplica a todo el lote.
+    Devuelve {subtotal, descuento, recargo, neto, aplico_descuento, aplico_recargo}
+    como listas alineadas con la entrada; resultado idéntico fila por fila al escalar.
+    Condiciones y fechas se parsean una vez por valor distinto. Usa NumPy si está instalado.
+    """
+    today = today or date.today()
+    unit_prices = list(unit_prices)
+    n = len(unit_prices)
+    qtys = _columna(qtys, n)
+    d_pcts = [float(x or 0.0) for x in _columna(discount_pcts, n)]
+    s_pcts = [float(x or 0.0) for x in _columna(surcharge_pcts, n)]
+    s_cuts = [int(x or 0) for x in _columna(surcharge_day_cuts, n)]
+    metodos = [(m or "").lower() for m in _columna(method_norm, n)]
+    hasta = _columna(discount_valid_until, n)
+    conds = _columna(discount_methods, n)
+
+    # Fechas repetidas → un parseo por valor distinto (las condiciones ya van cacheadas)
+    cache_fechas: Dict[Any, Optional[date]] = {}
+
+    def _fecha(raw):
+        if raw not in cache_fechas:
+            cache_fechas[raw] = _as_date_or_none(raw)
+        return cache_fechas[raw]
+
+    apply_disc = []
+    for i in range(n):
+        d_methods = conditions_set(conds[i])
+        v_until = _fecha(hasta[i])
+        cond_ok = (not d_methods) or (metodos[i] in d_methods)
+        vig_ok = (v_until is None) or (today <= v_until)
+        apply_disc.append(d_pcts[i] > 0.0 and cond_ok and vig_ok)
+    apply_surch = [s_pcts[i] > 0.0 and s_cuts[i] > 0 and today.day > s_cuts[i] for i in range(n)]
+    qtys = [max(int(q or 1), 1) for q in qtys]
+
+    if np is None or n == 0:
+        sub_c = [_subtotal_cents(u, q) for u, q in zip(unit_prices, qtys)]
+        disc_c = [pct_cents(sub_c[i], d_pcts[i]) if apply_disc[i] else 0 for i in range(n)]
+        post_c = [max(sub_c[i] - disc_c[i], 0) for i in range(n)]
+        base_s = sub_c if surcharge_on == "subtotal" else post_c
+        surch_c = [pct_cents(base_s[i], s_pcts[i]) if apply_surch[i] else 0 for i in range(n)]
+        neto_c = [post_c[i] + surch_c[i] for i in range(n)]
+    else:
+        if all(isinstance(u, (int, float)) or u is None for u in unit_prices):
+            u = np.asarray([float(x or 0.0) for x in unit_prices], dtype=np.float64)
+            sub = _redondear_cents_np(u * np.asarray(qtys, dtype=np.float64) * 100.0,
+                                      lambda i: _subtotal_cents(float(unit_prices[i] or 0.0), qtys[i]))
+        else:  # Decimal (columnas Numeric) / str: conversión exacta por valor
+            sub = np.asarray([_subtotal_cents(x, q) for x, q in zip(unit_prices, qtys)], dtype=np.int64)
+        ad = np.asarray(apply_disc, dtype=bool)
+        asu = np.asarray(apply_surch, dtype=bool)
+        disc = np.where(ad, _pct_cents_np(sub, np.where(ad, np.asarray(d_pcts), 0.0)), 0)
+        post = np.maximum(sub - disc, 0)
+        base_s = sub if surcharge_on == "subtotal" else post
+        surch = np.where(asu, _pct_cents_np(base_s, np.where(asu, np.asarray(s_pcts), 0.0)), 0)
+        sub_c, disc_c, surch_c, neto_c = sub.tolist(), disc.tolist(), surch.tolist(), (post + surch).tolist()
+
+    return {
+        "subtotal": [c / 100 for c in sub_c],
+        "descuento": [c / 100 for c in disc_c],
+        "recargo": [c / 100 for c in surch_c],
+        "neto": [c / 100 for c in neto_c],
+        "aplico_descuento": apply_disc,
+        "aplico_recargo": apply_surch,
+    }
+
+
+def compute_full_net_batch_from_pagos(
+    pagos: Sequence[Any],
+    qtys: Any = 1,
+    method_norm: Any = "",
+    today: Optional[date] = None,
+    surcharge_on: str = "post_discount",
+) -> Dict[str, List[Any]]:
+    """compute_full_net_from_pago por lote: una fila por objeto Pago (se pueden repetir)."""
+    return compute_full_net_batch(
+        [getattr(p, "Pago_Monto", 0.0) or 0.0 for p in pagos],
+        qtys,
+        discount_pcts=[getattr(p, "Pago_Descuento_Porcentaje", 0.0) or 0.0 for p in pagos],
+        discount_methods=[getattr(p, "Pago_Condiciones", None) for p in pagos],
+        discount_valid_until=[getattr(p, "Pago_Restricciones_Fecha", None) for p in pagos],
+        surcharge_pcts=[getattr(p, "Pago_Recargo_Porcentaje", 0.0) or 0.0 for p in pagos],
+        surcharge_day_cuts=[getattr(p, "Pago_Recargo_DiaCorte", 0) or 0 for p in pagos],
+        method_norm=method_norm,
+        today=today,
+        surcharge_on=surcharge_on,
+    )
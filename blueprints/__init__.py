@@ -0,0 +1,44 @@
+# blueprints/__init__.py
+"""
+Rutas por dominio. Cada módulo expone `bp`; create_app los importa y registra
+aquí (import diferido: importar `app` no carga ninguna ruta).
+"""
+from __future__ import annotations
+import importlib
+import time
+from typing import Dict
+
+from werkzeug.routing import Rule
+
+# Orden de registro = orden de matching cuando dos reglas coinciden
+# (p.ej. /ventas/<id> de venta_detalle antes que detalle_venta, como en el app.py original).
+BLUEPRINTS = ('inicio', 'alumnos', 'inventario', 'ventas', 'cobranza')
+
+
+def _alias_legacy(app, bp_name: str) -> None:
+    """
+    Las plantillas y redirects usan url_for('consulta_ventas') (sin prefijo de blueprint).
+    Por cada regla del blueprint se agrega una regla build_only con el nombre viejo:
+    url_for sigue funcionando igual y no participa en el matching de requests.
+    """
+    prefijo = bp_name + '.'
+    for rule in list(app.url_map.iter_rules()):
+        if not rule.endpoint.startswith(prefijo):
+            continue
+        legacy = rule.endpoint[len(prefijo):]
+        if legacy in app.view_functions:
+            continue
+        app.url_map.add(Rule(rule.rule, endpoint=legacy, methods=rule.methods,
+                             defaults=rule.defaults, build_only=True))
+
+
+def registrar_blueprints(app) -> Dict[str, float]:
+    """Importa y registra cada blueprint; devuelve ms por módulo (import + registro)."""
+    tiempos: Dict[str, float] = {}
+    for nombre in BLUEPRINTS:
+        t0 = time.perf_counter()
+        modulo = importlib.import_module(f'blueprints.{nombre}')
+        app.register_blueprint(modulo.bp)
+        _alias_legacy(app, modulo.bp.name)
+        tiempos[nombre] = (time.perf_counter() - t0) * 1000.0
+    return tiempos
@@ -0,0 +1,1057 @@
+# blueprints/alumnos.py
+"""Tutores, instructores, grupos y estudiantes."""
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, current_app, session,
+)
+import io
+import json
+from extensions import db, csrf
+from datetime import datetime, date, timedelta
+from uuid import uuid4
+from flask_wtf.csrf import validate_csrf, CSRFError
+from sqlalchemy import or_, func
+from sqlalchemy.orm import joinedload
+from busqueda_utils import ids_fts
+from export_utils import respuesta_exportacion
+from resumen_utils import aportes_resumen, ajustar_resumen
+from importacion_utils import (
+    importar_estudiantes, leer_csv, filas_reporte, ENCABEZADOS_REPORTE,
+    COLUMNAS as COLUMNAS_IMPORTACION, REQUERIDAS as REQUERIDAS_IMPORTACION,
+)
+from models import Tutor, Estudiante, Instructor, Grupo, ContactoEmergencia, Venta
+from forms import EstudianteForm, TutorForm, InstructorForm, GrupoForm
+
+
+bp = Blueprint('alumnos', __name__)
+
+@bp.route('/registro/tutor', methods=['GET', 'POST'])
+def registro_tutor():
+    form = TutorForm()
+    
+    if form.validate_on_submit():
+        try:
+            nuevo_tutor = Tutor(
+                Tutor_Nombre=form.nombre.data,
+                Tutor_ApellidoP=form.apellido_paterno.data,
+                Tutor_ApellidoM=form.apellido_materno.data,
+                Tutor_Celular=form.celular.data,
+                Tutor_Edad=form.edad.data,
+                Tutor_Parentesco=form.parentesco.data,
+                Tutor_Correo=form.correo.data,
+                Tutor_Ocupacion=form.ocupacion.data,
+                Tutor_Facebook=form.facebook.data,
+                Tutor_Instagram=form.instagram.data,
+                Tutor_Direccion=form.direccion.data,
+                Tutor_Medio_Entero=form.medio_entero.data
+            )
+            
+            db.session.add(nuevo_tutor)
+            db.session.commit()
+            flash('Tutor registrado exitosamente!', 'success')
+            return redirect(url_for('consulta_tutores'))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al registrar tutor: {str(e)}', 'danger')
+    
+    return render_template('registro_tutor.html', form=form)
+
+## Consulta de tutor
+##----------------------------------------
+@bp.route('/consulta/tutores')
+def consulta_tutores():
+    orden = request.args.get('orden', 'apellido')  # Valor por defecto
+    
+    if orden == 'nombre':
+        tutores = Tutor.query.order_by(Tutor.Tutor_Nombre.asc()).all()
+    else:  # Orden por apellido (por defecto)
+        tutores = Tutor.query.order_by(
+            Tutor.Tutor_ApellidoP.asc(),
+            Tutor.Tutor_Nombre.asc()
+        ).all()
+    
+    return render_template('consulta_tutores.html', 
+                         tutores=tutores,
+                         orden_actual=orden)
+
+## Editar tutor
+##----------------------------------------
+@bp.route('/editar/tutor/<int:id>', methods=['GET', 'POST'])
+def editar_tutor(id):
+    tutor = Tutor.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        tutor.Tutor_Nombre = request.form['nombre']
+        tutor.Tutor_ApellidoP = request.form['apellido_paterno']
+        tutor.Tutor_ApellidoM = request.form['apellido_materno']
+        tutor.Tutor_Celular = request.form['celular']
+        tutor.Tutor_Edad = request.form['edad']
+        tutor.Tutor_Parentesco = request.form['parentesco']
+        tutor.Tutor_Correo = request.form.get('correo')
+        tutor.Tutor_Ocupacion = request.form.get('ocupacion')
+        tutor.Tutor_Facebook = request.form.get('facebook')
+        tutor.Tutor_Instagram = request.form.get('instagram')
+        tutor.Tutor_Direccion = request.form.get('direccion')
+        tutor.Tutor_Medio_Entero = request.form.get('medio_entero')
+        
+        db.session.commit()
+        flash('Tutor actualizado correctamente', 'success')
+        return redirect(url_for('consulta_tutores'))
+    
+    return render_template('editar_tutor.html', tutor=tutor)
+
+## Eliminar tutor
+##----------------------------------------
+@bp.route('/eliminar/tutor/<int:id>', methods=['POST'])
+def eliminar_tutor(id):
+    tutor = Tutor.query.get_or_404(id)
+    
+    try:
+        # Verificar si el tutor tiene estudiantes asociados
+        if tutor.estudiantes:
+            flash('No se puede eliminar el tutor porque tiene estudiantes asociados', 'danger')
+        else:
+            db.session.delete(tutor)
+            db.session.commit()
+            flash('Tutor eliminado correctamente', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar tutor: {str(e)}', 'danger')
+    
+    return redirect(url_for('consulta_tutores'))
+
+
+
+##----------------------------------------
+## Instructor
+##----------------------------------------
+
+## Registro de instructor
+##----------------------------------------
+@bp.route('/registro/instructor', methods=['GET', 'POST'])
+def registro_instructor():
+    form = InstructorForm()
+    
+    if form.validate_on_submit():
+        try:
+            nuevo_instructor = Instructor(
+                Instructor_Nombre=form.nombre.data,
+                Instructor_ApellidoP=form.apellido_paterno.data,
+                Instructor_ApellidoM=form.apellido_materno.data
+            )
+            db.session.add(nuevo_instructor)
+            db.session.commit()
+            flash('Instructor registrado exitosamente!', 'success')
+            return redirect(url_for('consulta_instructores'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al registrar instructor: {str(e)}', 'danger')
+    
+    return render_template('registro_instructor.html', form=form)
+
+## Consulta de instructor
+##----------------------------------------
+@bp.route('/consulta/instructores')
+def consulta_instructores():
+    instructores = Instructor.query.order_by(Instructor.Instructor_ApellidoP).all()
+    return render_template('consulta_instructores.html', instructores=instructores)
+
+## Editar instructor
+##----------------------------------------
+@bp.route('/editar/instructor/<int:id>', methods=['GET', 'POST'])
+def editar_instructor(id):
+    instructor = Instructor.query.get_or_404(id)
+    form = InstructorForm(obj=instructor)
+    
+    if request.method == 'GET':
+        # Precargar manualmente los datos en el formulario
+        form.nombre.data = instructor.Instructor_Nombre
+        form.apellido_paterno.data = instructor.Instructor_ApellidoP
+        form.apellido_materno.data = instructor.Instructor_ApellidoM
+
+    if form.validate_on_submit():
+        try:
+            # Actualizar los campos manualmente para asegurarnos
+            instructor.Instructor_Nombre = form.nombre.data
+            instructor.Instructor_ApellidoP = form.apellido_paterno.data
+            instructor.Instructor_ApellidoM = form.apellido_materno.data
+            
+            db.session.commit()
+            flash('Instructor actualizado correctamente', 'success')
+            return redirect(url_for('consulta_instructores'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al actualizar instructor: {str(e)}', 'danger')
+            current_app.logger.error(f"Error al actualizar instructor: {str(e)}")  # Para registro de errores
+
+    return render_template('editar_instructor.html', form=form, instructor=instructor)
+
+## Eliminar instrcutor
+##----------------------------------------
+@bp.route('/eliminar/instructor/<int:id>', methods=['POST'])
+def eliminar_instructor(id):
+    instructor = Instructor.query.get_or_404(id)
+    try:
+        # Sus ventas pierden el cliente: se ajusta su aporte al resumen diario
+        ventas_ids = [vid for (vid,) in db.session.query(Venta.Venta_ID).filter(Venta.Instructor_ID == id)]
+        antes_resumen = aportes_resumen(ventas_ids)
+        db.session.delete(instructor)
+        ajustar_resumen(ventas_ids, antes_resumen)
+        db.session.commit()
+        flash('Instructor eliminado', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    return redirect(url_for('consulta_instructores'))
+
+
+##----------------------------------------
+## Grupo
+##----------------------------------------
+
+## Registro de grupo
+##----------------------------------------
+@bp.route('/registro/grupo', methods=['GET', 'POST'])
+def registro_grupo():
+    form = GrupoForm()
+    if form.validate_on_submit():
+        try:
+            nuevo_grupo = Grupo(
+                Grupo_Nombre=form.nombre.data,
+                Grupo_Horario=form.horario.data,
+                Grupo_Dias=form.dias.data,
+                Grupo_Nivel=form.nivel.data,
+                Instructor_ID=form.instructor_id.data
+            )
+            db.session.add(nuevo_grupo)
+            db.session.commit()
+            flash('Grupo registrado exitosamente!', 'success')
+            return redirect(url_for('consulta_grupos'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al registrar grupo: {str(e)}', 'danger')
+    
+    return render_template('registro_grupo.html', form=form)
+
+## Consulta de grupo
+##----------------------------------------
+# Consulta Grupo
+@bp.route('/consulta/grupos')
+def consulta_grupos():
+    grupos = Grupo.query.options(db.joinedload(Grupo.instructor)).all()
+    return render_template('consulta_grupos.html', grupos=grupos)
+
+## Editar grupo
+##----------------------------------------
+@bp.route('/editar/grupo/<int:id>', methods=['GET', 'POST'])
+def editar_grupo(id):
+    grupo = Grupo.query.get_or_404(id)
+    form = GrupoForm(obj=grupo)
+    
+    # Actualizar las opciones del instructor (importante para el select)
+    form.instructor_id.choices = [(i.Instructor_ID, f"{i.Instructor_Nombre} {i.Instructor_ApellidoP}") 
+                                for i in Instructor.query.order_by(Instructor.Instructor_Nombre).all()]
+
+    if request.method == 'GET':
+        # Precargar manualmente los datos en el formulario
+        form.nombre.data = grupo.Grupo_Nombre
+        form.horario.data = grupo.Grupo_Horario
+        form.dias.data = grupo.Grupo_Dias
+        form.nivel.data = grupo.Grupo_Nivel
+        form.instructor_id.data = grupo.Instructor_ID
+
+    if form.validate_on_submit():
+        try:
+            # Actualizar los campos manualmente para asegurarnos
+            grupo.Grupo_Nombre = form.nombre.data
+            grupo.Grupo_Horario = form.horario.data
+            grupo.Grupo_Dias = form.dias.data
+            grupo.Grupo_Nivel = form.nivel.data
+            grupo.Instructor_ID = form.instructor_id.data
+            
+            db.session.commit()
+            flash('Grupo actualizado exitosamente!', 'success')
+            return redirect(url_for('consulta_grupos'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al actualizar grupo: {str(e)}', 'danger')
+
+    return render_template('editar_grupo.html', form=form, grupo=grupo)
+
+## Eliminar grupo
+##----------------------------------------
+@bp.route('/eliminar/grupo/<int:id>', methods=['POST'])
+def eliminar_grupo(id):
+    grupo = Grupo.query.get_or_404(id)
+    try:
+        db.session.delete(grupo)
+        db.session.commit()
+        flash('Grupo eliminado', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error: {str(e)}', 'danger')
+    return redirect(url_for('consulta_grupos'))
+
+
+
+##----------------------------------------
+## Estudiante
+##----------------------------------------
+
+## Registro de estudiante
+##----------------------------------------
+'''@bp.route('/registro/estudiante', methods=['GET', 'POST'])
+def registro_estudiante():
+    import json
+    from datetime import datetime, date
+
+    form = EstudianteForm()
+
+    if form.validate_on_submit():
+        try:
+            # =========================
+            # 1) Condiciones de salud
+            # =========================
+            condiciones = {}
+            for campo in ['pie_plano', 'escoliosis', 'genu_varo', 'genu_valgo',
+                          'desviacion_cadera', 'asma', 'psicopatologias']:
+                if getattr(form, campo).data:
+                    condiciones[campo] = True
+            if form.otras_condiciones.data:
+                condiciones['otras'] = form.otras_condiciones.data
+
+            # ============================================
+            # 2) Reingreso (marcar, fecha y nota opcional)
+            # ============================================
+            fecha_reingreso = None
+            nota_reingreso = None
+            if getattr(form, 'marcar_reingreso', None) and form.marcar_reingreso.data:
+                # Si no capturan fecha, toma hoy
+                fecha_reingreso = (form.fecha_reingreso.data or datetime.utcnow().date())
+                # Nota opcional, limpia espacios
+                nota_reingreso = (form.nota_reingreso.data or '').strip() or None
+
+            # ========================================
+            # 3) Crear Estudiante (incluye reingreso)
+            # ========================================
+            nuevo_estudiante = Estudiante(
+                Est_Nombre=form.nombre.data,
+                Est_ApellidoP=form.apellido_paterno.data,
+                Est_ApellidoM=form.apellido_materno.data,
+                Est_FechaNac=form.fecha_nacimiento.data,
+                Est_Sexo=form.sexo.data,
+                Tutor_ID=form.tutor_id.data,
+                Est_LugarNac=form.lugar_nacimiento.data,
+                Est_GradoEscolar=form.grado_escolar.data,
+                Est_FechaIngreso=form.fecha_ingreso.data or datetime.utcnow(),
+                Est_Colegio=form.colegio.data,
+                Est_OtrasDisciplinas=form.otras_disciplinas.data,
+                Est_MotivoIngreso=form.motivo_ingreso.data,
+                Est_Status=form.status.data,
+                Est_CondicionSalud=json.dumps(condiciones),
+                Est_Alergias=form.alergias.data,
+                Est_Medicamentos=form.medicamentos.data,
+                # >>> Nuevos campos de reingreso <<<
+                Est_FechaReingreso=fecha_reingreso,
+                Est_Reingreso_Nota=nota_reingreso
+            )
+
+            db.session.add(nuevo_estudiante)
+            db.session.flush()  # obtener Est_ID
+
+            # ============================================
+            # 4) Asignar grupos (checkboxes booleanos)
+            #    - form.grupos es FieldList(BooleanField)
+            #    - form.grupos_disponibles contiene los objetos Grupo en el mismo orden
+            # ============================================
+            grupos_elegidos = []
+            if hasattr(form, 'grupos') and hasattr(form, 'grupos_disponibles'):
+                for idx, entrada in enumerate(form.grupos.entries):
+                    if entrada.data is True and idx < len(form.grupos_disponibles):
+                        grupos_elegidos.append(form.grupos_disponibles[idx])
+            if grupos_elegidos:
+                nuevo_estudiante.grupos = grupos_elegidos
+
+            # ============================================
+            # 5) Contactos de emergencia
+            # ============================================
+            # Principal (obligatorio por tu validador)
+            cp = form.contacto_principal.data
+            contacto1 = ContactoEmergencia(
+                Est_ID=nuevo_estudiante.Est_ID,
+                Contacto_Nombre=cp['nombre'],
+                Contacto_ApellidoP=cp['apellido_paterno'],
+                Contacto_ApellidoM=cp.get('apellido_materno'),
+                Contacto_Telefono=cp['telefono'],
+                Contacto_Parentesco=cp['parentesco']
+            )
+            db.session.add(contacto1)
+
+            # Secundario (opcional)
+            cs = form.contacto_secundario.data
+            if cs.get('nombre'):
+                contacto2 = ContactoEmergencia(
+                    Est_ID=nuevo_estudiante.Est_ID,
+                    Contacto_Nombre=cs['nombre'],
+                    Contacto_ApellidoP=cs['apellido_paterno'],
+                    Contacto_ApellidoM=cs.get('apellido_materno'),
+                    Contacto_Telefono=cs['telefono'],
+                    Contacto_Parentesco=cs['parentesco']
+                )
+                db.session.add(contacto2)
+
+            db.session.commit()
+            flash('Estudiante registrado exitosamente!', 'success')
+            return redirect(url_for('consulta_estudiantes'))
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception("Error en registro estudiante")
+            flash(f'Error al registrar estudiante: {str(e)}', 'danger')
+
+    elif request.method == 'POST':
+        # Hubo POST pero no pasó validación WTForms
+        flash('Por favor corrige los errores en el formulario.', 'warning')
+
+    return render_template('registro_estudiante.html', form=form)
+'''
+
+## Consulta de estudiante
+##----------------------------------------
+@bp.route('/consulta/estudiantes')
+def consulta_estudiantes():
+    """
+    Parámetros GET soportados:
+      - orden: apellido (def), nombre, fecha, ingreso, reingreso
+      - status: Activo | Inactivo | Egresado
+      - busqueda: texto libre (nombre, apellidos, colegio, nombre del tutor)
+      - con_reingreso: 'si' | 'no'  (opcional)
+    """
+    orden = request.args.get('orden', 'apellido')
+    status = request.args.get('status', '').strip()
+    busqueda = (request.args.get('busqueda', '') or '').strip()
+    con_reingreso = (request.args.get('con_reingreso', '') or '').strip().lower()
+
+    query = (Estudiante.query
+             .options(
+                 joinedload(Estudiante.grupos),
+                 joinedload(Estudiante.contactos_emergencia),
+                 joinedload(Estudiante.tutor))
+            )
+
+    # Filtro por status
+    if status:
+        query = query.filter(Estudiante.Est_Status == status)
+
+    # Filtro por reingreso
+    if con_reingreso == 'si':
+        query = query.filter(Estudiante.Est_FechaReingreso.isnot(None))
+    elif con_reingreso == 'no':
+        query = query.filter(Estudiante.Est_FechaReingreso.is_(None))
+
+    # Búsqueda libre: índice FTS5 (sin acentos, por prefijo de palabra); ilike si no hay índice
+    ids_est = ids_fts('estudiante', busqueda, secundario=True) if busqueda else None
+    if ids_est is not None:
+        query = query.filter(
+            or_(
+                Estudiante.Est_ID.in_(ids_est),
+                Estudiante.Tutor_ID.in_(ids_fts('tutor', busqueda))
+            )
+        )
+    elif busqueda:
+        b = f"%{busqueda}%"
+        query = query.filter(
+            or_(
+                Estudiante.Est_Nombre.ilike(b),
+                Estudiante.Est_ApellidoP.ilike(b),
+                Estudiante.Est_ApellidoM.ilike(b),
+                Estudiante.Est_Colegio.ilike(b)
+            )
+        )
+
+    # Ordenamiento
+    if orden == 'nombre':
+        query = query.order_by(Estudiante.Est_Nombre.asc(),
+                               Estudiante.Est_ApellidoP.asc())
+    elif orden == 'fecha':
+        query = query.order_by(Estudiante.Est_FechaNac.asc(),
+                               Estudiante.Est_ApellidoP.asc())
+    elif orden == 'ingreso':
+        query = query.order_by(Estudiante.Est_FechaIngreso.asc(),
+                               Estudiante.Est_ApellidoP.asc())
+    elif orden == 'reingreso':
+        # Primero los que SÍ tienen reingreso (NULLS LAST/ FIRST depende del motor)
+        # Aquí: ordena por Est_FechaReingreso asc, dejando None al final.
+        query = query.order_by(Estudiante.Est_FechaReingreso.is_(None),
+                               Estudiante.Est_FechaReingreso.asc(),
+                               Estudiante.Est_ApellidoP.asc())
+    else:  # apellido (default)
+        query = query.order_by(Estudiante.Est_ApellidoP.asc(),
+                               Estudiante.Est_Nombre.asc())
+
+    estudiantes = query.all()
+
+    return render_template(
+        'consulta_estudiantes.html',
+        estudiantes=estudiantes,
+        orden_actual=orden,
+        status_actual=status,
+        busqueda=busqueda,
+        con_reingreso=con_reingreso
+    )
+
+
+## Editar estudiante
+##----------------------------------------
+@bp.route('/editar/estudiante/<int:id>', methods=['GET', 'POST'])
+def editar_estudiante(id):
+    estudiante = (Estudiante.query
+                  .options(joinedload(Estudiante.contactos_emergencia),
+                           joinedload(Estudiante.grupos))
+                  .get_or_404(id))
+
+    tutores = Tutor.query.order_by(Tutor.Tutor_ApellidoP, Tutor.Tutor_Nombre).all()
+    grupos_disponibles = (Grupo.query
+                          .options(db.joinedload(Grupo.instructor))
+                          .order_by(Grupo.Grupo_Nombre.asc())
+                          .all())
+
+    if request.method == 'POST':
+        try:
+            # ========= Campos básicos =========
+            estudiante.Est_Nombre = request.form['nombre'].strip()
+            estudiante.Est_ApellidoP = request.form['apellido_paterno'].strip()
+            estudiante.Est_ApellidoM = request.form.get('apellido_materno', '').strip() or None
+
+            estudiante.Est_FechaNac = datetime.strptime(
+                request.form['fecha_nacimiento'], '%Y-%m-%d'
+            ).date()
+
+            estudiante.Est_Sexo = request.form['sexo']
+            estudiante.Tutor_ID = int(request.form['tutor_id'])
+
+            estudiante.Est_LugarNac = request.form.get('lugar_nacimiento', '').strip() or None
+            estudiante.Est_GradoEscolar = request.form.get('grado_escolar', '').strip() or None
+            estudiante.Est_Colegio = request.form.get('colegio', '').strip() or None
+            estudiante.Est_OtrasDisciplinas = request.form.get('otras_disciplinas', '').strip() or None
+            estudiante.Est_MotivoIngreso = request.form.get('motivo_ingreso', '').strip() or None
+            estudiante.Est_Status = request.form['status']
+
+            # Ingreso (opcional)
+            if request.form.get('fecha_ingreso'):
+                estudiante.Est_FechaIngreso = datetime.strptime(
+                    request.form['fecha_ingreso'], '%Y-%m-%d'
+                ).date()
+
+            # ========= Reingreso =========
+            # Convención del form (recomendado en tu template):
+            # - checkbox name="marcar_reingreso"
+            # - input date name="fecha_reingreso"
+            # - input text name="nota_reingreso"
+            # - input hidden name="limpiar_reingreso" value="1" si quieren limpiar
+            marcar_reingreso = ('marcar_reingreso' in request.form)
+            limpiar_reingreso = request.form.get('limpiar_reingreso', '0') == '1'
+            fecha_reingreso_raw = request.form.get('fecha_reingreso', '').strip()
+            nota_reingreso_raw = request.form.get('nota_reingreso', '').strip()
+
+            if limpiar_reingreso:
+                estudiante.Est_FechaReingreso = None
+                estudiante.Est_Reingreso_Nota = None
+            else:
+                if marcar_reingreso:
+                    # Si marcan reingreso, exigimos una fecha válida (o hoy, si quieres)
+                    if fecha_reingreso_raw:
+                        estudiante.Est_FechaReingreso = datetime.strptime(
+                            fecha_reingreso_raw, '%Y-%m-%d'
+                        ).date()
+                    else:
+                        # Por política de negocio: si no envían fecha, podrías usar hoy.
+                        estudiante.Est_FechaReingreso = datetime.utcnow().date()
+                    estudiante.Est_Reingreso_Nota = nota_reingreso_raw or None
+                else:
+                    # Si no se marca, conservar lo que haya (no tocar)
+                    pass
+
+            # ========= Salud =========
+            estudiante.Est_Alergias = request.form.get('alergias', '').strip() or None
+            estudiante.Est_Medicamentos = request.form.get('medicamentos', '').strip() or None
+
+            condiciones = {
+                'pie_plano': 'pie_plano' in request.form,
+                'escoliosis': 'escoliosis' in request.form,
+                'genu_varo': 'genu_varo' in request.form,
+                'genu_valgo': 'genu_valgo' in request.form,
+                'desviacion_cadera': 'desviacion_cadera' in request.form,
+                'asma': 'asma' in request.form,
+                'psicopatologias': 'psicopatologias' in request.form,
+                'otras': request.form.get('otras_condiciones', '').strip()
+            }
+            estudiante.Est_CondicionSalud = json.dumps(condiciones)
+
+            # ========= Grupos =========
+            # En tu template de edición, renderiza checkboxes con name="grupos" y value="{{ Grupo_ID }}"
+            grupos_seleccionados = set(request.form.getlist('grupos'))  # strings
+            grupos_actuales = {str(g.Grupo_ID) for g in estudiante.grupos}
+
+            # Agregar nuevos
+            to_add = grupos_seleccionados - grupos_actuales
+            if to_add:
+                nuevos = Grupo.query.filter(Grupo.Grupo_ID.in_(list(map(int, to_add)))).all()
+                for g in nuevos:
+                    estudiante.grupos.append(g)
+
+            # Quitar no seleccionados
+            for g in estudiante.grupos[:]:
+                if str(g.Grupo_ID) not in grupos_seleccionados:
+                    estudiante.grupos.remove(g)
+
+            # ========= Contactos emergencia =========
+            # Mantiene tu convención:
+            #   contacto_id_{i} (existentes)
+            #   contacto_nombre_{i}, contacto_apellido_p_{i}, contacto_apellido_m_{i},
+            #   contacto_telefono_{i}, contacto_parentesco_{i}
+            #
+            #   contacto_id_new_{j} para nuevos
+            #   contacto_nombre_new_{j}, ...
+            contactos_procesados = set()
+
+            # Actualizar existentes
+            for key in request.form.keys():
+                if key.startswith('contacto_id_') and not key.endswith('_new'):
+                    contacto_id = request.form[key]
+                    contacto = ContactoEmergencia.query.get(contacto_id)
+                    if contacto and contacto.Est_ID == estudiante.Est_ID:
+                        idx = key.split('_')[-1]
+                        contacto.Contacto_Nombre = request.form.get(f'contacto_nombre_{idx}', '').strip()
+                        contacto.Contacto_ApellidoP = request.form.get(f'contacto_apellido_p_{idx}', '').strip()
+                        contacto.Contacto_ApellidoM = request.form.get(f'contacto_apellido_m_{idx}', '').strip() or None
+                        contacto.Contacto_Telefono = request.form.get(f'contacto_telefono_{idx}', '').strip()
+                        contacto.Contacto_Parentesco = request.form.get(f'contacto_parentesco_{idx}', '').strip()
+                        contactos_procesados.add(str(contacto.Contacto_ID))
+
+            # Eliminar los que no vinieron
+            for contacto in estudiante.contactos_emergencia[:]:
+                if str(contacto.Contacto_ID) not in contactos_procesados:
+                    db.session.delete(contacto)
+
+            # Agregar nuevos
+            for key in request.form.keys():
+                if key.startswith('contacto_id_new_'):
+                    idx = key.split('_')[-1]
+                    nombre_n = request.form.get(f'contacto_nombre_new_{idx}', '').strip()
+                    if not nombre_n:
+                        continue  # ignora filas vacías
+                    nuevo_contacto = ContactoEmergencia(
+                        Est_ID=estudiante.Est_ID,
+                        Contacto_Nombre=nombre_n,
+                        Contacto_ApellidoP=request.form.get(f'contacto_apellido_p_new_{idx}', '').strip(),
+                        Contacto_ApellidoM=request.form.get(f'contacto_apellido_m_new_{idx}', '').strip() or None,
+                        Contacto_Telefono=request.form.get(f'contacto_telefono_new_{idx}', '').strip(),
+                        Contacto_Parentesco=request.form.get(f'contacto_parentesco_new_{idx}', '').strip()
+                    )
+                    db.session.add(nuevo_contacto)
+
+            db.session.commit()
+            flash('Estudiante actualizado correctamente', 'success')
+            return redirect(url_for('consulta_estudiantes'))
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception("Error al actualizar estudiante")
+            flash(f'Error al actualizar estudiante: {str(e)}', 'danger')
+
+    # GET
+    return render_template('editar_estudiante.html',
+                           estudiante=estudiante,
+                           tutores=tutores,
+                           grupos_disponibles=grupos_disponibles)
+
+
+## Eliminar estudiante
+##----------------------------------------
+@csrf.exempt
+@bp.route('/eliminar/estudiante/<int:id>', methods=['POST'])
+def eliminar_estudiante(id):
+    """
+    Elimina un estudiante validando CSRF manualmente para soportar tanto:
+    - Formularios HTML (input hidden name='csrf_token')
+    - Llamadas fetch/AJAX (header X-CSRFToken o X-CSRF-Token)
+    """
+    # 1) Validación CSRF manual (soporta form y headers)
+    token = (
+        request.form.get('csrf_token')
+        or request.headers.get('X-CSRFToken')
+        or request.headers.get('X-CSRF-Token')
+    )
+    try:
+        validate_csrf(token)
+    except CSRFError:
+        flash('Operación no autorizada: falta o es inválido el CSRF token.', 'danger')
+        return redirect(url_for('consulta_estudiantes'))
+
+    # 2) Buscar estudiante
+    estudiante = Estudiante.query.get_or_404(id)
+
+    # 3) Intentar eliminar
+    try:
+        # Sus ventas pierden el cliente: se ajusta su aporte al resumen diario
+        ventas_ids = [vid for (vid,) in db.session.query(Venta.Venta_ID).filter(Venta.Est_ID == id)]
+        antes_resumen = aportes_resumen(ventas_ids)
+        db.session.delete(estudiante)
+        ajustar_resumen(ventas_ids, antes_resumen)
+        db.session.commit()
+        flash('Estudiante eliminado correctamente', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar el estudiante: {str(e)}', 'danger')
+
+    # 4) Volver al listado
+    return redirect(url_for('consulta_estudiantes'))
+
+
+# --------------------------------------------------
+# Registro Estudiante - Tutor
+# --------------------------------------------------
+
+@bp.route('/registro/tutor-estudiante', methods=['GET', 'POST'])
+def registro_tutor_estudiante():
+    import json
+
+    # Instancias WTForms con prefijos (para GET inicial)
+    tutor_form = TutorForm(prefix='tutor')
+    est_form   = EstudianteForm(prefix='est')
+
+    # -------- Prefill por ?reuse_tutor=ID + generar NONCE en GET --------
+    reuse_tutor_id = request.args.get('reuse_tutor', type=int)
+
+    if request.method == 'GET':
+        # Nonce idempotente para este render
+        session['reg_te_nonce'] = str(uuid4())
+
+        if reuse_tutor_id:
+            t = Tutor.query.get(reuse_tutor_id)
+            if t:
+                # Prefill visual del tutor
+                tutor_form.nombre.data            = t.Tutor_Nombre
+                tutor_form.apellido_paterno.data  = t.Tutor_ApellidoP
+                tutor_form.apellido_materno.data  = t.Tutor_ApellidoM
+                tutor_form.celular.data           = t.Tutor_Celular
+                tutor_form.edad.data              = t.Tutor_Edad
+                tutor_form.parentesco.data        = t.Tutor_Parentesco
+                tutor_form.correo.data            = t.Tutor_Correo
+                tutor_form.ocupacion.data         = t.Tutor_Ocupacion
+                tutor_form.facebook.data          = t.Tutor_Facebook
+                tutor_form.instagram.data         = t.Tutor_Instagram
+                tutor_form.direccion.data         = t.Tutor_Direccion
+                tutor_form.medio_entero.data      = t.Tutor_Medio_Entero
+
+        return render_template(
+            'registro_tutor_estudiante.html',
+            tutor_form=tutor_form,
+            form=est_form,
+            reuse_tutor_id=reuse_tutor_id,
+            reg_te_nonce=session.get('reg_te_nonce')
+        )
+
+    # ===================== POST =====================
+    # Idempotencia: valida NONCE
+    posted_nonce = request.form.get('reg_te_nonce')
+    last_used = session.get('reg_te_last_used_nonce')
+
+    if not posted_nonce:
+        flash('Solicitud inválida. Refresca la página e inténtalo de nuevo.', 'warning')
+        return redirect(url_for('registro_tutor_estudiante'))
+
+    if posted_nonce == last_used:
+        # Ya se procesó este formulario
+        flash('Este formulario ya fue procesado.', 'info')
+        return redirect(url_for('consulta_estudiantes'))
+
+    # Reconstituye los forms desde request.form (mantén los prefijos)
+    tutor_form = TutorForm(request.form, prefix='tutor')
+    est_form   = EstudianteForm(request.form, prefix='est')
+
+    action = request.form.get('action')  # 'save' | 'save_and_new_student'
+    posted_reuse_id = request.form.get('reuse_tutor_id', type=int)
+
+    # ---- Normaliza selects (WTForms 3 no tolera choices=None) ----
+    def _ensure_select_choices(form):
+        try:
+            for f in form:
+                if hasattr(f, 'choices') and f.choices is None:
+                    f.choices = []
+        except Exception:
+            pass
+
+    _ensure_select_choices(tutor_form)
+    _ensure_select_choices(est_form)
+
+    # ---- Neutraliza est.tutor_id para esta vista (NO usamos ese field aquí) ----
+    if hasattr(est_form, 'tutor_id'):
+        try:
+            est_form.tutor_id.validators = []           # quita DataRequired
+            est_form.tutor_id.flags.required = False
+            est_form.tutor_id.validate_choice = False   # evita "Not a valid choice"
+            if getattr(est_form.tutor_id, 'choices', None) is None:
+                est_form.tutor_id.choices = []
+            # si vienes reutilizando tutor, setea el value (no se usa, pero evita rarezas)
+            if posted_reuse_id:
+                est_form.tutor_id.data = posted_reuse_id
+            else:
+                if est_form.tutor_id.data in (None, '', 'None'):
+                    est_form.tutor_id.data = None
+        except Exception:
+            pass
+
+    # Validación: si reutilizas tutor, no validamos sus campos
+    ok_tutor = tutor_form.validate() if not posted_reuse_id else True
+    ok_est   = est_form.validate()
+
+    if not (ok_tutor and ok_est):
+        # Loggea errores; ignora tutor si se reutiliza
+        if not posted_reuse_id:
+            for field, errs in (tutor_form.errors or {}).items():
+                try:
+                    label_txt = getattr(tutor_form, field).label.text
+                except Exception:
+                    label_txt = field
+                for e in errs:
+                    current_app.logger.warning(f"Tutor - {label_txt}: {e}")
+
+        for field, errs in (est_form.errors or {}).items():
+            if field == 'tutor_id':
+                continue
+            try:
+                label_txt = getattr(est_form, field).label.text
+            except Exception:
+                label_txt = field
+            for e in errs:
+                current_app.logger.warning(f"Estudiante - {label_txt}: {e}")
+
+        flash('Por favor corrige los errores indicados.', 'warning')
+        # Genera un nuevo nonce para el re-render (evita que el usuario se quede sin nonce)
+        session['reg_te_nonce'] = str(uuid4())
+        return render_template(
+            'registro_tutor_estudiante.html',
+            tutor_form=tutor_form,
+            form=est_form,
+            reuse_tutor_id=reuse_tutor_id,
+            reg_te_nonce=session.get('reg_te_nonce')
+        )
+
+    # ===== Guardado =====
+    try:
+        # ---------- A) Tutor: crear o reutilizar + anti-duplicado ----------
+        if posted_reuse_id:
+            nuevo_tutor = Tutor.query.get(posted_reuse_id)
+            if not nuevo_tutor:
+                flash('No se encontró el tutor a reutilizar.', 'danger')
+                return redirect(url_for('registro_tutor_estudiante'))
+        else:
+            # Anti-duplicado de Tutor por celular/correo si existen
+            candidato = None
+            cel = (tutor_form.celular.data or '').strip()
+            cor = (tutor_form.correo.data or '').strip()
+
+            if cel:
+                candidato = Tutor.query.filter(func.trim(Tutor.Tutor_Celular) == cel).first()
+            if not candidato and cor:
+                candidato = Tutor.query.filter(func.lower(func.trim(Tutor.Tutor_Correo)) == cor.lower()).first()
+
+            if candidato:
+                nuevo_tutor = candidato
+            else:
+                nuevo_tutor = Tutor(
+                    Tutor_Nombre=tutor_form.nombre.data,
+                    Tutor_ApellidoP=tutor_form.apellido_paterno.data,
+                    Tutor_ApellidoM=tutor_form.apellido_materno.data,
+                    Tutor_Celular=tutor_form.celular.data,
+                    Tutor_Edad=tutor_form.edad.data,
+                    Tutor_Parentesco=tutor_form.parentesco.data,
+                    Tutor_Correo=tutor_form.correo.data,
+                    Tutor_Ocupacion=tutor_form.ocupacion.data,
+                    Tutor_Facebook=tutor_form.facebook.data,
+                    Tutor_Instagram=tutor_form.instagram.data,
+                    Tutor_Direccion=tutor_form.direccion.data,
+                    Tutor_Medio_Entero=tutor_form.medio_entero.data
+                )
+                db.session.add(nuevo_tutor)
+                db.session.flush()  # obtiene Tutor_ID
+
+        # ---------- B) Condiciones de salud ----------
+        condiciones = {}
+        for campo in ['pie_plano', 'escoliosis', 'genu_varo', 'genu_valgo',
+                      'desviacion_cadera', 'asma', 'psicopatologias']:
+            try:
+                if getattr(est_form, campo).data:
+                    condiciones[campo] = True
+            except Exception:
+                pass
+        if getattr(est_form, 'otras_condiciones', None) and est_form.otras_condiciones.data:
+            condiciones['otras'] = est_form.otras_condiciones.data
+
+        # ---------- C) Reingreso ----------
+        fecha_reingreso = None
+        nota_reingreso  = None
+        try:
+            if getattr(est_form, 'marcar_reingreso', None) and est_form.marcar_reingreso.data:
+                fecha_reingreso = est_form.fecha_reingreso.data or date.today()
+                nota_reingreso  = (est_form.nota_reingreso.data or '').strip() or None
+        except Exception:
+            pass
+
+        # ---------- D) Anti-duplicado Estudiante en ventana corta ----------
+        ventana = datetime.utcnow() - timedelta(minutes=5)
+        ya_existe = (Estudiante.query
+            .filter(
+                func.lower(func.trim(Estudiante.Est_Nombre))    == (est_form.nombre.data or '').strip().lower(),
+                func.lower(func.trim(Estudiante.Est_ApellidoP)) == (est_form.apellido_paterno.data or '').strip().lower(),
+                func.lower(func.coalesce(func.trim(Estudiante.Est_ApellidoM), '')) ==
+                    (est_form.apellido_materno.data or '').strip().lower(),
+                Estudiante.Est_FechaNac == est_form.fecha_nacimiento.data,
+                Estudiante.Tutor_ID == nuevo_tutor.Tutor_ID,
+                Estudiante.Est_FechaIngreso >= ventana
+            ).first())
+
+        if ya_existe:
+            nuevo_estudiante = ya_existe
+        else:
+            nuevo_estudiante = Estudiante(
+                Est_Nombre=est_form.nombre.data,
+                Est_ApellidoP=est_form.apellido_paterno.data,
+                Est_ApellidoM=est_form.apellido_materno.data,
+                Est_FechaNac=est_form.fecha_nacimiento.data,
+                Est_Sexo=est_form.sexo.data,
+                Tutor_ID=nuevo_tutor.Tutor_ID,
+                Est_LugarNac=est_form.lugar_nacimiento.data,
+                Est_GradoEscolar=est_form.grado_escolar.data,
+                Est_FechaIngreso=est_form.fecha_ingreso.data or datetime.utcnow(),
+                Est_Colegio=est_form.colegio.data,
+                Est_OtrasDisciplinas=est_form.otras_disciplinas.data,
+                Est_MotivoIngreso=est_form.motivo_ingreso.data,
+                Est_Status=est_form.status.data,
+                Est_CondicionSalud=json.dumps(condiciones) if condiciones else None,
+                Est_Alergias=getattr(est_form, 'alergias', None).data if hasattr(est_form, 'alergias') else None,
+                Est_Medicamentos=getattr(est_form, 'medicamentos', None).data if hasattr(est_form, 'medicamentos') else None,
+                Est_FechaReingreso=fecha_reingreso,
+                Est_Reingreso_Nota=nota_reingreso
+            )
+            db.session.add(nuevo_estudiante)
+            db.session.flush()  # Est_ID
+
+        # ---------- E) Grupos ----------
+        try:
+            if hasattr(est_form, 'grupos') and hasattr(est_form, 'grupos_disponibles'):
+                seleccionados = []
+                for idx, entrada in enumerate(est_form.grupos.entries):
+                    if entrada.data is True and idx < len(est_form.grupos_disponibles):
+                        seleccionados.append(est_form.grupos_disponibles[idx])
+                nuevo_estudiante.grupos = seleccionados
+        except Exception as e:
+            current_app.logger.warning(f"No se pudieron asignar grupos: {e}")
+
+        # ---------- F) Contactos ----------
+        cp_data = est_form.contacto_principal.data if hasattr(est_form, 'contacto_principal') else {}
+        cp_nombre = (cp_data.get('nombre') or '').strip()
+        cp_ap     = (cp_data.get('apellido_paterno') or '').strip()
+        cp_tel    = (cp_data.get('telefono') or '').strip()
+        if not (cp_nombre and cp_ap and cp_tel):
+            raise ValueError("El contacto principal requiere nombre, apellido paterno y teléfono.")
+
+        db.session.add(ContactoEmergencia(
+            Est_ID=nuevo_estudiante.Est_ID,
+            Contacto_Nombre=cp_nombre,
+            Contacto_ApellidoP=cp_ap,
+            Contacto_ApellidoM=(cp_data.get('apellido_materno') or '').strip(),
+            Contacto_Telefono=cp_tel,
+            Contacto_Parentesco=(cp_data.get('parentesco') or '').strip()
+        ))
+
+        usar_sec = (request.form.get('est-usar_contacto_secundario') == '1')
+        if usar_sec and hasattr(est_form, 'contacto_secundario'):
+            cs = est_form.contacto_secundario.data
+            if cs and (cs.get('nombre') or '').strip():
+                db.session.add(ContactoEmergencia(
+                    Est_ID=nuevo_estudiante.Est_ID,
+                    Contacto_Nombre=(cs.get('nombre') or '').strip(),
+                    Contacto_ApellidoP=(cs.get('apellido_paterno') or '').strip(),
+                    Contacto_ApellidoM=(cs.get('apellido_materno') or '').strip(),
+                    Contacto_Telefono=(cs.get('telefono') or '').strip(),
+                    Contacto_Parentesco=(cs.get('parentesco') or '').strip()
+                ))
+
+        # Commit y marca nonce como usado
+        db.session.commit()
+        session['reg_te_last_used_nonce'] = posted_nonce
+        session.pop('reg_te_nonce', None)
+
+        # Redirecciones
+        if action == 'save_and_new_student':
+            flash('Estudiante registrado. Puedes capturar otro para el mismo tutor.', 'success')
+            reuse_id = posted_reuse_id or nuevo_tutor.Tutor_ID
+            return redirect(url_for('registro_tutor_estudiante', reuse_tutor=reuse_id))
+        else:
+            flash('Tutor y Estudiante registrados exitosamente.', 'success')
+            return redirect(url_for('consulta_estudiantes'))
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Error en registro tutor-estudiante")
+        flash(f'Error al registrar: {str(e)}', 'danger')
+        # Genera nuevo nonce para reintento
+        session['reg_te_nonce'] = str(uuid4())
+        return render_template(
+            'registro_tutor_estudiante.html',
+            tutor_form=tutor_form,
+            form=est_form,
+            reuse_tutor_id=reuse_tutor_id,
+            reg_te_nonce=session.get('reg_te_nonce')
+        )
+
+
+
+# --------------------------------------------------
+# Importación masiva (CSV) de estudiantes con tutor
+# --------------------------------------------------
+@bp.route('/estudiantes/importar', methods=['GET', 'POST'])
+def importar_estudiantes_csv():
+    """
+    Sube un CSV (mismas columnas que `flask estudiantes-importar`, ver importacion_utils).
+    validar=1 solo revisa; reporte=csv descarga el resultado por fila en vez de la pantalla.
+    """
+    if request.method == 'GET':
+        return render_template('importar_estudiantes.html', columnas=COLUMNAS_IMPORTACION,
+                               requeridas=REQUERIDAS_IMPORTACION, resultado=None)
+
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        flash('Selecciona un archivo CSV.', 'warning')
+        return redirect(url_for('importar_estudiantes_csv'))
+
+    validar = request.form.get('validar') in ('1', 'on', 'true')
+    try:
+        stream = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+        resultado = importar_estudiantes(leer_csv(stream), validar_solo=validar)
+    except (ValueError, UnicodeDecodeError) as e:
+        flash(f'No se pudo leer el archivo: {e}', 'danger')
+        return redirect(url_for('importar_estudiantes_csv'))
+
+    r = resultado['resumen']
+    flash(f"{'Validación' if validar else 'Importación'}: {r['ok']} ok · {r['omitido']} omitida(s) · "
+          f"{r['error']} con error.", 'success' if not r['error'] else 'warning')
+    if request.form.get('reporte') == 'csv':
+        return respuesta_exportacion('importacion_estudiantes', 'csv', ENCABEZADOS_REPORTE,
+                                     filas_reporte(resultado))
+    return render_template('importar_estudiantes.html', columnas=COLUMNAS_IMPORTACION,
+                           requeridas=REQUERIDAS_IMPORTACION, resultado=resultado,
+                           errores=[f for f in resultado['filas'] if f['estado'] != 'ok'])
+
+
+
+
+# --------------------------------------------------
+# Artículos
+# --------------------------------------------------
+
+## Agregar articulos
+##----------------------------------------
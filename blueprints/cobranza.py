@@ -0,0 +1,1460 @@
+# blueprints/cobranza.py
+"""Conceptos de pago, abonos, planes de cobro y su liquidación."""
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify,
+)
+import json, traceback, hashlib
+from extensions import db
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import joinedload, selectinload, aliased
+from billing_utils import (
+    money, normalize_method, requires_reference, conditions_set, compute_full_net, sum_money,
+)
+from plan_utils import (
+    get_or_create_plans, find_open_plans, registrar_abono, liquidar_plan, revertir_abono,
+    ESTADO_ABIERTO,
+)
+from report_utils import encode_cursor, decode_cursor
+from resumen_utils import aportes_resumen, ajustar_resumen
+from catalogo_utils import catalogo_ventas
+from idempotencia_utils import reservar_clave, TTL_FORM, TTL_PAYLOAD
+from busqueda_utils import choices_cliente
+from export_utils import respuesta_exportacion, formato_disponible, LOTE_EXPORTACION
+from models import Estudiante, Instructor, Pago, Venta, venta_pago, Abono, PlanCobro
+from forms import VentaForm, PagoForm
+try:
+    from models import VentaCobro  # tabla opcional (no todas las instalaciones la tienen)
+except ImportError:
+    VentaCobro = None
+
+bp = Blueprint('cobranza', __name__)
+
+# --------------------------------------------------
+# Pagos
+# --------------------------------------------------
+
+## Agregar Pagos
+##----------------------------------------
+@bp.route('/registro_pago', methods=['GET', 'POST'])
+def registro_pago():
+    form = PagoForm()
+    if form.validate_on_submit():
+        try:
+            # Descuento
+            condiciones = []
+            if form.aplicar_descuento.data:
+                if form.condicion_efectivo.data: condiciones.append('efectivo')
+                if form.condicion_tarjeta.data: condiciones.append('tarjeta')
+                if form.condicion_transferencia.data: condiciones.append('transferencia')
+                if form.condicion_deposito.data: condiciones.append('deposito')
+
+            # Recargo
+            tiene_recargo = bool(getattr(form, 'aplicar_recargo', False) and form.aplicar_recargo.data)
+            recargo_pct = form.porcentaje_recargo.data if tiene_recargo else None
+            recargo_dia_mes = form.recargo_dia_mes.data if (tiene_recargo and form.es_mensual.data) else None
+            recargo_fecha = form.recargo_fecha.data if (tiene_recargo and not form.es_mensual.data) else None
+
+            # Expiración (solo pagos únicos)
+            tiene_expiracion = bool(form.aplicar_expiracion.data)
+            expira_fecha = form.expira_fecha.data if (tiene_expiracion and not form.es_mensual.data) else None
+
+            nuevo_pago = Pago(
+                Pago_Monto=form.monto.data,
+                Pago_Tipo=form.tipo_pago.data.strip(),
+
+                # Periodicidad
+                Pago_Es_Mensual=form.es_mensual.data,
+
+                # Descuento
+                Pago_Descuento_Tipo=(form.nombre_descuento.data if form.aplicar_descuento.data else None),
+                Pago_Descuento_Porcentaje=(form.porcentaje_descuento.data if form.aplicar_descuento.data else None),
+                Pago_Condiciones=(json.dumps(condiciones) if condiciones else None),
+                # Válido hasta solo si NO es mensual
+                Pago_Restricciones_Fecha=(form.restricciones_fecha.data
+                                          if form.aplicar_descuento.data and not form.es_mensual.data else None),
+
+                # Recargo
+                Pago_Tiene_Recargo=tiene_recargo,
+                Pago_Recargo_Porcentaje=recargo_pct,
+                Pago_Recargo_DiaMes=recargo_dia_mes,
+                Pago_Recargo_Fecha=recargo_fecha,
+
+                # Expiración (pagos únicos)
+                Pago_Tiene_Expiracion=tiene_expiracion,
+                Pago_Expira_Fecha=expira_fecha,
+
+                Est_ID=None
+            )
+
+            db.session.add(nuevo_pago)
+            db.session.commit()
+            flash('✅ Pago registrado exitosamente!', 'success')
+            return redirect(url_for('index'))
+
+        except IntegrityError:
+            db.session.rollback()
+            flash('❌ Error: Problema con la base de datos. Contacte al administrador.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'❌ Error inesperado: {str(e)}', 'danger')
+
+    return render_template('registro_pago.html', form=form)
+
+
+
+# -------------------------------
+# CONSULTA DE PAGOS
+# -------------------------------
+@bp.route('/consulta_pagos', methods=['GET'])
+def consulta_pagos():
+
+    # Parámetros de búsqueda y ordenamiento
+    busqueda = request.args.get('busqueda', '').strip()
+    orden = request.args.get('orden', 'fecha')
+    direccion = request.args.get('dir', 'desc')
+
+    # Construir consulta base
+    query = Pago.query
+
+    # Aplicar filtro de búsqueda (tipo, descuento, condiciones, periodicidad, recargo, expiración)
+    if busqueda:
+        b = busqueda.lower()
+
+        # Texto libre (en tipo/desc/condiciones)
+        query = query.filter(
+            or_(
+                Pago.Pago_Tipo.ilike(f'%{busqueda}%'),
+                Pago.Pago_Descuento_Tipo.ilike(f'%{busqueda}%'),
+                Pago.Pago_Condiciones.ilike(f'%{busqueda}%')
+            )
+        )
+
+        # Periodicidad
+        if 'mensual' in b:
+            query = query.filter(Pago.Pago_Es_Mensual.is_(True))
+        elif 'unico' in b or 'único' in b:
+            query = query.filter(Pago.Pago_Es_Mensual.is_(False))
+
+        # Recargo: "recargo" => con recargo; "sin recargo"/"no recargo" => sin recargo
+        if 'recargo' in b:
+            if 'sin recargo' in b or 'no recargo' in b or 'sin' in b and 'recargo' in b:
+                query = query.filter(Pago.Pago_Tiene_Recargo.is_(False))
+            else:
+                query = query.filter(Pago.Pago_Tiene_Recargo.is_(True))
+
+        # Expiración (solo para pagos únicos)
+        today = date.today()
+        if 'expirado' in b:
+            query = query.filter(
+                Pago.Pago_Es_Mensual.is_(False),
+                Pago.Pago_Tiene_Expiracion.is_(True),
+                Pago.Pago_Expira_Fecha.isnot(None),
+                Pago.Pago_Expira_Fecha < today
+            )
+        elif 'vigente' in b:
+            query = query.filter(
+                Pago.Pago_Es_Mensual.is_(False),
+                Pago.Pago_Tiene_Expiracion.is_(True),
+                Pago.Pago_Expira_Fecha.isnot(None),
+                Pago.Pago_Expira_Fecha >= today
+            )
+        elif 'sin expiracion' in b or 'sin expiración' in b or 'no expiracion' in b or 'no expiración' in b:
+            query = query.filter(Pago.Pago_Tiene_Expiracion.is_(False))
+
+    # Ordenamiento
+    if orden == 'tipo':
+        order_field = Pago.Pago_Tipo
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    elif orden == 'descuento':
+        order_field = Pago.Pago_Descuento_Tipo
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    elif orden == 'condiciones':
+        order_field = Pago.Pago_Condiciones
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    elif orden == 'validez':
+        order_field = Pago.Pago_Restricciones_Fecha
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    elif orden == 'periodicidad':
+        order_field = Pago.Pago_Es_Mensual
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    elif orden == 'recargo':
+        # Primero por si tiene recargo, luego por porcentaje
+        if direccion == 'desc':
+            query = query.order_by(Pago.Pago_Tiene_Recargo.desc(), Pago.Pago_Recargo_Porcentaje.desc())
+        else:
+            query = query.order_by(Pago.Pago_Tiene_Recargo.asc(), Pago.Pago_Recargo_Porcentaje.asc())
+    elif orden == 'expira':
+        order_field = Pago.Pago_Expira_Fecha
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+    else:  # fecha (por defecto)
+        order_field = Pago.Pago_Fecha
+        query = query.order_by(order_field.desc() if direccion == 'desc' else order_field.asc())
+
+    pagos = query.all()
+
+    return render_template(
+        'consulta_pagos.html',
+        pagos=pagos,
+        busqueda=busqueda,
+        orden=orden,
+        direccion=direccion
+    )
+
+
+
+# -------------------------------
+# EDITAR PAGO
+# -------------------------------
+@bp.route('/editar_pago/<int:id>', methods=['GET', 'POST'])
+def editar_pago(id):
+    pago = Pago.query.get_or_404(id)
+    form = PagoForm()
+
+    # Cargar datos existentes al formulario
+    if request.method == 'GET':
+        form.tipo_pago.data = pago.Pago_Tipo
+        form.monto.data = float(pago.Pago_Monto)
+
+        # Periodicidad
+        form.es_mensual.data = bool(pago.Pago_Es_Mensual)
+
+        # Descuento
+        if pago.Pago_Descuento_Tipo:
+            form.aplicar_descuento.data = True
+            form.nombre_descuento.data = pago.Pago_Descuento_Tipo
+            form.porcentaje_descuento.data = (
+                float(pago.Pago_Descuento_Porcentaje)
+                if pago.Pago_Descuento_Porcentaje is not None else None
+            )
+
+            # Condiciones
+            if pago.Pago_Condiciones:
+                condiciones_l = conditions_set(pago.Pago_Condiciones)
+                form.condicion_efectivo.data = 'efectivo' in condiciones_l
+                form.condicion_tarjeta.data = 'tarjeta' in condiciones_l
+                form.condicion_transferencia.data = 'transferencia' in condiciones_l
+                form.condicion_deposito.data = 'deposito' in condiciones_l
+
+            # Fecha de restricción (solo si NO es mensual)
+            form.restricciones_fecha.data = (pago.Pago_Restricciones_Fecha
+                                             if not pago.Pago_Es_Mensual else None)
+
+        # Recargo
+        form.aplicar_recargo.data = bool(pago.Pago_Tiene_Recargo)
+        form.porcentaje_recargo.data = (
+            float(pago.Pago_Recargo_Porcentaje)
+            if pago.Pago_Recargo_Porcentaje is not None else None
+        )
+
+        if pago.Pago_Es_Mensual:
+            form.recargo_dia_mes.data = pago.Pago_Recargo_DiaMes
+            form.recargo_fecha.data = None
+        else:
+            form.recargo_dia_mes.data = None
+            form.recargo_fecha.data = pago.Pago_Recargo_Fecha
+
+        # Expiración (solo si NO es mensual)
+        form.aplicar_expiracion.data = bool(pago.Pago_Tiene_Expiracion) and not pago.Pago_Es_Mensual
+        form.expira_fecha.data = (pago.Pago_Expira_Fecha if (not pago.Pago_Es_Mensual and pago.Pago_Tiene_Expiracion) else None)
+
+    if form.validate_on_submit():
+        try:
+            # Monto/descuento cambian los totales de las ventas ya ligadas a este pago:
+            # su aporte al resumen se toma antes de tocar el pago
+            ventas_ligadas = [vid for (vid,) in db.session.query(venta_pago.c.venta_id)
+                              .filter(venta_pago.c.pago_id == pago.Pago_ID).all()]
+            antes_resumen = aportes_resumen(ventas_ligadas)
+
+            # Básicos
+            pago.Pago_Tipo = form.tipo_pago.data.strip()
+            pago.Pago_Monto = form.monto.data
+            pago.Pago_Es_Mensual = bool(form.es_mensual.data)
+
+            # Descuento
+            if form.aplicar_descuento.data:
+                pago.Pago_Descuento_Tipo = form.nombre_descuento.data
+                pago.Pago_Descuento_Porcentaje = form.porcentaje_descuento.data
+
+                condiciones = []
+                if form.condicion_efectivo.data: condiciones.append('efectivo')
+                if form.condicion_tarjeta.data: condiciones.append('tarjeta')
+                if form.condicion_transferencia.data: condiciones.append('transferencia')
+                if form.condicion_deposito.data: condiciones.append('deposito')
+                pago.Pago_Condiciones = json.dumps(condiciones) if condiciones else None
+
+                # Válido hasta: solo si NO es mensual
+                pago.Pago_Restricciones_Fecha = (
+                    form.restricciones_fecha.data if not form.es_mensual.data else None
+                )
+            else:
+                pago.Pago_Descuento_Tipo = None
+                pago.Pago_Descuento_Porcentaje = None
+                pago.Pago_Condiciones = None
+                pago.Pago_Restricciones_Fecha = None
+
+            # Recargo
+            if form.aplicar_recargo.data:
+                pago.Pago_Tiene_Recargo = True
+                pago.Pago_Recargo_Porcentaje = form.porcentaje_recargo.data
+
+                if form.es_mensual.data:
+                    pago.Pago_Recargo_DiaMes = form.recargo_dia_mes.data
+                    pago.Pago_Recargo_Fecha = None
+                else:
+                    pago.Pago_Recargo_Fecha = form.recargo_fecha.data
+                    pago.Pago_Recargo_DiaMes = None
+            else:
+                pago.Pago_Tiene_Recargo = False
+                pago.Pago_Recargo_Porcentaje = None
+                pago.Pago_Recargo_DiaMes = None
+                pago.Pago_Recargo_Fecha = None
+
+            # Expiración (solo pagos únicos)
+            if form.aplicar_expiracion.data and not form.es_mensual.data:
+                pago.Pago_Tiene_Expiracion = True
+                pago.Pago_Expira_Fecha = form.expira_fecha.data
+            else:
+                pago.Pago_Tiene_Expiracion = False
+                pago.Pago_Expira_Fecha = None
+
+            ajustar_resumen(ventas_ligadas, antes_resumen)
+
+            db.session.commit()
+            flash('✅ Pago actualizado exitosamente!', 'success')
+            return redirect(url_for('consulta_pagos'))
+
+        except Exception as e:
+            db.session.rollback()
+            flash(f'❌ Error al actualizar el pago: {str(e)}', 'danger')
+
+    return render_template('editar_pago.html', form=form, pago=pago)
+
+## Eliminar pago
+##----------------------------------------
+@bp.route('/eliminar_pago/<int:id>', methods=['POST'])
+def eliminar_pago(id):
+    pago = Pago.query.get_or_404(id)
+    try:
+        # Las ventas ligadas pierden este pago (y su descuento): se ajusta su aporte al resumen
+        ventas_ligadas = [vid for (vid,) in db.session.query(venta_pago.c.venta_id)
+                          .filter(venta_pago.c.pago_id == pago.Pago_ID).all()]
+        antes_resumen = aportes_resumen(ventas_ligadas)
+        db.session.delete(pago)
+        ajustar_resumen(ventas_ligadas, antes_resumen)
+        db.session.commit()
+        flash('✅ Pago eliminado exitosamente!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error al eliminar el pago: {str(e)}', 'danger')
+    return redirect(url_for('consulta_pagos'))
+
+
+##----------------------------------------
+## Venta
+##----------------------------------------
+
+
+# ----------------------------------------
+# Registrar venta
+# ----------------------------------------
+
+## Registro abonos
+@bp.route('/registro/abonos', methods=['GET', 'POST'])
+def registro_abonos():
+
+    # ===== Helpers utilitarios (locales, solo formateo/compatibilidad) =====
+    def _to_float(x, default=0.0) -> float:
+        if x is None:
+            return float(default)
+        try:
+            if isinstance(x, Decimal):
+                return float(x)
+            return float(x)
+        except Exception:
+            return float(default)
+
+    # 🧱 Helper DEDUP: key determinística
+    def _make_idempotency_key(est_id, metodo_norm, referencia_val, cobro_pendiente, pagos_items, planes_movs):
+        """
+        Crea un hash reproducible del payload funcional para detectar reintentos.
+        Ordena dicts y listas para que sea estable.
+        """
+        payload = {
+            "est_id": int(est_id) if est_id else None,
+            "metodo_norm": (metodo_norm or "").lower(),
+            "referencia": (referencia_val or "").strip() if referencia_val else None,
+            "pendiente": bool(cobro_pendiente),
+            # Normalizamos la lista de items para que el orden no importe
+            "pagos": sorted([
+                {
+                    "pago_id": int(i["pago_id"]),
+                    "qty": int(i["qty"]),
+                    "unit": float(i["unit"]),
+                    "subtotal_catalogo": float(i["subtotal_catalogo"]),
+                    "charge_now": float(i["charge_now"]),
+                    "is_partial": bool(i["is_partial"]),
+                    # full_breakdown afecta el neto; guardamos solo el neto para el hash
+                    "neto_full": float(i["full_breakdown"].get("neto", 0.0))
+                }
+                for i in pagos_items
+            ], key=lambda x: (x["pago_id"], x["qty"], x["charge_now"], x["is_partial"], x["neto_full"])),
+            "planes": sorted([
+                {
+                    "plan_id": int(m["plan_id"]),
+                    "accion": (m["accion"] or "").lower(),
+                    "monto": float(m["monto"])
+                }
+                for m in planes_movs
+            ], key=lambda x: (x["plan_id"], x["accion"], x["monto"])),
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ====== Form ======
+    form = VentaForm()
+    if request.method == 'POST':
+        form.process(request.form)
+
+    # === Catálogos (snapshot compartido; se reconstruye solo si cambió la versión) ===
+    cat = catalogo_ventas(existencias=False)  # abonos no muestran artículos
+    pagos_dict = cat['pagos_dict_abonos']
+
+    # === Clientes: se buscan por typeahead (/api/clientes/buscar); aquí solo el seleccionado ===
+    form.estudiante_id.choices = choices_cliente('estudiante', form.estudiante_id.data)
+    form.instructor_id.choices = choices_cliente('instructor', form.instructor_id.data)
+    estudiantes = Estudiante.query.filter(Estudiante.Est_ID == (form.estudiante_id.data or 0)).all()
+    instructores = Instructor.query.filter(Instructor.Instructor_ID == (form.instructor_id.data or 0)).all()
+    if hasattr(form, 'pagos'):
+        form.pagos.choices = cat['pago_choices']
+
+    # === Pendientes (ventas sin cobro aplicado) ===
+    pend_rows = (Venta.query
+                 .options(
+                     joinedload(Venta.estudiante),
+                     joinedload(Venta.instructor),
+                     selectinload(Venta.pagos)
+                 )
+                 .filter(
+                     or_(
+                         Venta.Metodo_Pago.is_(None),
+                         Venta.Metodo_Pago == '',
+                         func.lower(Venta.Metodo_Pago) == '__pendiente__',
+                         func.lower(Venta.Metodo_Pago) == 'pendiente'
+                     )
+                 )
+                 .order_by(Venta.Fecha_Venta.desc())
+                 .all())
+    pendientes = []
+    for v in pend_rows:
+        if getattr(v, 'Est_ID', None):
+            cliente_tipo = 'estudiante'
+            cliente_id = v.Est_ID
+            cliente_nombre = (f"{v.estudiante.Est_Nombre} {v.estudiante.Est_ApellidoP}"
+                              if getattr(v, 'estudiante', None) else '—')
+        elif getattr(v, 'Instructor_ID', None):
+            cliente_tipo = 'instructor'
+            cliente_id = v.Instructor_ID
+            cliente_nombre = (f"{v.instructor.Instructor_Nombre} {v.instructor.Instructor_ApellidoP}"
+                              if getattr(v, 'instructor', None) else '—')
+        else:
+            cliente_tipo = 'desconocido'
+            cliente_id = None
+            cliente_nombre = '—'
+
+        pagos_list = []
+        for p in getattr(v, 'pagos', []):
+            pagos_list.append({
+                "Pago_ID": p.Pago_ID,
+                "Descripcion": p.Pago_Tipo,
+                "Monto": _to_float(p.Pago_Monto, 0.0)
+            })
+
+        pendientes.append({
+            "Venta_ID": v.Venta_ID,
+            "Fecha_Venta": v.Fecha_Venta.isoformat() if v.Fecha_Venta else None,
+            "cliente_tipo": cliente_tipo,
+            "cliente_id": cliente_id,
+            "cliente_nombre": cliente_nombre,
+            "pagos": pagos_list,
+            "Metodo_Pago": v.Metodo_Pago
+        })
+
+    # === Banderas UI ===
+    error_flags = {
+        "cliente": False,
+        "pagos": False,
+        "abonos": False,
+        "metodo_pago": False,
+        "referencia": False,
+        "db": False,
+        "unexpected": False,
+    }
+
+    if request.method == 'POST':
+        try:
+            today = datetime.now().date()
+
+            # Anti-duplicados básico (si tu HTML ya manda form_id)
+            anti_dup_form_id = (request.form.get('form_id') or '').strip()
+
+            # Cliente (solo estudiante)
+            est_id = form.estudiante_id.data if form.estudiante_id.data is not None else None
+            if est_id is None or int(est_id) == 0:
+                error_flags["cliente"] = True
+                flash("Debe seleccionar un estudiante.", "danger")
+
+            # Cobro pendiente (PASO 9)
+            cobro_pendiente = (request.form.get('cobro_pendiente') is not None)
+
+            # Método de pago + referencia (si NO es pendiente)
+            metodo_crudo = (getattr(form, 'metodo_pago', None).data or "").strip() if hasattr(form, 'metodo_pago') else (request.form.get('metodo_pago','').strip())
+            metodo_norm = normalize_method(metodo_crudo)
+            referencia_val = (getattr(form, 'referencia_pago', None).data or "").strip() if hasattr(form, "referencia_pago") else (request.form.get('referencia_pago','').strip())
+
+            if not cobro_pendiente:
+                if not metodo_crudo:
+                    error_flags["metodo_pago"] = True
+                    flash("Debe seleccionar un método de pago.", "danger")
+                if metodo_crudo and requires_reference(metodo_norm) and not referencia_val:
+                    error_flags["referencia"] = True
+                    flash("La referencia es obligatoria para transferencia, tarjeta o depósito.", "danger")
+            else:
+                # PASO 9: normalización para pendiente
+                metodo_norm = "__pendiente__"
+                referencia_val = None
+
+            # === Parseo de pagos seleccionados (+ cantidades y parciales) ===
+            pagos_items = []
+            idx = 0
+            EPS = 1e-6  # NUEVO: tolerancia para comparaciones flotantes
+            while True:
+                pid = request.form.get(f'pagos-{idx}-id', None)
+                if pid is None:
+                    break
+                try:
+                    pid_int = int(pid)
+                except Exception:
+                    idx += 1
+                    continue
+
+                qty_raw = request.form.get(f'pagos-{idx}-qty', "1")
+                try:
+                    qty = max(int(qty_raw), 1)
+                except Exception:
+                    qty = 1
+
+                monto_parcial_raw = request.form.get(f'pagos-{idx}-monto-parcial', None)
+                is_full_flag = request.form.get(f'pagos-{idx}-full', None) is not None
+
+                meta = pagos_dict.get(pid_int, {})
+                unit = float(meta.get("monto", 0.0))
+                subtotal = unit * qty
+                subtotal = money(subtotal)  # NUEVO: redondeo contable
+
+                # --- Cálculo de NETO FULL (subtotal - descuento + recargo) ---
+                full_calc = compute_full_net(
+                    unit_price=unit,
+                    qty=qty,
+                    discount_pct=meta.get("descuento_porcentaje", 0.0),
+                    discount_methods=meta.get("condiciones", []),
+                    discount_valid_until=meta.get("valido_hasta"),
+                    surcharge_pct=meta.get("recargo_porcentaje", 0.0),
+                    surcharge_day_cut=meta.get("recargo_dia_corte", 0),
+                    method_norm=metodo_norm,
+                    today=today,
+                    surcharge_on="post_discount",
+                )
+                neto_full = money(full_calc["neto"])  # NUEVO
+
+                # --- PASO 6 + PASO 9: Reglas parcial vs full + pendiente ---
+                is_partial = False
+                charge_now = 0.0
+
+                if cobro_pendiente:
+                    # PASO 9: no se cobra nada hoy
+                    is_partial = False
+                    charge_now = 0.0
+                else:
+                    if (monto_parcial_raw is not None) and not is_full_flag:
+                        try:
+                            monto_parcial = float(monto_parcial_raw or 0)
+                        except Exception:
+                            monto_parcial = 0.0
+                        monto_parcial = money(monto_parcial)  # NUEVO
+
+                        if (monto_parcial + EPS) >= subtotal:
+                            # Parcial >= subtotal ⇒ FULL/NETO
+                            is_partial = False
+                            charge_now = neto_full
+                            flash("El monto parcial ingresado fue ≥ al subtotal del concepto: se procesó como pago completo con descuento/recargo aplicable.", "info")
+                        elif monto_parcial > 0:
+                            is_partial = True
+                            charge_now = max(0.0, min(subtotal, monto_parcial))
+                        else:
+                            is_partial = False
+                            charge_now = neto_full
+                    else:
+                        is_partial = False
+                        charge_now = neto_full
+
+                charge_now = money(charge_now)  # NUEVO: redondeo final del renglón
+
+                # NUEVO: Bloqueo de “céntimos fantasma” (0.01) por redondeos de UI
+                if 0 < charge_now < 0.02:
+                    charge_now = 0.0
+                    flash("El monto calculado resultó demasiado pequeño y se redondeó a $0.00 para evitar errores por centavos.", "warning")
+
+                pagos_items.append({
+                    "pago_id": pid_int,
+                    "qty": qty,
+                    "unit": unit,
+                    "subtotal_catalogo": money(subtotal),
+                    "charge_now": charge_now,
+                    "is_partial": bool(is_partial),
+                    "full_breakdown": {**full_calc, "neto": neto_full}  # NUEVO: neto ya redondeado
+                })
+                idx += 1
+
+            # === Movimientos de planes (PASO 9: monto a cero si pendiente) ===
+            planes_movs = []
+            idx = 0
+            while True:
+                pid = request.form.get(f'planes-{idx}-id', None)
+                if pid is None:
+                    break
+                accion = (request.form.get(f'planes-{idx}-accion', '') or '').strip().lower()
+                monto_raw = request.form.get(f'planes-{idx}-monto', '0')
+                try:
+                    monto_val = max(float(monto_raw or 0), 0.0)
+                except Exception:
+                    monto_val = 0.0
+                monto_val = money(monto_val)  # NUEVO
+                planes_movs.append({
+                    "plan_id": int(pid),
+                    "accion": accion,
+                    "monto": (0.0 if cobro_pendiente else monto_val)  # PASO 9 + NUEVO redondeo
+                })
+                idx += 1
+
+            if (len(pagos_items) == 0) and (len(planes_movs) == 0):
+                error_flags["pagos"] = True
+                error_flags["abonos"] = True
+                flash("Debe agregar al menos un pago o un movimiento de plan.", "danger")
+
+            if any([error_flags["cliente"], error_flags["pagos"], error_flags["abonos"],
+                    error_flags["metodo_pago"], error_flags["referencia"]]):
+                return render_template(
+                    'registro_abonos.html',
+                    form=form,
+                    estudiantes=estudiantes,
+                    instructores=instructores,
+                    pagos_dict=pagos_dict,
+                    error_flags=error_flags,
+                    tipo_cliente_seleccionado="estudiante",
+                    pendientes=pendientes,
+                    planes_abiertos=[],
+                )
+
+            # 🧱 DEDUP (tabla idempotency_key, misma transacción que la venta; vale entre workers)
+            # 1) form_id explícito desde el HTML
+            if anti_dup_form_id and not reservar_clave('abonos-form', anti_dup_form_id, ttl=TTL_FORM):
+                db.session.rollback()
+                flash('Este registro ya fue procesado (se evitó un duplicado).', 'info')
+                return redirect(url_for("consulta_ventas"))
+
+            # 2) idempotency key determinística del payload (reintentos sin form_id / doble pestaña)
+            idem_key = _make_idempotency_key(est_id, metodo_norm, referencia_val, cobro_pendiente, pagos_items, planes_movs)
+            if not reservar_clave('abonos-payload', idem_key, ttl=TTL_PAYLOAD):
+                db.session.rollback()  # descarta también la llave del form_id
+                flash('Este registro es idéntico a uno ya confirmado (se evitó un duplicado).', 'info')
+                return redirect(url_for("consulta_ventas"))
+
+            # === Crear venta ===
+            nueva_venta = Venta(
+                Est_ID=est_id,
+                Instructor_ID=None,
+                Metodo_Pago=metodo_norm,  # "__pendiente__" si PASO 9
+                Referencia_Pago=(referencia_val if (not cobro_pendiente and requires_reference(metodo_norm)) else None),
+                Fecha_Venta=datetime.now(),
+            )
+            # PASO 9: si tu modelo tiene 'Estado', márcala como pendiente
+            if cobro_pendiente and hasattr(nueva_venta, 'Estado'):
+                try:
+                    nueva_venta.Estado = 'pendiente'
+                except Exception:
+                    pass
+
+            # Conceptos de todas las líneas en una sola consulta
+            pagos_obj = ({p.Pago_ID: p for p in
+                          Pago.query.filter(Pago.Pago_ID.in_({i["pago_id"] for i in pagos_items})).all()}
+                         if pagos_items else {})
+
+            # Asociar pagos (conceptos) a la venta (solo referencia del concepto)
+            total_conceptos_catalogo = 0.0
+            for item in pagos_items:
+                p = pagos_obj.get(item["pago_id"])
+                if p:
+                    nueva_venta.pagos.append(p)
+                    total_conceptos_catalogo += _to_float(p.Pago_Monto, 0.0) * int(item["qty"])
+            total_conceptos_catalogo = money(total_conceptos_catalogo)  # NUEVO
+
+            # Totales a cobrar (informativo)
+            monto_cobrar_pagos = money(sum(i["charge_now"] for i in pagos_items))  # NUEVO
+            monto_cobrar_planes = money(sum(m["monto"] for m in planes_movs))      # NUEVO
+            _monto_cobrado_total = (0.0 if cobro_pendiente else money(monto_cobrar_pagos + monto_cobrar_planes))  # NUEVO
+
+            # Persistir venta para obtener Venta_ID
+            db.session.add(nueva_venta)
+            db.session.flush()
+
+            # === Planes de todas las líneas: consultas y alta por lote (no una por renglón) ===
+            items_ok = [i for i in pagos_items if i["pago_id"] in pagos_obj]
+            clave_item = {id(i): (est_id, 'pago', i["pago_id"]) for i in items_ok}
+            parciales = [i for i in items_ok if i["is_partial"]]
+            planes_parciales = get_or_create_plans([{
+                "est_id": est_id,
+                "pago_obj": pagos_obj[i["pago_id"]],
+                "qty": i["qty"],
+                "descripcion_resumen": None,
+                "aplicar_descuento_al_liquidar": True,
+            } for i in parciales]) if parciales else []
+            # Un plan recién creado solo "existe" a partir del primer parcial que lo abre: una
+            # línea FULL anterior del mismo concepto no lo ve (mismo orden que renglón por renglón)
+            planes_abiertos = {clave_item[id(i)]: pl for i, (pl, creado) in zip(parciales, planes_parciales) if not creado}
+            planes_nuevos = {clave_item[id(i)]: pl for i, (pl, creado) in zip(parciales, planes_parciales) if creado}
+            sin_resolver = set(clave_item.values()) - planes_abiertos.keys() - planes_nuevos.keys()
+            if sin_resolver:
+                planes_abiertos.update(find_open_plans(sin_resolver))
+
+            # === Persistencia por renglón (Planes/Abonos), en el orden capturado ===
+            for item in items_ok:
+                clave = clave_item[id(item)]
+                if item["is_partial"]:
+                    # PASO 9: no registrar abono si pendiente
+                    plan = planes_abiertos.setdefault(clave, planes_nuevos.get(clave))
+                    if item["charge_now"] > 0 and not cobro_pendiente:
+                        # NUEVO: tope por saldo_antes del plan (seguridad adicional)
+                        try:
+                            saldo_antes = float(getattr(plan, "Saldo_Actual", 0.0) or 0.0)
+                        except Exception:
+                            saldo_antes = 0.0
+                        monto_a_registrar = min(item["charge_now"], saldo_antes)
+                        monto_a_registrar = money(monto_a_registrar)
+                        if monto_a_registrar <= 0:
+                            continue
+                        registrar_abono(
+                            plan=plan,
+                            venta=nueva_venta,
+                            monto=monto_a_registrar,
+                            metodo_norm=metodo_norm,
+                            referencia=referencia_val,
+                            observaciones="Parcial de concepto",
+                            close_if_zero=False,
+                        )
+                else:
+                    plan = planes_abiertos.get(clave)
+                    if plan and not cobro_pendiente:
+                        neto_full_liq = money(float(item["full_breakdown"]["neto"] or 0.0))  # NUEVO
+                        liquidar_plan(
+                            plan=plan,
+                            venta=nueva_venta,
+                            neto_full=neto_full_liq,
+                            metodo_norm=metodo_norm,
+                            referencia=referencia_val,
+                            observaciones="Liquidación automática (full en registro)",
+                        )
+
+            # Movimientos desde modal de Planes (PASO 9: omitidos si pendiente)
+            planes_mov = ({pl.Plan_ID: pl for pl in
+                           PlanCobro.query.filter(PlanCobro.Plan_ID.in_({m["plan_id"] for m in planes_movs})).all()}
+                          if planes_movs else {})
+            for mov in planes_movs:
+                plan = planes_mov.get(mov["plan_id"])
+                if not plan:
+                    continue
+
+                accion = (mov.get("accion") or "").strip().lower()
+                if accion == "abonar":
+                    if mov.get("monto", 0.0) > 0 and not cobro_pendiente:
+                        # NUEVO: tope a saldo actual del plan
+                        try:
+                            saldo_antes = float(getattr(plan, "Saldo_Actual", 0.0) or 0.0)
+                        except Exception:
+                            saldo_antes = 0.0
+                        monto_a_registrar = min(money(float(mov["monto"])), saldo_antes)
+                        if monto_a_registrar <= 0:
+                            continue
+                        registrar_abono(
+                            plan=plan,
+                            venta=nueva_venta,
+                            monto=monto_a_registrar,
+                            metodo_norm=metodo_norm,
+                            referencia=referencia_val,
+                            observaciones="Abono manual (modal)",
+                            close_if_zero=True,
+                        )
+
+                elif accion == "liquidar" and not cobro_pendiente:
+                    pago_id = getattr(plan, "Pago_ID", None)
+                    if pago_id:
+                        meta = pagos_dict.get(pago_id, {})
+                        unit = float(meta.get("monto", 0.0))
+                        qty_guess = 1
+                        try:
+                            pb = float(getattr(plan, "Precio_Base_Snapshot", 0.0) or 0.0)
+                            mt = float(getattr(plan, "Monto_Total_Original", 0.0) or 0.0)
+                            if pb > 0.0:
+                                qty_guess = max(1, int(round(mt / pb)))
+                        except Exception:
+                            qty_guess = 1
+
+                        full_calc = compute_full_net(
+                            unit_price=unit,
+                            qty=qty_guess,
+                            discount_pct=meta.get("descuento_porcentaje", 0.0),
+                            discount_methods=meta.get("condiciones", []),
+                            discount_valid_until=meta.get("valido_hasta"),
+                            surcharge_pct=meta.get("recargo_porcentaje", 0.0),
+                            surcharge_day_cut=meta.get("recargo_dia_corte", 0),
+                            method_norm=metodo_norm,
+                            today=today,
+                            surcharge_on="post_discount",
+                        )
+                        neto_full = money(float(full_calc["neto"] or 0.0))  # NUEVO
+
+                        liquidar_plan(
+                            plan=plan,
+                            venta=nueva_venta,
+                            neto_full=neto_full,
+                            metodo_norm=metodo_norm,
+                            referencia=referencia_val,
+                            observaciones="Liquidación desde modal de planes",
+                        )
+                    else:
+                        saldo = money(float(getattr(plan, "Saldo_Actual", 0.0) or 0.0))  # NUEVO
+                        if saldo > 0.0 and not cobro_pendiente:
+                            registrar_abono(
+                                plan=plan,
+                                venta=nueva_venta,
+                                monto=saldo,
+                                metodo_norm=metodo_norm,
+                                referencia=referencia_val,
+                                observaciones="Liquidación por saldo (sin PAGO asociado)",
+                                close_if_zero=True,
+                            )
+
+            # Registro de cobro (si aplica) — PASO 9: NO crear si pendiente
+            if not cobro_pendiente and (monto_cobrar_pagos + monto_cobrar_planes) > 0 and VentaCobro:
+                try:
+                    cobro = VentaCobro(
+                        Venta_ID=nueva_venta.Venta_ID,
+                        Metodo=metodo_norm,
+                        Referencia=(referencia_val if requires_reference(metodo_norm) else None),
+                        Monto=money(monto_cobrar_pagos + monto_cobrar_planes),
+                        Fecha=datetime.now()
+                    )
+                    db.session.add(cobro)
+                except Exception as e:
+                    current_app.logger.error("Error creando VentaCobro: %s", e)
+                    current_app.logger.error(traceback.format_exc())
+
+            # Resumen diario (misma transacción)
+            ajustar_resumen([nueva_venta.Venta_ID])
+
+            # Commit final (incluye las llaves de idempotencia)
+            db.session.commit()
+
+            msg = "Registro guardado como PENDIENTE." if cobro_pendiente else "Abono(s)/pago(s) registrado(s) con éxito."
+            flash(msg, "success")
+            return redirect(url_for("consulta_ventas"))
+
+        except IntegrityError as e:
+            db.session.rollback()
+            current_app.logger.error("IntegrityError en /registro/abonos: %s", e)
+            current_app.logger.error(traceback.format_exc())
+            error_flags["db"] = True
+            flash("❌ Error de integridad en la base de datos. Verifique los datos e intente de nuevo.", "danger")
+            return render_template(
+                'registro_abonos.html',
+                form=form,
+                estudiantes=estudiantes,
+                instructores=instructores,
+                pagos_dict=pagos_dict,
+                error_flags=error_flags,
+                tipo_cliente_seleccionado="estudiante",
+                pendientes=pendientes,
+                planes_abiertos=[],
+            )
+        except Exception as e:
+            db.session.rollback()
+            # 🔎 Logging detallado: nombre de la excepción + traceback
+            current_app.logger.error("Error en /registro/abonos [%s]: %s", type(e).__name__, e)
+            current_app.logger.error(traceback.format_exc())
+            error_flags["unexpected"] = True
+            flash(f'❌ Error inesperado ({type(e).__name__}): {str(e)}', 'danger')
+            return render_template(
+                'registro_abonos.html',
+                form=form,
+                estudiantes=estudiantes,
+                instructores=instructores,
+                pagos_dict=pagos_dict,
+                error_flags=error_flags,
+                tipo_cliente_seleccionado="estudiante",
+                pendientes=pendientes,
+                planes_abiertos=[],
+            )
+
+    # === GET ===
+    # Paso 8: cargar planes abiertos si llega ?est_id=
+    planes_abiertos = []
+    try:
+        q_est_id = request.args.get('est_id')
+        if q_est_id:
+            q_est_id = int(q_est_id)
+            if q_est_id > 0:
+                planes_abiertos = (PlanCobro.query
+                                   .filter(PlanCobro.Est_ID == q_est_id,
+                                           PlanCobro.Estado == ESTADO_ABIERTO,
+                                           (PlanCobro.Saldo_Actual > 0))
+                                   .order_by(getattr(PlanCobro, 'Fecha_Creacion', PlanCobro.Plan_ID).desc())
+                                   .all())
+    except Exception:
+        planes_abiertos = []
+
+    return render_template(
+        'registro_abonos.html',
+        form=form,
+        estudiantes=estudiantes,
+        instructores=instructores,
+        pagos_dict=pagos_dict,
+        error_flags={
+            "cliente": False,
+            "pagos": False,
+            "abonos": False,
+            "metodo_pago": False,
+            "referencia": False,
+            "db": False,
+            "unexpected": False,
+        },
+        tipo_cliente_seleccionado="estudiante",
+        pendientes=pendientes,
+        planes_abiertos=planes_abiertos,  # 👈 ahora sí se envía al template
+    )
+
+
+
+########
+# Planes abiertos
+# === Nuevo endpoint ===
+@bp.route('/api/planes_abiertos')
+def api_planes_abiertos():
+    try:
+        est_id = int(request.args.get('est_id', '0'))
+    except Exception:
+        est_id = 0
+
+    if est_id <= 0:
+        return jsonify({"ok": False, "planes": [], "error": "est_id inválido"}), 400
+
+    planes = (PlanCobro.query
+              .filter(
+                  PlanCobro.Est_ID == est_id,
+                  PlanCobro.Estado == ESTADO_ABIERTO,
+                  (PlanCobro.Saldo_Actual.isnot(None)),
+                  (PlanCobro.Saldo_Actual > 0)
+              )
+              .order_by(PlanCobro.Fecha_Creacion.desc())
+              .all())
+
+    def _tipo_item(p):
+        if p.Articulo_ID is not None: return "articulo"
+        if p.Paquete_ID  is not None: return "paquete"
+        if p.Pago_ID     is not None: return "pago"
+        return "desconocido"
+
+    data = []
+    for p in planes:
+        data.append({
+            "plan_id": p.Plan_ID,
+            "tipo_item": _tipo_item(p),
+            "descripcion": p.Descripcion_Resumen,
+            "precio_base": float(p.Precio_Base_Snapshot or 0.0),
+            "total": float(p.Monto_Total_Original or 0.0),
+            "saldo": float(p.Saldo_Actual or 0.0),
+            "fecha_creacion": p.Fecha_Creacion.isoformat() if p.Fecha_Creacion else None,
+            "pago_id": p.Pago_ID,
+        })
+
+    return jsonify({"ok": True, "planes": data})
+
+##############
+## consulta abonos
+##################
+def _consulta_abonos_query():
+    """
+    Filtros de consulta_abonos (querystring) → (query de Abono_ID con joins a venta
+    y plan, filtros). Lo comparten la pantalla y la exportación.
+    """
+    # --------- Filtros (querystring) ---------
+    est_id   = request.args.get('estudiante_id', type=int)
+    est_id   = est_id if (est_id and est_id > 0) else None
+    metodo   = (request.args.get('metodo', '') or '').strip().lower()
+    f_desde  = (request.args.get('desde', '') or '').strip()
+    f_hasta  = (request.args.get('hasta', '') or '').strip()
+
+    # --------- Base query (solo columnas; sin joinedload) ---------
+    # Joins a-uno (outer) → no duplican filas, así count/sum no necesitan DISTINCT
+    V = aliased(Venta)
+    q = (db.session.query(Abono.Abono_ID)
+         .outerjoin(V, Abono.Venta_ID == V.Venta_ID)
+         .outerjoin(PlanCobro, PlanCobro.Plan_ID == Abono.Plan_ID))
+
+    # Fecha del abono: Fecha_Abono es NOT NULL (server_default), así el filtro y el
+    # orden usan ix_abono_fecha (en SQLite el índice ya incluye el rowid = Abono_ID)
+    fecha_expr = Abono.Fecha_Abono
+
+    # --------- Aplicar filtros ---------
+    if est_id:
+        q = q.filter(or_(
+            and_(Abono.Plan_ID.isnot(None), PlanCobro.Est_ID == est_id),
+            and_(Abono.Venta_ID.isnot(None), V.Est_ID == est_id)
+        ))
+
+    if metodo:
+        # método en Abono (lower) — si está vacío se muestra "—" en UI
+        q = q.filter(func.lower(func.coalesce(Abono.Metodo_Pago, '')) == metodo)
+
+    def _parse_date(s: str):
+        try:
+            return datetime.strptime(s, '%Y-%m-%d')
+        except Exception:
+            return None
+
+    dt_desde = _parse_date(f_desde)
+    dt_hasta = _parse_date(f_hasta)
+
+    if dt_desde:
+        # desde inclusivo (00:00)
+        q = q.filter(fecha_expr >= dt_desde.replace(hour=0, minute=0, second=0, microsecond=0))
+    if dt_hasta:
+        # hasta inclusivo -> < (hasta + 1 día)
+        end_exclusive = dt_hasta.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        q = q.filter(fecha_expr < end_exclusive)
+
+    filtros = {'estudiante_id': est_id, 'metodo': metodo, 'desde': f_desde, 'hasta': f_hasta}
+    return q, filtros
+
+
+@bp.route('/consulta/abonos')
+def consulta_abonos():
+    """
+    Consulta de Abonos/Recibos con:
+      - Filtros por estudiante, método, rango de fechas [desde, hasta] (hasta es inclusivo)
+      - Totales (global y por página); el global sale de un solo agregado SQL
+      - Paginación por cursor (Fecha_Abono, Abono_ID) desc; solo la página se hidrata
+      - Muestra Saldo_Antes, Monto_Abonado, Saldo_Despues, Método y Referencia
+    """
+    q, f = _consulta_abonos_query()
+    est_id, metodo, f_desde, f_hasta = f['estudiante_id'], f['metodo'], f['desde'], f['hasta']
+    fecha_expr = Abono.Fecha_Abono
+    per_page = max(1, min(200, request.args.get('per_page', default=25, type=int)))
+    cursor   = (request.args.get('cursor') or '').strip()
+
+    # Selector de estudiante por typeahead: solo se manda el filtrado actual
+    estudiantes = Estudiante.query.filter(Estudiante.Est_ID == est_id).all() if est_id else []
+
+    # --------- Conteo y total global (un solo agregado) ---------
+    total_registros, total_monto_global = q.with_entities(
+        func.count(Abono.Abono_ID),
+        func.coalesce(func.sum(Abono.Monto_Abonado), 0),
+    ).one()
+    total_registros = int(total_registros or 0)
+    total_monto_global = money(total_monto_global)
+
+    # --------- Página por cursor: per_page + 1 claves ---------
+    pos = decode_cursor(cursor)
+    if pos:
+        c_fecha, c_id = pos
+        q = q.filter(or_(
+            fecha_expr < c_fecha,
+            and_(fecha_expr == c_fecha, Abono.Abono_ID < c_id),
+        ))
+    claves = (q.with_entities(Abono.Abono_ID, fecha_expr)
+               .order_by(fecha_expr.desc(), Abono.Abono_ID.desc())
+               .limit(per_page + 1)
+               .all())
+    next_cursor = None
+    if len(claves) > per_page:
+        claves = claves[:per_page]
+        ult_id, ult_fecha = claves[-1]
+        next_cursor = encode_cursor(ult_fecha, ult_id)
+
+    # Objetos completos solo para la página visible
+    page_ids = [aid for aid, _ in claves]
+    page_rows = (Abono.query
+                 .options(
+                     joinedload(Abono.plan).joinedload(PlanCobro.pago),
+                     joinedload(Abono.plan).joinedload(PlanCobro.estudiante),
+                     joinedload(Abono.venta))
+                 .filter(Abono.Abono_ID.in_(page_ids))
+                 .order_by(Abono.Fecha_Abono.desc(), Abono.Abono_ID.desc())
+                 .all()) if page_ids else []
+
+    # --------- Armar filas (vista) ---------
+    rows = []
+
+    for a in page_rows:
+        plan = getattr(a, 'plan', None)
+        est  = getattr(plan, 'estudiante', None) if plan else None
+        pago = getattr(plan, 'pago', None) if plan else None
+        v    = getattr(a, 'venta', None)
+
+        # fecha mostrable (Date/DateTime)
+        fecha_val = a.Fecha_Abono or (v.Fecha_Venta if v and getattr(v, 'Fecha_Venta', None) else None)
+
+        saldo_antes   = money(getattr(a, 'Saldo_Antes', None))
+        monto_abonado = money(getattr(a, 'Monto_Abonado', 0.0))
+        saldo_despues = money(getattr(a, 'Saldo_Despues', None))
+
+
+        rows.append({
+            "Abono_ID": getattr(a, 'Abono_ID', None),
+            "Fecha": fecha_val,  # se renderiza con formateo en el template
+            "Estudiante": (f"{getattr(est, 'Est_Nombre', '')} {getattr(est, 'Est_ApellidoP', '')}".strip() if est else "—"),
+            "Concepto": getattr(pago, 'Pago_Tipo', '—'),
+            "Saldo_Antes": saldo_antes,
+            "Monto_Abonado": monto_abonado,
+            "Saldo_Despues": saldo_despues,
+            "Metodo_Pago": (getattr(a, 'Metodo_Pago', None) or '—'),
+            "Referencia_Pago": (getattr(a, 'Referencia_Pago', None) or '—'),
+            "Observaciones": (getattr(a, 'Observaciones', None) or ''),
+        })
+
+    total_monto_pagina = sum_money(r["Monto_Abonado"] for r in rows)
+
+    # --------- Render ---------
+    return render_template(
+        'consulta_abonos.html',
+        total=total_registros,
+        total_monto_global=total_monto_global,
+        total_monto_pagina=total_monto_pagina,
+        rows=rows,
+        estudiantes=estudiantes,
+        filtros={
+            "estudiante_id": est_id or "",
+            "metodo": metodo or "",
+            "desde": f_desde or "",
+            "hasta": f_hasta or "",
+            "per_page": per_page,
+            "cursor": cursor,
+        },
+        pagination={
+            "per_page": per_page,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "has_next": bool(next_cursor),
+            "es_primera": not cursor,
+        }
+    )
+
+
+def _consulta_planes_query():
+    """
+    Filtros de consulta_planes (querystring) → (query de PlanCobro ordenada, filtros).
+    Lo comparten la pantalla y la exportación.
+    """
+    # --------- Filtros (querystring) ---------
+    est_id   = request.args.get('estudiante_id', type=int)
+    est_id   = est_id if (est_id and est_id > 0) else None
+    estado   = (request.args.get('estado', '') or '').strip().lower()  # '', 'abierto', 'cerrado'
+
+    # --------- Base query ---------
+    q = (PlanCobro.query
+         .options(
+             joinedload(PlanCobro.estudiante),
+             joinedload(PlanCobro.pago)
+         ))
+
+    if est_id:
+        q = q.filter(PlanCobro.Est_ID == est_id)
+
+    if estado in ('abierto', 'cerrado'):
+        q = q.filter(func.lower(PlanCobro.Estado) == estado)
+
+    # Ordenamiento: estado, saldo desc, más recientes primero (fallback si no hay Fecha_Creacion)
+    try:
+        order_date_col = getattr(PlanCobro, 'Fecha_Creacion')
+    except Exception:
+        order_date_col = PlanCobro.Plan_ID
+    q = q.order_by(
+        func.lower(PlanCobro.Estado).asc(),
+        PlanCobro.Saldo_Actual.desc(),
+        order_date_col.desc()
+    )
+
+    return q, {'estudiante_id': est_id, 'estado': estado}
+
+
+@bp.route('/consulta/abonos/exportar')
+def exportar_abonos():
+    """CSV/XLSX de consulta_abonos con los mismos filtros; filas en streaming (yield_per)."""
+    formato = (request.args.get('formato') or 'csv').strip().lower()
+    if not formato_disponible(formato):
+        flash(f"Exportación a {formato.upper()} no disponible en este servidor.", "warning")
+        return redirect(url_for('consulta_abonos', **{k: v for k, v in request.args.items() if k != 'formato'}))
+    q, _f = _consulta_abonos_query()
+    filas_q = (q.outerjoin(Estudiante, Estudiante.Est_ID == PlanCobro.Est_ID)
+                .outerjoin(Pago, Pago.Pago_ID == PlanCobro.Pago_ID)
+                .with_entities(Abono.Abono_ID, Abono.Fecha_Abono, Estudiante.Est_Nombre,
+                               Estudiante.Est_ApellidoP, Pago.Pago_Tipo, Abono.Saldo_Antes,
+                               Abono.Monto_Abonado, Abono.Saldo_Despues, Abono.Metodo_Pago,
+                               Abono.Referencia_Pago, Abono.Observaciones)
+                .order_by(Abono.Fecha_Abono.desc(), Abono.Abono_ID.desc())
+                .yield_per(LOTE_EXPORTACION))
+
+    def _filas():
+        for (aid, fecha, nom, ap, concepto, antes, monto, despues, metodo, ref, obs) in filas_q:
+            yield (aid, fecha, f"{nom or ''} {ap or ''}".strip() or '—', concepto or '—',
+                   money(antes) if antes is not None else None, money(monto),
+                   money(despues) if despues is not None else None, metodo or '—', ref or '', obs or '')
+
+    encabezados = ('Abono', 'Fecha', 'Estudiante', 'Concepto', 'Saldo antes', 'Monto abonado',
+                   'Saldo después', 'Método', 'Referencia', 'Observaciones')
+    return respuesta_exportacion('abonos', formato, encabezados, _filas())
+
+
+# ========= CONSULTA: PLANES =========
+@bp.route('/consulta/planes')
+def consulta_planes():
+    """
+    Consulta de Planes de Cobro con:
+      - Filtros por estudiante y estado (abierto | cerrado)
+      - Totales globales: saldo en abiertos y monto cobrado en cerrados
+      - Paginación y ordenamiento
+    """
+    q, f = _consulta_planes_query()
+    est_id, estado = f['estudiante_id'], f['estado']
+    per_page = max(1, min(200, request.args.get('per_page', default=25, type=int)))
+    page     = max(1, request.args.get('page', default=1, type=int))
+
+    # Selector de estudiante por typeahead: solo se manda el filtrado actual
+    estudiantes = Estudiante.query.filter(Estudiante.Est_ID == est_id).all() if est_id else []
+
+    # --------- Totales globales ---------
+    # Nota: para compatibilidad con SQLite y evitar subconsultas complejas, usamos subquery simple
+    try:
+        base_sq = q.with_entities(
+            PlanCobro.Plan_ID.label('Plan_ID'),
+            PlanCobro.Estado.label('Estado'),
+            PlanCobro.Monto_Total_Original.label('Monto_Total_Original'),
+            PlanCobro.Saldo_Actual.label('Saldo_Actual')
+        ).subquery()
+
+        total_registros = db.session.query(func.count(base_sq.c.Plan_ID)).scalar() or 0
+
+        tot_abiertos = db.session.query(
+            func.coalesce(func.sum(base_sq.c.Saldo_Actual), 0.0)
+        ).filter(func.lower(base_sq.c.Estado) == 'abierto').scalar() or 0.0
+
+        tot_cobrados_cerrados = db.session.query(
+            func.coalesce(func.sum(base_sq.c.Monto_Total_Original - base_sq.c.Saldo_Actual), 0.0)
+        ).filter(func.lower(base_sq.c.Estado) == 'cerrado').scalar() or 0.0
+
+    except Exception:
+        # Fallback: traer y sumar en Python (menos eficiente, pero robusto)
+        all_rows = q.all()
+        total_registros = len(all_rows)
+        tot_abiertos = sum(float(getattr(p, 'Saldo_Actual', 0.0) or 0.0)
+                           for p in all_rows if str(getattr(p, 'Estado', '')).lower() == 'abierto')
+        tot_cobrados_cerrados = sum(
+            float(getattr(p, 'Monto_Total_Original', 0.0) or 0.0) - float(getattr(p, 'Saldo_Actual', 0.0) or 0.0)
+            for p in all_rows if str(getattr(p, 'Estado', '')).lower() == 'cerrado'
+        )
+
+    # --------- Paginación ---------
+    page_rows = q.limit(per_page).offset((page - 1) * per_page).all()
+
+    # --------- Armar filas (vista) ---------
+    rows = []
+    for p in page_rows:
+        est  = getattr(p, 'estudiante', None)
+        pago = getattr(p, 'pago', None)
+
+        rows.append({
+            "Plan_ID": getattr(p, 'Plan_ID', None),
+            "Estudiante": (f"{getattr(est, 'Est_Nombre', '')} {getattr(est, 'Est_ApellidoP', '')}".strip() if est else "—"),
+            "Concepto": getattr(pago, 'Pago_Tipo', '—'),
+            "Monto_Total_Original": money(getattr(p, 'Monto_Total_Original', 0.0)),
+            "Saldo_Actual": money(getattr(p, 'Saldo_Actual', 0.0)),
+            "Estado": getattr(p, 'Estado', '—'),
+            "Vigencia_Inicio": getattr(p, 'Vigencia_Inicio', None),
+            "Vigencia_Fin": getattr(p, 'Vigencia_Fin', None),
+        })
+
+    # --------- Render ---------
+    return render_template(
+        'consulta_planes.html',
+        total=total_registros,
+        totales={
+            "abiertos": money(tot_abiertos),
+            "cerrados": money(tot_cobrados_cerrados)  # lo cobrado en planes cerrados
+        },
+        rows=rows,
+        estudiantes=estudiantes,
+        filtros={
+            "estudiante_id": est_id or "",
+            "estado": estado or "",
+            "per_page": per_page,
+            "page": page,
+        },
+        pagination={
+            "page": page,
+            "per_page": per_page,
+            "has_prev": page > 1,
+            "has_next": (page * per_page) < total_registros,
+            "prev_page": (page - 1),
+            "next_page": (page + 1),
+        }
+    )
+
+@bp.route('/consulta/planes/exportar')
+def exportar_planes():
+    """CSV/XLSX de consulta_planes con los mismos filtros y orden; filas en streaming (yield_per)."""
+    formato = (request.args.get('formato') or 'csv').strip().lower()
+    if not formato_disponible(formato):
+        flash(f"Exportación a {formato.upper()} no disponible en este servidor.", "warning")
+        return redirect(url_for('consulta_planes', **{k: v for k, v in request.args.items() if k != 'formato'}))
+    q, _f = _consulta_planes_query()
+
+    def _filas():
+        for p in q.yield_per(LOTE_EXPORTACION):
+            est, pago = p.estudiante, p.pago
+            yield (p.Plan_ID,
+                   f"{est.Est_Nombre or ''} {est.Est_ApellidoP or ''}".strip() if est else '—',
+                   pago.Pago_Tipo if pago else '—', p.Descripcion_Resumen,
+                   money(p.Monto_Total_Original), money(p.Abonado_Acumulado), money(p.Saldo_Actual),
+                   p.Estado, p.Vigencia_Inicio, p.Vigencia_Fin, p.Fecha_Creacion, p.Fecha_Ultimo_Abono)
+
+    encabezados = ('Plan', 'Estudiante', 'Concepto', 'Descripción', 'Monto total', 'Abonado',
+                   'Saldo', 'Estado', 'Vigencia inicio', 'Vigencia fin', 'Creado', 'Último abono')
+    return respuesta_exportacion('planes', formato, encabezados, _filas())
+
+
+# === RUTAS: eliminar abonos y eliminar planes ================================
+# Reglas sugeridas:
+# - Eliminar Abono:
+#     * Requiere POST.
+#     * Si el Abono pertenece a un Plan, se "reversa" el saldo: Saldo_Actual += Monto_Abonado.
+#     * Si el Plan estaba 'cerrado' y tras la reversa el saldo > 0, se reabre ('abierto').
+#     * No toca VentaCobro (si tienes esa tabla, considera manejarlo en tu flujo contable).
+# - Eliminar Plan:
+#     * Por defecto, solo si NO tiene abonos (histórico limpio) y sin importar el saldo.
+#     * Si agregas ?force=1, elimina primero TODOS los abonos del plan y luego el plan (¡pierdes historial!).
+#       Úsalo con cautela o deshabilítalo en producción.
+# - Redirige al referer (si existe) o a las consultas por defecto.
+#
+# Nota: Estas rutas asumen que usas CSRF (Flask-WTF) en los formularios que hacen POST.
+
+
+def _safe_redirect(default_endpoint: str):
+    """Redirige de vuelta al referer si existe; si no, al endpoint indicado."""
+    ref = (request.referrer or '').strip()
+    if ref:
+        return redirect(ref)
+    return redirect(url_for(default_endpoint))
+
+
+@bp.route('/abonos/<int:abono_id>/eliminar', methods=['POST'])
+def eliminar_abono(abono_id: int):
+    """
+    Elimina un Abono y, si está ligado a un Plan:
+      - Revierte su efecto en el Plan: Saldo_Actual += Monto_Abonado (acotado por el ledger)
+      - Abonado_Acumulado lo ajusta el evento de Abono
+      - Si el plan estaba 'cerrado' y queda Saldo_Actual > 0, se reabre ('abierto')
+    """
+    try:
+        ab = (Abono.query
+              .options(joinedload(Abono.plan))
+              .filter(Abono.Abono_ID == abono_id)
+              .first())
+        if not ab:
+            flash('Abono no encontrado.', 'warning')
+            return _safe_redirect('consulta_abonos')
+
+        plan = revertir_abono(ab)
+        db.session.commit()
+
+        if plan is not None:
+            flash(f'Abono eliminado. Plan #{plan.Plan_ID} actualizado (saldo: ${plan.Saldo_Actual:.2f}).', 'success')
+        else:
+            flash('Abono eliminado.', 'success')
+
+        return _safe_redirect('consulta_abonos')
+
+    except IntegrityError as e:
+        db.session.rollback()
+        flash('❌ No se pudo eliminar el abono (conflicto de integridad).', 'danger')
+        return _safe_redirect('consulta_abonos')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error inesperado al eliminar abono: {type(e).__name__}', 'danger')
+        return _safe_redirect('consulta_abonos')
+
+
+@bp.route('/planes/<int:plan_id>/eliminar', methods=['POST'])
+def eliminar_plan(plan_id: int):
+    """
+    Elimina un Plan de Cobro.
+    Comportamiento:
+      - Por defecto: solo permite eliminar si el plan NO tiene abonos.
+      - Si querystring incluye ?force=1: elimina TODOS los abonos del plan y luego el plan (pierde historial).
+        Úsalo con extrema cautela.
+
+    Recomendación: En producción, deshabilita el 'force' si necesitas auditoría.
+    """
+    force = str(request.args.get('force', '') or '').strip() == '1'
+
+    try:
+        plan = (PlanCobro.query
+                .options(joinedload(PlanCobro.estudiante), joinedload(PlanCobro.pago))
+                .filter(PlanCobro.Plan_ID == plan_id)
+                .first())
+        if not plan:
+            flash('Plan no encontrado.', 'warning')
+            return _safe_redirect('consulta_planes')
+
+        # Verificar si existen abonos ligados
+        abonos_q = Abono.query.filter(Abono.Plan_ID == plan.Plan_ID)
+        abonos_count = abonos_q.count()
+
+        if abonos_count > 0 and not force:
+            flash('No se puede eliminar el plan: tiene abonos registrados. '
+                  'Si estás absolutamente seguro, usa la opción forzada.', 'warning')
+            return _safe_redirect('consulta_planes')
+
+        if force and abonos_count > 0:
+            # ⚠️ ELIMINACIÓN DE HISTORIAL
+            for ab in abonos_q.all():
+                db.session.delete(ab)
+
+        db.session.delete(plan)
+        db.session.commit()
+
+        if force and abonos_count > 0:
+            flash(f'Plan #{plan_id} y {abonos_count} abono(s) fueron eliminados permanentemente.', 'success')
+        else:
+            flash(f'Plan #{plan_id} eliminado.', 'success')
+
+        return _safe_redirect('consulta_planes')
+
+    except IntegrityError:
+        db.session.rollback()
+        flash('❌ No se pudo eliminar el plan (conflicto de integridad).', 'danger')
+        return _safe_redirect('consulta_planes')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'❌ Error inesperado al eliminar plan: {type(e).__name__}', 'danger')
+        return _safe_redirect('consulta_planes')
@@ -0,0 +1,331 @@
+# blueprints/comun.py
+"""Helpers compartidos entre blueprints (filtros y armado del reporte de ventas)."""
+from flask import request, flash
+from extensions import db
+from datetime import datetime
+from sqlalchemy import or_, func, select
+from billing_utils import method_allowed, to_cents, pct_cents
+from models import Estudiante, Instructor, Pago, Venta, venta_pago
+
+
+# ===== Helpers comunes =====
+MESES_ES = ["", "Enero","Febrero","Marzo","Abril","Mayo","Junio",
+            "Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"]
+
+def _cliente_nombre_y_tipo(est, ins):
+    if est:
+        apm = est.Est_ApellidoM or ''
+        return (f"{est.Est_Nombre} {est.Est_ApellidoP} {apm}".strip(), "Estudiante")
+    if ins:
+        apm = ins.Instructor_ApellidoM or ''
+        return (f"{ins.Instructor_Nombre} {ins.Instructor_ApellidoP} {apm}".strip(), "Instructor")
+    return ("—", "N/D")
+
+def _aplicar_filtros_ventas(q):
+    #"""Aplica filtros a la query de ventas, leyendo request.args."""#
+    inicio_str = request.args.get('inicio', '').strip()
+    fin_str    = request.args.get('fin', '').strip()
+    metodo     = request.args.get('metodo', '').strip().lower()  # efectivo, tarjeta, etc (opcional, filtra por pagos)
+    tipo       = request.args.get('tipo', '').strip().lower()    # 'estudiante' | 'instructor' | '' (todos)
+    qnombre    = request.args.get('q', '').strip()               # búsqueda por nombre del cliente
+
+    inicio = None
+    fin    = None
+    if inicio_str:
+        try:
+            inicio = datetime.strptime(inicio_str, '%Y-%m-%d')
+        except:
+            flash('Fecha "inicio" inválida. Use YYYY-MM-DD.', 'warning')
+    if fin_str:
+        try:
+            fin = datetime.strptime(fin_str, '%Y-%m-%d')
+            fin = fin.replace(hour=23, minute=59, second=59, microsecond=999999)
+        except:
+            flash('Fecha "fin" inválida. Use YYYY-MM-DD.', 'warning')
+
+    if inicio:
+        q = q.filter(Venta.Fecha_Venta >= inicio)
+    if fin:
+        q = q.filter(Venta.Fecha_Venta <= fin)
+
+    # Filtro por tipo de cliente
+    if tipo == 'estudiante':
+        q = q.filter(Venta.Est_ID.isnot(None))
+    elif tipo == 'instructor':
+        q = q.filter(Venta.Instructor_ID.isnot(None))
+
+    # Filtro por nombre (coalesce estudiante/instructor)
+    if qnombre:
+        nombre_expr = func.trim(
+            func.coalesce(
+                (Estudiante.Est_Nombre + ' ' + Estudiante.Est_ApellidoP + ' ' + func.coalesce(Estudiante.Est_ApellidoM, '')),
+                (Instructor.Instructor_Nombre + ' ' + Instructor.Instructor_ApellidoP + ' ' + func.coalesce(Instructor.Instructor_ApellidoM, ''))
+            )
+        )
+        q = q.filter(nombre_expr.ilike(f"%{qnombre}%"))
+
+    # Filtro por método de pago: ventas que tengan al menos un pago con ese método.
+    # EXISTS en lugar de JOIN + DISTINCT ON (solo PostgreSQL): no duplica filas ni
+    # obliga a reordenar por Venta_ID.
+    if metodo:
+        q = q.filter(
+            select(venta_pago.c.venta_id)
+            .join(Pago, Pago.Pago_ID == venta_pago.c.pago_id)
+            .where(venta_pago.c.venta_id == Venta.Venta_ID,
+                   func.lower(Pago.Pago_Tipo) == metodo)
+            .exists()
+        )
+
+    return q
+
+def _sum_pagado_query(q_filtrada_base):
+    #"""Devuelve la suma total de pagos para las ventas en la consulta filtrada."""#
+    subq = q_filtrada_base.with_entities(Venta.Venta_ID).subquery()
+    total = (db.session.query(func.coalesce(func.sum(Pago.Pago_Monto), 0.0))
+             .select_from(Venta)
+             .join(venta_pago, Venta.Venta_ID == venta_pago.c.venta_id)
+             .join(Pago, Pago.Pago_ID == venta_pago.c.pago_id)
+             .filter(Venta.Venta_ID.in_(db.session.query(subq.c.Venta_ID)))
+             .scalar())
+    return float(total or 0.0)
+
+def _metodos_breakdown(q_filtrada_base):
+    #"""Conteo/suma por método de pago sobre la consulta filtrada."""#
+    subq = q_filtrada_base.with_entities(Venta.Venta_ID).subquery()
+    rows = (db.session.query(Pago.Pago_Tipo, func.count(Pago.Pago_ID), func.coalesce(func.sum(Pago.Pago_Monto), 0.0))
+            .select_from(Venta)
+            .join(venta_pago, Venta.Venta_ID == venta_pago.c.venta_id)
+            .join(Pago, Pago.Pago_ID == venta_pago.c.pago_id)
+            .filter(Venta.Venta_ID.in_(db.session.query(subq.c.Venta_ID)))
+            .group_by(Pago.Pago_Tipo)
+            .order_by(func.sum(Pago.Pago_Monto).desc())
+            .all())
+    return [{'tipo': r[0], 'conteo': int(r[1]), 'monto': float(r[2])} for r in rows]
+
+# === RUTAS CRUD VENTAS ===
+# ===== Helpers =====
+def _normalize_method(val: str) -> str:
+    v = (val or "").strip().lower()
+    map_alias = {
+        "cash": "efectivo",
+        "tarjeta de crédito": "tarjeta",
+        "tarjeta de debito": "tarjeta",
+        "tarjeta de débito": "tarjeta",
+        "debito": "tarjeta",
+        "débito": "tarjeta",
+        "transferencia bancaria": "transferencia",
+        "depósito": "deposito",
+        "deposito bancario": "deposito",
+    }
+    return map_alias.get(v, v)
+
+def _is_empty_meta(val) -> bool:
+    if val is None:
+        return True
+    if isinstance(val, (list, tuple, set, dict)):
+        return len(val) == 0
+    s = str(val).strip()
+    if s in ("", "[]", "{}", "null", "None", "NULL"):
+        return True
+    try:
+        import json
+        j = json.loads(s)
+        if isinstance(j, (list, dict)) and len(j) == 0:
+            return True
+    except Exception:
+        pass
+    return False
+
+def _is_autopago_unit(p, metodo_norm: str, subtotal_items: float) -> bool:
+    #""Detecta el autopago auto-generado cuando no hay promos."""#
+    try:
+        tipo_norm = _normalize_method(getattr(p, 'Pago_Tipo', '') or '')
+        monto     = float(getattr(p, 'Pago_Monto', 0.0) or 0.0)
+        desc_tipo = getattr(p, 'Pago_Descuento_Tipo', None)
+        desc_pct  = getattr(p, 'Pago_Descuento_Porcentaje', None)
+        conds     = getattr(p, 'Pago_Condiciones', None)
+        vence     = getattr(p, 'Pago_Restricciones_Fecha', None)
+    except Exception:
+        return False
+    tol = max(0.05, 0.001 * max(1.0, float(subtotal_items)))
+    mismo_monto = abs(monto - float(subtotal_items)) <= tol
+    sin_desc    = _is_empty_meta(desc_tipo) and (desc_pct is None or float(desc_pct or 0) == 0.0)
+    sin_restr   = _is_empty_meta(conds) and (vence is None)
+    return (tipo_norm == metodo_norm) and mismo_monto and sin_desc and sin_restr
+
+def _is_autopago_group(pagos, metodo_norm: str, subtotal_items: float) -> bool:
+    #"""Todos lucen como autopago y la suma ≈ subtotal_items."""#
+    if not pagos:
+        return False
+    try:
+        total = sum(float(getattr(p, 'Pago_Monto', 0.0) or 0.0) for p in pagos)
+    except Exception:
+        return False
+    tol = max(0.05, 0.001 * max(1.0, float(subtotal_items)))
+    if abs(total - float(subtotal_items)) > tol:
+        return False
+    for p in pagos:
+        tipo_norm = _normalize_method(getattr(p, 'Pago_Tipo', '') or '')
+        desc_tipo = getattr(p, 'Pago_Descuento_Tipo', None)
+        desc_pct  = getattr(p, 'Pago_Descuento_Porcentaje', None)
+        conds     = getattr(p, 'Pago_Condiciones', None)
+        vence     = getattr(p, 'Pago_Restricciones_Fecha', None)
+        sin_desc  = _is_empty_meta(desc_tipo) and (desc_pct is None or float(desc_pct or 0) == 0.0)
+        sin_restr = _is_empty_meta(conds) and (vence is None)
+        if not ((tipo_norm == metodo_norm) and sin_desc and sin_restr):
+            return False
+    return True
+
+def _armar_reporte(ventas_raw):
+    #"""Devuelve (ventas, kpis) calculando:
+    #   - subtotal de artículos
+    #   - descuentos solo sobre pagos válidos por método/fecha
+    #   - ignorando autopagos para no duplicar totales
+    #"""
+    ventas = []
+    # Acumuladores en centavos enteros (half-up por valor, sin deriva)
+    kpi_subtotal_items = 0
+    kpi_descuentos     = 0
+    kpi_total_general  = 0
+
+    for v in ventas_raw:
+        # Cliente
+        if getattr(v, 'Est_ID', None):
+            cli_tipo = 'estudiante'
+            cli_nombre = f"{getattr(v.estudiante, 'Est_Nombre', '')} {getattr(v.estudiante, 'Est_ApellidoP', '')}".strip()
+        elif getattr(v, 'Instructor_ID', None):
+            cli_tipo = 'instructor'
+            cli_nombre = f"{getattr(v.instructor, 'Instructor_Nombre', '')} {getattr(v.instructor, 'Instructor_ApellidoP', '')}".strip()
+        else:
+            cli_tipo = '—'
+            cli_nombre = '—'
+
+        # Líneas (sin descuento)
+        items = []
+        subtotal_items = 0
+        for ln in (v.lineas or []):
+            # ln.articulo llega precargado (selectinload(...).joinedload(VentaLinea.articulo)
+            # en quien llama); sin él sería una consulta por línea.
+            art_nombre = getattr(getattr(ln, 'articulo', None), 'Articulo_Nombre', None) or f"ID {ln.Articulo_ID}"
+            cantidad = int(getattr(ln, 'Cantidad', 0) or 0)
+            p_unit   = float(getattr(ln, 'Precio_Unitario', 0.0) or 0.0)
+            total_ln = cantidad * p_unit
+            subtotal_items += to_cents(total_ln)
+            items.append({
+                'articulo': art_nombre,
+                'talla': getattr(ln, 'Talla', None),
+                'cantidad': cantidad,
+                'precio_unit': p_unit,
+                'total_linea': total_ln
+            })
+
+        # Pagos/promos válidos (filtrando autopagos)
+        metodo_norm = _normalize_method(getattr(v, 'Metodo_Pago', '') or '')
+        venta_dt = getattr(v, 'Fecha_Venta', None)
+
+        if cli_tipo == 'instructor':
+            pagos_validos = []
+        else:
+            pagos_validos = []
+            for p in (v.pagos or []):
+                if _is_autopago_unit(p, metodo_norm, subtotal_items / 100):
+                    continue
+                pagos_validos.append(p)
+            if (not pagos_validos) and _is_autopago_group((v.pagos or []), metodo_norm, subtotal_items / 100):
+                pagos_validos = []
+
+        pagos_view = []
+        pagos_subtotal = 0
+        desc_total_pagos = 0
+        pagos_total_neto = 0
+
+        for p in pagos_validos:
+            monto_bruto = float(getattr(p, 'Pago_Monto', 0.0) or 0.0)
+            bruto_c = to_cents(monto_bruto)
+            pagos_subtotal += bruto_c
+            try:
+                pct = float(p.Pago_Descuento_Porcentaje) if p.Pago_Descuento_Porcentaje is not None else 0.0
+            except Exception:
+                pct = 0.0
+            condiciones_ok = method_allowed(getattr(p, 'Pago_Condiciones', None), metodo_norm)
+
+            vence = getattr(p, 'Pago_Restricciones_Fecha', None)
+            vigente = True
+            if vence and venta_dt:
+                try:
+                    vence_d = vence.date() if hasattr(vence, 'date') else vence
+                    venta_d = venta_dt.date() if hasattr(venta_dt, 'date') else venta_dt
+                    vigente = (venta_d <= vence_d)
+                except Exception:
+                    vigente = True
+
+            pct_aplicado = pct if (pct > 0 and condiciones_ok and vigente) else 0.0
+            desc_c = pct_cents(bruto_c, pct_aplicado)
+            desc_monto = desc_c / 100
+            monto_neto = (bruto_c - desc_c) / 100
+
+            desc_total_pagos += desc_c
+            pagos_total_neto += bruto_c - desc_c
+
+            pagos_view.append({
+                'tipo': getattr(p, 'Pago_Tipo', ''),
+                'monto_bruto': monto_bruto,
+                'pct_aplicado': pct_aplicado,
+                'descuento_monto': desc_monto,
+                'monto_neto': monto_neto,
+                'cond': getattr(p, 'Pago_Condiciones', None),
+                'vence': getattr(p, 'Pago_Restricciones_Fecha', None),
+            })
+
+        total_venta_c = subtotal_items + pagos_total_neto
+
+        ventas.append({
+            'id': getattr(v, 'Venta_ID', None),
+            'fecha': venta_dt,
+            'cliente_tipo': cli_tipo,
+            'cliente_nombre': cli_nombre or '—',
+            'metodo': getattr(v, 'Metodo_Pago', '') or '—',
+            'referencia': getattr(v, 'Referencia_Pago', None),
+            'items': items,
+            'subtotal_items': subtotal_items / 100,
+            'pagos': pagos_view,
+            'pagos_subtotal': pagos_subtotal / 100,
+            'descuento_pagos': desc_total_pagos / 100,
+            'total_venta': total_venta_c / 100,
+        })
+
+        kpi_subtotal_items += subtotal_items
+        kpi_descuentos     += desc_total_pagos
+        kpi_total_general  += total_venta_c
+
+    kpis = {
+        'total_ventas': len(ventas),
+        'sum_items': kpi_subtotal_items / 100,
+        'sum_descuentos': kpi_descuentos / 100,
+        'sum_total': kpi_total_general / 100
+    }
+    return ventas, kpis
+
+def _pendiente_expr():
+    if hasattr(Venta, 'Cobro_Pendiente'):
+        return or_(
+            Venta.Cobro_Pendiente == True,
+            func.lower(Venta.Metodo_Pago) == '__pendiente__',
+            func.lower(Venta.Metodo_Pago) == 'pendiente',
+            Venta.Metodo_Pago.is_(None),
+            Venta.Metodo_Pago == ''
+        )
+    return or_(
+        func.lower(Venta.Metodo_Pago) == '__pendiente__',
+        func.lower(Venta.Metodo_Pago) == 'pendiente',
+        Venta.Metodo_Pago.is_(None),
+        Venta.Metodo_Pago == ''
+    )
+
+
+##----------------------------------------
+## Tutor
+##----------------------------------------
+
+## Registro de tutor
+##----------------------------------------
@@ -0,0 +1,18 @@
+# blueprints/inicio.py
+"""Páginas de menú (inicio, registro, consulta)."""
+from flask import Blueprint, render_template
+
+
+bp = Blueprint('inicio', __name__)
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+@bp.route('/registro')
+def registro():
+    return render_template('registro.html')
+
+@bp.route('/consulta')
+def consulta():
+    return render_template('consulta.html')
@@ -0,0 +1,940 @@
+# blueprints/inventario.py
+"""Artículos, variantes (tallas), recepción de inventario y paquetes."""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
+from extensions import db
+from sqlalchemy.exc import IntegrityError
+from inventario_utils import (
+    variantes_por_articulo, sincronizar_variantes, aplicar_movimientos,
+    MovimientoInvalido, StockInsuficiente, TIPOS_MOVIMIENTO,
+    existencias_por_clave, registrar_diferencia, registrar_movimientos,
+)
+from models import Articulo, Paquete, PaqueteItem, MovimientoInventario
+from forms import ArticuloForm, PaqueteForm
+
+
+bp = Blueprint('inventario', __name__)
+
+@bp.route('/registro/articulo', methods=['GET', 'POST'])
+def registro_articulo():
+    form = ArticuloForm()
+    
+    if form.validate_on_submit():
+        try:
+            # Procesar las tallas si aplica
+            tallas = {}
+            if form.tipo_talla.data != 'ninguno':
+                for item in form.tallas_numeros.data:
+                    tallas[item['nombre']] = item['cantidad']
+
+            nuevo_articulo = Articulo(
+                Articulo_Nombre=form.nombre.data,
+                Articulo_PrecioVenta=form.precio.data,
+                Articulo_Existencia=form.existencia.data if form.tipo_talla.data == 'ninguno' else sum(tallas.values()),
+                Articulo_TipoTalla=form.tipo_talla.data if form.tipo_talla.data != 'ninguno' else None,
+            )
+            sincronizar_variantes(nuevo_articulo, tallas)
+
+            db.session.add(nuevo_articulo)
+            registrar_diferencia(nuevo_articulo, {}, tipo='alta')
+            db.session.commit()
+            flash('Artículo registrado exitosamente!', 'success')
+            return redirect(url_for('registro_articulo'))
+
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al registrar artículo: {str(e)}', 'danger')
+            current_app.logger.error(f"Error en registro_articulo: {str(e)}")
+    
+    elif request.method == 'POST':
+        flash('Por favor corrige los errores en el formulario.', 'warning')
+
+    return render_template('registro_articulo.html', form=form)
+
+
+## ---------------------------------------
+## Consultar articulos
+##----------------------------------------
+@bp.route('/consulta_articulos')
+def consulta_articulos():
+    import json
+    from collections import Counter
+    from sqlalchemy.orm import joinedload
+
+    orden = request.args.get('orden', 'nombre')
+    orden_paq = request.args.get('orden_paq', 'nombre')
+    busqueda = request.args.get('busqueda', '')
+    vista = request.args.get('vista', 'articulos')  # 'articulos' | 'paquetes'
+
+    articulos = []
+    paquetes = []
+
+    # =========================
+    #  ARTÍCULOS
+    # =========================
+    try:
+        query = Articulo.query
+        if busqueda:
+            query = query.filter(Articulo.Articulo_Nombre.ilike(f'%{busqueda}%'))
+
+        lista_articulos = query.all()
+        variantes_map = variantes_por_articulo(a.Articulo_ID for a in lista_articulos)
+
+        # ➊ Contar duplicados (por nombre, case/espacios normalizados)
+        nombres_norm = [((a.Articulo_Nombre or '').strip().lower()) for a in lista_articulos]
+        name_counts = Counter(nombres_norm)
+
+        for articulo in lista_articulos:
+            precio = float(articulo.Articulo_PrecioVenta or 0)
+            nombre = articulo.Articulo_Nombre or ''
+            nombre_key = nombre.strip().lower()
+            es_duplicado = name_counts.get(nombre_key, 0) > 1
+
+            tipo_raw = (articulo.Articulo_TipoTalla or 'ninguno')
+            tipo = str(tipo_raw).strip().lower()
+            iterable = variantes_map.get(articulo.Articulo_ID, [])
+            raw_tallas = json.dumps(dict(iterable)) if iterable else None
+
+            # ➋ SIN talla
+            if not tipo or tipo == 'ninguno':
+                articulos.append({
+                    'id': articulo.Articulo_ID,
+                    'nombre': nombre,
+                    'talla_numero': '-',
+                    'precio': precio,
+                    'existencia': articulo.Articulo_Existencia,
+                    'tipo': 'sin_talla',
+                    'tipo_talla': tipo,              # extra para tooltip/debug
+                    'raw_tallas': raw_tallas,
+                    'duplicado': es_duplicado,
+                    'inconsistente': False           # consistente (no usa tallas)
+                })
+                continue
+
+            # ➌ CON talla/número: variantes ya leídas de articulo_variante
+            if iterable:
+                # Hay variantes reales ⇒ desplegar cada una
+                for talla, existencia in iterable:
+                    articulos.append({
+                        'id': articulo.Articulo_ID,
+                        'nombre': nombre,
+                        'talla_numero': talla,
+                        'precio': precio,
+                        'existencia': existencia if existencia is not None else articulo.Articulo_Existencia,
+                        'tipo': 'con_talla',
+                        'tipo_talla': tipo,
+                        'raw_tallas': raw_tallas,
+                        'duplicado': es_duplicado,
+                        'inconsistente': False
+                    })
+            else:
+                # ⚠ Tipo declarado pero SIN variantes ⇒ mostrar fila “fantasma” marcada como inconsistente
+                articulos.append({
+                    'id': articulo.Articulo_ID,
+                    'nombre': nombre,
+                    'talla_numero': '-',              # se ve en la columna Talla/Número
+                    'precio': precio,
+                    'existencia': articulo.Articulo_Existencia,
+                    'tipo': 'con_talla',
+                    'tipo_talla': tipo,
+                    'raw_tallas': raw_tallas,
+                    'duplicado': es_duplicado,
+                    'inconsistente': True
+                })
+
+        # Ordenamiento de artículos
+        if orden == 'precio':
+            articulos.sort(key=lambda x: (x['precio'], x['nombre'], str(x['talla_numero'])))
+        elif orden == 'talla_numero':
+            # Mantener '-' al final
+            articulos.sort(key=lambda x: (x['talla_numero'] == '-', str(x['talla_numero']), x['nombre'], x['precio']))
+        else:
+            articulos.sort(key=lambda x: (x['nombre'].lower(), str(x['talla_numero']), x['precio']))
+
+    except Exception as e:
+        current_app.logger.error(f"Error en consulta_articulos (artículos): {str(e)}")
+        flash('Ocurrió un error al obtener los artículos', 'danger')
+
+    # =========================
+    #  PAQUETES (leer solo talla_numero)
+    # =========================
+    try:
+        paquetes_q = (Paquete.query
+                      .options(joinedload(Paquete.items).joinedload(PaqueteItem.articulo)))
+        if busqueda:
+            paquetes_q = paquetes_q.filter(Paquete.nombre.ilike(f'%{busqueda}%'))
+
+        paquetes_db = paquetes_q.all()
+
+        for p in paquetes_db:
+            items_rel = getattr(p, 'items', None)
+            if items_rel is None:
+                items_rel = PaqueteItem.query.filter_by(paquete_id=p.id).all()
+
+            items = []
+            total_lista = 0.0
+            total_cantidades = 0
+
+            for it in items_rel:
+                art_obj = getattr(it, 'articulo', None)  # precargado con joinedload
+
+                nombre_art = art_obj.Articulo_Nombre if art_obj else f'ID {it.articulo_id}'
+                precio_unit = float((art_obj.Articulo_PrecioVenta if art_obj else 0) or 0)
+                cant = int(it.cantidad or 0)
+                subtotal = precio_unit * cant
+
+                tn_val = getattr(it, 'talla_numero', None)
+                tn_val = tn_val if tn_val not in (None, '') else None
+
+                tipo_raw = (art_obj.Articulo_TipoTalla if art_obj else None) or 'ninguno'
+                var_tipo = str(tipo_raw).strip().lower()
+                if var_tipo not in ('talla', 'numero'):
+                    var_tipo = 'ninguno'
+
+                total_lista += subtotal
+                total_cantidades += cant
+
+                items.append({
+                    'articulo_id': it.articulo_id,
+                    'nombre': nombre_art,
+                    'cantidad': cant,
+                    'precio_unit': round(precio_unit, 2),
+                    'subtotal': round(subtotal, 2),
+                    'var_nombre': tn_val,
+                    'var_tipo': var_tipo,
+                })
+
+            desc_tipo = (p.descuento_tipo or 'ninguno').lower()
+            desc_val = float(p.descuento_valor or 0)
+
+            if desc_tipo == 'porcentaje':
+                desc_monto = round(total_lista * (desc_val / 100.0), 2)
+            elif desc_tipo == 'monto':
+                desc_monto = round(min(total_lista, desc_val), 2)
+            else:
+                desc_monto = 0.0
+
+            total_final = round(total_lista - desc_monto, 2)
+
+            paquetes.append({
+                'id': p.id,
+                'nombre': p.nombre,
+                'descuento_tipo': desc_tipo,
+                'descuento_valor': desc_val,
+                'total_lista': round(total_lista, 2),
+                'descuento_monto': desc_monto,
+                'total_final': total_final,
+                'detalle_items': items,
+                'num_items': total_cantidades,
+                'lineas': len(items_rel),
+            })
+
+        # Ordenamiento de paquetes
+        if orden_paq == 'total':
+            paquetes.sort(key=lambda x: (x['total_final'], x['nombre'].lower()))
+        elif orden_paq == 'num_items':
+            paquetes.sort(key=lambda x: (-x['num_items'], x['nombre'].lower()))
+        else:
+            paquetes.sort(key=lambda x: x['nombre'].lower())
+
+    except Exception as e:
+        current_app.logger.error(f"Error en consulta_articulos (paquetes): {str(e)}")
+        flash('Ocurrió un error al obtener los paquetes', 'danger')
+
+    return render_template(
+        'consulta_articulos.html',
+        articulos=articulos,
+        paquetes=paquetes,
+        orden=orden,
+        orden_paq=orden_paq,
+        busqueda=busqueda,
+        vista=vista
+    )
+
+
+
+## Editar articulos
+##----------------------------------------
+@bp.route('/editar_articulo/<int:id>', methods=['GET', 'POST'])
+def editar_articulo(id):
+    articulo = Articulo.query.get_or_404(id)
+    form = ArticuloForm(obj=articulo)  # Esto carga automáticamente los campos coincidentes
+    
+    if request.method == 'GET':
+        # Asegurarnos de cargar manualmente los campos que no coinciden exactamente
+        form.nombre.data = articulo.Articulo_Nombre
+        form.precio.data = float(articulo.Articulo_PrecioVenta)  # Convertir Decimal a float
+        form.tipo_talla.data = articulo.Articulo_TipoTalla if articulo.Articulo_TipoTalla else 'ninguno'
+        
+        # Si no tiene tallas, establecer la existencia general
+        if not articulo.variantes:
+            form.existencia.data = articulo.Articulo_Existencia
+        
+        # Si tiene tallas, cargarlas en el FieldList
+        if articulo.variantes:
+            tallas = articulo.tallas_disponibles()
+            # Limpiar cualquier entrada existente
+            while len(form.tallas_numeros) > 0:
+                form.tallas_numeros.pop_entry()
+            
+            # Agregar cada talla/número al formulario
+            for nombre, cantidad in tallas.items():
+                talla_form = form.tallas_numeros.append_entry()
+                talla_form.nombre.data = nombre
+                talla_form.cantidad.data = cantidad
+
+    if form.validate_on_submit():
+        try:
+            # Procesar las tallas si aplica
+            tallas = {}
+            if form.tipo_talla.data != 'ninguno':
+                for item in form.tallas_numeros.data:
+                    if item['nombre'] and item['cantidad']:
+                        tallas[item['nombre']] = item['cantidad']
+
+            # Actualizar el artículo (la diferencia de existencias va a la bitácora)
+            antes = existencias_por_clave(articulo)
+            articulo.Articulo_Nombre = form.nombre.data
+            articulo.Articulo_PrecioVenta = form.precio.data
+            articulo.Articulo_Existencia = form.existencia.data if form.tipo_talla.data == 'ninguno' else sum(tallas.values())
+            articulo.Articulo_TipoTalla = form.tipo_talla.data if form.tipo_talla.data != 'ninguno' else None
+            sincronizar_variantes(articulo, tallas)
+            registrar_diferencia(articulo, antes, tipo='edicion')
+
+            db.session.commit()
+            flash('Artículo actualizado exitosamente!', 'success')
+            return redirect(url_for('consulta_articulos'))
+
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al actualizar artículo: {str(e)}', 'danger')
+            current_app.logger.error(f"Error en editar_articulo: {str(e)}")
+    
+    return render_template('editar_articulo.html', form=form, articulo=articulo)
+
+## Eliminar articulos
+##----------------------------------------
+@bp.route('/eliminar_variante/<int:id>', methods=['POST'])
+def eliminar_variante(id):
+    if request.method == 'POST':
+        articulo = Articulo.query.get_or_404(id)
+        talla_a_eliminar = request.form.get('talla_numero')
+        
+        try:
+            antes = existencias_por_clave(articulo)
+            # Si es una variante con talla/número
+            if talla_a_eliminar and talla_a_eliminar != '-':
+                if articulo.eliminar_talla(talla_a_eliminar):
+                    registrar_diferencia(articulo, antes, tipo='baja')
+                    db.session.commit()
+                    flash(f'Se eliminó la variante {talla_a_eliminar} correctamente', 'success')
+                else:
+                    flash('No se encontró la variante especificada', 'warning')
+            # Si es un artículo sin tallas
+            else:
+                registrar_movimientos([(articulo.Articulo_ID, t, -n) for t, n in antes.items()], tipo='baja')
+                db.session.delete(articulo)
+                db.session.commit()
+                flash('Artículo eliminado completamente', 'success')
+                
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al eliminar: {str(e)}', 'danger')
+        
+        return redirect(url_for('consulta_articulos'))
+
+
+## Recepción / ajuste de inventario en lote
+##----------------------------------------
+def _renglones_recepcion_form():
+    """Lee renglones items-{i}-articulo_id / -talla / -delta del POST (vacíos se ignoran)."""
+    import re
+    indices = set()
+    for k in request.form.keys():
+        m = re.match(r"^items-(\d+)-(articulo_id|talla|delta)$", k)
+        if m:
+            indices.add(int(m.group(1)))
+    out = []
+    for i in sorted(indices):
+        art = (request.form.get(f'items-{i}-articulo_id') or '').strip()
+        delta = (request.form.get(f'items-{i}-delta') or '').strip()
+        if not art and not delta:
+            continue
+        out.append({'articulo_id': art, 'talla': request.form.get(f'items-{i}-talla'), 'delta': delta})
+    return out
+
+
+@bp.route('/inventario/recepcion', methods=['GET', 'POST'])
+def recepcion_inventario():
+    """Pantalla de captura: muchos renglones (artículo, talla, cantidad) en un solo envío."""
+    from sqlalchemy.orm import joinedload
+
+    renglones, errores = [], []
+    tipo = request.form.get('tipo') or 'recepcion'
+    referencia = (request.form.get('referencia') or '').strip() or None
+    nota = (request.form.get('nota') or '').strip() or None
+
+    if request.method == 'POST':
+        renglones = _renglones_recepcion_form()
+        try:
+            res = aplicar_movimientos(renglones, tipo=tipo, referencia=referencia, nota=nota)
+            db.session.commit()
+            flash(f"Inventario actualizado: {res['movimientos']} movimiento(s), "
+                  f"{res['articulos']} artículo(s), {res['piezas']:+d} pieza(s).", 'success')
+            return redirect(url_for('consulta_articulos'))
+        except MovimientoInvalido as ex:
+            db.session.rollback()
+            errores = ex.errores
+            flash('No se aplicó ningún movimiento: revisa los renglones marcados.', 'danger')
+        except StockInsuficiente as ex:
+            db.session.rollback()
+            detalle = ', '.join(f"{f['nombre']}{' ' + f['talla'] if f['talla'] else ''} ({f['disponible']} disp.)"
+                                for f in ex.faltantes)
+            flash(f'Existencia insuficiente: {detalle}', 'danger')
+        except ValueError as ex:
+            db.session.rollback()
+            flash(str(ex), 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al aplicar movimientos: {str(e)}', 'danger')
+            current_app.logger.error(f"Error en recepcion_inventario: {str(e)}")
+
+    articulos = Articulo.query.order_by(Articulo.Articulo_Nombre.asc()).all()
+    variantes = variantes_por_articulo([a.Articulo_ID for a in articulos])
+    recientes = (MovimientoInventario.query
+                 .options(joinedload(MovimientoInventario.articulo))
+                 .order_by(MovimientoInventario.Movimiento_ID.desc())
+                 .limit(50).all())
+    return render_template('recepcion_inventario.html',
+                           articulos=articulos, variantes=variantes, recientes=recientes,
+                           renglones=renglones, errores=errores, tipos=TIPOS_MOVIMIENTO,
+                           tipo=tipo, referencia=referencia or '', nota=nota or '')
+
+
+@bp.route('/api/inventario/movimientos', methods=['POST'])
+def api_movimientos_inventario():
+    """
+    JSON: {"tipo": "recepcion"|"ajuste", "referencia": "...", "nota": "...",
+           "items": [{"articulo_id": 1, "talla": "M", "delta": 12}, ...]}
+    Todo o nada, en una transacción. Igual que los formularios, requiere X-CSRFToken.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        return jsonify({'ok': False, 'error': 'se esperaba un objeto JSON con "items"'}), 400
+    try:
+        res = aplicar_movimientos(
+            data['items'],
+            tipo=data.get('tipo') or 'recepcion',
+            referencia=(str(data.get('referencia') or '').strip() or None),
+            nota=(str(data.get('nota') or '').strip() or None),
+        )
+        db.session.commit()
+    except MovimientoInvalido as ex:
+        db.session.rollback()
+        return jsonify({'ok': False, 'error': str(ex), 'errores': ex.errores}), 422
+    except StockInsuficiente as ex:
+        db.session.rollback()
+        return jsonify({'ok': False, 'error': str(ex), 'faltantes': ex.faltantes}), 409
+    except ValueError as ex:
+        db.session.rollback()
+        return jsonify({'ok': False, 'error': str(ex)}), 400
+    return jsonify({'ok': True, **res})
+
+
+##---------------------------------------
+## Paquetes
+##----------------------------------------
+
+## Registro Paquetes
+##----------------------------------------
+@bp.route('/registro/paquete', methods=['GET', 'POST'])
+def registro_paquete():
+    import json, re
+    form = PaqueteForm()
+
+    # === 1) Cargar artículos desde BD y preparar metadatos ===
+    arts = Articulo.query.order_by(Articulo.Articulo_Nombre.asc()).all()
+
+    def _pk(a):
+        return getattr(a, 'id', getattr(a, 'Articulo_ID', None))
+
+    def _precio(a):
+        return float(a.Articulo_PrecioVenta or 0)
+
+    def _tipo(a):
+        # 'ninguno' | 'talla' | 'numero' (None → 'ninguno')
+        return a.Articulo_TipoTalla or 'ninguno'
+
+    variantes_map = variantes_por_articulo()
+
+    def _variantes(a):
+        """Tallas/números válidos del artículo (articulo_variante); [] si no maneja tallas."""
+        return [t for t, _e in variantes_map.get(a.Articulo_ID, [])]
+
+    arts_data = []
+    for a in arts:
+        pk = _pk(a)
+        if pk is None:
+            continue
+        arts_data.append({
+            'pk': int(pk),
+            'nombre': a.Articulo_Nombre,
+            'precio': _precio(a),
+            'tipo_talla': _tipo(a),       # 'ninguno'|'talla'|'numero'
+            'variantes': _variantes(a),   # ej. ['CH','M','G'] o ['24','25',...]
+        })
+
+    art_choices = [(ad['pk'], ad['nombre']) for ad in arts_data]
+    by_pk = {ad['pk']: ad for ad in arts_data}
+
+    # Carga choices del SelectField de cada renglón existente
+    for it in form.items:
+        it.articulo.choices = art_choices
+
+    # GET inicial → al menos un renglón
+    if request.method == 'GET' and len(form.items) == 0:
+        form.items.append_entry()
+        form.items[0].articulo.choices = art_choices
+
+    # === 2) Helpers para leer tallas/números desde request.form (sin depender de WTForms) ===
+    # NOTA: el JS del template sigue creando campos:
+    #   items-{i}-variantes-{j}-nombre   (talla o número seleccionado)
+    #   items-{i}-variantes-{j}-cantidad (siempre 1 en tu UI actual)
+    VAR_NOMBRE_RE = re.compile(r"^items-(\d+)-variantes-(\d+)-nombre$")
+    VAR_CANT_RE   = re.compile(r"^items-(\d+)-variantes-(\d+)-cantidad$")
+
+    def _collect_item_indices_from_request():
+        """Encuentra los índices i de items presentes en el POST,
+           buscando keys como items-{i}-articulo o items-{i}-cantidad."""
+        indices = set()
+        for k in request.form.keys():
+            m = re.match(r"^items-(\d+)-(articulo|cantidad)$", k)
+            if m:
+                indices.add(int(m.group(1)))
+        return sorted(indices)
+
+    def _read_variants_for_item(i):
+        """Lee todas las filas de talla/número para el item i y regresa
+           una lista [{'nombre': 'M', 'cantidad': 1}, ...]"""
+        nombres = {}
+        cantidades = {}
+        for k, v in request.form.items():
+            m_nom = VAR_NOMBRE_RE.match(k)
+            if m_nom and int(m_nom.group(1)) == i:
+                vIdx = int(m_nom.group(2))
+                nombres[vIdx] = (v or "").strip()
+            m_can = VAR_CANT_RE.match(k)
+            if m_can and int(m_can.group(1)) == i:
+                vIdx = int(m_can.group(2))
+                try:
+                    cantidades[vIdx] = int(v or 0)
+                except:
+                    cantidades[vIdx] = 0
+        out = []
+        for vIdx in sorted(set(list(nombres.keys()) + list(cantidades.keys()))):
+            out.append({
+                'nombre': nombres.get(vIdx, ""),
+                'cantidad': cantidades.get(vIdx, 0),
+            })
+        return out
+
+    # === 3) POST: validar y guardar (solo estructura y tallas/números) ===
+    if form.validate_on_submit():
+        try:
+            # Guardaremos tuplas: (art_id, cantidad, talla_numero(str|None), tipo_talla)
+            resolved_rows = []
+
+            # Indices de items
+            if form.items.entries:
+                item_indices = list(range(len(form.items.entries)))
+            else:
+                item_indices = _collect_item_indices_from_request()
+
+            if not item_indices:
+                raise ValueError('Agrega al menos un artículo al paquete.')
+
+            for i in item_indices:
+                # Obtener art_id y cantidad 1 (tu UI fija 1 por renglón)
+                if i < len(form.items.entries):
+                    val = form.items.entries[i].form.articulo.data
+                    if hasattr(val, 'id') or hasattr(val, 'Articulo_ID'):
+                        art_id = getattr(val, 'id', getattr(val, 'Articulo_ID', None))
+                    else:
+                        art_id = int(val) if val not in (None, '') else None
+
+                    cantidad_general = form.items.entries[i].form.cantidad.data
+                    try:
+                        cantidad_general = int(cantidad_general or 0)
+                    except:
+                        cantidad_general = 0
+                else:
+                    art_raw = request.form.get(f'items-{i}-articulo')
+                    art_id = int(art_raw) if art_raw not in (None, '') else None
+
+                    q_raw = request.form.get(f'items-{i}-cantidad')
+                    try:
+                        cantidad_general = int(q_raw or 0)
+                    except:
+                        cantidad_general = 0
+
+                if not art_id:
+                    continue
+
+                cfg = by_pk.get(int(art_id))
+                if not cfg:
+                    raise ValueError(f'Artículo con id {art_id} no existe.')
+
+                tipo = cfg['tipo_talla']                   # 'ninguno'|'talla'|'numero'
+                valores_validos = set(cfg['variantes'] or [])  # catálogo permitidos
+
+                if tipo == 'ninguno':
+                    if cantidad_general < 1:
+                        raise ValueError('Cada cantidad debe ser ≥ 1.')
+                    # Sin talla/número
+                    resolved_rows.append((int(art_id), cantidad_general, None, 'ninguno'))
+                else:
+                    filas = _read_variants_for_item(i)
+                    if not filas:
+                        raise ValueError(f'Agrega al menos una {tipo} para "{cfg["nombre"]}".')
+
+                    total_item = 0
+                    for fila in filas:
+                        talla_numero = (fila.get('nombre') or "").strip()
+                        cant = int(fila.get('cantidad') or 0)
+
+                        if not talla_numero:
+                            raise ValueError(f'Debes elegir la {tipo} en todas las filas.')
+                        if cant < 1:
+                            raise ValueError('La cantidad por talla/número debe ser ≥ 1.')
+                        if valores_validos and talla_numero not in valores_validos:
+                            raise ValueError(f'La {tipo} "{talla_numero}" no es válida para "{cfg["nombre"]}".')
+
+                        resolved_rows.append((int(art_id), cant, talla_numero, tipo))
+                        total_item += cant
+
+                    if total_item == 0:
+                        raise ValueError(f'Agrega al menos una {tipo} con cantidad ≥ 1 para "{cfg["nombre"]}".')
+
+            if not resolved_rows:
+                raise ValueError('Agrega al menos un artículo válido.')
+
+            # Guardado del paquete (sin validar existencias)
+            nuevo = Paquete(
+                nombre=form.nombre.data.strip(),
+                descuento_tipo=form.descuento_tipo.data,
+                descuento_valor=form.descuento_valor.data or 0
+            )
+            db.session.add(nuevo)
+            db.session.flush()
+
+            # Guardar líneas: SOLO escribimos talla_numero (si aplica)
+            for art_id, cant, talla_numero, tipo_talla in resolved_rows:
+                item = PaqueteItem(
+                    paquete_id=nuevo.id,
+                    articulo_id=int(art_id),
+                    cantidad=int(cant)
+                )
+                # Si el artículo maneja talla/numero, guardamos el valor seleccionado
+                if tipo_talla in ('talla', 'numero'):
+                    item.talla_numero = talla_numero  # "CH", "M", "25", etc.
+
+                db.session.add(item)
+
+            db.session.commit()
+            flash('Paquete registrado exitosamente.', 'success')
+            return redirect(url_for('registro_paquete'))
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Error al registrar paquete')
+            flash(f'Error al registrar paquete: {e}', 'danger')
+
+    elif request.method == 'POST':
+        flash('Por favor corrige los errores del formulario.', 'warning')
+
+    # Reinyectar choices antes de renderizar
+    for it in form.items:
+        it.articulo.choices = art_choices
+
+    return render_template('registro_paquete.html',
+                           form=form,
+                           arts_data=arts_data)  # [{pk,nombre,precio,tipo_talla,variantes:[...]}]
+
+## Editar Paquetes
+##----------------------------------------
+@bp.route('/paquetes/<int:paquete_id>/editar', methods=['GET', 'POST'])
+def editar_paquete(paquete_id):
+    import json, re
+    from sqlalchemy.orm import joinedload
+
+    # -------- helpers comunes (idénticos a registro) --------
+    def _pk(a):
+        return getattr(a, 'id', getattr(a, 'Articulo_ID', None))
+
+    def _precio(a):
+        return float(a.Articulo_PrecioVenta or 0)
+
+    def _tipo(a):
+        # 'ninguno' | 'talla' | 'numero' (None → 'ninguno')
+        return a.Articulo_TipoTalla or 'ninguno'
+
+    variantes_map = variantes_por_articulo()
+
+    def _variantes(a):
+        """Tallas/números válidos del artículo (articulo_variante)."""
+        return [t for t, _e in variantes_map.get(a.Articulo_ID, [])]
+
+    # -------- obtener paquete ----------
+    paq = (Paquete.query
+           .options(joinedload(Paquete.items).joinedload(PaqueteItem.articulo))
+           .get_or_404(paquete_id))
+
+    form = PaqueteForm()
+
+    # -------- catálogo de artículos para el selector ----------
+    arts = Articulo.query.order_by(Articulo.Articulo_Nombre.asc()).all()
+    arts_data = []
+    for a in arts:
+        pk = _pk(a)
+        if pk is None:
+            continue
+        arts_data.append({
+            'pk': int(pk),
+            'nombre': a.Articulo_Nombre,
+            'precio': _precio(a),
+            'tipo_talla': _tipo(a),       # 'ninguno'|'talla'|'numero'
+            'variantes': _variantes(a),   # ej. ['CH','M','G'] o ['24','25',...]
+        })
+    art_choices = [(ad['pk'], ad['nombre']) for ad in arts_data]
+    by_pk = {ad['pk']: ad for ad in arts_data}
+
+    # Cargar choices en las entradas existentes del FieldList
+    for it in form.items:
+        it.articulo.choices = art_choices
+
+    # -------- regex y lectores del POST (idénticos a registro) ----------
+    VAR_NOMBRE_RE = re.compile(r"^items-(\d+)-variantes-(\d+)-nombre$")
+    VAR_CANT_RE   = re.compile(r"^items-(\d+)-variantes-(\d+)-cantidad$")
+
+    def _collect_item_indices_from_request():
+        indices = set()
+        for k in request.form.keys():
+            m = re.match(r"^items-(\d+)-(articulo|cantidad)$", k)
+            if m:
+                indices.add(int(m.group(1)))
+        return sorted(indices)
+
+    def _read_variants_for_item(i):
+        nombres = {}
+        cantidades = {}
+        for k, v in request.form.items():
+            m_nom = VAR_NOMBRE_RE.match(k)
+            if m_nom and int(m_nom.group(1)) == i:
+                vIdx = int(m_nom.group(2))
+                nombres[vIdx] = (v or "").strip()
+            m_can = VAR_CANT_RE.match(k)
+            if m_can and int(m_can.group(1)) == i:
+                vIdx = int(m_can.group(2))
+                try:
+                    cantidades[vIdx] = int(v or 0)
+                except:
+                    cantidades[vIdx] = 0
+        out = []
+        for vIdx in sorted(set(list(nombres.keys()) + list(cantidades.keys()))):
+            out.append({
+                'nombre': nombres.get(vIdx, ""),
+                'cantidad': cantidades.get(vIdx, 0),
+            })
+        return out
+
+    # -------- POST: actualizar paquete ----------
+    if form.validate_on_submit():
+        try:
+            # 1) Resolver filas (igual que en registro)
+            resolved_rows = []  # (art_id, cantidad, talla_numero(str|None), tipo_talla)
+
+            if form.items.entries:
+                item_indices = list(range(len(form.items.entries)))
+            else:
+                item_indices = _collect_item_indices_from_request()
+
+            if not item_indices:
+                raise ValueError('Agrega al menos un artículo al paquete.')
+
+            for i in item_indices:
+                # Obtener art_id y cantidad_general (tu UI: 1 por renglón)
+                if i < len(form.items.entries):
+                    val = form.items.entries[i].form.articulo.data
+                    if hasattr(val, 'id') or hasattr(val, 'Articulo_ID'):
+                        art_id = getattr(val, 'id', getattr(val, 'Articulo_ID', None))
+                    else:
+                        art_id = int(val) if val not in (None, '') else None
+
+                    cantidad_general = form.items.entries[i].form.cantidad.data
+                    try:
+                        cantidad_general = int(cantidad_general or 0)
+                    except:
+                        cantidad_general = 0
+                else:
+                    art_raw = request.form.get(f'items-{i}-articulo')
+                    art_id = int(art_raw) if art_raw not in (None, '') else None
+
+                    q_raw = request.form.get(f'items-{i}-cantidad')
+                    try:
+                        cantidad_general = int(q_raw or 0)
+                    except:
+                        cantidad_general = 0
+
+                if not art_id:
+                    continue
+
+                cfg = by_pk.get(int(art_id))
+                if not cfg:
+                    raise ValueError(f'Artículo con id {art_id} no existe.')
+
+                tipo = cfg['tipo_talla']                   # 'ninguno'|'talla'|'numero'
+                valores_validos = set(cfg['variantes'] or [])
+
+                if tipo == 'ninguno':
+                    if cantidad_general < 1:
+                        raise ValueError('Cada cantidad debe ser ≥ 1.')
+                    resolved_rows.append((int(art_id), cantidad_general, None, 'ninguno'))
+                else:
+                    filas = _read_variants_for_item(i)
+                    if not filas:
+                        raise ValueError(f'Agrega al menos una {tipo} para "{cfg["nombre"]}".')
+
+                    total_item = 0
+                    for fila in filas:
+                        tn = (fila.get('nombre') or "").strip()
+                        cant = int(fila.get('cantidad') or 0)
+                        if not tn:
+                            raise ValueError(f'Debes elegir la {tipo} en todas las filas.')
+                        if cant < 1:
+                            raise ValueError('La cantidad por talla/número debe ser ≥ 1.')
+                        if valores_validos and tn not in valores_validos:
+                            raise ValueError(f'La {tipo} "{tn}" no es válida para "{cfg["nombre"]}".')
+
+                        resolved_rows.append((int(art_id), cant, tn, tipo))
+                        total_item += cant
+
+                    if total_item == 0:
+                        raise ValueError(f'Agrega al menos una {tipo} con cantidad ≥ 1 para "{cfg["nombre"]}".')
+
+            if not resolved_rows:
+                raise ValueError('Agrega al menos un artículo válido.')
+
+            # 2) Actualizar encabezado del paquete
+            paq.nombre = form.nombre.data.strip()
+            paq.descuento_tipo = form.descuento_tipo.data
+            paq.descuento_valor = form.descuento_valor.data or 0
+
+            # 3) Reemplazar líneas existentes por las nuevas
+            #    (delete-orphan hace el trabajo al limpiar la relación)
+            paq.items.clear()
+            db.session.flush()
+
+            for art_id, cant, tn, tipo_talla in resolved_rows:
+                item = PaqueteItem(
+                    paquete_id=paq.id,
+                    articulo_id=int(art_id),
+                    cantidad=int(cant)
+                )
+                if tipo_talla in ('talla', 'numero'):
+                    item.talla_numero = tn
+                db.session.add(item)
+
+            db.session.commit()
+            flash('Paquete actualizado exitosamente.', 'success')
+            return redirect(url_for('consulta_articulos', vista='paquetes'))
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Error al actualizar paquete')
+            flash(f'Error al actualizar paquete: {e}', 'danger')
+
+    # -------- GET: precargar formulario e info para el front ----------
+    else:
+        # Prefill de encabezado
+        form.nombre.data = paq.nombre
+        form.descuento_tipo.data = paq.descuento_tipo
+        form.descuento_valor.data = paq.descuento_valor
+
+        # Asegurar al menos tantas entradas como líneas existan
+        lineas = paq.items or []
+        faltan = max(1, len(lineas)) - len(form.items)
+        for _ in range(faltan):
+            form.items.append_entry()
+
+        # Cargar choices del select de cada renglón
+        for it in form.items:
+            it.articulo.choices = art_choices
+
+        # Construir arreglo de prellenado para el JS del template
+        prefill_items = []
+        for idx, it in enumerate(lineas):
+            art_obj = it.articulo or Articulo.query.get(it.articulo_id)
+            tipo = (art_obj.Articulo_TipoTalla if art_obj else None) or 'ninguno'
+            prefill_items.append({
+                'idx': idx,
+                'articulo_id': it.articulo_id,
+                'cantidad': int(it.cantidad or 1),
+                'tipo_talla': str(tipo).lower(),
+                'talla_numero': it.talla_numero or '',
+            })
+
+        # SUGERENCIA: en tu template (editar), añade un bloque JS que:
+        # - Setee select de artículo por cada fila
+        # - Llame a la misma lógica de UI para crear filas de talla/número
+        # - Seleccione la opción guardada (talla_numero)
+        # Ejemplo (pseudocódigo a insertar en el template):
+        #
+        # const prefill = {{ prefill_items|tojson }};
+        # prefill.forEach(row => {
+        #   const card = document.querySelectorAll('.paquete-item')[row.idx];
+        #   const sel = card.querySelector('.articulo-select');
+        #   sel.value = String(row.articulo_id);
+        #   sel.dispatchEvent(new Event('change')); // para que pinte tn-wrapper
+        #   if (row.tipo_talla === 'talla' || row.tipo_talla === 'numero') {
+        #       const tbody = card.querySelector('.tn-table tbody');
+        #       // crea 1 fila y selecciona la talla/número:
+        #       const addBtn = card.querySelector('.btn-add-tn');
+        #       addBtn.click();
+        #       const lastSel = tbody.querySelector('.tn-row:last-child select.tn-nombre');
+        #       if (lastSel) { lastSel.value = row.talla_numero; }
+        #   }
+        # });
+
+        return render_template('registro_paquete.html',
+                               form=form,
+                               arts_data=arts_data,
+                               edit_mode=True,
+                               paquete_id=paq.id,
+                               prefill_items=prefill_items)
+
+
+
+
+## Eliminar Paquetes
+##----------------------------------------
+
+@bp.route('/paquetes/<int:paquete_id>/eliminar', methods=['POST'])
+def eliminar_paquete(paquete_id):
+    try:
+        paq = Paquete.query.get_or_404(paquete_id)
+
+        # Al eliminar el paquete, SQLAlchemy eliminará sus items por el cascade
+        db.session.delete(paq)
+        db.session.commit()
+        flash('Paquete eliminado exitosamente.', 'success')
+
+    except IntegrityError:
+        db.session.rollback()
+        current_app.logger.exception('Integridad referencial al eliminar paquete')
+        flash('No se puede eliminar el paquete porque está referenciado por otros registros.', 'danger')
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Error al eliminar paquete')
+        flash(f'Error al eliminar paquete: {e}', 'danger')
+
+    return redirect(url_for('consulta_articulos', vista='paquetes'))
@@ -0,0 +1,1353 @@
+# blueprints/ventas.py
+"""Registro y consulta de ventas, recibos, historial y APIs de apoyo."""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from extensions import db
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta
+from sqlalchemy import or_, func, text
+from sqlalchemy.orm import joinedload, selectinload
+from report_utils import filas_ventas, kpis_ventas, kpis_de_filas, pagina_ventas
+from export_utils import respuesta_exportacion, formato_disponible, LOTE_EXPORTACION
+from resumen_utils import aportes_resumen, ajustar_resumen, kpis_resumen
+from catalogo_utils import catalogo_ventas
+from idempotencia_utils import reservar_clave, TTL_FORM
+from busqueda_utils import buscar_clientes, choices_cliente, ids_fts
+from inventario_utils import descontar_stock_lote, StockInsuficiente, reponer_stock
+from models import (
+    Estudiante, Instructor, Articulo, Pago, Venta, VentaLinea, Abono, PlanCobro, Liquidacion,
+)
+from forms import VentaForm
+from blueprints.comun import _normalize_method, _armar_reporte, _pendiente_expr
+
+
+bp = Blueprint('ventas', __name__)
+
+@bp.route('/registro/venta', methods=['GET', 'POST'])
+def registro_venta():
+    form = VentaForm()
+    if request.method == 'POST':
+        # Rehidrata WTForms con lo que viene del form
+        form.process(request.form)
+
+    # === Catálogos (snapshot compartido; se reconstruye solo si cambió la versión) ===
+    cat = catalogo_ventas()
+    KEY_SEP = cat['KEY_SEP']
+    articulos_dict = cat['articulos_dict']
+    pagos_dict = cat['pagos_dict_venta']
+    paquetes_choices = cat['paquetes_choices']
+    paquetes_dict = cat['paquetes_dict']
+
+    # === Clientes: se buscan por typeahead (/api/clientes/buscar); aquí solo el seleccionado ===
+    form.estudiante_id.choices = choices_cliente('estudiante', form.estudiante_id.data)
+    form.instructor_id.choices = choices_cliente('instructor', form.instructor_id.data)
+    estudiantes = Estudiante.query.filter(Estudiante.Est_ID == (form.estudiante_id.data or 0)).all()
+    instructores = Instructor.query.filter(Instructor.Instructor_ID == (form.instructor_id.data or 0)).all()
+
+    form.articulos.choices = cat['articulo_choices']
+    if hasattr(form, 'pagos'):
+        form.pagos.choices = cat['pago_choices']
+    if hasattr(form, 'paquetes'):
+        form.paquetes.choices = paquetes_choices
+
+    # === Helpers método de pago / referencia ===
+    def _normalize_method(val: str) -> str:
+        v = (val or "").strip().lower()
+        map_alias = {
+            "cash": "efectivo",
+            "tarjeta de crédito": "tarjeta",
+            "tarjeta de debito": "tarjeta",
+            "tarjeta de débito": "tarjeta",
+            "debito": "tarjeta",
+            "débito": "tarjeta",
+            "transferencia bancaria": "transferencia",
+            "depósito": "deposito",
+            "deposito bancario": "deposito",
+        }
+        return map_alias.get(v, v)
+
+    def _requires_reference(method_norm: str) -> bool:
+        return method_norm in {"transferencia", "tarjeta", "deposito"}
+
+    # === PENDIENTES ===
+    pend_rows = (Venta.query
+                 .options(
+                     joinedload(Venta.estudiante),
+                     joinedload(Venta.instructor),
+                     selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+                     selectinload(Venta.pagos)
+                 )
+                 .filter(
+                     or_(
+                         Venta.Metodo_Pago.is_(None),
+                         Venta.Metodo_Pago == '',
+                         func.lower(Venta.Metodo_Pago) == '__pendiente__',
+                         func.lower(Venta.Metodo_Pago) == 'pendiente'
+                     )
+                 )
+                 .order_by(Venta.Fecha_Venta.desc())
+                 .all())
+
+    pendientes = []
+    for v in pend_rows:
+        if getattr(v, 'Est_ID', None):
+            cliente_tipo = 'estudiante'
+            cliente_id = v.Est_ID
+            cliente_nombre = (f"{v.estudiante.Est_Nombre} {v.estudiante.Est_ApellidoP}"
+                              if getattr(v, 'estudiante', None) else '—')
+        elif getattr(v, 'Instructor_ID', None):
+            cliente_tipo = 'instructor'
+            cliente_id = v.Instructor_ID
+            cliente_nombre = (f"{v.instructor.Instructor_Nombre} {v.instructor.Instructor_ApellidoP}"
+                              if getattr(v, 'instructor', None) else '—')
+        else:
+            cliente_tipo = 'desconocido'
+            cliente_id = None
+            cliente_nombre = '—'
+
+        items = []
+        for ln in v.lineas:
+            key = f"{ln.Articulo_ID}{KEY_SEP}{ln.Talla}" if ln.Talla else f"{ln.Articulo_ID}"
+            meta = articulos_dict.get(key)
+            if meta:
+                desc = meta["Articulo_Nombre"] + (f" ({meta['Talla']})" if meta["Talla"] else "")
+                precio_u = float(meta["Precio"])
+            else:
+                nombre = getattr(ln.articulo, 'Articulo_Nombre', f"Artículo {ln.Articulo_ID}")
+                desc = nombre + (f" ({ln.Talla})" if ln.Talla else "")
+                precio_u = float(getattr(ln, 'Precio_Unitario', 0) or 0)
+            items.append({
+                "Articulo_ID": ln.Articulo_ID,
+                "Talla": ln.Talla,
+                "Cantidad": int(ln.Cantidad or 0),
+                "Precio": float(getattr(ln, 'Precio_Unitario', precio_u) or precio_u),
+                "Descripcion": desc
+            })
+
+        pagos_list = []
+        for p in getattr(v, 'pagos', []):
+            pagos_list.append({
+                "Pago_ID": p.Pago_ID,
+                "Descripcion": p.Pago_Tipo,
+                "Monto": float(p.Pago_Monto or 0.0)
+            })
+
+        pendientes.append({
+            "Venta_ID": v.Venta_ID,
+            "Fecha_Venta": v.Fecha_Venta.isoformat() if v.Fecha_Venta else None,
+            "cliente_tipo": cliente_tipo,
+            "cliente_id": cliente_id,
+            "cliente_nombre": cliente_nombre,
+            "lineas": items,
+            "pagos": pagos_list,
+            "Metodo_Pago": v.Metodo_Pago
+        })
+
+    # === Banderas de UI ===
+    error_flags = {
+        "cliente": False,
+        "articulos_o_pagos": False,  # estudiante: artículos o pagos
+        "articulos": False,          # instructor: artículos
+        "metodo_pago": False,
+        "referencia": False,
+        "db": False,
+        "unexpected": False,
+        "abonos": False,             # NUEVO
+    }
+
+    # ===========================
+    # Helpers de Plan/Abono/Liq
+    # ===========================
+    def _find_open_plan(est_id: int, tipo_item: str, item_ref_id: int):
+        """Busca un plan ABIERTO por combinación (est, tipo, item)."""
+        q = PlanCobro.query.filter(PlanCobro.Est_ID == est_id,
+                                   PlanCobro.Estado == 'abierto')
+        if tipo_item == 'articulo':
+            q = q.filter(PlanCobro.Articulo_ID == item_ref_id)
+        elif tipo_item == 'paquete':
+            q = q.filter(PlanCobro.Paquete_ID == item_ref_id)
+        else:
+            q = q.filter(PlanCobro.Pago_ID == item_ref_id)
+        return q.first()
+
+    def _build_plan_snapshot(est_id: int, sub):
+        """
+        Obtiene descripcion y total para crear plan si no existe.
+        Prefiere lo que venga del modal; si no, calcula con BD.
+        """
+        tipo = (sub.tipo_item.data or '').strip().lower()
+        item_id = int(sub.item_ref_id.data or 0)
+        desc = (sub.descripcion_resumen.data or '').strip()
+        total = sub.monto_total_original.data
+
+        # Si ya vino desde el modal, lo usamos (evita divergencias)
+        if desc and (total is not None):
+            try:
+                total_float = float(total)
+                return tipo, item_id, desc, max(0.0, total_float)
+            except Exception:
+                pass
+
+        # Fallback a cálculo local
+        if tipo == 'pago':
+            pg = db.session.get(Pago, item_id)
+            if not pg:
+                raise ValueError("Pago no encontrado para plan.")
+            desc = desc or f"{pg.Pago_Tipo}"
+            total = float(pg.Pago_Monto or 0.0)
+            return tipo, item_id, desc, total
+
+        elif tipo == 'articulo':
+            art = db.session.get(Articulo, item_id)
+            if not art:
+                raise ValueError("Artículo no encontrado para plan.")
+            desc = desc or f"{art.Articulo_Nombre}"
+            total = float(art.Articulo_PrecioVenta or 0.0)
+            return tipo, item_id, desc, total
+
+        elif tipo == 'paquete':
+            paq = paquetes_dict.get(item_id)
+            if not paq:
+                raise ValueError("Paquete no encontrado para plan.")
+            # Usamos el precio final del paquete (con descuento del paquete)
+            desc = desc or f"Paquete {paq['nombre']}"
+            total = float(paq['total_final'] or 0.0)
+            return tipo, item_id, desc, total
+
+        raise ValueError("Tipo de ítem inválido para plan.")
+
+    def _apply_policy_from_pago(plan: PlanCobro, pago_obj: Pago):
+        """
+        Traslada reglas básicas desde Pago hacia el plan (para evaluar al liquidar).
+        Mantiene todo simple: descuento por vigencia (fecha), recargo % o fijo.
+        """
+        # Descuento: usamos Pago_Descuento_Porcentaje y Pago_Restricciones_Fecha
+        plan.Aplica_Desc_Al_Liquidar = True if (pago_obj.Pago_Descuento_Porcentaje or pago_obj.Pago_Restricciones_Fecha) else False
+        plan.Vigencia_Inicio = None  # simplificamos: solo fecha fin
+        plan.Vigencia_Fin = pago_obj.Pago_Restricciones_Fecha
+        plan.Porc_Descuento = (pago_obj.Pago_Descuento_Porcentaje or None)
+        plan.Monto_Desc_Max = None
+
+        # Recargo: % (día de mes/fecha exacta lo dejamos como política externa)
+        if pago_obj.Pago_Tiene_Recargo:
+            plan.Porc_Recargo = (pago_obj.Pago_Recargo_Porcentaje or None)
+            if not plan.Porc_Recargo and pago_obj.Pago_Recargo_Porcentaje is None:
+                plan.Porc_Recargo = None
+        else:
+            plan.Porc_Recargo = None
+        plan.Monto_Rec_Fijo = None
+
+    def _get_or_create_plan(est_id: int, sub) -> PlanCobro:
+        """
+        Busca plan abierto. Si no existe y 'crear_plan_si_no_existe' está activo,
+        crea uno tomando snapshot de precio y reglas.
+        """
+        tipo = (sub.tipo_item.data or '').strip().lower()
+        # Si se especificó plan_id, mejor cargarlo directo
+        if sub.plan_id.data:
+            pl = db.session.get(PlanCobro, int(sub.plan_id.data))
+            if not pl:
+                raise ValueError("Plan especificado no existe.")
+            if pl.Estado != 'abierto':
+                raise ValueError("El plan especificado no está abierto.")
+            if pl.Est_ID != est_id:
+                raise ValueError("El plan no pertenece al estudiante seleccionado.")
+            return pl
+
+        # Buscar plan abierto por combinación
+        item_id = int(sub.item_ref_id.data or 0)
+        pl = _find_open_plan(est_id, tipo, item_id)
+        if pl:
+            return pl
+
+        # ¿Crear?
+        if not sub.crear_plan_si_no_existe.data:
+            raise ValueError("No existe plan y no se autorizó crear uno nuevo.")
+
+        # Construir snapshot y crear plan
+        tipo, item_id, desc, total = _build_plan_snapshot(est_id, sub)
+        pl = PlanCobro(
+            Est_ID=est_id,
+            Articulo_ID=item_id if tipo == 'articulo' else None,
+            Paquete_ID=item_id if tipo == 'paquete' else None,
+            Pago_ID=item_id if tipo == 'pago' else None,
+            Precio_Base_Snapshot=total,
+            Descripcion_Resumen=desc,
+            Monto_Total_Original=total,
+            Saldo_Actual=total,
+            Estado='abierto',
+            Entregable=True if tipo in ('articulo', 'paquete') else False,
+        )
+        # Reglas si viene de Pago
+        if tipo == 'pago':
+            pg = db.session.get(Pago, item_id)
+            if pg:
+                _apply_policy_from_pago(pl, pg)
+
+        db.session.add(pl)
+        db.session.flush()
+        return pl
+
+    def _registrar_abono_y_posible_liquidacion(plan: PlanCobro,
+                                               venta: Venta,
+                                               metodo_norm: str,
+                                               referencia_val: str | None,
+                                               sub) -> tuple[float, float]:
+        """
+        Registra el abono (o liquidación) y, si el saldo llega a 0, calcula y adjunta
+        el ajuste (descuento o recargo) a la misma venta como un Pago.
+        Devuelve (descuento_aplicado, recargo_aplicado).
+        """
+        ahora = datetime.now()
+        # Determinar monto del abono
+        if sub.liquidar.data:
+            abono_monto = float(plan.Saldo_Actual or 0.0)
+        else:
+            abono_monto = float(sub.monto_abono.data or 0.0)
+
+        if abono_monto <= 0:
+            raise ValueError("El monto del abono debe ser mayor a 0.")
+
+        if abono_monto > float(plan.Saldo_Actual or 0.0):
+            # Capar al saldo
+            abono_monto = float(plan.Saldo_Actual or 0.0)
+
+        # Crear Abono + enlazar a la venta
+        ab = Abono(
+            Plan_ID=plan.Plan_ID,
+            Venta_ID=venta.Venta_ID,
+            Monto_Abonado=abono_monto,
+            Fecha_Abono=ahora,
+            Metodo_Pago=metodo_norm,
+            Referencia_Pago=(referencia_val if _requires_reference(metodo_norm) else None),
+            Observaciones=(sub.observaciones.data or None)
+        )
+        db.session.add(ab)
+
+        # Actualizar plan
+        plan.Saldo_Actual = round(max(0.0, float(plan.Saldo_Actual or 0.0) - abono_monto), 2)
+        plan.Fecha_Ultimo_Abono = ahora
+
+        descuento_aplicado = 0.0
+        recargo_aplicado = 0.0
+
+        # ¿Llegó a 0? -> Liquidación y ajuste
+        if float(plan.Saldo_Actual) <= 0.00001 and plan.Estado == 'abierto':
+            # Determinar descuento/recargo según vigencia simple
+            hoy = date.today()
+            en_vigencia = True
+            if plan.Vigencia_Inicio and plan.Vigencia_Fin:
+                en_vigencia = (plan.Vigencia_Inicio <= hoy <= plan.Vigencia_Fin)
+            elif plan.Vigencia_Fin and not plan.Vigencia_Inicio:
+                en_vigencia = (hoy <= plan.Vigencia_Fin)
+            elif plan.Vigencia_Inicio and not plan.Vigencia_Fin:
+                en_vigencia = (hoy >= plan.Vigencia_Inicio)
+
+            base = float(plan.Monto_Total_Original or 0.0)
+
+            if plan.Aplica_Desc_Al_Liquidar and en_vigencia and plan.Porc_Descuento:
+                descuento_aplicado = round(base * float(plan.Porc_Descuento) / 100.0, 2)
+                if plan.Monto_Desc_Max:
+                    descuento_aplicado = min(descuento_aplicado, float(plan.Monto_Desc_Max or 0.0))
+
+                # Adjuntamos ajuste como Pago negativo
+                pago_desc = Pago(
+                    Pago_Tipo=f"Descuento liquidación plan #{plan.Plan_ID}",
+                    Pago_Monto=-descuento_aplicado,
+                    Pago_Fecha=hoy,
+                    Est_ID=venta.Est_ID,
+                    Pago_Es_Mensual=False
+                )
+                db.session.add(pago_desc)
+                db.session.flush()
+                venta.pagos.append(pago_desc)
+
+            else:
+                # ¿Recargo?
+                rec_sobre_base = round(base * float(plan.Porc_Recargo or 0.0) / 100.0, 2) if plan.Porc_Recargo else 0.0
+                rec_fijo = float(plan.Monto_Rec_Fijo or 0.0)
+                recargo_aplicado = round(rec_sobre_base + rec_fijo, 2)
+
+                if recargo_aplicado > 0:
+                    pago_rec = Pago(
+                        Pago_Tipo=f"Recargo liquidación plan #{plan.Plan_ID}",
+                        Pago_Monto=recargo_aplicado,
+                        Pago_Fecha=hoy,
+                        Est_ID=venta.Est_ID,
+                        Pago_Es_Mensual=False
+                    )
+                    db.session.add(pago_rec)
+                    db.session.flush()
+                    venta.pagos.append(pago_rec)
+
+            # Crear registro de liquidación y cerrar plan
+            liq = Liquidacion(
+                Plan_ID=plan.Plan_ID,
+                Venta_Final_ID=venta.Venta_ID,
+                Fecha_Liquidacion=ahora,
+                Descuento_Aplicado=descuento_aplicado,
+                Recargo_Aplicado=recargo_aplicado,
+                Base_Calculo='total_original',
+                Nota_Reglas=None
+            )
+            db.session.add(liq)
+            plan.Estado = 'liquidado'
+
+            # NOTA: Si el plan es entregable (art/paq), aquí podrías disparar entrega/inventario.
+            # Para mantener "mínima intrusión", lo dejamos como paso posterior.
+
+        return descuento_aplicado, recargo_aplicado
+
+    # ===========================
+    #         POST
+    # ===========================
+    if request.method == 'POST':
+        try:
+            # Idempotencia (anti-duplicados por form_id; se reserva en BD antes de escribir)
+            anti_dup_form_id = (request.form.get('form_id') or '').strip()
+
+            # Ventas pendientes a consolidar
+            raw_pend = (request.form.get('pendientes_ids') or '').strip()
+            pendientes_ids = []
+            if raw_pend:
+                for tok in raw_pend.split(','):
+                    tok = tok.strip()
+                    if tok.isdigit():
+                        pendientes_ids.append(int(tok))
+
+            # Deducción de tipo de cliente
+            tipo_cliente = (request.form.get("tipo_cliente") or "").strip().lower()
+            est_id = form.estudiante_id.data if form.estudiante_id.data is not None else None
+            ins_id = form.instructor_id.data if form.instructor_id.data is not None else None
+            if not tipo_cliente:
+                if est_id and int(est_id) != 0:
+                    tipo_cliente = "estudiante"
+                elif ins_id and int(ins_id) != 0:
+                    tipo_cliente = "instructor"
+
+            # Validación cliente
+            if tipo_cliente == "estudiante":
+                if est_id is None or int(est_id) == 0:
+                    error_flags["cliente"] = True
+                    flash("Debe seleccionar un estudiante.", "danger")
+            elif tipo_cliente == "instructor":
+                if ins_id is None or int(ins_id) == 0:
+                    error_flags["cliente"] = True
+                    flash("Debe seleccionar un instructor.", "danger")
+            else:
+                error_flags["cliente"] = True
+                flash("Debe seleccionar un estudiante o un instructor.", "danger")
+
+            # Método de pago + referencia
+            metodo_crudo = (getattr(form, 'metodo_pago', None).data or "").strip() if hasattr(form, 'metodo_pago') else (request.form.get('metodo_pago','').strip())
+            if not metodo_crudo:
+                error_flags["metodo_pago"] = True
+                flash("Debe seleccionar un método de pago.", "danger")
+            metodo_norm = _normalize_method(metodo_crudo)
+
+            referencia_val = (getattr(form, 'referencia_pago', None).data or "").strip() if hasattr(form, "referencia_pago") else (request.form.get('referencia_pago','').strip())
+            if metodo_crudo and _requires_reference(metodo_norm) and not referencia_val:
+                error_flags["referencia"] = True
+                flash("La referencia es obligatoria para transferencia, tarjeta o depósito.", "danger")
+
+            # === Parseo de Artículos ===
+            items = []  # {'art_id','talla','qty','price':None|float}
+            for k in request.form.keys():
+                if k.startswith("articulos-") and "-id" in k:
+                    art_key = request.form[k]  # "15:::M" o "15"
+                    base_key = k.rsplit('-id', 1)[0]
+                    qty_str = request.form.get(base_key + '-qty') or request.form.get(base_key + '-cantidad')
+                    try:
+                        qty = max(int(qty_str), 1) if qty_str is not None else 1
+                    except Exception:
+                        qty = 1
+
+                    if KEY_SEP in art_key:
+                        art_id_str, talla = art_key.split(KEY_SEP, 1)
+                        art_id = int(art_id_str)
+                        talla = talla or None
+                    else:
+                        art_id = int(art_key)
+                        talla = None
+
+                    items.append({'art_id': art_id, 'talla': talla, 'qty': qty, 'price': None})
+
+            # === Parseo de Paquetes ===
+            for k in request.form.keys():
+                if k.startswith("paquetes-") and k.endswith("-id"):
+                    base_key = k[:-3]  # quitar "-id"
+                    try:
+                        paq_id = int(request.form[k])
+                    except Exception:
+                        continue
+                    qty_paq = request.form.get(base_key + 'qty') or request.form.get(base_key + 'cantidad') or "1"
+                    try:
+                        qty_paq = max(int(qty_paq), 1)
+                    except Exception:
+                        qty_paq = 1
+
+                    paq = paquetes_dict.get(paq_id)
+                    if not paq:
+                        continue
+
+                    for it in paq['items']:
+                        total_qty = int(it['cantidad']) * qty_paq
+                        price_override = float(it['precio_unit_ajustado'])
+                        items.append({
+                            'art_id': it['articulo_id'],
+                            'talla': it['talla'],
+                            'qty': total_qty,
+                            'price': price_override
+                        })
+
+            # === Pagos seleccionados ===
+            pagos_ids = []
+            for k in request.form.keys():
+                if k.startswith("pagos-") and k.endswith("-id"):
+                    pagos_ids.append(request.form[k])
+
+            # Reglas de contenido
+            if tipo_cliente == "instructor":
+                if len(items) == 0:
+                    error_flags["articulos"] = True
+                    flash("Para instructor, debe agregar al menos un artículo.", "danger")
+                pagos_ids = []  # ignorar pagos para instructor
+            elif tipo_cliente == "estudiante":
+                if (len(items) == 0) and (len(pagos_ids) == 0) and (len(getattr(form, 'abonos', []).entries) == 0):
+                    # Si no hay artículos, ni pagos, ni abonos → error
+                    error_flags["articulos_o_pagos"] = True
+                    flash("Para estudiante, agregue artículos y/o pagos, o registre un abono.", "danger")
+
+            # Si hay errores: re-render
+            if any(error_flags.values()):
+                return render_template(
+                    'registro_venta.html',
+                    form=form,
+                    articulos_dict=articulos_dict,
+                    estudiantes=estudiantes,
+                    instructores=instructores,
+                    pagos_dict=pagos_dict,
+                    paquetes_choices=paquetes_choices,
+                    paquetes_dict=paquetes_dict,
+                    KEY_SEP=KEY_SEP,
+                    error_flags=error_flags,
+                    tipo_cliente_seleccionado=tipo_cliente,
+                    pendientes=pendientes,
+                )
+
+            # Anti-duplicados: el form_id queda en la misma transacción que la venta
+            if anti_dup_form_id and not reservar_clave('venta-form', anti_dup_form_id, ttl=TTL_FORM):
+                db.session.rollback()
+                flash('Esta venta ya fue registrada (se evitó un duplicado).', 'info')
+                return redirect(url_for("consulta_ventas"))
+
+            # === Crear venta nueva
+            nueva_venta = Venta(
+                Est_ID=est_id if tipo_cliente == "estudiante" else None,
+                Instructor_ID=ins_id if tipo_cliente == "instructor" else None,
+                Metodo_Pago=metodo_norm,
+                Referencia_Pago=referencia_val if _requires_reference(metodo_norm) else None,
+                Fecha_Venta=datetime.now(),
+            )
+
+            # === Líneas (solo artículos NO parciales)
+            subtotal_lineas = 0.0
+            stock_solicitado = []  # (articulo_id, talla, qty) → se descuenta en lote al final
+            for it in items:
+                articulo = db.session.get(Articulo, it['art_id'])
+                if not articulo:
+                    error_flags["articulos"] = True
+                    flash("Artículo no encontrado.", "danger")
+                    return render_template(
+                        'registro_venta.html',
+                        form=form,
+                        articulos_dict=articulos_dict,
+                        estudiantes=estudiantes,
+                        instructores=instructores,
+                        pagos_dict=pagos_dict,
+                        paquetes_choices=paquetes_choices,
+                        paquetes_dict=paquetes_dict,
+                        KEY_SEP=KEY_SEP,
+                        error_flags=error_flags,
+                        tipo_cliente_seleccionado=tipo_cliente,
+                        pendientes=pendientes,
+                    )
+
+                precio = float(it['price']) if (it.get('price') is not None) else float(articulo.Articulo_PrecioVenta or 0)
+                qty = int(it['qty'])
+                talla = it['talla']
+                stock_solicitado.append((articulo.Articulo_ID, talla, qty))
+
+                linea = VentaLinea(
+                    venta=nueva_venta,
+                    Articulo_ID=articulo.Articulo_ID,
+                    Talla=talla,
+                    Cantidad=qty,
+                    Precio_Unitario=precio
+                )
+                db.session.add(linea)
+                subtotal_lineas += precio * qty
+
+            # === Control de stock: verificar y descontar TODAS las líneas en un solo paso
+            # (UPDATE condicionado: dos cajas no pueden vender la última pieza a la vez)
+            try:
+                db.session.add(nueva_venta)
+                db.session.flush()  # Venta_ID para la bitácora de inventario
+                descontar_stock_lote(stock_solicitado, venta_id=nueva_venta.Venta_ID)
+            except StockInsuficiente as ex_stock:
+                db.session.rollback()
+                error_flags["articulos"] = True
+                for f in ex_stock.faltantes:
+                    if f['talla']:
+                        flash(f"Stock insuficiente para {f['nombre']} ({f['talla']}). Disponible: {f['disponible']}", "danger")
+                    else:
+                        flash(f"Stock insuficiente para {f['nombre']}. Disponible: {f['disponible']}", "danger")
+                return render_template(
+                    'registro_venta.html',
+                    form=form,
+                    articulos_dict=articulos_dict,
+                    estudiantes=estudiantes,
+                    instructores=instructores,
+                    pagos_dict=pagos_dict,
+                    paquetes_choices=paquetes_choices,
+                    paquetes_dict=paquetes_dict,
+                    KEY_SEP=KEY_SEP,
+                    error_flags=error_flags,
+                    tipo_cliente_seleccionado=tipo_cliente,
+                    pendientes=pendientes,
+                )
+
+            # === Asociar pagos (solo estudiante)
+            total_conceptos = 0.0
+            if tipo_cliente == "estudiante" and pagos_ids:
+                for pid in pagos_ids:
+                    try:
+                        pid_int = int(pid)
+                    except Exception:
+                        continue
+                    pago = db.session.get(Pago, pid_int)
+                    if pago:
+                        nueva_venta.pagos.append(pago)
+                        total_conceptos += float(pago.Pago_Monto or 0.0)
+
+            # Persistimos venta y obtenemos ID
+            db.session.add(nueva_venta)
+            db.session.flush()
+
+            # === NUEVO: Procesar ABONOS (solo estudiante)
+            if tipo_cliente != "estudiante" and len(getattr(form, 'abonos', []).entries) > 0:
+                flash("Los abonos parciales aplican solo a estudiantes. Se ignoraron en esta venta.", "warning")
+
+            ajustes_totales_desc = 0.0
+            ajustes_totales_rec = 0.0
+
+            if tipo_cliente == "estudiante":
+                for sub in getattr(form, 'abonos', []).entries:
+                    try:
+                        plan = _get_or_create_plan(int(est_id), sub)
+                        desc_apl, rec_apl = _registrar_abono_y_posible_liquidacion(
+                            plan=plan,
+                            venta=nueva_venta,
+                            metodo_norm=metodo_norm,
+                            referencia_val=referencia_val,
+                            sub=sub
+                        )
+                        ajustes_totales_desc += float(desc_apl or 0.0)
+                        ajustes_totales_rec  += float(rec_apl or 0.0)
+                    except Exception as ex_ab:
+                        error_flags["abonos"] = True
+                        flash(f"❌ Error en abonos: {str(ex_ab)}", "danger")
+                        # re-render conservando estado
+                        return render_template(
+                            'registro_venta.html',
+                            form=form,
+                            articulos_dict=articulos_dict,
+                            estudiantes=estudiantes,
+                            instructores=instructores,
+                            pagos_dict=pagos_dict,
+                            paquetes_choices=paquetes_choices,
+                            paquetes_dict=paquetes_dict,
+                            KEY_SEP=KEY_SEP,
+                            error_flags=error_flags,
+                            tipo_cliente_seleccionado=tipo_cliente,
+                            pendientes=pendientes,
+                        )
+
+            # === Recalcular totales de pagos después de ajustes por liquidación
+            total_conceptos = 0.0
+            for p in nueva_venta.pagos:
+                total_conceptos += float(p.Pago_Monto or 0.0)
+
+            # === Registrar COBRO (si el modelo existe) con importes actualizados
+            try:
+                monto_cobrado = float(subtotal_lineas) + float(total_conceptos)
+                if monto_cobrado > 0:
+                    cobro = VentaCobro(
+                        Venta_ID=nueva_venta.Venta_ID,
+                        Metodo=metodo_norm,
+                        Referencia=(referencia_val if _requires_reference(metodo_norm) else None),
+                        Monto=monto_cobrado,
+                        Fecha=datetime.now()
+                    )
+                    db.session.add(cobro)
+            except NameError:
+                pass
+
+            # === ELIMINAR ventas PENDIENTES seleccionadas (reponiendo stock)
+            antes_resumen = aportes_resumen(pendientes_ids)
+            if pendientes_ids:
+                for vid in pendientes_ids:
+                    vpend = (Venta.query
+                             .filter(
+                                 Venta.Venta_ID == vid,
+                                 or_(Venta.Metodo_Pago.is_(None),
+                                     Venta.Metodo_Pago == '',
+                                     func.lower(Venta.Metodo_Pago).in_(['__pendiente__', 'pendiente']))
+                             ).first())
+                    if not vpend:
+                        continue
+
+                    lineas_pend = VentaLinea.query.filter(VentaLinea.Venta_ID == vid).all()
+                    for lp in lineas_pend:
+                        reponer_stock(lp.Articulo_ID, lp.Talla, int(lp.Cantidad or 0), venta_id=vid)
+
+                    VentaLinea.query.filter(VentaLinea.Venta_ID == vid).delete(synchronize_session=False)
+                    try:
+                        db.session.execute(text("DELETE FROM venta_pago WHERE venta_id = :vid"), {"vid": vid})
+                    except Exception:
+                        pass
+                    Venta.query.filter(Venta.Venta_ID == vid).delete(synchronize_session=False)
+
+            # Resumen diario (misma transacción): suma la nueva venta y resta las pendientes borradas
+            ajustar_resumen([nueva_venta.Venta_ID, *pendientes_ids], antes_resumen)
+
+            # Commit final (incluye la llave de idempotencia)
+            db.session.commit()
+
+            flash("Venta registrada con éxito.", "success")
+            return redirect(url_for("consulta_ventas"))
+
+        except IntegrityError:
+            db.session.rollback()
+            error_flags["db"] = True
+            flash("❌ Error de integridad en la base de datos. Verifique los datos e intente de nuevo.", "danger")
+            return render_template(
+                'registro_venta.html',
+                form=form,
+                articulos_dict=articulos_dict,
+                estudiantes=estudiantes,
+                instructores=instructores,
+                pagos_dict=pagos_dict,
+                paquetes_choices=paquetes_choices,
+                paquetes_dict=paquetes_dict,
+                KEY_SEP=KEY_SEP,
+                error_flags=error_flags,
+                tipo_cliente_seleccionado=(request.form.get('tipo_cliente') or '').strip().lower(),
+                pendientes=pendientes,
+            )
+        except Exception as e:
+            db.session.rollback()
+            error_flags["unexpected"] = True
+            flash(f'❌ Error inesperado: {str(e)}', 'danger')
+            return render_template(
+                'registro_venta.html',
+                form=form,
+                articulos_dict=articulos_dict,
+                estudiantes=estudiantes,
+                instructores=instructores,
+                pagos_dict=pagos_dict,
+                paquetes_choices=paquetes_choices,
+                paquetes_dict=paquetes_dict,
+                KEY_SEP=KEY_SEP,
+                error_flags=error_flags,
+                tipo_cliente_seleccionado=(request.form.get('tipo_cliente') or '').strip().lower(),
+                pendientes=pendientes,
+            )
+
+    # === GET o POST con errores ===
+    return render_template(
+        'registro_venta.html',
+        form=form,
+        articulos_dict=articulos_dict,
+        estudiantes=estudiantes,
+        instructores=instructores,
+        pagos_dict=pagos_dict,
+        paquetes_choices=paquetes_choices,
+        paquetes_dict=paquetes_dict,
+        KEY_SEP=KEY_SEP,
+        error_flags=error_flags,
+        tipo_cliente_seleccionado=request.form.get('tipo_cliente', '') if request.method == 'POST' else '',
+        pendientes=pendientes,
+    )
+
+
+# -----------------------------
+# Consulta ventas
+# -----------------------------
+def _consulta_ventas_query():
+    """
+    Filtros de consulta_ventas (querystring) → (query de Venta filtrada, filtros).
+    Lo comparten la pantalla y la exportación, así ambas ven las mismas ventas.
+    """
+    # ===== Filtros =====
+    inicio_str = (request.args.get('inicio') or '').strip()
+    fin_str    = (request.args.get('fin') or '').strip()
+    metodo     = _normalize_method((request.args.get('metodo') or '').strip())
+    tipo       = (request.args.get('tipo') or 'todos').strip().lower()
+    q          = (request.args.get('q') or '').strip()
+    estado     = (request.args.get('estado') or 'todas').strip().lower()  # NUEVO
+
+    # Si alguien elige "método = pendiente", lo tratamos como estado=pendientes
+    if metodo in ('pendiente', '__pendiente__', '__pendiente', '__PENDIENTE__'):
+        estado = 'pendientes'
+        metodo = ''
+
+    # Si el estado es "pendientes", NO aplicar filtro por método (pendiente no tiene método)
+    if estado == 'pendientes':
+        metodo = ''
+
+    # ===== Fechas =====
+    dt_ini = None
+    dt_fin = None
+    if inicio_str:
+        try:
+            dt_ini = datetime.strptime(inicio_str, '%Y-%m-%d')
+        except Exception:
+            dt_ini = None
+    if fin_str:
+        try:
+            dt_fin = datetime.strptime(fin_str, '%Y-%m-%d') + timedelta(days=1)
+        except Exception:
+            dt_fin = None
+
+    # ===== Query base (solo filtros; el reporte se arma en SQL) =====
+    query = Venta.query
+
+    # Tipo de cliente
+    if tipo == 'estudiante':
+        query = query.filter(Venta.Est_ID.isnot(None))
+    elif tipo == 'instructor':
+        query = query.filter(Venta.Instructor_ID.isnot(None))
+
+    # Método (solo si quedó algo después de la lógica de pendientes)
+    if metodo:
+        query = query.filter(Venta.Metodo_Pago == metodo)
+
+    # Rango de fechas
+    if dt_ini:
+        query = query.filter(Venta.Fecha_Venta >= dt_ini)
+    if dt_fin:
+        query = query.filter(Venta.Fecha_Venta < dt_fin)
+
+    # ===== Filtro de ESTADO =====
+    # Consideramos PENDIENTE cuando:
+    #  - Cobro_Pendiente == True (si existe esa columna)
+    #  - o Metodo_Pago es '__PENDIENTE__' / 'pendiente' (en cualquier casing)
+    #  - o Metodo_Pago es NULL o '' (cadena vacía)
+    base_pend_expr = or_(
+        func.lower(Venta.Metodo_Pago) == '__pendiente__',
+        func.lower(Venta.Metodo_Pago) == 'pendiente',
+        Venta.Metodo_Pago.is_(None),
+        Venta.Metodo_Pago == ''
+    )
+    if hasattr(Venta, 'Cobro_Pendiente'):
+        pendiente_expr = or_(Venta.Cobro_Pendiente == True, base_pend_expr)
+    else:
+        pendiente_expr = base_pend_expr
+
+    if estado == 'pendientes':
+        query = query.filter(pendiente_expr)
+    elif estado == 'cobradas':
+        query = query.filter(~pendiente_expr)
+
+    # Búsqueda libre: índice FTS5 (nombre del cliente, método, referencia); ilike si no hay índice
+    ids_venta = ids_fts('venta', q) if q else None
+    if ids_venta is not None:
+        query = query.filter(or_(
+            Venta.Venta_ID.in_(ids_venta),
+            Venta.Est_ID.in_(ids_fts('estudiante', q)),
+            Venta.Instructor_ID.in_(ids_fts('instructor', q)),
+        ))
+    elif q:
+        patron = f"%{q}%"
+        query = (query
+                 .outerjoin(Estudiante, Estudiante.Est_ID == Venta.Est_ID)
+                 .outerjoin(Instructor, Instructor.Instructor_ID == Venta.Instructor_ID)
+                 .filter(or_(
+                     Estudiante.Est_Nombre.ilike(patron),
+                     Estudiante.Est_ApellidoP.ilike(patron),
+                     Instructor.Instructor_Nombre.ilike(patron),
+                     Instructor.Instructor_ApellidoP.ilike(patron),
+                     Venta.Metodo_Pago.ilike(patron),
+                     Venta.Referencia_Pago.ilike(patron)
+                 ))
+                 .distinct())
+
+    filtros = {'inicio': inicio_str, 'fin': fin_str, 'metodo': metodo, 'tipo': tipo, 'q': q,
+               'estado': estado, 'dt_ini': dt_ini, 'dt_fin': dt_fin}
+    return query, filtros
+
+
+@bp.route('/consulta/ventas', methods=['GET'])
+def consulta_ventas():
+    query, f = _consulta_ventas_query()
+    inicio_str, fin_str, metodo, tipo, q, estado, dt_ini, dt_fin = (
+        f['inicio'], f['fin'], f['metodo'], f['tipo'], f['q'], f['estado'], f['dt_ini'], f['dt_fin'])
+    cursor     = (request.args.get('cursor') or '').strip()
+    per_page   = request.args.get('per_page', type=int) or 50
+    per_page   = max(10, min(per_page, 200))
+
+    # === Página por cursor (Fecha_Venta, Venta_ID) + KPIs por separado ===
+    # - filas y kpis_pagina: solo las ventas de esta página
+    # - kpis: agregados de todo el filtro (no dependen de la página)
+    pagina_sq, next_cursor = pagina_ventas(query, cursor, per_page)
+    ventas = filas_ventas(pagina_sq)
+    kpis_pagina = kpis_de_filas(ventas)
+
+    # KPIs globales: del resumen diario si no hay búsqueda libre; si no, en SQL directo
+    kpis = None
+    if not q:
+        try:
+            kpis = kpis_resumen(dt_ini=dt_ini, dt_fin=dt_fin, tipo=tipo, metodo=metodo, estado=estado)
+        except Exception:
+            db.session.rollback()  # tabla aún no migrada
+            kpis = None
+    if kpis is None:
+        ids_sq = query.with_entities(Venta.Venta_ID).distinct().subquery()
+        kpis = kpis_ventas(ids_sq)
+
+    # === Link historial estudiante ===
+    for row in ventas:
+        est_id = row.get('est_id')
+        if row.get('cliente_tipo') == 'estudiante' and est_id:
+            row['cliente_url'] = url_for('historial_ventas_estudiante', estudiante_id=est_id)
+        else:
+            row['cliente_url'] = None
+
+    return render_template(
+        'consulta_ventas.html',
+        ventas=ventas,
+        kpis=kpis,
+        kpis_pagina=kpis_pagina,
+        paginacion={
+            'per_page': per_page,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'has_next': bool(next_cursor),
+            'es_primera': not cursor,
+        },
+        filtros={
+            'inicio': inicio_str,
+            'fin': fin_str,
+            'metodo': metodo,
+            'tipo': tipo,
+            'q': q,
+            'estado': estado
+        }
+    )
+
+
+@bp.route('/consulta/ventas/exportar', methods=['GET'])
+def exportar_ventas():
+    """
+    CSV/XLSX de consulta_ventas con los mismos filtros (sin paginar). Se recorre por
+    páginas de cursor de LOTE_EXPORTACION ventas: memoria constante y la descarga empieza
+    con la primera página.
+    """
+    formato = (request.args.get('formato') or 'csv').strip().lower()
+    if not formato_disponible(formato):
+        flash(f"Exportación a {formato.upper()} no disponible en este servidor.", "warning")
+        return redirect(url_for('consulta_ventas', **{k: v for k, v in request.args.items() if k != 'formato'}))
+    query, _f = _consulta_ventas_query()
+
+    def _desc_item(i):
+        talla = f" ({i['talla']})" if i['talla'] else ''
+        return f"{i['articulo']}{talla} x{i['cantidad']}"
+
+    def _filas():
+        cursor = None
+        while True:
+            pagina_sq, cursor = pagina_ventas(query, cursor, LOTE_EXPORTACION)
+            for v in filas_ventas(pagina_sq):
+                yield (
+                    v['id'], v['fecha'], v['cliente_tipo'], v['cliente_nombre'], v['metodo'],
+                    v['referencia'],
+                    '; '.join(_desc_item(i) for i in v['items']),
+                    v['subtotal_items'],
+                    '; '.join(p['tipo'] for p in v['pagos']),
+                    v['pagos_subtotal'], v['descuento_pagos'], v['total_venta'],
+                )
+            db.session.expunge_all()
+            if not cursor:
+                break
+
+    encabezados = ('Venta', 'Fecha', 'Tipo cliente', 'Cliente', 'Método', 'Referencia', 'Artículos',
+                   'Subtotal artículos', 'Conceptos', 'Subtotal conceptos', 'Descuento', 'Total')
+    return respuesta_exportacion('ventas', formato, encabezados, _filas())
+
+
+#
+# Eliminar venta
+#
+@bp.route('/ventas/<int:venta_id>/eliminar', methods=['POST'])
+def eliminar_venta(venta_id):
+    import json
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy import text
+    from sqlalchemy.orm import selectinload
+
+    # Cargar venta con sus líneas
+    v = (Venta.query
+         .options(selectinload(Venta.lineas))
+         .get_or_404(venta_id))
+
+    try:
+        antes_resumen = aportes_resumen([v.Venta_ID])
+
+        # === Restablecer inventario por cada línea ===
+        for ln in (v.lineas or []):
+            reponer_stock(ln.Articulo_ID, getattr(ln, 'Talla', None), int(getattr(ln, 'Cantidad', 0) or 0),
+                          venta_id=v.Venta_ID)
+
+        # === Limpiar dependencias (por si no hay cascade) ===
+        # Cobros (si el modelo existe)
+        try:
+            VentaCobro.query.filter_by(Venta_ID=v.Venta_ID).delete(synchronize_session=False)
+        except NameError:
+            pass  # Si no tienes el modelo, lo ignoramos con seguridad
+
+        # Relación venta_pago (tabla puente)
+        try:
+            db.session.execute(text("DELETE FROM venta_pago WHERE venta_id = :vid"), {"vid": v.Venta_ID})
+        except Exception:
+            pass
+
+        # Líneas (si tu relación no tiene cascade delete)
+        try:
+            VentaLinea.query.filter(VentaLinea.Venta_ID == v.Venta_ID).delete(synchronize_session=False)
+        except Exception:
+            pass
+
+        # Eliminar la venta
+        db.session.delete(v)
+
+        # Resumen diario: se resta lo que aportaba la venta
+        ajustar_resumen([venta_id], antes_resumen)
+        db.session.commit()
+
+        flash(f'La venta #{venta_id} fue eliminada y el inventario fue restablecido.', 'success')
+
+    except IntegrityError:
+        db.session.rollback()
+        flash('No se pudo eliminar la venta por un problema de integridad.', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Ocurrió un error al eliminar la venta: {e}', 'danger')
+
+    next_url = request.form.get('next') or url_for('consulta_ventas')
+    return redirect(next_url)
+
+
+#
+# Detalle de la venta
+#
+@bp.get('/ventas/<int:venta_id>')
+def venta_detalle(venta_id: int):
+    v = (Venta.query
+         .options(
+             joinedload(Venta.estudiante),
+             joinedload(Venta.instructor),
+             selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+             selectinload(Venta.pagos)
+         )
+         .filter(Venta.Venta_ID == venta_id)
+         .first())
+    if not v:
+        flash(f"Venta #{venta_id} no encontrada.", "warning")
+        return redirect(url_for('consulta_ventas'))
+
+    # Reusar ensamblado existente
+    ventas, _kpis = _armar_reporte([v])
+    det = ventas[0] if ventas else None
+    if not det:
+        flash(f"No fue posible armar el detalle de la venta #{venta_id}.", "danger")
+        return redirect(url_for('consulta_ventas'))
+
+    # <- NUEVO: si piden parcial, devolvemos solo el fragmento embebible
+    if request.args.get('partial') == '1':
+        return render_template(
+            'venta_detalle_partial.html',
+            v=det,
+            venta_id=venta_id,
+            rid=request.args.get('rid', ''),  # id del acordeón en la tabla
+            back=(request.args.get('next') or url_for('consulta_ventas'))
+        )
+
+    # Página completa (si algún día quieres abrir en pestaña)
+    return render_template(
+        'venta_detalle.html',
+        v=det,
+        venta_id=venta_id,
+        back=(request.args.get('next') or url_for('consulta_ventas'))
+    )
+
+#
+#  recibo
+#
+@bp.get('/ventas/<int:venta_id>/recibo')
+def venta_recibo(venta_id: int):
+    v = (Venta.query
+         .options(
+             joinedload(Venta.estudiante),
+             joinedload(Venta.instructor),
+             selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+             selectinload(Venta.pagos)
+         )
+         .filter(Venta.Venta_ID == venta_id)
+         .first())
+    if not v:
+        flash(f"Venta #{venta_id} no encontrada.", "warning")
+        return redirect(url_for('consulta_ventas'))
+
+    ventas, _kpis = _armar_reporte([v])
+    det = ventas[0] if ventas else None
+    if not det:
+        flash(f"No fue posible armar el detalle de la venta #{venta_id}.", "danger")
+        return redirect(url_for('consulta_ventas'))
+
+    back = request.args.get('next') or url_for('venta_detalle', venta_id=venta_id)
+    return render_template('venta_recibo.html', v=det, venta_id=venta_id, back=back)
+
+# ----
+# Historial estudiante
+#
+@bp.route('/estudiantes/<int:estudiante_id>/historial-ventas', endpoint='historial_ventas_estudiante')
+def historial_ventas_estudiante(estudiante_id):
+    # --- 1) Estudiante ---
+    est = Estudiante.query.get_or_404(estudiante_id)
+
+    # Helpers
+    def _first_attr(o, names, default=None):
+        for n in names:
+            if hasattr(o, n):
+                v = getattr(o, n)
+                if v is not None:
+                    return v
+        return default
+
+    # Encabezado
+    fecha_ingreso = _first_attr(est, [
+        'Est_FechaIngreso', 'fecha_ingreso', 'Est_FechaRegistro',
+        'Est_FechaAlta', 'created_at', 'fecha_registro'
+    ])
+    est_status_raw = _first_attr(est, ['status','estatus','Est_Status','Est_Estatus','Est_Activo'])
+    est_status = ('Activo' if est_status_raw is True else
+                  'Inactivo' if est_status_raw is False else
+                  (est_status_raw or '—'))
+
+    # --- 2) Ventas del estudiante (solo IDs; el detalle se arma en SQL) ---
+    ids_sq = (db.session.query(Venta.Venta_ID)
+              .filter(Venta.Est_ID == estudiante_id)
+              .subquery())
+
+    # --- 3) Mismo formato que _armar_reporte para que coincida con "detalle de venta" ---
+    ventas_armadas = filas_ventas(ids_sq)
+    # ventas_armadas: cada elemento trae:
+    #  id, fecha, metodo, referencia, items (articulo, talla, cantidad, precio_unit, total_linea),
+    #  subtotal_items, pagos (tipo, cond, vence, monto_bruto, pct_aplicado, descuento_monto, monto_neto),
+    #  descuento_pagos, total_venta, ...
+
+    # --- 4) Agrupar por día usando las ventas armadas ---
+    from collections import OrderedDict
+    grupos = OrderedDict()
+
+    for det in ventas_armadas:
+        fecha = det.get('fecha')
+        try:
+            fecha_key = fecha.date() if fecha else None
+        except Exception:
+            fecha_key = None
+
+        # Armar registro compatible con el template
+        total_art = float(det.get('subtotal_items', 0.0) or 0.0)
+        pagos_det = list(det.get('pagos', []) or [])
+        total_pag = float(sum(float(p.get('monto_neto', 0.0) or 0.0) for p in pagos_det))
+        total_ven = float(det.get('total_venta', total_art + total_pag) or (total_art + total_pag))
+
+        grupos.setdefault(fecha_key, []).append({
+            'venta': {'Venta_ID': det.get('id'), 'status': det.get('status')},
+            'fecha_venta': fecha,
+            'metodo_pago': det.get('metodo'),
+            'referencia': det.get('referencia'),
+            'articulos': list(det.get('items', []) or []),
+            'pagos': pagos_det,
+            'total_articulos': total_art,
+            'total_pagos': total_pag,
+            'total_venta': total_ven,
+        })
+
+    # Orden dentro del día (más recientes primero)
+    for k in list(grupos.keys()):
+        grupos[k].sort(key=lambda x: x['fecha_venta'] or 0, reverse=True)
+
+    total_global = float(sum(h['total_venta'] for lst in grupos.values() for h in lst))
+
+    # Para KPI "Total de ventas" el template usa {{ ventas|length }}
+    ventas_para_kpi = ventas_armadas
+
+    return render_template(
+        'historial_ventas_estudiante.html',
+        est=est,
+        fecha_ingreso=fecha_ingreso,
+        est_status=est_status,
+        grupos=grupos,
+        total_global=total_global,
+        ventas=ventas_para_kpi  # <- cuenta coincide con detalle
+    )
+
+#
+#
+#
+@bp.get('/ventas/<int:venta_id>', endpoint='detalle_venta')
+def detalle_venta_view(venta_id: int):
+    v = (Venta.query
+         .options(
+             joinedload(Venta.estudiante),
+             joinedload(Venta.instructor),
+             selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+             selectinload(Venta.pagos)
+         )
+         .filter(Venta.Venta_ID == venta_id)
+         .first())
+    if not v:
+        flash(f"Venta #{venta_id} no encontrada.", "warning")
+        return redirect(url_for('consulta_ventas'))
+
+    # Ensamblado existente
+    ventas, _kpis = _armar_reporte([v])
+    det = ventas[0] if ventas else None
+    if not det:
+        flash(f"No fue posible armar el detalle de la venta #{venta_id}.", "danger")
+        return redirect(url_for('consulta_ventas'))
+
+    # === OBTENER ESTUDIANTE_ID DE MANERA ROBUSTA ===
+    estudiante_id = None
+    
+    # Primero intentar desde la relación estudiante
+    if hasattr(v, 'estudiante') and v.estudiante:
+        estudiante_id = (
+            getattr(v.estudiante, 'Est_ID', None) or
+            getattr(v.estudiante, 'id', None) or
+            getattr(v.estudiante, 'Estudiante_ID', None)
+        )
+    
+    # Si no se encontró, intentar desde el atributo directo
+    if not estudiante_id:
+        estudiante_id = getattr(v, 'Est_ID', None) or getattr(v, 'estudiante_id', None)
+    
+    # Si usas render parcial embebido
+    if request.args.get('partial') == '1':
+        return render_template(
+            'venta_detalle_partial.html',
+            v=det,
+            venta_id=venta_id,
+            rid=request.args.get('rid', ''),
+            back=(request.args.get('next') or url_for('consulta_ventas')),
+            estudiante_id=estudiante_id  # <-- importante
+        )
+
+    # Página completa
+    return render_template(
+        'venta_detalle.html',
+        v=det,
+        venta_id=venta_id,
+        back=(request.args.get('next') or url_for('consulta_ventas')),
+        estudiante_id=estudiante_id  # <-- importante
+    )
+
+
+#
+# Ventas pendientes
+#
+@bp.route('/api/ventas/pendientes', methods=['GET'])
+def api_ventas_pendientes():
+    tipo = (request.args.get('tipo') or '').strip().lower()  # 'estudiante' | 'instructor'
+    cliente_id = (request.args.get('cliente_id') or '').strip()
+    if not tipo or not cliente_id:
+        return jsonify({'ventas': []})
+
+    q = (Venta.query
+         .options(
+             joinedload(Venta.estudiante),
+             joinedload(Venta.instructor),
+             selectinload(Venta.lineas),
+             selectinload(Venta.pagos))
+         .filter(_pendiente_expr())
+         .order_by(Venta.Fecha_Venta.desc()))
+
+    if tipo == 'estudiante':
+        q = q.filter(Venta.Est_ID == int(cliente_id))
+    elif tipo == 'instructor':
+        q = q.filter(Venta.Instructor_ID == int(cliente_id))
+    else:
+        return jsonify({'ventas': []})
+
+    out = []
+    for v in q.all():
+        vid = getattr(v, 'Venta_ID', None) or getattr(v, 'id', None)
+        cliente_nombre = (
+            f"{v.estudiante.Est_Nombre} {v.estudiante.Est_ApellidoP}" if v.estudiante else
+            f"{v.instructor.Instructor_Nombre} {v.instructor.Instructor_ApellidoP}" if v.instructor else '—'
+        )
+        lineas = []
+        for l in (v.lineas or []):
+            # ajusta prioridad de IDs según tu esquema:
+            var_id = (getattr(l, 'Variante_ID', None) or
+                      getattr(l, 'ArticuloVariante_ID', None) or
+                      getattr(l, 'variante_id', None) or
+                      getattr(l, 'articulo_variante_id', None) or
+                      getattr(l, 'Articulo_ID', None))
+            cant = int(getattr(l, 'Cantidad', None) or getattr(l, 'cantidad', None) or 1)
+            if var_id:
+                lineas.append({'id': str(var_id), 'cantidad': cant})
+
+        pagos = []
+        for p in (v.pagos or []):
+            pago_id = (getattr(p, 'Pago_ID', None) or
+                       getattr(p, 'Promocion_ID', None) or
+                       getattr(p, 'pago_id', None) or
+                       getattr(p, 'promocion_id', None) or
+                       getattr(p, 'id', None))
+            cant = int(getattr(p, 'Cantidad', None) or getattr(p, 'cantidad', None) or 1)
+            if pago_id:
+                pagos.append({'id': str(pago_id), 'cantidad': cant})
+
+        out.append({
+            'id': vid,
+            'fecha': v.Fecha_Venta.strftime('%Y-%m-%d %H:%M') if v.Fecha_Venta else '',
+            'cliente_nombre': cliente_nombre,
+            'tipo_cliente': tipo,
+            'cliente_id': int(cliente_id),
+            'lineas': lineas,
+            'pagos': pagos,
+        })
+
+    return jsonify({'ventas': out})
+
+
+#
+# Typeahead de clientes (estudiantes / instructores)
+#
+@bp.route('/api/clientes/buscar', methods=['GET'])
+def api_clientes_buscar():
+    """
+    ?q=<prefijo del nombre>&tipo=estudiante|instructor|todos&limit=20
+    Prefijo sobre el nombre completo normalizado (sin acentos), orden estable.
+    """
+    q = (request.args.get('q') or '').strip()
+    tipo = (request.args.get('tipo') or 'todos').strip().lower()
+    if tipo not in ('todos', 'estudiante', 'instructor'):
+        tipo = 'todos'
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify({'resultados': buscar_clientes(q, tipo=tipo, limit=limit)})
+
+################################################
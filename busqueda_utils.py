@@ -0,0 +1,255 @@
+# busqueda_utils.py
+from __future__ import annotations
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, column, inspect, select, table, text
+
+
+# ---------------------------------------------
+# Normalización de texto (nombres en español)
+# ---------------------------------------------
+def normalizar_texto(*partes: Optional[str]) -> str:
+    """
+    'José  Pérez', 'Núñez' → 'jose perez nunez'
+    Minúsculas, sin acentos/diéresis, espacios colapsados. Se usa tanto para
+    guardar las columnas *_NombreBusqueda como para normalizar lo que teclea el usuario.
+    """
+    s = " ".join(str(p) for p in partes if p)
+    s = unicodedata.normalize('NFKD', s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return re.sub(r'\s+', ' ', s).strip().lower()
+
+
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.Estudiante, Instructor
+    """
+    from extensions import db
+    from models import Estudiante, Instructor
+    return db, Estudiante, Instructor
+
+
+def _prefijo(col, pref: str):
+    """
+    col empieza con `pref`, como rango [pref, pref + U+FFFF) para que use el índice
+    B-tree de la columna (LIKE 'x%' no lo usa en SQLite sin COLLATE NOCASE).
+    """
+    return (col >= pref) & (col < pref + '\uffff')
+
+
+# ---------------------------------------------
+# Typeahead de clientes
+# ---------------------------------------------
+def buscar_clientes(q: str, *, tipo: str = 'todos', limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Busca estudiantes/instructores cuyo nombre completo normalizado empiece con `q`.
+    Orden estable: nombre normalizado, luego ID. Devuelve a lo más `limit` filas
+    [{id, tipo, nombre}] (estudiantes primero si tipo='todos').
+    """
+    db, Estudiante, Instructor = _get_models()
+    pref = normalizar_texto(q)
+    limit = max(1, min(int(limit or 20), 50))
+    out: List[Dict[str, Any]] = []
+
+    if tipo in ('todos', 'estudiante'):
+        qe = db.session.query(Estudiante.Est_ID, Estudiante.Est_Nombre, Estudiante.Est_ApellidoP,
+                              Estudiante.Est_ApellidoM)
+        if pref:
+            qe = qe.filter(_prefijo(Estudiante.Est_NombreBusqueda, pref))
+        for eid, nom, ap, am in (qe.order_by(Estudiante.Est_NombreBusqueda, Estudiante.Est_ID)
+                                 .limit(limit).all()):
+            out.append({'id': eid, 'tipo': 'estudiante', 'nombre': " ".join(p for p in (nom, ap, am) if p)})
+
+    restantes = limit - len(out)
+    if tipo in ('todos', 'instructor') and restantes > 0:
+        qi = db.session.query(Instructor.Instructor_ID, Instructor.Instructor_Nombre,
+                              Instructor.Instructor_ApellidoP, Instructor.Instructor_ApellidoM)
+        if pref:
+            qi = qi.filter(_prefijo(Instructor.Instructor_NombreBusqueda, pref))
+        for iid, nom, ap, am in (qi.order_by(Instructor.Instructor_NombreBusqueda, Instructor.Instructor_ID)
+                                 .limit(restantes).all()):
+            out.append({'id': iid, 'tipo': 'instructor', 'nombre': " ".join(p for p in (nom, ap, am) if p)})
+
+    return out
+
+
+def choices_cliente(tipo: str, seleccionado: Optional[int]) -> List[tuple]:
+    """
+    Choices mínimos para un SelectField de cliente cargado por typeahead:
+    placeholder + el cliente ya seleccionado (para re-render y validación del POST).
+    """
+    db, Estudiante, Instructor = _get_models()
+    choices = [(0, "— Selecciona —")]
+    try:
+        sel = int(seleccionado or 0)
+    except (TypeError, ValueError):
+        sel = 0
+    if sel <= 0:
+        return choices
+    if tipo == 'estudiante':
+        e = db.session.get(Estudiante, sel)
+        if e:
+            choices.append((e.Est_ID, f"{e.Est_Nombre} {e.Est_ApellidoP}"))
+    else:
+        i = db.session.get(Instructor, sel)
+        if i:
+            choices.append((i.Instructor_ID, f"{i.Instructor_Nombre} {i.Instructor_ApellidoP}"))
+    return choices
+
+
+def reindexar_nombres() -> int:
+    """Rellena/recalcula *_NombreBusqueda para todos los clientes. No hace commit."""
+    db, Estudiante, Instructor = _get_models()
+    n = 0
+    for e in Estudiante.query.yield_per(500):
+        e.Est_NombreBusqueda = normalizar_texto(e.Est_Nombre, e.Est_ApellidoP, e.Est_ApellidoM)
+        n += 1
+    for i in Instructor.query.yield_per(500):
+        i.Instructor_NombreBusqueda = normalizar_texto(i.Instructor_Nombre, i.Instructor_ApellidoP,
+                                                       i.Instructor_ApellidoM)
+        n += 1
+    db.session.flush()
+    return n
+
+
+# ---------------------------------------------
+# Índice de texto completo (SQLite FTS5)
+# ---------------------------------------------
+# Un solo índice para todos los tipos; rowid = ID * _FTS_N + código del tipo, así
+# los triggers borran/reescriben por rowid (O(log n)) y el tipo sale de rowid % _FTS_N.
+# Dos columnas FTS: `principal` (nombre / método y referencia) y `secundario` (datos
+# que solo algunas pantallas buscan, p.ej. el colegio en consulta de alumnos).
+FTS_TABLA = 'busqueda_fts'
+_FTS_N = 4
+_FTS_TIPOS = {
+    # tipo: (código, tabla, pk, columnas de `principal`, columnas de `secundario`)
+    'estudiante': (0, 'estudiante', 'Est_ID',
+                   ('Est_Nombre', 'Est_ApellidoP', 'Est_ApellidoM'), ('Est_Colegio',)),
+    'tutor': (1, 'tutor', 'Tutor_ID',
+              ('Tutor_Nombre', 'Tutor_ApellidoP', 'Tutor_ApellidoM'), ()),
+    'instructor': (2, 'instructor', 'Instructor_ID',
+                   ('Instructor_Nombre', 'Instructor_ApellidoP', 'Instructor_ApellidoM'), ()),
+    'venta': (3, 'venta', 'Venta_ID',
+              ('Metodo_Pago', 'Referencia_Pago'), ()),
+}
+
+_fts = table(FTS_TABLA, column('rowid', Integer), column(FTS_TABLA))
+_fts_ok: Optional[bool] = None
+
+
+def _texto_sql(alias: str, cols) -> str:
+    if not cols:
+        return "''"
+    return " || ' ' || ".join(f"coalesce({alias}.{c}, '')" for c in cols)
+
+
+def _valores_sql(alias: str, principal, secundario) -> str:
+    return f"{_texto_sql(alias, principal)}, {_texto_sql(alias, secundario)}"
+
+
+def _ddl_fts() -> List[str]:
+    """CREATE de la tabla virtual + triggers de sincronización (idempotente)."""
+    stmts = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLA} USING fts5("
+        f"principal, secundario, tokenize = 'unicode61 remove_diacritics 2')"
+    ]
+    for tipo, (cod, tabla, pk, principal, secundario) in _FTS_TIPOS.items():
+        cols = principal + secundario
+        rid_new = f"NEW.{pk} * {_FTS_N} + {cod}"
+        rid_old = f"OLD.{pk} * {_FTS_N} + {cod}"
+        ins = (f"INSERT INTO {FTS_TABLA}(rowid, principal, secundario) "
+               f"VALUES ({rid_new}, {_valores_sql('NEW', principal, secundario)});")
+        dele = f"DELETE FROM {FTS_TABLA} WHERE rowid = {rid_old};"
+        stmts += [
+            f"CREATE TRIGGER IF NOT EXISTS fts_{tabla}_ai AFTER INSERT ON {tabla} BEGIN {ins} END",
+            f"CREATE TRIGGER IF NOT EXISTS fts_{tabla}_ad AFTER DELETE ON {tabla} BEGIN {dele} END",
+            # Solo cuando cambia algo indexado (p.ej. no al cobrar una venta sin tocar la referencia)
+            f"CREATE TRIGGER IF NOT EXISTS fts_{tabla}_au AFTER UPDATE OF {pk}, {', '.join(cols)} "
+            f"ON {tabla} BEGIN {dele} {ins} END",
+        ]
+    return stmts
+
+
+def fts_disponible() -> bool:
+    """
+    True si el motor es SQLite y la tabla FTS ya fue creada (flask busqueda-fts-init)
+    con las columnas actuales; un índice de una sola columna (versión previa) se ignora
+    hasta volver a correr busqueda-fts-init. Solo se recuerda el sí: si el índice se
+    crea desde otro proceso (el comando), este lo detecta sin reiniciar.
+    """
+    global _fts_ok
+    if not _fts_ok:
+        db, *_ = _get_models()
+        try:
+            conn = db.session.connection()
+            _fts_ok = (conn.dialect.name == 'sqlite' and inspect(conn).has_table(FTS_TABLA)
+                       and 'principal' in {c['name'] for c in inspect(conn).get_columns(FTS_TABLA)})
+        except Exception:
+            _fts_ok = False
+    return _fts_ok
+
+
+def crear_fts() -> int:
+    """
+    Crea la tabla FTS5 y sus triggers, y la llena desde cero. Si ya existían (aunque
+    sea con otro esquema) los vuelve a crear. Devuelve los documentos indexados. No hace commit.
+    """
+    global _fts_ok
+    db, *_ = _get_models()
+    conn = db.session.connection()
+    if conn.dialect.name != 'sqlite':
+        raise RuntimeError("El índice FTS5 solo está disponible con SQLite.")
+    for _cod, tabla, *_ in _FTS_TIPOS.values():
+        for suf in ('ai', 'ad', 'au'):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS fts_{tabla}_{suf}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLA}"))
+    for stmt in _ddl_fts():
+        conn.execute(text(stmt))
+    _fts_ok = True
+    return reconstruir_fts()
+
+
+def reconstruir_fts() -> int:
+    """Vacía y vuelve a poblar el índice con INSERT ... SELECT por tipo. No hace commit."""
+    db, *_ = _get_models()
+    conn = db.session.connection()
+    conn.execute(text(f"DELETE FROM {FTS_TABLA}"))
+    for tipo, (cod, tabla, pk, principal, secundario) in _FTS_TIPOS.items():
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLA}(rowid, principal, secundario) "
+            f"SELECT t.{pk} * {_FTS_N} + {cod}, {_valores_sql('t', principal, secundario)} FROM {tabla} t"
+        ))
+    conn.execute(text(f"INSERT INTO {FTS_TABLA}({FTS_TABLA}) VALUES ('optimize')"))
+    return int(conn.execute(text(f"SELECT count(*) FROM {FTS_TABLA}")).scalar() or 0)
+
+
+def consulta_fts(q: str) -> Optional[str]:
+    """
+    Texto libre → expresión MATCH: cada palabra como prefijo entre comillas, todas requeridas.
+    'Ana Pérez' → '"ana"* "perez"*'. None si no queda ninguna palabra.
+    """
+    palabras = re.findall(r'\w+', normalizar_texto(q))
+    if not palabras:
+        return None
+    return " ".join(f'"{p}"*' for p in palabras)
+
+
+def ids_fts(tipo: str, q: str, *, secundario: bool = False):
+    """
+    SELECT de IDs del `tipo` cuyo documento coincide con `q` (para usar en .in_()).
+    Por defecto solo busca en la columna `principal` (nombres); secundario=True
+    incluye también la otra (p.ej. Est_Colegio).
+    None si no hay índice o no hay palabras: el llamador usa su ilike de siempre.
+    """
+    m = consulta_fts(q)
+    if m is None or not fts_disponible():
+        return None
+    if not secundario:
+        m = f"principal : ({m})"
+    cod = _FTS_TIPOS[tipo][0]
+    return (select((_fts.c.rowid // _FTS_N).label('ref_id'))
+            .where(_fts.c[FTS_TABLA].match(m), _fts.c.rowid % _FTS_N == cod))
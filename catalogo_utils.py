@@ -0,0 +1,352 @@
+# catalogo_utils.py
+from __future__ import annotations
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session, joinedload
+
+from billing_utils import parse_conditions
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+KEY_SEP = ":::"
+
+# Clases cuyo alta/edición/baja invalida el catálogo (por nombre para no importar models aquí)
+_CLASES_CATALOGO = {
+    'Articulo', 'ArticuloVariante', 'Pago', 'Paquete', 'PaqueteItem',
+}
+# Existencias: cambian con cada venta/ajuste, no forman parte del snapshot y su cambio
+# NO sube la versión. Se cachean aparte, con el último Movimiento_ID de la bitácora
+# (todo cambio de existencia se asienta ahí) como versión: un max() sobre la PK.
+_COLUMNAS_EXISTENCIA = {'Articulo_Existencia', 'Existencia'}
+
+_lock = threading.Lock()
+_cache: Dict[str, Any] = {'version': None, 'snapshot': None,
+                          'version_existencias': None, 'con_existencias': None}
+_tabla_ok: Optional[bool] = None
+
+
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.CatalogoVersion, Articulo, Pago, Paquete, PaqueteItem
+    """
+    from extensions import db
+    from models import CatalogoVersion, Articulo, Pago, Paquete, PaqueteItem
+    return db, CatalogoVersion, Articulo, Pago, Paquete, PaqueteItem
+
+
+def _tabla_version_existe(conn) -> bool:
+    """
+    Evita romper flushes/renders si la migración de catalogo_version aún no corre.
+    Solo se recuerda el sí: un proceso que arrancó antes de migrar lo detecta después.
+    """
+    global _tabla_ok
+    if not _tabla_ok:
+        try:
+            _tabla_ok = inspect(conn).has_table('catalogo_version')
+        except Exception:
+            _tabla_ok = False
+    return _tabla_ok
+
+
+def _to_float(x, default=0.0) -> float:
+    try:
+        return float(x) if x is not None else float(default)
+    except Exception:
+        return float(default)
+
+
+def _iso_or_none(d):
+    if isinstance(d, datetime):
+        return d.date().isoformat()
+    if isinstance(d, date):
+        return d.isoformat()
+    return None
+
+
+# ---------------------------------------------
+# Versión (compartida entre procesos vía BD)
+# ---------------------------------------------
+def version_actual() -> Optional[int]:
+    """Versión vigente del catálogo; None si la tabla no existe todavía."""
+    db, CatalogoVersion, *_ = _get_models()
+    if not _tabla_version_existe(db.session.connection()):
+        return None
+    v = db.session.execute(
+        select(CatalogoVersion.Version).where(CatalogoVersion.Catalogo_ID == 1)
+    ).scalar()
+    return int(v or 0)
+
+
+def _versiones() -> Tuple[Optional[int], Optional[int]]:
+    """(versión del catálogo, último Movimiento_ID) en una consulta; (None, None) sin tabla."""
+    db, CatalogoVersion, *_ = _get_models()
+    from models import MovimientoInventario
+    if not _tabla_version_existe(db.session.connection()):
+        return None, None
+    version, mov = db.session.execute(select(
+        select(CatalogoVersion.Version).where(CatalogoVersion.Catalogo_ID == 1).scalar_subquery(),
+        select(func.max(MovimientoInventario.Movimiento_ID)).scalar_subquery(),
+    )).one()
+    return int(version or 0), int(mov or 0)
+
+
+def invalidar_catalogo(conn=None) -> None:
+    """
+    Incrementa la versión del catálogo dentro de la transacción en curso
+    (se publica al hacer commit). Úsalo tras INSERT/UPDATE directos que cambian la
+    definición del catálogo (no para existencias: esas no viven en el snapshot).
+    """
+    db, CatalogoVersion, *_ = _get_models()
+    conn = conn if conn is not None else db.session.connection()
+    if not _tabla_version_existe(conn):
+        return
+    T = CatalogoVersion.__table__
+    res = conn.execute(update(T).where(T.c.Catalogo_ID == 1)
+                       .values(Version=T.c.Version + 1, Actualizado=datetime.now()))
+    if res.rowcount == 0:
+        conn.execute(insert(T).values(Catalogo_ID=1, Version=1, Actualizado=datetime.now()))
+
+
+def _cambio_de_definicion(obj) -> bool:
+    """¿Cambió algo del objeto además de sus existencias?"""
+    for attr in inspect(obj).attrs:
+        if attr.key not in _COLUMNAS_EXISTENCIA and attr.history.has_changes():
+            return True
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_por_flush(session, flush_context):
+    """Altas/bajas o cambios de definición (nombre, precio, tallas...) invalidan el snapshot."""
+    for obj in list(session.new) + list(session.deleted):
+        if type(obj).__name__ in _CLASES_CATALOGO:
+            invalidar_catalogo(session.connection())
+            return
+    for obj in session.dirty:
+        if type(obj).__name__ in _CLASES_CATALOGO:
+            if _cambio_de_definicion(obj):
+                invalidar_catalogo(session.connection())
+                return
+            # Existencia editada por ORM: en este proceso no se espera a la bitácora
+            _cache['con_existencias'] = None
+
+
+# ---------------------------------------------
+# Construcción del snapshot (O(catálogo), solo al cambiar la versión)
+# ---------------------------------------------
+def _construir_snapshot() -> Dict[str, Any]:
+    db, CatalogoVersion, Articulo, Pago, Paquete, PaqueteItem = _get_models()
+    from inventario_utils import variantes_por_articulo
+
+    # === Artículos y variantes ===
+    variantes_map = variantes_por_articulo()
+    articulo_choices = []
+    articulos_dict = {}
+    for art in Articulo.query.order_by(Articulo.Articulo_Nombre.asc()).all():
+        precio = float(art.Articulo_PrecioVenta or 0)
+        tipo_raw = (art.Articulo_TipoTalla or 'ninguno').strip().lower()
+        tallas_art = variantes_map.get(art.Articulo_ID)
+
+        # Con variantes -> existencias por talla
+        if tallas_art:
+            for talla, _existencia in tallas_art:
+                key = f"{art.Articulo_ID}{KEY_SEP}{talla}"
+                articulo_choices.append((key, f"{art.Articulo_Nombre} ({talla})"))
+                articulos_dict[key] = {
+                    "Articulo_ID": art.Articulo_ID,
+                    "Articulo_Nombre": art.Articulo_Nombre,
+                    "Talla": talla,
+                    "Precio": precio,
+                    "Tipo_Talla": tipo_raw,
+                }
+        # Sin tallas
+        else:
+            key = f"{art.Articulo_ID}"
+            articulo_choices.append((key, f"{art.Articulo_Nombre} (sin talla)"))
+            articulos_dict[key] = {
+                "Articulo_ID": art.Articulo_ID,
+                "Articulo_Nombre": art.Articulo_Nombre,
+                "Talla": None,
+                "Precio": precio,
+                "Tipo_Talla": 'ninguno',
+            }
+
+    # === Pagos (conceptos) ===
+    # Dos formatos: el de registro_venta y el de registro_abonos (incluye nombre y recargos)
+    pagos = Pago.query.order_by(Pago.Pago_Tipo.asc()).all()
+    pago_choices = [(p.Pago_ID, f"{p.Pago_Tipo} - ${_to_float(p.Pago_Monto, 0):.2f}") for p in pagos]
+    pagos_dict_venta = {}
+    pagos_dict_abonos = {}
+    for p in pagos:
+        condiciones = parse_conditions(p.Pago_Condiciones)
+        pagos_dict_venta[p.Pago_ID] = {
+            "monto": float(p.Pago_Monto or 0),
+            "descuento_tipo": p.Pago_Descuento_Tipo,
+            "descuento_porcentaje": float(p.Pago_Descuento_Porcentaje) if p.Pago_Descuento_Porcentaje is not None else 0.0,
+            "condiciones": condiciones,
+            "valido_hasta": p.Pago_Restricciones_Fecha.isoformat() if p.Pago_Restricciones_Fecha else None
+        }
+        pagos_dict_abonos[p.Pago_ID] = {
+            "nombre": p.Pago_Tipo,
+            "monto": _to_float(p.Pago_Monto, 0.0),
+            "descuento_tipo": (getattr(p, 'Pago_Descuento_Tipo', '') or '').strip().lower(),
+            "descuento_porcentaje": _to_float(getattr(p, 'Pago_Descuento_Porcentaje', 0.0), 0.0),
+            "condiciones": condiciones,
+            "valido_hasta": _iso_or_none(getattr(p, 'Pago_Restricciones_Fecha', None)),
+            "recargo_porcentaje": _to_float(getattr(p, 'Pago_Recargo_Porcentaje', 0.0), 0.0),
+            "recargo_dia_corte": int(getattr(p, 'Pago_Recargo_DiaCorte', 0) or 0),
+        }
+
+    # === Paquetes (precio prorrateado por línea) ===
+    paquetes_choices = []
+    paquetes_dict = {}
+    paquetes_db = (Paquete.query
+                   .options(joinedload(Paquete.items).joinedload(PaqueteItem.articulo))
+                   .order_by(Paquete.nombre.asc())
+                   .all())
+    for p in paquetes_db:
+        items = []
+        total_lista = 0.0
+        total_cant = 0
+        for it in (getattr(p, 'items', []) or []):
+            art_obj = getattr(it, 'articulo', None)
+            nombre_art = art_obj.Articulo_Nombre if art_obj else f'ID {it.articulo_id}'
+            precio_unit = float((art_obj.Articulo_PrecioVenta if art_obj else 0) or 0)
+            cant = int(it.cantidad or 0)
+            tn_val = getattr(it, 'talla_numero', None)
+            tn_val = tn_val if tn_val not in (None, '') else None
+
+            total_lista += precio_unit * cant
+            total_cant += cant
+            items.append({
+                'articulo_id': it.articulo_id,
+                'nombre': nombre_art,
+                'cantidad': cant,
+                'precio_unit': round(precio_unit, 2),
+                'talla': tn_val,
+            })
+
+        desc_tipo = (p.descuento_tipo or 'ninguno').strip().lower()
+        desc_val = float(p.descuento_valor or 0)
+        if desc_tipo == 'porcentaje':
+            desc_monto = round(total_lista * (desc_val / 100.0), 2)
+        elif desc_tipo == 'monto':
+            desc_monto = round(min(total_lista, desc_val), 2)
+        else:
+            desc_monto = 0.0
+
+        total_final = round(total_lista - desc_monto, 2)
+        pr = (total_final / total_lista) if total_lista > 0 else 1.0
+
+        items_aj = [{
+            'articulo_id': it['articulo_id'],
+            'talla': it['talla'],
+            'cantidad': it['cantidad'],
+            'precio_unit_ajustado': round(it['precio_unit'] * pr, 2),
+            'precio_unit_lista': it['precio_unit'],
+            'nombre': it['nombre'],
+        } for it in items]
+
+        paquetes_choices.append((p.id, f"{p.nombre} ({len(items)} líneas, {total_cant} piezas) — ${total_final:.2f}"))
+        paquetes_dict[p.id] = {
+            'id': p.id,
+            'nombre': p.nombre,
+            'descuento_tipo': desc_tipo,
+            'descuento_valor': desc_val,
+            'total_lista': round(total_lista, 2),
+            'descuento_monto': desc_monto,
+            'total_final': total_final,
+            'items': items_aj,
+            'lineas': len(items),
+            'piezas': total_cant,
+            'prorrateo': pr,
+        }
+
+    return {
+        'articulo_choices': articulo_choices,
+        'articulos_dict': articulos_dict,
+        'pago_choices': pago_choices,
+        'pagos_dict_venta': pagos_dict_venta,
+        'pagos_dict_abonos': pagos_dict_abonos,
+        'paquetes_choices': paquetes_choices,
+        'paquetes_dict': paquetes_dict,
+        'KEY_SEP': KEY_SEP,
+    }
+
+
+def _con_existencias(snap: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del snapshot con la Existencia vigente en cada artículo (dos consultas, O(catálogo))."""
+    db, CatalogoVersion, Articulo, *_ = _get_models()
+    from inventario_utils import variantes_por_articulo
+
+    existencias = {f"{a}{KEY_SEP}{t}": e
+                   for a, lst in variantes_por_articulo().items() for t, e in lst}
+    for a, e in db.session.execute(select(Articulo.Articulo_ID, Articulo.Articulo_Existencia)):
+        existencias[f"{a}"] = int(e or 0)
+
+    articulos = {k: dict(meta, Existencia=existencias.get(k, 0))
+                 for k, meta in snap['articulos_dict'].items()}
+    return dict(snap, articulos_dict=articulos)
+
+
+def _snapshot_vigente(version: Optional[int]) -> Dict[str, Any]:
+    """Snapshot cacheado por proceso; se reconstruye si cambió la versión en BD."""
+    if version is None:
+        # Sin tabla de versión no hay forma segura de cachear
+        return _construir_snapshot()
+
+    snap = _cache['snapshot']
+    if snap is not None and _cache['version'] == version:
+        return snap
+
+    with _lock:
+        if _cache['snapshot'] is not None and _cache['version'] == version:
+            return _cache['snapshot']
+        snap = _construir_snapshot()
+        _cache['snapshot'] = snap
+        _cache['version'] = version
+        return snap
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def catalogo_ventas(*, existencias: bool = True) -> Dict[str, Any]:
+    """
+    Snapshot del catálogo para los formularios de venta/abonos (artículos,
+    conceptos de pago, paquetes). Se comparte entre requests del proceso y solo se
+    reconstruye cuando cambia la versión en BD. Tratarlo como SOLO LECTURA.
+    Con existencias=True se devuelve una copia con articulos_dict[...]['Existencia'];
+    esa copia también se comparte y solo se rearma cuando la bitácora de inventario
+    registra un movimiento nuevo (el snapshot base no se toca).
+    """
+    try:
+        version, ultimo_mov = _versiones()
+    except Exception:
+        version, ultimo_mov = None, None
+    snap = _snapshot_vigente(version)
+    if not existencias:
+        return snap
+    if version is None:
+        return _con_existencias(snap)
+
+    clave = (version, ultimo_mov)
+    con = _cache['con_existencias']
+    if con is not None and _cache['version_existencias'] == clave:
+        return con
+    with _lock:
+        con = _cache['con_existencias']
+        if con is not None and _cache['version_existencias'] == clave:
+            return con
+        con = _con_existencias(snap)
+        _cache['con_existencias'] = con
+        _cache['version_existencias'] = clave
+        return con
+
@@ -0,0 +1,227 @@
+# cli.py
+"""Comandos `flask ...` de mantenimiento (se registran en create_app)."""
+import csv
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from extensions import db
+from billing_utils import normalize_method, requires_reference
+from plan_utils import verificar_abonado_acumulado, liquidar_planes_abiertos, normalizar_estados
+from resumen_utils import reconstruir_resumen
+from db_config import mantenimiento_sqlite
+from idempotencia_utils import purgar_vencidas
+from busqueda_utils import reindexar_nombres, crear_fts, reconstruir_fts
+from inventario_utils import migrar_tallas_json, tomar_snapshot, existencias_en
+from importacion_utils import importar_estudiantes, leer_csv, filas_reporte, ENCABEZADOS_REPORTE, LOTE
+
+# Contenedor de los comandos; cada uno se agrega suelto a app.cli (flask <comando>)
+# y AppGroup ya los envuelve en el app context.
+comandos = AppGroup('ballet')
+
+
+def registrar_cli(app) -> None:
+    for cmd in comandos.commands.values():
+        app.cli.add_command(cmd)
+
+
+# =========================================================
+# CLI: resumen diario de ventas / inventario
+# =========================================================
+@comandos.command('resumen-ventas-rebuild')
+@click.option('--desde', default=None, help='Fecha inicial AAAA-MM-DD (por defecto, la primera venta).')
+@click.option('--hasta', default=None, help='Fecha final AAAA-MM-DD, inclusiva (por defecto, la última venta).')
+@click.option('--lote', default=31, show_default=True, help='Días por lote (commit por lote).')
+def resumen_ventas_rebuild(desde, hasta, lote):
+    """Reconstruye venta_resumen_diario desde las ventas (corrige cualquier desfase)."""
+    d_ini = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+    d_fin = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+
+    def _avance(ini, fin, filas):
+        click.echo(f"  {ini:%Y-%m-%d} → {fin:%Y-%m-%d}: {filas} fila(s)")
+
+    total = reconstruir_resumen(d_ini, d_fin, dias_por_lote=lote, on_lote=_avance)
+    click.echo(f"Resumen reconstruido: {total} fila(s).")
+
+
+@comandos.command('inventario-migrar-tallas')
+@click.option('--sobrescribir', is_flag=True, help='Reemplaza variantes ya existentes con lo que diga el JSON.')
+def inventario_migrar_tallas(sobrescribir):
+    """Copia Articulo.Articulo_Tallas (JSON) a la tabla articulo_variante."""
+    stats = migrar_tallas_json(sobrescribir=sobrescribir)
+    db.session.commit()
+    click.echo(f"Artículos migrados: {stats['articulos']} · variantes: {stats['variantes']} · "
+               f"ya migrados: {stats['omitidos']} · JSON inválido: {stats['invalidos']}")
+    if stats['sin_existencias']:
+        click.echo(f"⚠ {stats['sin_existencias']} artículo(s) tenían solo lista de tallas (sin existencias); "
+                   f"sus variantes quedaron en 0 y conviene capturarlas.")
+
+
+@comandos.command('inventario-snapshot')
+def inventario_snapshot():
+    """Foto de existencias por artículo/talla para reconstruir fechas pasadas (programar en cron)."""
+    r = tomar_snapshot()
+    db.session.commit()
+    click.echo(f"Snapshot: {r['claves']} clave(s) · hasta movimiento #{r['ultimo_movimiento']}")
+
+
+@comandos.command('inventario-existencia')
+@click.argument('articulo_id', type=int)
+@click.option('--fecha', required=True, help='AAAA-MM-DD o "AAAA-MM-DD HH:MM" (día completo si no trae hora).')
+def inventario_existencia(articulo_id, fecha):
+    """Existencia de un artículo (por talla) a una fecha pasada: snapshot + bitácora."""
+    try:
+        momento = datetime.strptime(fecha, '%Y-%m-%d %H:%M')
+    except ValueError:
+        momento = datetime.strptime(fecha, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    por_talla = existencias_en(articulo_id, momento)
+    for talla, n in por_talla.items():
+        click.echo(f"  {talla or '(sin talla)':<14} {n:>8}")
+    click.echo(f"Total al {momento:%Y-%m-%d %H:%M}: {sum(por_talla.values())}")
+
+
+@comandos.command('clientes-reindexar')
+def clientes_reindexar():
+    """Rellena el nombre normalizado (typeahead) de estudiantes e instructores."""
+    n = reindexar_nombres()
+    db.session.commit()
+    click.echo(f"Clientes reindexados: {n}")
+
+
+@comandos.command('estudiantes-importar')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lote', default=LOTE, show_default=True, help='Filas por transacción.')
+@click.option('--validar', is_flag=True, help='Solo valida (hace todo y revierte).')
+@click.option('--reporte', default=None, type=click.Path(dir_okay=False),
+              help='CSV con el resultado de cada fila (ok / omitido / error y motivo).')
+def estudiantes_importar(archivo, lote, validar, reporte):
+    """Alta masiva de estudiantes + tutor + contactos + grupos desde CSV (UTF-8)."""
+    with open(archivo, encoding='utf-8-sig', newline='') as f:
+        try:
+            filas = leer_csv(f)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        res = importar_estudiantes(filas, lote=lote, validar_solo=validar,
+                                   on_lote=lambda n: click.echo(f"  {n} fila(s) procesadas"))
+
+    errores = [r for r in res['filas'] if r['estado'] == 'error']
+    for r in errores[:20]:
+        click.echo(f"  fila {r['fila']}: {' | '.join(r['errores'])}", err=True)
+    if len(errores) > 20:
+        click.echo(f"  ... y {len(errores) - 20} fila(s) más con error", err=True)
+    if reporte:
+        with open(reporte, 'w', encoding='utf-8-sig', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(ENCABEZADOS_REPORTE)
+            w.writerows(filas_reporte(res))
+    r = res['resumen']
+    click.echo(f"{'Validación' if validar else 'Importación'}: {r['filas']} fila(s) · {r['ok']} ok · "
+               f"{r['omitido']} omitida(s) · {r['error']} con error"
+               + (f" · reporte en {reporte}" if reporte else ""))
+
+
+@comandos.command('busqueda-fts-init')
+def busqueda_fts_init():
+    """Crea el índice FTS5 (estudiantes, tutores, instructores, ventas) y sus triggers."""
+    n = crear_fts()
+    db.session.commit()
+    click.echo(f"Índice de búsqueda creado: {n} documentos")
+
+
+@comandos.command('busqueda-fts-reconstruir')
+def busqueda_fts_reconstruir():
+    """Vuelve a poblar el índice FTS5 desde las tablas base."""
+    n = reconstruir_fts()
+    db.session.commit()
+    click.echo(f"Índice de búsqueda reconstruido: {n} documentos")
+
+
+@comandos.command('planes-verificar-abonos')
+@click.option('--reparar', is_flag=True, help='Corrige Abonado_Acumulado con la suma del ledger.')
+def planes_verificar_abonos(reparar):
+    """Compara PlanCobro.Abonado_Acumulado contra la suma de sus abonos."""
+    difs = verificar_abonado_acumulado(reparar=reparar)
+    for d in difs:
+        click.echo(f"Plan #{d['plan_id']}: acumulado {d['acumulado']:.2f} / ledger {d['ledger']:.2f}")
+    if reparar:
+        db.session.commit()
+        click.echo(f"Planes corregidos: {len(difs)}")
+    else:
+        click.echo(f"Planes con diferencia: {len(difs)}")
+
+
+@comandos.command('planes-normalizar-estado')
+def planes_normalizar_estado():
+    """Pasa PlanCobro.Estado a minúsculas (correr antes de la migración de ck_plan_estado_minusculas)."""
+    n = normalizar_estados()
+    db.session.commit()
+    click.echo(f"Planes normalizados: {n}")
+
+
+@comandos.command('planes-liquidar-mes')
+@click.option('--metodo', required=True, help='Método de pago de los abonos finales (efectivo, transferencia, ...).')
+@click.option('--referencia', default=None, help='Referencia (solo métodos que la requieren).')
+@click.option('--desde-id', default=0, show_default=True, help='Reanudar tras este Plan_ID.')
+@click.option('--lote', default=500, show_default=True, help='Planes por lote (commit por lote).')
+@click.option('--limite', default=None, type=int, help='Máximo de planes a liquidar en esta corrida.')
+def planes_liquidar_mes(metodo, referencia, desde_id, lote, limite):
+    """Cierre de mes: liquida todos los planes abiertos con saldo (neto FULL con reglas)."""
+    metodo_norm = normalize_method(metodo)
+    if requires_reference(metodo_norm) and not (referencia or '').strip():
+        raise click.UsageError(f"El método '{metodo_norm}' requiere --referencia.")
+
+    def _avance(r):
+        click.echo(f"  lote {r['lotes']}: {r['planes']} plan(es) · {r['abonos']} abono(s) · "
+                   f"{r['liquidaciones']} liquidación(es) · ${r['monto']:,.2f} · hasta Plan #{r['ultimo_id']}")
+
+    try:
+        r = liquidar_planes_abiertos(metodo_norm=metodo_norm, referencia=(referencia or '').strip() or None,
+                                     desde_id=desde_id, tamano_lote=lote, limite=limite, on_lote=_avance)
+    except Exception as e:
+        ultimo = getattr(e, 'ultimo_id', desde_id)
+        click.echo(f"❌ Falló un lote ({type(e).__name__}: {e}). Lo ya confirmado se conserva; "
+                   f"reanudar con --desde-id {ultimo}", err=True)
+        raise SystemExit(1)
+    click.echo(f"Planes liquidados: {r['planes']} · abonos: {r['abonos']} · liquidaciones: {r['liquidaciones']} "
+               f"· total ${r['monto']:,.2f}")
+    if r['sin_venta']:
+        click.echo(f"⚠️  {r['sin_venta']} plan(es) sin venta previa a la cual ligar la liquidación; "
+                   f"siguen abiertos (revisar en consulta de planes).", err=True)
+
+
+@comandos.command('idempotencia-purgar')
+def idempotencia_purgar():
+    """Borra las llaves de idempotencia vencidas (programar en cron)."""
+    n = purgar_vencidas()
+    db.session.commit()
+    click.echo(f"Llaves vencidas borradas: {n}")
+
+
+@comandos.command('sqlite-mantenimiento')
+@click.option('--truncate', is_flag=True, help='Checkpoint TRUNCATE (espera lectores y vacía el archivo -wal).')
+def sqlite_mantenimiento(truncate):
+    """PRAGMA optimize + checkpoint del WAL (para cron; los workers hacen uno PASSIVE por intervalo)."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo("La base de datos no es SQLite; nada que hacer.")
+        return
+    raw = db.engine.raw_connection()
+    try:
+        busy, wal, copiadas = mantenimiento_sqlite(raw.driver_connection,
+                                                   checkpoint='TRUNCATE' if truncate else 'PASSIVE')
+        modo = raw.driver_connection.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        raw.close()
+    click.echo(f"journal_mode={modo} · checkpoint: {copiadas}/{wal} página(s) copiadas"
+               + (" · ocupado (reintentar)" if busy else ""))
+
+
+@comandos.command('arranque-tiempos')
+def arranque_tiempos():
+    """Muestra cuánto tardó create_app y cada blueprint (import + registro)."""
+    info = current_app.extensions.get('arranque') or {}
+    for nombre, ms in (info.get('blueprints_ms') or {}).items():
+        click.echo(f"  {nombre:<12} {ms:8.1f} ms")
+    click.echo(f"create_app: {info.get('total_ms', 0.0):.1f} ms "
+               f"(presupuesto {current_app.config.get('ARRANQUE_PRESUPUESTO_MS')} ms)")
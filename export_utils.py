@@ -0,0 +1,118 @@
+# export_utils.py
+from __future__ import annotations
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Sequence
+
+from flask import Response, stream_with_context
+
+try:  # XLSX es opcional: sin xlsxwriter solo se ofrece CSV
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+FORMATOS = ('csv', 'xlsx')
+LOTE_EXPORTACION = 1000     # filas leídas de BD por vuelta (yield_per / página de cursor)
+FILAS_POR_BLOQUE = 500      # filas CSV por chunk enviado al cliente
+BYTES_POR_BLOQUE = 64 * 1024
+
+_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _celda(v: Any) -> Any:
+    """Valor exportable: Decimal → float, fechas → ISO, None → ''."""
+    if v is None:
+        return ''
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime):
+        return v.strftime('%Y-%m-%d %H:%M')
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+
+def formato_disponible(formato: str) -> bool:
+    return formato == 'csv' or (formato == 'xlsx' and xlsxwriter is not None)
+
+
+# ---------------------------------------------
+# Generadores
+# ---------------------------------------------
+def stream_csv(encabezados: Sequence[str], filas: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """
+    CSV por bloques de FILAS_POR_BLOQUE filas; nunca junta el archivo completo.
+    Empieza con BOM para que Excel lo abra como UTF-8 (acentos y ñ).
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    buf.write('\ufeff')
+    w.writerow(encabezados)
+    n = 0
+    for fila in filas:
+        w.writerow([_celda(v) for v in fila])
+        n += 1
+        if n % FILAS_POR_BLOQUE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    yield buf.getvalue()
+
+
+def stream_xlsx(encabezados: Sequence[str], filas: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    XLSX con xlsxwriter en modo constant_memory (cada fila se escribe a disco y se
+    libera). Un .xlsx es un zip: se arma en un temporal y luego se manda por bloques.
+    """
+    fd, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb = xlsxwriter.Workbook(ruta, {'constant_memory': True, 'strings_to_numbers': False})
+        ws = wb.add_worksheet()
+        ws.write_row(0, 0, encabezados, wb.add_format({'bold': True}))
+        for i, fila in enumerate(filas, start=1):
+            ws.write_row(i, 0, [_celda(v) for v in fila])
+        wb.close()
+        with open(ruta, 'rb') as f:
+            while True:
+                bloque = f.read(BYTES_POR_BLOQUE)
+                if not bloque:
+                    break
+                yield bloque
+    finally:
+        os.remove(ruta)
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def respuesta_exportacion(nombre: str, formato: str, encabezados: Sequence[str],
+                          filas: Iterable[Sequence[Any]]) -> Response:
+    """
+    Respuesta de descarga en streaming. `filas` debe ser un generador perezoso
+    (yield_per / páginas por cursor): se consume mientras se envía, dentro del
+    contexto del request (stream_with_context), así la sesión de BD sigue viva.
+    """
+    if not formato_disponible(formato):
+        raise ValueError(f"Formato de exportación no disponible: {formato}")
+    gen = stream_xlsx(encabezados, filas) if formato == 'xlsx' else stream_csv(encabezados, filas)
+    archivo = f"{nombre}_{date.today():%Y%m%d}.{formato}"
+    return Response(
+        stream_with_context(gen),
+        mimetype=_MIMETYPES[formato],
+        headers={
+            'Content-Disposition': f'attachment; filename="{archivo}"',
+            'X-Accel-Buffering': 'no',  # nginx: no esperar al final para empezar a mandar
+        },
+    )
@@ -0,0 +1,96 @@
+# idempotencia_utils.py
+from __future__ import annotations
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+
+# Vigencia por defecto: un form_id no se reenvía después de un día; un payload
+# idéntico solo se considera reintento durante unos minutos.
+TTL_FORM = timedelta(hours=24)
+TTL_PAYLOAD = timedelta(minutes=10)
+
+_tabla_ok: Optional[bool] = None
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.IdempotencyKey
+    """
+    from extensions import db
+    from models import IdempotencyKey
+    return db, IdempotencyKey
+
+
+def _tabla_existe(conn) -> bool:
+    """
+    Si la migración de idempotency_key aún no corre, no se bloquea ningún registro
+    (y se avisa en el log). Solo se recuerda el sí: tras migrar se activa sin reiniciar.
+    """
+    global _tabla_ok
+    if not _tabla_ok:
+        try:
+            _tabla_ok = inspect(conn).has_table('idempotency_key')
+        except Exception:
+            _tabla_ok = False
+        if not _tabla_ok and has_app_context():
+            current_app.logger.warning("Falta la tabla idempotency_key (correr `flask db upgrade`): "
+                                       "la protección contra reenvíos está desactivada")
+    return _tabla_ok
+
+
+def _hash(ambito: str, clave: str) -> str:
+    return hashlib.sha256(f"{ambito}:{clave}".encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def reservar_clave(ambito: str, clave: str, *, ttl: timedelta = TTL_FORM,
+                   ahora: Optional[datetime] = None) -> bool:
+    """
+    Inserta la llave en la transacción en curso (en un SAVEPOINT, sin commit).
+    Devuelve False si ya existe una vigente: es un reenvío. Solo se deshace el
+    SAVEPOINT; lo que el llamador ya tenga en la sesión sigue ahí y él decide.
+    Si la venta falla y se hace rollback, la llave desaparece con ella y el usuario
+    puede reintentar. Entre workers la PK serializa: el segundo INSERT espera al
+    commit del primero y choca.
+    """
+    clave = (clave or "").strip()
+    if not clave:
+        return True
+    db, IdempotencyKey = _get_models()
+    if not _tabla_existe(db.session.connection()):
+        return True
+
+    ahora = ahora or datetime.now()
+    h = _hash(ambito, clave)
+    # Una llave vencida no bloquea: se libera aquí sin esperar al barrido
+    (IdempotencyKey.query
+     .filter(IdempotencyKey.Clave == h, IdempotencyKey.Expira <= ahora)
+     .delete(synchronize_session=False))
+    try:
+        with db.session.begin_nested():
+            db.session.add(IdempotencyKey(Clave=h, Ambito=ambito, Creado=ahora, Expira=ahora + ttl))
+    except IntegrityError:
+        return False
+    return True
+
+
+def purgar_vencidas(ahora: Optional[datetime] = None) -> int:
+    """Borra las llaves vencidas (no hace commit). Devuelve cuántas se borraron."""
+    db, IdempotencyKey = _get_models()
+    if not _tabla_existe(db.session.connection()):
+        return 0
+    return (IdempotencyKey.query
+            .filter(IdempotencyKey.Expira <= (ahora or datetime.now()))
+            .delete(synchronize_session=False))
@@ -0,0 +1,408 @@
+# importacion_utils.py
+from __future__ import annotations
+import csv
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from werkzeug.datastructures import MultiDict
+
+from busqueda_utils import normalizar_texto
+
+
+# ---------------------------------------------
+# Formato del CSV
+# ---------------------------------------------
+# Columna CSV → campo del formulario. Los nombres siguen a TutorForm / EstudianteForm
+# (prefijos tutor_ / est_ / contacto1_ / contacto2_), así las reglas son las mismas.
+CAMPOS_TUTOR = ('nombre', 'apellido_paterno', 'apellido_materno', 'celular', 'edad', 'parentesco',
+                'correo', 'ocupacion', 'facebook', 'instagram', 'direccion', 'medio_entero')
+CAMPOS_EST = ('nombre', 'apellido_paterno', 'apellido_materno', 'fecha_nacimiento', 'sexo',
+              'lugar_nacimiento', 'grado_escolar', 'fecha_ingreso', 'colegio', 'otras_disciplinas',
+              'motivo_ingreso', 'status', 'otras_condiciones', 'alergias', 'medicamentos')
+CAMPOS_CONTACTO = ('nombre', 'apellido_paterno', 'apellido_materno', 'telefono', 'parentesco')
+CONDICIONES = ('pie_plano', 'escoliosis', 'genu_varo', 'genu_valgo', 'desviacion_cadera',
+               'asma', 'psicopatologias')
+_CONTACTOS = {'contacto1': 'contacto_principal', 'contacto2': 'contacto_secundario'}
+
+# est_condiciones: "asma; pie_plano"  ·  grupos: IDs o nombres separados por ';'
+COLUMNAS = ([f'tutor_{c}' for c in CAMPOS_TUTOR] + [f'est_{c}' for c in CAMPOS_EST]
+            + ['est_condiciones', 'grupos']
+            + [f'{p}_{c}' for p in _CONTACTOS for c in CAMPOS_CONTACTO])
+REQUERIDAS = ('tutor_celular', 'est_nombre', 'est_apellido_paterno', 'est_fecha_nacimiento',
+              'est_sexo', 'contacto1_nombre', 'contacto1_telefono')
+LOTE = 200
+
+
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.Tutor, Estudiante, ContactoEmergencia, Grupo
+    - forms.TutorForm, EstudianteForm
+    """
+    from extensions import db
+    from models import Tutor, Estudiante, ContactoEmergencia, Grupo
+    from forms import TutorForm, EstudianteForm
+    return db, Tutor, Estudiante, ContactoEmergencia, Grupo, TutorForm, EstudianteForm
+
+
+def _txt(v: Any) -> str:
+    return str(v).strip() if v is not None else ''
+
+
+def _fecha_iso(s: str) -> str:
+    """Acepta AAAA-MM-DD y DD/MM/AAAA (lo que exporta Excel en es-MX); deja lo demás tal cual."""
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(s, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return s
+
+
+def _clave_tutor(cel: str, correo: str) -> List[Tuple[str, str]]:
+    claves = []
+    if cel:
+        claves.append(('cel', cel))
+    if correo:
+        claves.append(('correo', correo.lower()))
+    return claves
+
+
+def _clave_est(nombre, ap_p, ap_m, fecha_nac, tutor) -> tuple:
+    return (_txt(nombre).lower(), _txt(ap_p).lower(), _txt(ap_m).lower(), fecha_nac, tutor)
+
+
+def leer_csv(stream) -> Iterable[Dict[str, str]]:
+    """
+    DictReader con encabezados normalizados (minúsculas, sin espacios). `stream` es texto
+    (abrir con encoding='utf-8-sig'). Falla con ValueError si faltan columnas requeridas.
+    """
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [_txt(h).lower().replace(' ', '_') for h in (reader.fieldnames or [])]
+    faltan = [c for c in REQUERIDAS if c not in reader.fieldnames]
+    if faltan:
+        raise ValueError(f"Faltan columnas requeridas: {', '.join(faltan)}")
+    return reader
+
+
+# ---------------------------------------------
+# Validación por fila (mismas reglas que registro_tutor_estudiante)
+# ---------------------------------------------
+class _Validador:
+    """
+    Un TutorForm y un EstudianteForm reutilizados para todas las filas (form.process por
+    fila): sus __init__ consultan tutores/grupos y no conviene repetirlo cientos de veces.
+    """
+
+    def __init__(self):
+        db, Tutor, Estudiante, ContactoEmergencia, Grupo, TutorForm, EstudianteForm = _get_models()
+        self.tutor_form = TutorForm(prefix='tutor', meta={'csrf': False})
+        self.est_form = EstudianteForm(prefix='est', meta={'csrf': False})
+        # Igual que en registro_tutor_estudiante: el tutor no sale del select
+        self.est_form.tutor_id.validators = []
+        self.est_form.tutor_id.flags.required = False
+        self.est_form.tutor_id.validate_choice = False
+        self.est_form.tutor_id.choices = []
+
+        self.grupos: Dict[str, int] = {}
+        for gid, nombre in db.session.execute(select(Grupo.Grupo_ID, Grupo.Grupo_Nombre)):
+            self.grupos[str(gid)] = gid
+            self.grupos.setdefault(_txt(nombre).lower(), gid)
+
+    @staticmethod
+    def _errores(form, mapa) -> List[str]:
+        out = []
+        for campo, errs in (form.errors or {}).items():
+            if isinstance(errs, dict):  # FormField (contactos)
+                for sub, sub_errs in errs.items():
+                    out += [f"{mapa(campo, sub)}: {e}" for e in sub_errs]
+            else:
+                out += [f"{mapa(campo, None)}: {e}" for e in errs]
+        return out
+
+    def validar(self, fila: Dict[str, Any], *, tutor_conocido: bool) -> Tuple[Optional[dict], List[str]]:
+        """(datos listos para guardar, errores). Si el tutor ya existe no se validan sus campos."""
+        fd = MultiDict()
+        for c in CAMPOS_TUTOR:
+            v = _txt(fila.get(f'tutor_{c}'))
+            if v:
+                fd.add(f'tutor-{c}', v)
+        for c in CAMPOS_EST:
+            v = _txt(fila.get(f'est_{c}'))
+            if c in ('fecha_nacimiento', 'fecha_ingreso') and v:
+                v = _fecha_iso(v)
+            elif c == 'sexo':
+                v = v[:1].upper()
+            elif c == 'status':
+                v = v.capitalize()
+            if v:
+                fd.add(f'est-{c}', v)
+        for cond in _txt(fila.get('est_condiciones')).replace('|', ';').split(';'):
+            cond = cond.strip().lower().replace(' ', '_')
+            if cond in CONDICIONES:
+                fd.add(f'est-{cond}', 'y')
+        for pref, sub in _CONTACTOS.items():
+            for c in CAMPOS_CONTACTO:
+                v = _txt(fila.get(f'{pref}_{c}'))
+                if v:
+                    fd.add(f'est-{sub}-{c}', v)
+
+        errores: List[str] = []
+        tf, ef = self.tutor_form, self.est_form
+        tf.process(fd)
+        ef.process(fd)
+        if not tutor_conocido and not tf.validate():
+            errores += self._errores(tf, lambda campo, _s: f"tutor_{campo}")
+        if not ef.validate():
+            inv = {v: k for k, v in _CONTACTOS.items()}
+            errores += self._errores(
+                ef, lambda campo, sub: f"{inv[campo]}_{sub}" if sub else f"est_{campo}")
+
+        grupos = []
+        for g in _txt(fila.get('grupos')).split(';'):
+            g = g.strip()
+            if not g:
+                continue
+            gid = self.grupos.get(g.lower())
+            if gid is None:
+                errores.append(f"grupos: no existe el grupo «{g}»")
+            elif gid not in grupos:
+                grupos.append(gid)
+        if errores:
+            return None, errores
+
+        condiciones = {c: True for c in CONDICIONES if getattr(ef, c).data}
+        if ef.otras_condiciones.data:
+            condiciones['otras'] = ef.otras_condiciones.data
+        fecha_ing = ef.fecha_ingreso.data or datetime.utcnow()
+        datos = {
+            'tutor': {
+                'Tutor_Nombre': tf.nombre.data, 'Tutor_ApellidoP': tf.apellido_paterno.data,
+                'Tutor_ApellidoM': tf.apellido_materno.data, 'Tutor_Celular': _txt(tf.celular.data),
+                'Tutor_Edad': tf.edad.data, 'Tutor_Parentesco': tf.parentesco.data,
+                'Tutor_Correo': _txt(tf.correo.data) or None, 'Tutor_Ocupacion': tf.ocupacion.data,
+                'Tutor_Facebook': tf.facebook.data, 'Tutor_Instagram': tf.instagram.data,
+                'Tutor_Direccion': tf.direccion.data, 'Tutor_Medio_Entero': tf.medio_entero.data,
+            },
+            'estudiante': {
+                'Est_Nombre': ef.nombre.data, 'Est_ApellidoP': ef.apellido_paterno.data,
+                'Est_ApellidoM': ef.apellido_materno.data, 'Est_FechaNac': ef.fecha_nacimiento.data,
+                'Est_Sexo': ef.sexo.data, 'Est_LugarNac': ef.lugar_nacimiento.data,
+                'Est_GradoEscolar': ef.grado_escolar.data,
+                'Est_FechaIngreso': fecha_ing.date() if isinstance(fecha_ing, datetime) else fecha_ing,
+                'Est_Colegio': ef.colegio.data, 'Est_OtrasDisciplinas': ef.otras_disciplinas.data,
+                'Est_MotivoIngreso': ef.motivo_ingreso.data, 'Est_Status': ef.status.data or 'Activo',
+                'Est_CondicionSalud': json.dumps(condiciones) if condiciones else None,
+                'Est_Alergias': ef.alergias.data, 'Est_Medicamentos': ef.medicamentos.data,
+            },
+            'contactos': [],
+            'grupos': grupos,
+        }
+        for sub in _CONTACTOS.values():
+            cd = getattr(ef, sub).data or {}
+            if _txt(cd.get('nombre')):
+                datos['contactos'].append({
+                    'Contacto_Nombre': _txt(cd.get('nombre')),
+                    'Contacto_ApellidoP': _txt(cd.get('apellido_paterno')),
+                    'Contacto_ApellidoM': _txt(cd.get('apellido_materno')),
+                    'Contacto_Telefono': _txt(cd.get('telefono')),
+                    'Contacto_Parentesco': _txt(cd.get('parentesco')),
+                })
+        return datos, []
+
+
+# ---------------------------------------------
+# Guardado por lotes
+# ---------------------------------------------
+def _indice_tutores() -> Dict[Tuple[str, str], int]:
+    """(‘cel’|‘correo’, valor) → Tutor_ID de los tutores ya registrados (anti-duplicado)."""
+    db, Tutor, *_ = _get_models()
+    idx: Dict[Tuple[str, str], int] = {}
+    filas = db.session.execute(select(Tutor.Tutor_ID, func.trim(Tutor.Tutor_Celular),
+                                      func.lower(func.trim(Tutor.Tutor_Correo))).order_by(Tutor.Tutor_ID))
+    for tid, cel, correo in filas:
+        for k in _clave_tutor(cel or '', correo or ''):
+            idx.setdefault(k, tid)
+    return idx
+
+
+def _guardar_lote(pendientes: List[dict], tutores_idx: Dict, *, validar_solo: bool) -> None:
+    """
+    Inserta un lote en una transacción con un INSERT de varias filas por tabla (tutores,
+    estudiantes, contactos, estudiante_grupo). Los grupos se consultan una vez por lote y
+    los duplicados (contra la BD o dentro del mismo archivo) se resuelven antes de insertar,
+    así cada tutor/estudiante nuevo tiene clave única y su ID se asocia por esa clave en el
+    RETURNING. Si aun así algo falla se reintenta fila por fila para que el error quede
+    en su renglón y el resto del lote sí se guarde.
+    Cada pendiente es {'fila', 'datos', 'claves', 'res'}; 'res' se actualiza in situ.
+    """
+    db, Tutor, Estudiante, ContactoEmergencia, Grupo, *_ = _get_models()
+    from models import estudiante_grupo
+    try:
+        # Estudiantes ya existentes de los tutores conocidos (para no duplicar al reimportar)
+        conocidos = {tutores_idx[k] for p in pendientes for k in p['claves'] if k in tutores_idx}
+        existentes: Dict[tuple, Optional[int]] = {}   # clave → fila del archivo (None si ya está en BD)
+        if conocidos:
+            for n, ap, am, fnac, tid in db.session.execute(
+                    select(Estudiante.Est_Nombre, Estudiante.Est_ApellidoP, Estudiante.Est_ApellidoM,
+                           Estudiante.Est_FechaNac, Estudiante.Tutor_ID)
+                    .where(Estudiante.Tutor_ID.in_(conocidos))):
+                existentes[_clave_est(n, ap, am, fnac, tid)] = None
+        gids = {g for p in pendientes for g in p['datos']['grupos']}
+        grupos_ok = (set(db.session.execute(select(Grupo.Grupo_ID).where(Grupo.Grupo_ID.in_(gids))).scalars())
+                     if gids else set())
+
+        # Tutor de cada fila: Tutor_ID conocido o ('nuevo', clave) de un tutor creado en este lote
+        tutores_nuevos: Dict[Tuple[str, str], dict] = {}
+        nuevos: Dict[Tuple[str, str], tuple] = {}
+        creados = []
+        for p in pendientes:
+            d = p['datos']
+            faltan = [g for g in d['grupos'] if g not in grupos_ok]
+            if faltan:
+                p['res'].update(estado='error', errores=[f"grupos: no existe el grupo {g}" for g in faltan])
+                continue
+            tutor = next((tutores_idx[k] for k in p['claves'] if k in tutores_idx), None)
+            if tutor is None:
+                tutor = next((nuevos[k] for k in p['claves'] if k in nuevos), ('nuevo', p['claves'][0]))
+
+            e = d['estudiante']
+            clave = _clave_est(e['Est_Nombre'], e['Est_ApellidoP'], e['Est_ApellidoM'], e['Est_FechaNac'], tutor)
+            if clave in existentes:
+                previa = existentes[clave]
+                p['res'].update(estado='omitido', errores=[
+                    'ya existe (mismo nombre, fecha y tutor)' if previa is None
+                    else f'repetido en el archivo (fila {previa})'])
+                continue
+            existentes[clave] = p['fila']
+
+            if isinstance(tutor, tuple):
+                tutores_nuevos.setdefault(tutor[1], d['tutor'])
+            for k in p['claves']:
+                if k not in tutores_idx:
+                    nuevos.setdefault(k, tutor)
+            creados.append((p, tutor, clave))
+
+        ids_tutor: Dict[Tuple[str, str], int] = {}
+        if tutores_nuevos:
+            for tid, cel, correo in db.session.execute(
+                    insert(Tutor).returning(Tutor.Tutor_ID, Tutor.Tutor_Celular, Tutor.Tutor_Correo),
+                    list(tutores_nuevos.values())):
+                ids_tutor[_clave_tutor(_txt(cel), _txt(correo))[0]] = tid
+
+        def _tid(tutor) -> int:
+            return ids_tutor[tutor[1]] if isinstance(tutor, tuple) else tutor
+
+        if creados:
+            # Inserción masiva: el evento before_insert no corre, el nombre de búsqueda va aquí
+            filas_est = []
+            for p, tutor, _c in creados:
+                e = p['datos']['estudiante']
+                filas_est.append(dict(e, Tutor_ID=_tid(tutor), Est_NombreBusqueda=normalizar_texto(
+                    e['Est_Nombre'], e['Est_ApellidoP'], e['Est_ApellidoM'])))
+            ids_est = {}
+            for eid, n, ap, am, fnac, tid in db.session.execute(
+                    insert(Estudiante).returning(Estudiante.Est_ID, Estudiante.Est_Nombre, Estudiante.Est_ApellidoP,
+                                                 Estudiante.Est_ApellidoM, Estudiante.Est_FechaNac,
+                                                 Estudiante.Tutor_ID),
+                    filas_est):
+                ids_est[_clave_est(n, ap, am, fnac, tid)] = eid
+
+            contactos, grupos = [], []
+            for p, tutor, clave in creados:
+                tid = _tid(tutor)
+                eid = ids_est[clave[:-1] + (tid,)]
+                contactos += [dict(c, Est_ID=eid) for c in p['datos']['contactos']]
+                grupos += [{'Est_ID': eid, 'Grupo_ID': g} for g in p['datos']['grupos']]
+                p['res'].update(estado='ok', est_id=eid, tutor_id=tid)
+            if contactos:
+                db.session.execute(insert(ContactoEmergencia), contactos)
+            if grupos:
+                db.session.execute(estudiante_grupo.insert(), grupos)
+
+        if validar_solo:
+            db.session.rollback()
+            for p, _t, _c in creados:
+                p['res'].update(est_id=None, tutor_id=None)
+            return
+        db.session.commit()
+        for k, tutor in nuevos.items():
+            tutores_idx.setdefault(k, _tid(tutor))
+    except Exception as ex:
+        db.session.rollback()
+        if len(pendientes) == 1:
+            pendientes[0]['res'].update(estado='error', est_id=None, tutor_id=None,
+                                        errores=[f"error al guardar: {ex}"])
+            return
+        for p in pendientes:
+            p['res'].update(estado=None, est_id=None, tutor_id=None, errores=[])
+            _guardar_lote([p], tutores_idx, validar_solo=validar_solo)
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def importar_estudiantes(filas: Iterable[Dict[str, Any]], *, lote: int = LOTE,
+                         validar_solo: bool = False, on_lote=None) -> Dict[str, Any]:
+    """
+    Alta masiva de estudiantes con su tutor, contactos de emergencia y grupos.
+
+    - Cada fila se valida con TutorForm / EstudianteForm (mismas reglas que la captura).
+    - Tutores: se reutiliza el existente (o uno ya creado en el archivo) con el mismo
+      celular o correo; en ese caso no se validan los campos del tutor.
+    - Estudiantes con mismo nombre, fecha de nacimiento y tutor se omiten (reimportar
+      el mismo archivo no duplica).
+    - Se guarda en transacciones de `lote` filas; validar_solo=True hace todo y revierte.
+
+    Devuelve {'resumen': {...}, 'filas': [{'fila', 'estado', 'tutor_id', 'est_id', 'errores'}]}
+    donde 'fila' es la línea del CSV (la 1 es el encabezado) y estado ∈ ok|omitido|error.
+    `on_lote(procesadas)` permite reportar avance.
+    """
+    val = _Validador()
+    tutores_idx = _indice_tutores()
+    reporte: List[dict] = []
+    pendientes: List[dict] = []
+    procesadas = 0
+
+    def _vaciar():
+        nonlocal pendientes
+        if pendientes:
+            _guardar_lote(pendientes, tutores_idx, validar_solo=validar_solo)
+            pendientes = []
+            if on_lote:
+                on_lote(procesadas)
+
+    for n, fila in enumerate(filas, start=2):
+        procesadas += 1
+        res = {'fila': n, 'estado': 'error', 'tutor_id': None, 'est_id': None, 'errores': []}
+        reporte.append(res)
+        claves = _clave_tutor(_txt(fila.get('tutor_celular')), _txt(fila.get('tutor_correo')))
+        if not claves:
+            res['errores'] = ['tutor_celular: requerido para identificar al tutor']
+            continue
+        conocido = any(k in tutores_idx for k in claves)
+        datos, errores = val.validar(fila, tutor_conocido=conocido)
+        if errores:
+            res['errores'] = errores
+            continue
+        pendientes.append({'fila': n, 'datos': datos, 'claves': claves, 'res': res})
+        if len(pendientes) >= max(1, lote):
+            _vaciar()
+    _vaciar()
+
+    resumen = {'filas': len(reporte), 'ok': 0, 'omitido': 0, 'error': 0, 'validar_solo': validar_solo}
+    for r in reporte:
+        resumen[r['estado']] += 1
+    return {'resumen': resumen, 'filas': reporte}
+
+
+def filas_reporte(resultado: Dict[str, Any]):
+    """Renglones (fila, estado, tutor_id, est_id, errores) para CSV/pantalla."""
+    for r in resultado['filas']:
+        yield r['fila'], r['estado'], r['tutor_id'], r['est_id'], ' | '.join(r['errores'])
+
+
+ENCABEZADOS_REPORTE = ('Fila', 'Estado', 'Tutor_ID', 'Est_ID', 'Errores')
@@ -0,0 +1,620 @@
+# inventario_utils.py
+from __future__ import annotations
+import json
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, select, update
+
+from catalogo_utils import invalidar_catalogo
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.Articulo, ArticuloVariante
+    """
+    from extensions import db
+    from models import Articulo, ArticuloVariante
+    return db, Articulo, ArticuloVariante
+
+
+def _norm_talla(talla) -> Optional[str]:
+    t = (str(talla).strip() if talla is not None else '')
+    return t or None
+
+
+# ---------------------------------------------
+# Lecturas
+# ---------------------------------------------
+def variantes_por_articulo(articulo_ids: Optional[Iterable[int]] = None) -> Dict[int, List[Tuple[str, int]]]:
+    """
+    {Articulo_ID: [(talla, existencia), ...]} en una sola consulta,
+    en el orden de alta de las variantes.
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    q = (select(ArticuloVariante.Articulo_ID, ArticuloVariante.Talla, ArticuloVariante.Existencia)
+         .order_by(ArticuloVariante.Articulo_ID, ArticuloVariante.Variante_ID))
+    if articulo_ids is not None:
+        ids = list({int(i) for i in articulo_ids})
+        if not ids:
+            return {}
+        q = q.where(ArticuloVariante.Articulo_ID.in_(ids))
+
+    out: Dict[int, List[Tuple[str, int]]] = OrderedDict()
+    for art_id, talla, existencia in db.session.execute(q):
+        out.setdefault(art_id, []).append((talla, int(existencia or 0)))
+    return out
+
+
+def existencia_disponible(articulo, talla) -> int:
+    """
+    Existencia vendible de un artículo/talla:
+      - si el artículo maneja variantes y viene talla → la de esa variante (0 si no existe)
+      - en otro caso → Articulo_Existencia
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    talla = _norm_talla(talla)
+    if talla and articulo.variantes:
+        for v in articulo.variantes:
+            if v.Talla == talla:
+                return int(v.Existencia or 0)
+        return 0
+    return int(getattr(articulo, 'Articulo_Existencia', 0) or 0)
+
+
+# ---------------------------------------------
+# Escrituras (UPDATE de una sola fila)
+# ---------------------------------------------
+def _ajustar(articulo_id: int, talla, delta: int, *, tipo: str, venta_id: Optional[int] = None) -> None:
+    """
+    Suma `delta` a la variante (si existe) y al total denormalizado del artículo,
+    con UPDATE directos (sin leer/reescribir JSON), y lo asienta en la bitácora.
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    talla = _norm_talla(talla)
+    talla_mov = None
+    if talla:
+        res = db.session.execute(
+            update(ArticuloVariante)
+            .where(ArticuloVariante.Articulo_ID == articulo_id, ArticuloVariante.Talla == talla)
+            .values(Existencia=ArticuloVariante.Existencia + delta)
+        )
+        talla_mov = talla if res.rowcount else None
+    db.session.execute(
+        update(Articulo)
+        .where(Articulo.Articulo_ID == articulo_id)
+        .values(Articulo_Existencia=Articulo.Articulo_Existencia + delta)
+    )
+    registrar_movimientos([(articulo_id, talla_mov, delta)], tipo=tipo, venta_id=venta_id)
+
+
+def descontar_stock(articulo_id: int, talla, qty: int, *, venta_id: Optional[int] = None) -> None:
+    """Descuenta `qty` piezas de la variante/artículo. No valida existencia (ver existencia_disponible)."""
+    _ajustar(articulo_id, talla, -abs(int(qty or 0)), tipo='venta', venta_id=venta_id)
+
+
+def reponer_stock(articulo_id: int, talla, qty: int, *, venta_id: Optional[int] = None) -> None:
+    """Regresa `qty` piezas a la variante/artículo (cancelaciones y eliminación de ventas)."""
+    _ajustar(articulo_id, talla, abs(int(qty or 0)), tipo='cancelacion', venta_id=venta_id)
+
+
+class StockInsuficiente(Exception):
+    """
+    El descuento en lote no pudo aplicarse completo.
+    `faltantes`: lista de dicts {articulo_id, nombre, talla, solicitado, disponible}.
+    La transacción queda a medias: el llamador debe hacer rollback.
+    """
+    def __init__(self, faltantes: List[dict]):
+        self.faltantes = faltantes
+        super().__init__("Stock insuficiente")
+
+
+def _expirar_existencias(articulo_ids) -> None:
+    """Tras un UPDATE directo, invalida las existencias cacheadas en la sesión."""
+    db, Articulo, ArticuloVariante = _get_models()
+    ids = set(articulo_ids)
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Articulo) and obj.Articulo_ID in ids:
+            db.session.expire(obj, ['Articulo_Existencia'])
+        elif isinstance(obj, ArticuloVariante) and obj.Articulo_ID in ids:
+            db.session.expire(obj, ['Existencia'])
+
+
+def _faltantes(por_variante: Dict[Tuple[int, str], int], por_articulo: Dict[int, int]) -> List[dict]:
+    """Relee existencias para armar el detalle del error (solo en el camino de falla)."""
+    db, Articulo, ArticuloVariante = _get_models()
+    ids = {a for a, _t in por_variante} | set(por_articulo)
+    arts = dict(db.session.execute(
+        select(Articulo.Articulo_ID, Articulo.Articulo_Nombre).where(Articulo.Articulo_ID.in_(ids))
+    ).all())
+    out = []
+    if por_variante:
+        disp = {(a, t): int(e or 0) for a, t, e in db.session.execute(
+            select(ArticuloVariante.Articulo_ID, ArticuloVariante.Talla, ArticuloVariante.Existencia)
+            .where(ArticuloVariante.Articulo_ID.in_({a for a, _t in por_variante}))
+        )}
+        for (a, t), q in por_variante.items():
+            if disp.get((a, t), 0) < q:
+                out.append({'articulo_id': a, 'nombre': arts.get(a, f"ID {a}"), 'talla': t,
+                            'solicitado': q, 'disponible': disp.get((a, t), 0)})
+    if por_articulo:
+        disp = dict(db.session.execute(
+            select(Articulo.Articulo_ID, Articulo.Articulo_Existencia).where(Articulo.Articulo_ID.in_(set(por_articulo)))
+        ).all())
+        for a, q in por_articulo.items():
+            if int(disp.get(a) or 0) < q:
+                out.append({'articulo_id': a, 'nombre': arts.get(a, f"ID {a}"), 'talla': None,
+                            'solicitado': q, 'disponible': int(disp.get(a) or 0)})
+    return out
+
+
+# ---------------------------------------------
+# Bitácora (MovimientoInventario, append-only)
+# ---------------------------------------------
+# Clave de existencia: (Articulo_ID, Talla). Talla None = lo que el total del artículo
+# tiene fuera de variantes (todo, si no maneja tallas). Así la suma de las claves de un
+# artículo siempre es Articulo_Existencia.
+TIPOS_LEDGER = ('venta', 'cancelacion', 'recepcion', 'ajuste', 'alta', 'edicion', 'baja')
+
+
+def registrar_movimientos(movs: Iterable[Tuple[int, Optional[str], int]], *, tipo: str,
+                          venta_id: Optional[int] = None, referencia: Optional[str] = None,
+                          nota: Optional[str] = None) -> Optional[str]:
+    """
+    Asienta (articulo_id, talla|None, cantidad con signo) en un solo INSERT; los ceros
+    se omiten. No hace commit. Devuelve el Lote (None si no hubo nada que asentar).
+    """
+    from models import MovimientoInventario
+    db, Articulo, ArticuloVariante = _get_models()
+    if tipo not in TIPOS_LEDGER:
+        raise ValueError(f"Tipo de movimiento inválido: {tipo}")
+    lote, ahora = uuid.uuid4().hex, datetime.now()
+    filas = [{'Lote': lote, 'Fecha': ahora, 'Tipo': tipo, 'Articulo_ID': int(a), 'Talla': _norm_talla(t),
+              'Cantidad': int(d), 'Venta_ID': venta_id, 'Referencia': referencia, 'Nota': nota}
+             for a, t, d in movs if int(d or 0) != 0]
+    if not filas:
+        return None
+    db.session.execute(MovimientoInventario.__table__.insert(), filas)
+    return lote
+
+
+def existencias_por_clave(articulo) -> Dict[Optional[str], int]:
+    """{talla|None: existencia} del objeto en memoria (antes/después de editarlo)."""
+    out: Dict[Optional[str], int] = {v.Talla: int(v.Existencia or 0) for v in articulo.variantes}
+    resto = int(articulo.Articulo_Existencia or 0) - sum(out.values())
+    if resto or not out:
+        out[None] = resto
+    return out
+
+
+def registrar_diferencia(articulo, antes: Dict[Optional[str], int], *, tipo: str,
+                         nota: Optional[str] = None) -> Optional[str]:
+    """
+    Asienta la diferencia entre `antes` (existencias_por_clave previo) y el estado actual
+    del artículo: para rutas que reescriben existencias absolutas (alta/edición/baja de talla).
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    if articulo.Articulo_ID is None:
+        db.session.flush()
+    despues = existencias_por_clave(articulo)
+    claves = list(antes) + [k for k in despues if k not in antes]
+    return registrar_movimientos(
+        [(articulo.Articulo_ID, k, despues.get(k, 0) - antes.get(k, 0)) for k in claves],
+        tipo=tipo, nota=nota)
+
+
+def descontar_stock_lote(items: Iterable[Tuple[int, Optional[str], int]], *,
+                         venta_id: Optional[int] = None) -> None:
+    """
+    Verifica y descuenta el stock de TODAS las líneas de una venta de forma atómica:
+      UPDATE ... SET existencia = existencia - :q WHERE ... AND existencia >= :q
+    Un solo UPDATE para variantes (talla) y otro para artículos sin talla; si el número
+    de filas afectadas no cuadra, alguien se llevó la pieza antes → StockInsuficiente.
+    `items`: (articulo_id, talla|None, qty). Las líneas repetidas se suman.
+    Cada clave descontada queda en la bitácora como tipo 'venta' (con `venta_id`).
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    V = ArticuloVariante.__table__
+    A = Articulo.__table__
+
+    items = [(int(a), _norm_talla(t), int(q or 0)) for a, t, q in items if int(q or 0) > 0]
+    if not items:
+        return
+
+    # ¿Qué artículos manejan variantes? (una consulta)
+    con_tallas = set(db.session.execute(
+        select(ArticuloVariante.Articulo_ID)
+        .where(ArticuloVariante.Articulo_ID.in_({a for a, _t, _q in items}))
+        .group_by(ArticuloVariante.Articulo_ID)
+    ).scalars())
+
+    por_variante: Dict[Tuple[int, str], int] = OrderedDict()
+    por_articulo: Dict[int, int] = OrderedDict()   # sin variantes: se valida el total
+    total_variantes: Dict[int, int] = OrderedDict() # con variantes: el total solo se ajusta
+    for a, t, q in items:
+        if t and a in con_tallas:
+            por_variante[(a, t)] = por_variante.get((a, t), 0) + q
+            total_variantes[a] = total_variantes.get(a, 0) + q
+        else:
+            por_articulo[a] = por_articulo.get(a, 0) + q
+
+    if por_variante:
+        delta = case(*[(and_(V.c.Articulo_ID == a, V.c.Talla == t), q) for (a, t), q in por_variante.items()],
+                     else_=0)
+        guarda = or_(*[and_(V.c.Articulo_ID == a, V.c.Talla == t, V.c.Existencia >= q)
+                       for (a, t), q in por_variante.items()])
+        res = db.session.execute(V.update().where(guarda).values(Existencia=V.c.Existencia - delta))
+        if res.rowcount != len(por_variante):
+            raise StockInsuficiente(_faltantes(por_variante, {}))
+
+    if por_articulo:
+        delta = case(*[(A.c.Articulo_ID == a, q) for a, q in por_articulo.items()], else_=0)
+        guarda = or_(*[and_(A.c.Articulo_ID == a, A.c.Articulo_Existencia >= q) for a, q in por_articulo.items()])
+        res = db.session.execute(A.update().where(guarda).values(Articulo_Existencia=A.c.Articulo_Existencia - delta))
+        if res.rowcount != len(por_articulo):
+            raise StockInsuficiente(_faltantes({}, por_articulo))
+
+    if total_variantes:
+        delta = case(*[(A.c.Articulo_ID == a, q) for a, q in total_variantes.items()], else_=0)
+        db.session.execute(A.update()
+                           .where(A.c.Articulo_ID.in_(list(total_variantes)))
+                           .values(Articulo_Existencia=A.c.Articulo_Existencia - delta))
+
+    registrar_movimientos([(a, t, -q) for (a, t), q in por_variante.items()]
+                          + [(a, None, -q) for a, q in por_articulo.items()],
+                          tipo='venta', venta_id=venta_id)
+    _expirar_existencias({a for a, _t, _q in items})
+
+
+# ---------------------------------------------
+# Recepción / ajuste en lote (con bitácora)
+# ---------------------------------------------
+TIPOS_MOVIMIENTO = ('recepcion', 'ajuste')
+MAX_MOVIMIENTOS = 2000   # renglones por solicitud
+
+
+class MovimientoInvalido(ValueError):
+    """
+    La solicitud no se aplicó (nada se escribió).
+    `errores`: lista de dicts {renglon, articulo_id, talla, error}; renglon empieza en 1.
+    """
+    def __init__(self, errores: List[dict]):
+        self.errores = errores
+        super().__init__("Movimientos de inventario inválidos")
+
+
+def _error_mov(renglon, articulo_id, talla, error: str) -> dict:
+    return {'renglon': renglon, 'articulo_id': articulo_id, 'talla': talla, 'error': error}
+
+
+def _normalizar_movimientos(items) -> Tuple[List[Tuple[int, int, Optional[str], int]], List[dict]]:
+    """[(renglon, articulo_id, talla, delta)] + errores de formato (ids/cantidades no enteros, delta 0)."""
+    out, errores = [], []
+    for n, it in enumerate(items or [], start=1):
+        if isinstance(it, dict):
+            a, t, d = it.get('articulo_id'), it.get('talla'), it.get('delta')
+        else:
+            try:
+                a, t, d = it
+            except (TypeError, ValueError):
+                errores.append(_error_mov(n, None, None, 'renglón mal formado'))
+                continue
+        talla = _norm_talla(t)
+        try:
+            a = int(a)
+            d = int(d)
+        except (TypeError, ValueError):
+            errores.append(_error_mov(n, a, talla, 'articulo_id y delta deben ser enteros'))
+            continue
+        if d == 0:
+            errores.append(_error_mov(n, a, talla, 'delta no puede ser 0'))
+            continue
+        out.append((n, a, talla, d))
+    return out, errores
+
+
+def aplicar_movimientos(items, *, tipo: str = 'recepcion', referencia: Optional[str] = None,
+                        nota: Optional[str] = None) -> dict:
+    """
+    Aplica muchos (articulo_id, talla|None, delta) en la transacción actual:
+      - valida TODO antes de escribir (artículo existe, talla coherente con el artículo,
+        ninguna existencia queda negativa) → MovimientoInvalido con el detalle por renglón
+      - un UPDATE relativo (CASE) para todas las variantes y otro para los totales de
+        artículo, como descontar_stock_lote; las tallas nuevas con delta > 0 se dan de alta
+      - una fila de bitácora por renglón, todas con el mismo Lote
+    Renglones repetidos (mismo artículo/talla) se suman. Una venta que se lleve la pieza
+    entre la validación y el UPDATE hace fallar la guarda → StockInsuficiente.
+    No hace commit. Devuelve {lote, movimientos, articulos, piezas}.
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    V = ArticuloVariante.__table__
+    A = Articulo.__table__
+
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise ValueError(f"Tipo de movimiento inválido: {tipo}")
+    items = list(items or [])
+    if not items:
+        raise MovimientoInvalido([_error_mov(None, None, None, 'no hay renglones')])
+    if len(items) > MAX_MOVIMIENTOS:
+        raise MovimientoInvalido([_error_mov(None, None, None,
+                                             f'máximo {MAX_MOVIMIENTOS} renglones por solicitud')])
+
+    renglones, errores = _normalizar_movimientos(items)
+    ids = {a for _n, a, _t, _d in renglones}
+
+    # Estado actual: artículos y variantes en dos consultas
+    arts = {a: (tipo_talla, int(ex or 0)) for a, tipo_talla, ex in db.session.execute(
+        select(Articulo.Articulo_ID, Articulo.Articulo_TipoTalla, Articulo.Articulo_Existencia)
+        .where(Articulo.Articulo_ID.in_(ids))
+    )} if ids else {}
+    variantes = {(a, t): int(e or 0) for a, t, e in db.session.execute(
+        select(ArticuloVariante.Articulo_ID, ArticuloVariante.Talla, ArticuloVariante.Existencia)
+        .where(ArticuloVariante.Articulo_ID.in_(ids))
+    )} if ids else {}
+    con_tallas = {a for a, _t in variantes}
+
+    por_variante: Dict[Tuple[int, str], int] = OrderedDict()
+    por_articulo: Dict[int, int] = OrderedDict()   # delta del total (con o sin variantes)
+    sin_talla: Dict[int, int] = OrderedDict()      # delta de renglones sin talla (artículos sin variantes)
+    primer_renglon: Dict[Tuple[int, Optional[str]], int] = {}
+    for n, a, t, d in renglones:
+        if a not in arts:
+            errores.append(_error_mov(n, a, t, 'el artículo no existe'))
+            continue
+        maneja_tallas = a in con_tallas or bool(arts[a][0])
+        if t and not maneja_tallas:
+            errores.append(_error_mov(n, a, t, 'el artículo no maneja tallas'))
+            continue
+        if not t and a in con_tallas:
+            errores.append(_error_mov(n, a, t, 'falta la talla (el artículo tiene variantes)'))
+            continue
+        if t:
+            por_variante[(a, t)] = por_variante.get((a, t), 0) + d
+        else:
+            sin_talla[a] = sin_talla.get(a, 0) + d
+        por_articulo[a] = por_articulo.get(a, 0) + d
+        primer_renglon.setdefault((a, t), n)
+
+    for (a, t), d in por_variante.items():
+        if (a, t) not in variantes and d < 0:
+            errores.append(_error_mov(primer_renglon[(a, t)], a, t, 'la talla no existe'))
+        elif variantes.get((a, t), 0) + d < 0:
+            errores.append(_error_mov(primer_renglon[(a, t)], a, t,
+                                      f'existencia insuficiente ({variantes.get((a, t), 0)} disponibles)'))
+    # Las tallas de un artículo sin variantes se validan arriba (salidas sobre tallas
+    # inexistentes se rechazan); aquí solo cuenta lo que se mueve sin talla.
+    for a, d in sin_talla.items():
+        if arts[a][1] + d < 0:
+            errores.append(_error_mov(primer_renglon[(a, None)], a, None,
+                                      f'existencia insuficiente ({arts[a][1]} disponibles)'))
+
+    if errores:
+        raise MovimientoInvalido(sorted(errores, key=lambda e: e['renglon'] or 0))
+
+    # Tallas nuevas (solo entradas): alta con existencia 0 y el UPDATE de abajo las suma
+    nuevas = [(a, t) for (a, t) in por_variante if (a, t) not in variantes]
+    if nuevas:
+        db.session.execute(V.insert(), [{'Articulo_ID': a, 'Talla': t, 'Existencia': 0} for a, t in nuevas])
+
+    if por_variante:
+        delta = case(*[(and_(V.c.Articulo_ID == a, V.c.Talla == t), d) for (a, t), d in por_variante.items()],
+                     else_=0)
+        guarda = or_(*[and_(V.c.Articulo_ID == a, V.c.Talla == t, V.c.Existencia + d >= 0)
+                       for (a, t), d in por_variante.items()])
+        res = db.session.execute(V.update().where(guarda).values(Existencia=V.c.Existencia + delta))
+        if res.rowcount != len(por_variante):
+            raise StockInsuficiente(_faltantes({k: -d for k, d in por_variante.items() if d < 0}, {}))
+
+    delta = case(*[(A.c.Articulo_ID == a, d) for a, d in por_articulo.items()], else_=0)
+    guarda = or_(*[and_(A.c.Articulo_ID == a, A.c.Articulo_Existencia + d >= 0) for a, d in por_articulo.items()])
+    res = db.session.execute(A.update().where(guarda).values(Articulo_Existencia=A.c.Articulo_Existencia + delta))
+    if res.rowcount != len(por_articulo):
+        raise StockInsuficiente(_faltantes({}, {a: -d for a, d in por_articulo.items() if d < 0}))
+
+    lote = registrar_movimientos([(a, t, d) for _n, a, t, d in renglones],
+                                 tipo=tipo, referencia=referencia, nota=nota)
+
+    _expirar_existencias(por_articulo)
+    if nuevas:
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, Articulo) and obj.Articulo_ID in {a for a, _t in nuevas}:
+                db.session.expire(obj, ['variantes'])
+        invalidar_catalogo()  # tallas nuevas = opciones nuevas en el catálogo
+    return {'lote': lote, 'movimientos': len(renglones), 'articulos': len(por_articulo),
+            'piezas': sum(d for _n, _a, _t, d in renglones)}
+
+
+def sincronizar_variantes(articulo, tallas: Dict[str, int]) -> None:
+    """
+    Deja las variantes del artículo exactamente como `tallas` ({talla: existencia}),
+    actualizando/creando/borrando filas, y recalcula Articulo_Existencia.
+    Un dict vacío elimina todas las variantes (artículo sin talla).
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    deseadas = OrderedDict()
+    for talla, cant in (tallas or {}).items():
+        t = _norm_talla(talla)
+        if t:
+            deseadas[t] = int(cant or 0)
+
+    actuales = {v.Talla: v for v in articulo.variantes}
+    for talla, v in actuales.items():
+        if talla not in deseadas:
+            articulo.variantes.remove(v)
+    for talla, cant in deseadas.items():
+        v = actuales.get(talla)
+        if v is None:
+            articulo.variantes.append(ArticuloVariante(Talla=talla, Existencia=cant))
+        else:
+            v.Existencia = cant
+
+    if deseadas:
+        articulo.Articulo_Existencia = sum(deseadas.values())
+
+
+# ---------------------------------------------
+# Snapshots y existencia a una fecha pasada
+# ---------------------------------------------
+# Un movimiento con ID mayor al Ultimo_Movimiento_ID del snapshot pudo tomar su Fecha
+# justo antes que el snapshot (transacción en vuelo); la holgura acota ese caso sin
+# perder el rango por índice (Articulo_ID, Talla, Fecha).
+HOLGURA_SNAPSHOT = timedelta(minutes=5)
+
+
+def _es_talla(col, talla):
+    return col.is_(None) if talla is None else col == talla
+
+
+def existencias_actuales(articulo_ids: Optional[Iterable[int]] = None) -> Dict[Tuple[int, Optional[str]], int]:
+    """{(articulo_id, talla|None): existencia} de todo el inventario (o de `articulo_ids`) en dos consultas."""
+    db, Articulo, ArticuloVariante = _get_models()
+    qv = select(ArticuloVariante.Articulo_ID, ArticuloVariante.Talla, ArticuloVariante.Existencia)
+    qa = select(Articulo.Articulo_ID, Articulo.Articulo_Existencia)
+    if articulo_ids is not None:
+        ids = list({int(i) for i in articulo_ids})
+        qv = qv.where(ArticuloVariante.Articulo_ID.in_(ids))
+        qa = qa.where(Articulo.Articulo_ID.in_(ids))
+
+    out: Dict[Tuple[int, Optional[str]], int] = OrderedDict()
+    suma: Dict[int, int] = {}
+    for a, t, e in db.session.execute(qv):
+        out[(a, t)] = int(e or 0)
+        suma[a] = suma.get(a, 0) + int(e or 0)
+    for a, total in db.session.execute(qa):
+        resto = int(total or 0) - suma.get(a, 0)
+        if resto or a not in suma:
+            out[(a, None)] = resto
+    return out
+
+
+def tomar_snapshot() -> Dict[str, int]:
+    """
+    Foto de existencias actuales (una fila por clave) marcada con el último movimiento
+    incluido. Pensado para correr periódicamente (`flask ballet inventario-snapshot`).
+    No hace commit.
+    """
+    from models import MovimientoInventario, InventarioSnapshot
+    db, Articulo, ArticuloVariante = _get_models()
+    ultimo = db.session.execute(select(func.max(MovimientoInventario.Movimiento_ID))).scalar() or 0
+    ahora = datetime.now()
+    filas = [{'Fecha': ahora, 'Articulo_ID': a, 'Talla': t, 'Existencia': e, 'Ultimo_Movimiento_ID': ultimo}
+             for (a, t), e in existencias_actuales().items()]
+    if filas:
+        db.session.execute(InventarioSnapshot.__table__.insert(), filas)
+    return {'claves': len(filas), 'ultimo_movimiento': ultimo}
+
+
+def existencia_en(articulo_id: int, talla, fecha: datetime) -> int:
+    """
+    Existencia de (artículo, talla|None) al momento `fecha`:
+      1) snapshot más reciente con Fecha <= fecha (búsqueda por índice) + movimientos
+         posteriores a él hasta `fecha`
+      2) si no hay snapshot previo: el siguiente snapshot (o la existencia actual)
+         menos los movimientos entre `fecha` y él
+    Antes del primer movimiento/snapshot registrado la respuesta es la extrapolación
+    hacia atrás del estado actual.
+    """
+    from models import MovimientoInventario as M, InventarioSnapshot as S
+    db, Articulo, ArticuloVariante = _get_models()
+    articulo_id, talla = int(articulo_id), _norm_talla(talla)
+    clave_m = and_(M.Articulo_ID == articulo_id, _es_talla(M.Talla, talla))
+    clave_s = and_(S.Articulo_ID == articulo_id, _es_talla(S.Talla, talla))
+
+    previo = db.session.execute(
+        select(S.Fecha, S.Existencia, S.Ultimo_Movimiento_ID)
+        .where(clave_s, S.Fecha <= fecha).order_by(S.Fecha.desc()).limit(1)
+    ).first()
+    if previo:
+        delta = db.session.execute(
+            select(func.coalesce(func.sum(M.Cantidad), 0))
+            .where(clave_m, M.Fecha >= previo.Fecha - HOLGURA_SNAPSHOT, M.Fecha <= fecha,
+                   M.Movimiento_ID > previo.Ultimo_Movimiento_ID)
+        ).scalar()
+        return int(previo.Existencia) + int(delta or 0)
+
+    siguiente = db.session.execute(
+        select(S.Fecha, S.Existencia, S.Ultimo_Movimiento_ID)
+        .where(clave_s, S.Fecha > fecha).order_by(S.Fecha.asc()).limit(1)
+    ).first()
+    if siguiente:
+        base = int(siguiente.Existencia)
+        q = select(func.coalesce(func.sum(M.Cantidad), 0)).where(
+            clave_m, M.Fecha > fecha, M.Fecha <= siguiente.Fecha,
+            M.Movimiento_ID <= siguiente.Ultimo_Movimiento_ID)
+    else:
+        # Sin snapshot para esta clave (p.ej. talla dada de alta después del último)
+        base = existencias_actuales([articulo_id]).get((articulo_id, talla), 0)
+        q = select(func.coalesce(func.sum(M.Cantidad), 0)).where(clave_m, M.Fecha > fecha)
+    return base - int(db.session.execute(q).scalar() or 0)
+
+
+def existencias_en(articulo_id: int, fecha: datetime) -> Dict[Optional[str], int]:
+    """{talla|None: existencia} del artículo a `fecha` (claves actuales + las vistas en bitácora/snapshots)."""
+    from models import MovimientoInventario as M, InventarioSnapshot as S
+    db, Articulo, ArticuloVariante = _get_models()
+    articulo_id = int(articulo_id)
+    claves = OrderedDict((t, None) for (_a, t) in existencias_actuales([articulo_id]))
+    for modelo in (M, S):
+        for t in db.session.execute(select(modelo.Talla).where(modelo.Articulo_ID == articulo_id).distinct()).scalars():
+            claves.setdefault(t, None)
+    return OrderedDict((t, existencia_en(articulo_id, t, fecha)) for t in claves)
+
+
+# ---------------------------------------------
+# Migración desde Articulo_Tallas (JSON)
+# ---------------------------------------------
+def migrar_tallas_json(*, sobrescribir: bool = False) -> Dict[str, int]:
+    """
+    Copia Articulo.Articulo_Tallas (JSON) a filas de ArticuloVariante.
+      - dict {talla: existencia} → una variante por talla con su existencia
+      - lista [talla, ...]       → variantes con existencia 0 (el JSON no traía existencias)
+    Por defecto salta artículos que ya tienen variantes (idempotente); con
+    sobrescribir=True las reemplaza. No hace commit. Devuelve contadores.
+    """
+    db, Articulo, ArticuloVariante = _get_models()
+    stats = {'articulos': 0, 'variantes': 0, 'sin_existencias': 0, 'omitidos': 0, 'invalidos': 0}
+
+    con_variantes = set(db.session.execute(
+        select(ArticuloVariante.Articulo_ID).group_by(ArticuloVariante.Articulo_ID)
+    ).scalars())
+
+    arts = (Articulo.query
+            .filter(Articulo.Articulo_Tallas.isnot(None), func.trim(Articulo.Articulo_Tallas) != '')
+            .order_by(Articulo.Articulo_ID)
+            .all())
+    for art in arts:
+        if art.Articulo_ID in con_variantes and not sobrescribir:
+            stats['omitidos'] += 1
+            continue
+        try:
+            data = json.loads(art.Articulo_Tallas)
+        except Exception:
+            stats['invalidos'] += 1
+            continue
+
+        if isinstance(data, dict):
+            tallas = OrderedDict((str(k), int(v or 0)) for k, v in data.items())
+        elif isinstance(data, list):
+            tallas = OrderedDict((str(k), 0) for k in data)
+            stats['sin_existencias'] += 1
+        else:
+            stats['invalidos'] += 1
+            continue
+
+        total_previo = int(art.Articulo_Existencia or 0)
+        sincronizar_variantes(art, tallas)
+        if not any(tallas.values()):
+            # Lista sin existencias: conservar el total que ya tenía el artículo
+            art.Articulo_Existencia = total_previo
+        stats['articulos'] += 1
+        stats['variantes'] += len(tallas)
+
+    db.session.flush()
+    return stats
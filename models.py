@@ -1,15 +1,36 @@
 from extensions import db
 from datetime import datetime, date
+from decimal import Decimal
 from enum import Enum
 import json
 from sqlalchemy import CheckConstraint, text
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+from sqlalchemy.orm.util import identity_key
+from busqueda_utils import normalizar_texto
+from billing_utils import parse_conditions, method_allowed, money
 from sqlalchemy import (
     Numeric, Column, Integer, String, Date, DateTime, ForeignKey, Boolean,
-    CheckConstraint, Index, func
+    CheckConstraint, Index, func, column, case, or_
 )
 
 
+# CHECKs portables (SQLite / PostgreSQL): las columnas van como column() para que
+# cada dialecto las cite (PostgreSQL pliega a minúsculas lo que no va entre comillas)
+# y sin sumar booleanos, que PostgreSQL no permite.
+def _nulo_o(nombre, cond):
+    return or_(column(nombre).is_(None), cond(column(nombre)))
+
+
+def _solo_uno(*nombres):
+    suma = case((column(nombres[0]).isnot(None), 1), else_=0)
+    for n in nombres[1:]:
+        suma = suma + case((column(n).isnot(None), 1), else_=0)
+    return suma == 1
+
+
 
 class Tutor(db.Model):
     __tablename__ = 'tutor'
@@ -50,6 +71,15 @@ class Instructor(db.Model):
     Instructor_Nombre = db.Column(db.String(45), nullable=False)
     Instructor_ApellidoP = db.Column(db.String(45), nullable=False)
     Instructor_ApellidoM = db.Column(db.String(45), nullable=True)
+    # Nombre completo normalizado (minúsculas, sin acentos) para el typeahead
+    Instructor_NombreBusqueda = db.Column(db.String(140), nullable=True, index=True)
+
+
+@event.listens_for(Instructor, 'before_insert')
+@event.listens_for(Instructor, 'before_update')
+def _instructor_nombre_busqueda(mapper, connection, target):
+    target.Instructor_NombreBusqueda = normalizar_texto(
+        target.Instructor_Nombre, target.Instructor_ApellidoP, target.Instructor_ApellidoM)
 
 
 class Grupo(db.Model):
@@ -84,6 +114,8 @@ class Estudiante(db.Model):
     Est_CondicionSalud = db.Column(db.String(200))  # JSON o texto con las condiciones
     Est_Alergias = db.Column(db.String(200))
     Est_Medicamentos = db.Column(db.String(200))
+    # Nombre completo normalizado (minúsculas, sin acentos) para el typeahead
+    Est_NombreBusqueda = db.Column(db.String(140), nullable=True, index=True)
     
     # Relaciones
     tutor = db.relationship('Tutor', backref='estudiantes')
@@ -91,6 +123,13 @@ class Estudiante(db.Model):
     grupos = db.relationship('Grupo', secondary='estudiante_grupo', backref='estudiantes')
 
 
+@event.listens_for(Estudiante, 'before_insert')
+@event.listens_for(Estudiante, 'before_update')
+def _estudiante_nombre_busqueda(mapper, connection, target):
+    target.Est_NombreBusqueda = normalizar_texto(
+        target.Est_Nombre, target.Est_ApellidoP, target.Est_ApellidoM)
+
+
 class ContactoEmergencia(db.Model):
     __tablename__ = 'contacto_emergencia'
     Contacto_ID = db.Column(db.Integer, primary_key=True)
@@ -115,47 +154,121 @@ class Articulo(db.Model):
     Articulo_PrecioVenta = db.Column(Numeric(10, 2), nullable=False)
     Articulo_Existencia = db.Column(db.Integer, nullable=False, default=0)
     Articulo_TipoTalla = db.Column(db.String(20), nullable=True)  # 'talla', 'numero' o None
-    Articulo_Tallas = db.Column(db.String(200), nullable=True)  # JSON con tallas y existencias
+    # LEGADO: JSON con tallas y existencias. Ya no se escribe; la fuente de verdad es
+    # ArticuloVariante (ver `flask inventario-migrar-tallas`).
+    Articulo_Tallas = db.Column(db.String(200), nullable=True)
+
+    # Existencia por talla/número (una fila por variante)
+    variantes = db.relationship(
+        'ArticuloVariante',
+        back_populates='articulo',
+        cascade='all, delete-orphan',
+        order_by='ArticuloVariante.Variante_ID'
+    )
 
     def tallas_disponibles(self):
-        if self.Articulo_Tallas:
-            return json.loads(self.Articulo_Tallas)
-        return {}
+        return {v.Talla: int(v.Existencia or 0) for v in self.variantes}
 
     def existencia_total(self):
-        if self.Articulo_Tallas:
-            tallas = json.loads(self.Articulo_Tallas)
-            return sum(tallas.values())
+        if self.variantes:
+            return sum(int(v.Existencia or 0) for v in self.variantes)
         return self.Articulo_Existencia
 
     def eliminar_talla(self, talla):
-        if not self.Articulo_Tallas:
-            return False
-        tallas = json.loads(self.Articulo_Tallas)
-        if talla in tallas:
-            del tallas[talla]
-            self.Articulo_Tallas = json.dumps(tallas) if tallas else None
-            self.Articulo_Existencia = sum(tallas.values()) if tallas else 0
-            return True
+        for v in list(self.variantes):
+            if v.Talla == talla:
+                self.variantes.remove(v)
+                self.Articulo_Existencia = sum(int(x.Existencia or 0) for x in self.variantes)
+                return True
         return False
     
     @property
     def talla_numero_str(self):
-        # Si no tiene tallas definidas
-        if not self.Articulo_Tallas:
-            return ""
-        # Decodifica JSON
-        try:
-            tallas = json.loads(self.Articulo_Tallas)
-            # Solo devuelve las claves (tallas/números) separadas por coma
-            return ", ".join(tallas.keys())
-        except Exception:
-            return ""
+        # Solo devuelve las tallas/números separados por coma
+        return ", ".join(v.Talla for v in self.variantes)
 
     # Relación muchos a muchos con Venta
     ventas = db.relationship('Venta', secondary='venta_articulo', back_populates='articulos')
 
 
+class ArticuloVariante(db.Model):
+    """
+    Existencia de un artículo para una talla/número concreto.
+    Reemplaza al JSON Articulo.Articulo_Tallas; Articulo_Existencia queda como total
+    denormalizado (suma de las variantes).
+    """
+    __tablename__ = 'articulo_variante'
+
+    Variante_ID = Column(Integer, primary_key=True)
+    Articulo_ID = Column(Integer, ForeignKey('articulo.Articulo_ID', ondelete='CASCADE'), nullable=False)
+    Talla       = Column(String(50), nullable=False)
+    Existencia  = Column(Integer, nullable=False, default=0)
+
+    articulo = db.relationship('Articulo', back_populates='variantes')
+
+    __table_args__ = (
+        db.UniqueConstraint('Articulo_ID', 'Talla', name='uq_variante_articulo_talla'),
+        Index('ix_variante_existencia', 'Existencia'),
+    )
+
+
+class MovimientoInventario(db.Model):
+    """
+    Bitácora append-only de TODO cambio de existencia: ventas, cancelaciones,
+    recepciones/ajustes en lote, altas, ediciones y bajas de artículos. Nunca se
+    actualiza ni se borra (tampoco en cascada: Articulo_ID no lleva FK, así que borrar
+    un artículo conserva su historial); la existencia a una fecha pasada se reconstruye con
+    InventarioSnapshot + los movimientos posteriores (ver inventario_utils.existencia_en).
+    Lote agrupa los renglones escritos por una misma operación.
+    """
+    __tablename__ = 'movimiento_inventario'
+
+    Movimiento_ID = Column(Integer, primary_key=True)
+    Lote          = Column(String(32), nullable=False)                 # uuid4().hex por operación
+    Fecha         = Column(DateTime, nullable=False, default=datetime.now)
+    Tipo          = Column(String(20), nullable=False)                 # ver inventario_utils.TIPOS_LEDGER
+    Articulo_ID   = Column(Integer, nullable=False)                    # sin FK: sobrevive al borrar el artículo
+    Talla         = Column(String(50), nullable=True)                  # None = artículo sin talla
+    Cantidad      = Column(Integer, nullable=False)                    # delta con signo
+    Venta_ID      = Column(Integer, nullable=True)                     # sin FK: la venta puede borrarse
+    Referencia    = Column(String(100), nullable=True)                 # factura / remisión del proveedor
+    Nota          = Column(String(200), nullable=True)
+
+    articulo = db.relationship(
+        'Articulo',
+        primaryjoin='foreign(MovimientoInventario.Articulo_ID) == Articulo.Articulo_ID',
+        viewonly=True,
+    )
+
+    __table_args__ = (
+        CheckConstraint(column('Cantidad') != 0, name='ck_mov_cantidad_no_cero'),
+        Index('ix_mov_articulo_talla_fecha', 'Articulo_ID', 'Talla', 'Fecha'),
+        Index('ix_mov_lote', 'Lote'),
+        Index('ix_mov_fecha', 'Fecha'),
+        Index('ix_mov_venta', 'Venta_ID'),
+    )
+
+
+class InventarioSnapshot(db.Model):
+    """
+    Foto periódica de la existencia por artículo/talla (`flask ballet inventario-snapshot`,
+    p.ej. diario por cron). Ultimo_Movimiento_ID marca qué movimientos ya están incluidos.
+    """
+    __tablename__ = 'inventario_snapshot'
+
+    Snapshot_ID = Column(Integer, primary_key=True)
+    Fecha       = Column(DateTime, nullable=False)
+    Articulo_ID = Column(Integer, nullable=False)   # sin FK, igual que la bitácora
+    Talla       = Column(String(50), nullable=True)
+    Existencia  = Column(Integer, nullable=False)
+    Ultimo_Movimiento_ID = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_snap_articulo_talla_fecha', 'Articulo_ID', 'Talla', 'Fecha'),
+        Index('ix_snap_fecha', 'Fecha'),
+    )
+
+
 class Pago(db.Model):
     __tablename__ = 'pago'
     Pago_ID = db.Column(db.Integer, primary_key=True)
@@ -204,9 +317,11 @@ class Pago(db.Model):
 
 
     def condiciones_lista(self):
-        if self.Pago_Condiciones:
-            return json.loads(self.Pago_Condiciones)
-        return []
+        return parse_conditions(self.Pago_Condiciones)
+
+    def acepta_metodo(self, metodo_norm: str) -> bool:
+        """¿El descuento aplica con este método? (condiciones parseadas una vez por valor)"""
+        return method_allowed(self.Pago_Condiciones, metodo_norm)
     
     def esta_expirado(self, ref: date | None = None) -> bool:
         if self.Pago_Es_Mensual:
@@ -258,7 +373,7 @@ class Venta(db.Model):
     # Validación a nivel de modelo
     __table_args__ = (
         db.CheckConstraint(
-            '(Est_ID IS NOT NULL) OR (Instructor_ID IS NOT NULL)',
+            or_(column('Est_ID').isnot(None), column('Instructor_ID').isnot(None)),
             name='check_estudiante_or_instructor'
         ),
     )
@@ -363,8 +478,10 @@ class PlanCobro(db.Model):
     # Montos
     Monto_Total_Original = Column(Numeric(10, 2), nullable=False)
     Saldo_Actual         = Column(Numeric(10, 2), nullable=False)
+    # Suma de Monto_Abonado de sus abonos; la mantienen los eventos de Abono (ver abajo)
+    Abonado_Acumulado    = Column(Numeric(10, 2), nullable=False, default=0, server_default='0')
 
-    # Estado: abierto/liquidado/cancelado
+    # Estado: abierto/liquidado/cancelado (siempre en minúsculas, ver _plan_estado_minusculas)
     Estado = Column(String(15), nullable=False, default='abierto')
 
     # Política de ajuste SOLO al liquidar
@@ -431,13 +548,15 @@ class PlanCobro(db.Model):
     __table_args__ = (
         # Asegurar que SOLO uno de los 3 campos de ítem esté poblado
         CheckConstraint(
-            "((Articulo_ID IS NOT NULL) + (Paquete_ID IS NOT NULL) + (Pago_ID IS NOT NULL)) = 1",
+            _solo_uno('Articulo_ID', 'Paquete_ID', 'Pago_ID'),
             name='ck_plan_un_solo_item'
         ),
-        CheckConstraint("Monto_Total_Original >= 0", name='ck_plan_total_no_neg'),
-        CheckConstraint("Saldo_Actual >= 0", name='ck_plan_saldo_no_neg'),
-        CheckConstraint("(Porc_Descuento IS NULL) OR (Porc_Descuento BETWEEN 0 AND 100)", name='ck_plan_desc_0_100'),
-        CheckConstraint("(Porc_Recargo IS NULL) OR (Porc_Recargo BETWEEN 0 AND 100)", name='ck_plan_rec_0_100'),
+        CheckConstraint(column('Monto_Total_Original') >= 0, name='ck_plan_total_no_neg'),
+        CheckConstraint(column('Saldo_Actual') >= 0, name='ck_plan_saldo_no_neg'),
+        CheckConstraint(_nulo_o('Porc_Descuento', lambda c: c.between(0, 100)), name='ck_plan_desc_0_100'),
+        CheckConstraint(_nulo_o('Porc_Recargo', lambda c: c.between(0, 100)), name='ck_plan_rec_0_100'),
+        # Antes de migrar una BD existente: `flask planes-normalizar-estado`
+        CheckConstraint(column('Estado') == func.lower(column('Estado')), name='ck_plan_estado_minusculas'),
         Index('ix_plan_est_estado', 'Est_ID', 'Estado'),
         Index('ix_plan_item_art', 'Articulo_ID'),
         Index('ix_plan_item_paq', 'Paquete_ID'),
@@ -445,6 +564,13 @@ class PlanCobro(db.Model):
     )
 
 
+@event.listens_for(PlanCobro, 'before_insert')
+@event.listens_for(PlanCobro, 'before_update')
+def _plan_estado_minusculas(mapper, connection, target):
+    # Un solo literal por estado: los filtros comparan con igualdad y usan ix_plan_est_estado
+    target.Estado = (target.Estado or 'abierto').strip().lower()
+
+
 class Abono(db.Model):
     """
     Movimiento de abono contra un PlanCobro. Se liga a una Venta para trazabilidad.
@@ -453,11 +579,14 @@ class Abono(db.Model):
     __tablename__ = 'abono'
 
     Abono_ID = Column(Integer, primary_key=True)
-    Plan_ID  = Column(Integer, ForeignKey('plan_cobro.Plan_ID', ondelete='CASCADE'), nullable=False)
+    # active_history: al cambiar Plan_ID/Monto de un abono ya expirado (tras commit) se carga
+    # el valor previo, que _abono_update necesita para mover Abonado_Acumulado
+    Plan_ID  = db.column_property(Column(Integer, ForeignKey('plan_cobro.Plan_ID', ondelete='CASCADE'),
+                                         nullable=False), active_history=True)
     Venta_ID = Column(Integer, ForeignKey('venta.Venta_ID'), nullable=False)
 
     # Monto del movimiento (siempre > 0)
-    Monto_Abonado = Column(Numeric(10, 2), nullable=False)
+    Monto_Abonado = db.column_property(Column(Numeric(10, 2), nullable=False), active_history=True)
 
     # Saldos alrededor del movimiento (útil para reportes y auditoría)
     # Si estás migrando, mantenlos nullable=True inicialmente
@@ -476,15 +605,15 @@ class Abono(db.Model):
     venta = db.relationship('Venta')  # lectura simple
 
     __table_args__ = (
-        CheckConstraint("Monto_Abonado > 0", name='ck_abono_monto_pos'),
+        CheckConstraint(column('Monto_Abonado') > 0, name='ck_abono_monto_pos'),
         # Checks opcionales (seguros para reportes):
-        CheckConstraint("(Saldo_Antes   IS NULL) OR (Saldo_Antes   >= 0)", name='ck_abono_saldo_antes_no_neg'),
-        CheckConstraint("(Saldo_Despues IS NULL) OR (Saldo_Despues >= 0)", name='ck_abono_saldo_desp_no_neg'),
-        CheckConstraint("""
-            (Saldo_Antes   IS NULL) OR
-            (Saldo_Despues IS NULL) OR
-            (Saldo_Antes >= Saldo_Despues)
-        """, name='ck_abono_saldos_consistentes'),
+        CheckConstraint(_nulo_o('Saldo_Antes', lambda c: c >= 0), name='ck_abono_saldo_antes_no_neg'),
+        CheckConstraint(_nulo_o('Saldo_Despues', lambda c: c >= 0), name='ck_abono_saldo_desp_no_neg'),
+        CheckConstraint(or_(
+            column('Saldo_Antes').is_(None),
+            column('Saldo_Despues').is_(None),
+            column('Saldo_Antes') >= column('Saldo_Despues'),
+        ), name='ck_abono_saldos_consistentes'),
         Index('ix_abono_plan', 'Plan_ID'),
         Index('ix_abono_venta', 'Venta_ID'),
         Index('ix_abono_fecha', 'Fecha_Abono'),
@@ -493,6 +622,51 @@ class Abono(db.Model):
     )
 
 
+# --- PlanCobro.Abonado_Acumulado: UPDATE atómico dentro del mismo flush del Abono ---
+# Los borrados/updates masivos (query.delete(), SQL directo) no pasan por aquí;
+# para eso está `flask planes-verificar-abonos --reparar`.
+def _acumular_abono(connection, target, plan_id, delta):
+    if not plan_id or not delta:
+        return
+    T = PlanCobro.__table__
+    connection.execute(
+        T.update()
+        .where(T.c.Plan_ID == plan_id)
+        # delta como Decimal: numeric + numeric (round(double, int) no existe en PostgreSQL)
+        .values(Abonado_Acumulado=func.round(func.coalesce(T.c.Abonado_Acumulado, 0) + Decimal(str(money(delta))), 2))
+    )
+    # Refleja el valor en el plan ya cargado (sin marcarlo como modificado)
+    sess = object_session(target)
+    plan = sess.identity_map.get(identity_key(PlanCobro, plan_id)) if sess is not None else None
+    if plan is not None:
+        nuevo = connection.execute(
+            db.select(T.c.Abonado_Acumulado).where(T.c.Plan_ID == plan_id)
+        ).scalar()
+        set_committed_value(plan, 'Abonado_Acumulado', nuevo)
+
+
+@event.listens_for(Abono, 'after_insert')
+def _abono_insert(mapper, connection, target):
+    _acumular_abono(connection, target, target.Plan_ID, target.Monto_Abonado or 0)
+
+
+@event.listens_for(Abono, 'after_delete')
+def _abono_delete(mapper, connection, target):
+    _acumular_abono(connection, target, target.Plan_ID, -float(target.Monto_Abonado or 0))
+
+
+@event.listens_for(Abono, 'after_update')
+def _abono_update(mapper, connection, target):
+    h_plan = get_history(target, 'Plan_ID')
+    h_monto = get_history(target, 'Monto_Abonado')
+    if not (h_plan.has_changes() or h_monto.has_changes()):
+        return
+    plan_ant = (h_plan.deleted or [target.Plan_ID])[0]
+    monto_ant = (h_monto.deleted or [target.Monto_Abonado])[0]
+    _acumular_abono(connection, target, plan_ant, -float(monto_ant or 0))
+    _acumular_abono(connection, target, target.Plan_ID, float(target.Monto_Abonado or 0))
+
+
 
 class Liquidacion(db.Model):
     """
@@ -519,9 +693,82 @@ class Liquidacion(db.Model):
     venta_final  = db.relationship('Venta')  # lectura simple
 
     __table_args__ = (
-        CheckConstraint("Descuento_Aplicado >= 0", name='ck_liq_desc_no_neg'),
-        CheckConstraint("Recargo_Aplicado >= 0", name='ck_liq_rec_no_neg'),
+        CheckConstraint(column('Descuento_Aplicado') >= 0, name='ck_liq_desc_no_neg'),
+        CheckConstraint(column('Recargo_Aplicado') >= 0, name='ck_liq_rec_no_neg'),
         Index('ix_liq_plan', 'Plan_ID'),
         Index('ix_liq_venta_final', 'Venta_Final_ID'),
         Index('ix_liq_fecha', 'Fecha_Liquidacion'),
     )
+
+
+class VentaResumenDiario(db.Model):
+    """
+    Resumen materializado de ventas por día / método / tipo de cliente.
+    Cada operación sobre ventas suma/resta solo su aporte con un upsert
+    (ajustar_resumen en resumen_utils) y
+    se puede reconstruir completo con `flask resumen-ventas-rebuild`.
+    Los importes siguen las mismas reglas que el reporte de consulta_ventas.
+    """
+    __tablename__ = 'venta_resumen_diario'
+
+    Resumen_ID   = Column(Integer, primary_key=True)
+    Fecha        = Column(Date, nullable=False)
+    Metodo       = Column(String(50), nullable=False, default='')   # Metodo_Pago tal cual ('' si NULL)
+    Cliente_Tipo = Column(String(15), nullable=False)               # 'estudiante' | 'instructor' | '—'
+
+    Num_Ventas     = Column(Integer, nullable=False, default=0)
+    Subtotal_Items = Column(Numeric(12, 2), nullable=False, default=0)
+    Descuento      = Column(Numeric(12, 2), nullable=False, default=0)
+    Total          = Column(Numeric(12, 2), nullable=False, default=0)
+
+    Actualizado = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('Fecha', 'Metodo', 'Cliente_Tipo', name='uq_resumen_dia_metodo_tipo'),
+        Index('ix_resumen_fecha', 'Fecha'),
+    )
+
+
+class VentaResumenCobertura(db.Model):
+    """
+    Marca (una sola fila, Cobertura_ID=1) de que venta_resumen_diario se reconstruyó
+    sobre todo el histórico. A partir de ahí cada alta/baja/edición lo mantiene por día;
+    sin esta fila consulta_ventas sigue con el cálculo directo aunque haya días sueltos.
+    """
+    __tablename__ = 'venta_resumen_cobertura'
+
+    Cobertura_ID = Column(Integer, primary_key=True)
+    Desde        = Column(Date, nullable=True)       # primera / última venta al reconstruir
+    Hasta        = Column(Date, nullable=True)       # (NULL si no había ventas)
+    Reconstruido = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class CatalogoVersion(db.Model):
+    """
+    Contador (una sola fila, Catalogo_ID=1) que se incrementa con cada cambio de
+    artículos, conceptos de pago o paquetes. Los procesos lo comparan
+    contra su snapshot en memoria (ver catalogo_utils).
+    """
+    __tablename__ = 'catalogo_version'
+
+    Catalogo_ID = Column(Integer, primary_key=True)
+    Version     = Column(Integer, nullable=False, default=0)
+    Actualizado = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class IdempotencyKey(db.Model):
+    """
+    Llaves de idempotencia de los formularios de cobro (form_id del HTML o hash del
+    payload). Se insertan en la misma transacción que la venta: si el INSERT choca
+    con la PK es un reenvío. Las vencidas se purgan con `flask idempotencia-purgar`.
+    """
+    __tablename__ = 'idempotency_key'
+
+    Clave   = Column(String(64), primary_key=True)      # sha256(ambito:clave)
+    Ambito  = Column(String(30), nullable=False)        # 'venta-form', 'abonos-payload', ...
+    Creado  = Column(DateTime, nullable=False, default=datetime.now)
+    Expira  = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_idem_expira', 'Expira'),
+    )
@@ -1,12 +1,18 @@
 # plan_utils.py
 from __future__ import annotations
-from datetime import datetime
-from typing import Optional, Tuple
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-from sqlalchemy import func
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import joinedload
 
 # Utilidades del proyecto
-from billing_utils import money, requires_reference
+from billing_utils import money, requires_reference, compute_full_net_batch_from_pagos
+
+
+# PlanCobro.Estado se guarda siempre en minúsculas (evento en models + CHECK), así que
+# basta la igualdad con este literal y el motor usa ix_plan_est_estado.
+ESTADO_ABIERTO = 'abierto'
 
 
 # ---------------------------------------------
@@ -49,7 +55,7 @@ def find_open_plan(
 
     q = PlanCobro.query.filter(
         PlanCobro.Est_ID == est_id,
-        func.lower(PlanCobro.Estado) == 'abierto'
+        PlanCobro.Estado == ESTADO_ABIERTO
     )
     if pago_id is not None:
         q = q.filter(PlanCobro.Pago_ID == pago_id)
@@ -63,6 +69,128 @@ def find_open_plan(
     return q.order_by(PlanCobro.Fecha_Creacion.desc()).first()
 
 
+def _clave_item(spec: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """('pago'|'articulo'|'paquete', id) a partir de pago_id/articulo_id/paquete_id o del objeto."""
+    pago_obj, art_obj, paq_obj = spec.get("pago_obj"), spec.get("articulo_obj"), spec.get("paquete_obj")
+    pago_id = spec.get("pago_id") or (getattr(pago_obj, "Pago_ID", None) if pago_obj else None)
+    if pago_id is not None:
+        return ('pago', int(pago_id))
+    art_id = spec.get("articulo_id") or (getattr(art_obj, "Articulo_ID", None) if art_obj else None)
+    if art_id is not None:
+        return ('articulo', int(art_id))
+    paq_id = spec.get("paquete_id") or (
+        (getattr(paq_obj, "Paquete_ID", None) or getattr(paq_obj, "id", None)) if paq_obj else None)
+    if paq_id is not None:
+        return ('paquete', int(paq_id))
+    return None
+
+
+def find_open_plans(claves: Iterable[Tuple[int, str, int]]) -> Dict[Tuple[int, str, int], object]:
+    """
+    Versión por lote de find_open_plan: claves = [(est_id, 'pago'|'articulo'|'paquete', item_id)].
+    Una sola consulta; devuelve {clave: plan abierto más reciente} (las claves sin plan no aparecen).
+    """
+    db, PlanCobro, *_ = _get_models()
+    claves = {(int(e), t, int(i)) for e, t, i in claves}
+    if not claves:
+        return {}
+
+    cols = {'pago': PlanCobro.Pago_ID, 'articulo': PlanCobro.Articulo_ID, 'paquete': PlanCobro.Paquete_ID}
+    por_tipo = {t: {i for _, tt, i in claves if tt == t} for t in cols}
+    planes = (PlanCobro.query
+              .filter(PlanCobro.Est_ID.in_({e for e, _, _ in claves}),
+                      PlanCobro.Estado == ESTADO_ABIERTO,
+                      or_(*[cols[t].in_(ids) for t, ids in por_tipo.items() if ids]))
+              .order_by(PlanCobro.Fecha_Creacion.desc(), PlanCobro.Plan_ID.desc())
+              .all())
+
+    out: Dict[Tuple[int, str, int], object] = {}
+    for p in planes:
+        for t, col in cols.items():
+            item_id = getattr(p, col.key)
+            if item_id is not None:
+                clave = (p.Est_ID, t, item_id)
+                if clave in claves:
+                    out.setdefault(clave, p)  # el primero es el más reciente
+                break
+    return out
+
+
+def _nuevo_plan(PlanCobro, est_id: int, spec: Dict[str, Any], now: datetime) -> object:
+    qty = max(int(spec.get("qty") or 1), 1)
+    descripcion_resumen = spec.get("descripcion_resumen")
+    aplicar = bool(spec.get("aplicar_descuento_al_liquidar", True))
+    pago_obj, articulo_obj, paquete_obj = spec.get("pago_obj"), spec.get("articulo_obj"), spec.get("paquete_obj")
+
+    if pago_obj:
+        unit = float(getattr(pago_obj, "Pago_Monto", 0.0) or 0.0)
+        desc = descripcion_resumen or f"{getattr(pago_obj, 'Pago_Tipo', 'Pago')} x{qty}"
+        item = {"Pago_ID": getattr(pago_obj, "Pago_ID", None)}
+    elif articulo_obj:
+        unit = float(getattr(articulo_obj, "Precio", 0.0) or 0.0)
+        art_id = getattr(articulo_obj, "Articulo_ID", None)
+        desc = descripcion_resumen or f"Artículo #{art_id} x{qty}"
+        item = {"Articulo_ID": art_id}
+    elif paquete_obj:
+        unit = float(getattr(paquete_obj, "precio", 0.0) or 0.0)
+        paq_id = getattr(paquete_obj, "Paquete_ID", None) or getattr(paquete_obj, "id", None)
+        desc = descripcion_resumen or f"Paquete #{paq_id} x{qty}"
+        item = {"Paquete_ID": paq_id}
+    else:
+        raise ValueError("Debes proporcionar pago_obj, articulo_obj o paquete_obj")
+
+    total = money(unit * qty)
+    return PlanCobro(
+        Est_ID=est_id,
+        **item,
+        Precio_Base_Snapshot=money(unit),
+        Descripcion_Resumen=desc,
+        Monto_Total_Original=total,
+        Saldo_Actual=total,
+        Estado='abierto',
+        Aplica_Desc_Al_Liquidar=aplicar,
+        Fecha_Creacion=now,
+    )
+
+
+def get_or_create_plans(specs: List[Dict[str, Any]]) -> List[Tuple[object, bool]]:
+    """
+    Versión por lote de get_or_create_plan. Cada spec:
+      {est_id, pago_obj | articulo_obj | paquete_obj, qty, descripcion_resumen,
+       aplicar_descuento_al_liquidar}
+    Resuelve los planes abiertos de todas las specs con UNA consulta y crea los
+    faltantes con UN flush. Devuelve [(plan, creado_nuevo)] en el orden de `specs`;
+    dos specs del mismo (Est_ID, ítem) comparten el plan (como en llamadas sucesivas).
+    """
+    db, PlanCobro, *_ = _get_models()
+    now = _now()
+
+    claves = []
+    for spec in specs:
+        item = _clave_item(spec)
+        if item is None:
+            raise ValueError("Debes proporcionar pago_obj, articulo_obj o paquete_obj")
+        claves.append((int(spec["est_id"]), *item))
+
+    existentes = find_open_plans(claves)
+    out: List[Tuple[object, bool]] = []
+    nuevos = []
+    for clave, spec in zip(claves, specs):
+        plan = existentes.get(clave)
+        if plan is not None:
+            out.append((plan, False))
+            continue
+        plan = _nuevo_plan(PlanCobro, clave[0], spec, now)
+        existentes[clave] = plan
+        nuevos.append(plan)
+        out.append((plan, True))
+
+    if nuevos:
+        db.session.add_all(nuevos)
+        db.session.flush()
+    return out
+
+
 def get_or_create_plan(
     est_id: int,
     *,
@@ -83,70 +211,17 @@ def get_or_create_plan(
       * Saldo_Actual = Monto_Total_Original
       * Descripcion_Resumen = nombre o uno sugerido
       * Aplica_Desc_Al_Liquidar = controla que el ajuste se compute al final
+    Para varias líneas a la vez usa get_or_create_plans.
     """
-    db, PlanCobro, *_ = _get_models()
-    now = _now()
-    qty = max(int(qty or 1), 1)
-
-    pago_id = getattr(pago_obj, "Pago_ID", None) if pago_obj else None
-    art_id = getattr(articulo_obj, "Articulo_ID", None) if articulo_obj else None
-    paq_id = getattr(paquete_obj, "Paquete_ID", None) or getattr(paquete_obj, "id", None) if paquete_obj else None
-
-    existing = find_open_plan(est_id, pago_id=pago_id, articulo_id=art_id, paquete_id=paq_id)
-    if existing:
-        return existing, False
-
-    if pago_obj:
-        unit = float(getattr(pago_obj, "Pago_Monto", 0.0) or 0.0)
-        total = money(unit * qty)
-        desc = descripcion_resumen or f"{getattr(pago_obj, 'Pago_Tipo', 'Pago')} x{qty}"
-        plan = PlanCobro(
-            Est_ID=est_id,
-            Pago_ID=pago_id,
-            Precio_Base_Snapshot=money(unit),
-            Descripcion_Resumen=desc,
-            Monto_Total_Original=total,
-            Saldo_Actual=total,
-            Estado='abierto',
-            Aplica_Desc_Al_Liquidar=bool(aplicar_descuento_al_liquidar),
-            Fecha_Creacion=now,
-        )
-    elif articulo_obj:
-        unit = float(getattr(articulo_obj, "Precio", 0.0) or 0.0)
-        total = money(unit * qty)
-        desc = descripcion_resumen or f"Artículo #{art_id} x{qty}"
-        plan = PlanCobro(
-            Est_ID=est_id,
-            Articulo_ID=art_id,
-            Precio_Base_Snapshot=money(unit),
-            Descripcion_Resumen=desc,
-            Monto_Total_Original=total,
-            Saldo_Actual=total,
-            Estado='abierto',
-            Aplica_Desc_Al_Liquidar=bool(aplicar_descuento_al_liquidar),
-            Fecha_Creacion=now,
-        )
-    elif paquete_obj:
-        unit = float(getattr(paquete_obj, "precio", 0.0) or 0.0)
-        total = money(unit * qty)
-        desc = descripcion_resumen or f"Paquete #{paq_id} x{qty}"
-        plan = PlanCobro(
-            Est_ID=est_id,
-            Paquete_ID=paq_id,
-            Precio_Base_Snapshot=money(unit),
-            Descripcion_Resumen=desc,
-            Monto_Total_Original=total,
-            Saldo_Actual=total,
-            Estado='abierto',
-            Aplica_Desc_Al_Liquidar=bool(aplicar_descuento_al_liquidar),
-            Fecha_Creacion=now,
-        )
-    else:
-        raise ValueError("Debes proporcionar pago_obj, articulo_obj o paquete_obj")
-
-    db.session.add(plan)
-    db.session.flush()
-    return plan, True
+    return get_or_create_plans([{
+        "est_id": est_id,
+        "pago_obj": pago_obj,
+        "articulo_obj": articulo_obj,
+        "paquete_obj": paquete_obj,
+        "qty": qty,
+        "descripcion_resumen": descripcion_resumen,
+        "aplicar_descuento_al_liquidar": aplicar_descuento_al_liquidar,
+    }])[0]
 
 
 # ---------------------------------------------
@@ -155,10 +230,12 @@ def get_or_create_plan(
 def sum_abonos_plan(plan_id: int) -> float:
     """
     Suma Monto_Abonado para el plan (0.00 si no hay).
+    Lee PlanCobro.Abonado_Acumulado (mantenido por los eventos de Abono): una fila por PK,
+    sin recorrer el ledger. La consulta hace autoflush, así que cuenta abonos pendientes.
     """
-    db, _, Abono, *_ = _get_models()
-    total = (db.session.query(func.coalesce(func.sum(Abono.Monto_Abonado), 0.0))
-             .filter(Abono.Plan_ID == plan_id)
+    db, PlanCobro, *_ = _get_models()
+    total = (db.session.query(PlanCobro.Abonado_Acumulado)
+             .filter(PlanCobro.Plan_ID == plan_id)
              .scalar())
     try:
         return float(total or 0.0)
@@ -166,6 +243,18 @@ def sum_abonos_plan(plan_id: int) -> float:
         return 0.0
 
 
+def _saldo_plan(plan: object, abonado: Optional[float] = None) -> float:
+    """
+    Saldo cobrable del plan: el menor entre Saldo_Actual y (Monto_Total_Original - abonado).
+    Así un Saldo_Actual desfasado nunca permite cobrar de más contra el ledger, y un plan
+    liquidado con descuento (Saldo_Actual=0) sigue sin aceptar abonos.
+    """
+    if abonado is None:
+        abonado = sum_abonos_plan(plan.Plan_ID)
+    por_ledger = money(float(getattr(plan, "Monto_Total_Original", 0.0) or 0.0) - abonado)
+    return max(0.0, min(money(getattr(plan, "Saldo_Actual", 0.0) or 0.0), por_ledger))
+
+
 def registrar_abono(
     plan: object,
     venta: object,
@@ -189,7 +278,7 @@ def registrar_abono(
     if monto <= 0:
         raise ValueError("El monto del abono debe ser > 0")
 
-    saldo_antes = float(plan.Saldo_Actual or 0.0)
+    saldo_antes = _saldo_plan(plan)
     if saldo_antes <= 0:
         # Nada que abonar
         return None
@@ -259,7 +348,7 @@ def liquidar_plan(
     neto_full = money(neto_full)
     abonos_previos = sum_abonos_plan(plan.Plan_ID)
     delta = money(max(0.0, neto_full - abonos_previos))
-    saldo = money(getattr(plan, "Saldo_Actual", 0.0) or 0.0)
+    saldo = _saldo_plan(plan, abonos_previos)
 
     if saldo <= 0.0:
         # Asegura registro de Liquidacion si faltara (inconsistencia)
@@ -267,10 +356,7 @@ def liquidar_plan(
         db.session.flush()
         return None
 
-    # Si delta es 0 o negativo pero queda saldo (p.ej. por cambio de política),
-    # abonamos el saldo para cerrar correctamente.
-    monto_a_abonar = delta if delta > 0 else saldo
-    monto_a_abonar = min(monto_a_abonar, saldo)
+    monto_a_abonar = _monto_liquidacion(delta, saldo)
 
     ab_final = None
     if monto_a_abonar > 0:
@@ -294,6 +380,88 @@ def liquidar_plan(
     return ab_final
 
 
+def _monto_liquidacion(delta: float, saldo: float) -> float:
+    """
+    Lo que falta abonar para liquidar: delta = neto_full - abonos_previos, acotado al saldo.
+    Si delta es 0 o negativo pero queda saldo (p.ej. por cambio de política),
+    se abona el saldo para cerrar correctamente.
+    """
+    monto_a_abonar = delta if delta > 0 else saldo
+    return min(monto_a_abonar, saldo)
+
+
+def revertir_abono(ab: object) -> Optional[object]:
+    """
+    Elimina un Abono y regresa su monto al saldo del plan (si tiene).
+    Abonado_Acumulado lo corrige el evento after_delete; aquí solo Saldo_Actual,
+    acotado por el ledger. Si el plan estaba 'cerrado' y queda saldo, se reabre.
+    Devuelve el plan afectado (o None). No hace commit.
+    """
+    db, *_ = _get_models()
+    plan = getattr(ab, "plan", None)
+    monto = money(getattr(ab, "Monto_Abonado", 0.0))
+    saldo_antes = money(getattr(plan, "Saldo_Actual", 0.0)) if plan is not None else 0.0
+
+    db.session.delete(ab)
+    db.session.flush()
+
+    if plan is not None:
+        por_ledger = money(float(plan.Monto_Total_Original or 0.0) - float(plan.Abonado_Acumulado or 0.0))
+        plan.Saldo_Actual = max(0.0, min(money(saldo_antes + monto), por_ledger))
+        if _lower(plan.Estado) == 'cerrado' and plan.Saldo_Actual > 0:
+            plan.Estado = 'abierto'
+        db.session.flush()
+    return plan
+
+
+# ---------------------------------------------
+# VERIFICACIÓN DEL ACUMULADO
+# ---------------------------------------------
+def verificar_abonado_acumulado(*, reparar: bool = False, tolerancia: float = 0.005) -> List[Dict[str, Any]]:
+    """
+    Compara PlanCobro.Abonado_Acumulado contra SUM(Abono.Monto_Abonado) en una sola consulta.
+    Devuelve [{plan_id, acumulado, ledger}] de los planes que no cuadran; con reparar=True
+    los corrige (sin commit).
+    """
+    db, PlanCobro, Abono, *_ = _get_models()
+
+    sumas = (select(Abono.Plan_ID.label('Plan_ID'),
+                    func.sum(Abono.Monto_Abonado).label('total'))
+             .group_by(Abono.Plan_ID)
+             .subquery())
+    ledger = func.coalesce(sumas.c.total, 0)
+    acumulado = func.coalesce(PlanCobro.Abonado_Acumulado, 0)
+    filas = db.session.execute(
+        select(PlanCobro.Plan_ID, acumulado, ledger)
+        .outerjoin(sumas, sumas.c.Plan_ID == PlanCobro.Plan_ID)
+        .where(func.abs(acumulado - ledger) > tolerancia)
+        .order_by(PlanCobro.Plan_ID)
+    ).all()
+
+    out = [{'plan_id': pid, 'acumulado': money(acu), 'ledger': money(led)} for pid, acu, led in filas]
+    if reparar and out:
+        for d in out:
+            # update() ORM: también sincroniza el plan si ya está cargado en la sesión
+            db.session.execute(update(PlanCobro)
+                               .where(PlanCobro.Plan_ID == d['plan_id'])
+                               .values(Abonado_Acumulado=d['ledger']))
+    return out
+
+
+def normalizar_estados() -> int:
+    """
+    Pasa PlanCobro.Estado a minúsculas sin espacios en los planes capturados antes del
+    evento/CHECK (p.ej. 'Abierto', 'ABIERTO '). Devuelve los planes corregidos. No hace commit.
+    """
+    db, PlanCobro, *_ = _get_models()
+    limpio = func.lower(func.trim(PlanCobro.Estado))
+    res = db.session.execute(update(PlanCobro)
+                             .where(PlanCobro.Estado != limpio)
+                             .values(Estado=limpio)
+                             .execution_options(synchronize_session=False))
+    return int(res.rowcount or 0)
+
+
 def _ensure_liquidacion(db, plan, venta, neto_full: float, nota_reglas: Optional[str]):
     """
     Crea (si no existe) la fila de Liquidacion para el plan:
@@ -312,6 +480,15 @@ def _ensure_liquidacion(db, plan, venta, neto_full: float, nota_reglas: Optional
         # Idempotencia: no duplicar
         return liq
 
+    liq = _nueva_liquidacion(plan, venta, neto_full, nota_reglas)
+    db.session.add(liq)
+    return liq
+
+
+def _nueva_liquidacion(plan, venta, neto_full: float, nota_reglas: Optional[str], fecha: Optional[datetime] = None):
+    """Fila de Liquidacion (sin agregar a la sesión) con el ajuste contra Monto_Total_Original."""
+    from models import Liquidacion
+
     total_original = money(getattr(plan, "Monto_Total_Original", 0.0) or 0.0)
     neto_full = money(neto_full)
 
@@ -321,11 +498,177 @@ def _ensure_liquidacion(db, plan, venta, neto_full: float, nota_reglas: Optional
     liq = Liquidacion(
         Plan_ID=plan.Plan_ID,
         Venta_Final_ID=getattr(venta, "Venta_ID", None),
-        Fecha_Liquidacion=_now(),
+        Fecha_Liquidacion=fecha or _now(),
         Descuento_Aplicado=descuento,
         Recargo_Aplicado=recargo,
         Base_Calculo='total_original',
         Nota_Reglas=(nota_reglas or None),
     )
-    db.session.add(liq)
+    if getattr(venta, "Venta_ID", None) is None and venta is not None:
+        liq.venta_final = venta  # venta aún sin flush: el ID se asigna al insertar
     return liq
+
+
+# ---------------------------------------------
+# CIERRE DE MES (liquidación por lote)
+# ---------------------------------------------
+def _qty_plan(plan: object) -> int:
+    """Cantidad original del plan: Monto_Total_Original / Precio_Base_Snapshot (mín. 1)."""
+    try:
+        pb = float(getattr(plan, "Precio_Base_Snapshot", 0.0) or 0.0)
+        mt = float(getattr(plan, "Monto_Total_Original", 0.0) or 0.0)
+        return max(1, int(round(mt / pb))) if pb > 0.0 else 1
+    except Exception:
+        return 1
+
+
+def _ventas_de_origen(planes: List[object]) -> Dict[int, object]:
+    """
+    {Plan_ID: Venta} con la venta ya existente a la que se liga la liquidación de cada plan:
+    la del último abono del plan o, si no tiene abonos, la última venta del estudiante con
+    ese concepto (venta_pago). Dos consultas agregadas + una de ventas por lote.
+    """
+    db, PlanCobro, Abono, Pago, Venta, Liquidacion = _get_models()
+    from models import venta_pago
+
+    por_plan = dict(db.session.execute(
+        select(Abono.Plan_ID, func.max(Abono.Venta_ID))
+        .where(Abono.Plan_ID.in_([p.Plan_ID for p in planes]))
+        .group_by(Abono.Plan_ID)
+    ).all())
+
+    sin_abono = [p for p in planes if p.Plan_ID not in por_plan and p.Pago_ID]
+    if sin_abono:
+        por_concepto = {(est, pid): vid for est, pid, vid in db.session.execute(
+            select(Venta.Est_ID, venta_pago.c.pago_id, func.max(Venta.Venta_ID))
+            .join(venta_pago, venta_pago.c.venta_id == Venta.Venta_ID)
+            .where(venta_pago.c.pago_id.in_({p.Pago_ID for p in sin_abono}),
+                   Venta.Est_ID.in_({p.Est_ID for p in sin_abono}))
+            .group_by(Venta.Est_ID, venta_pago.c.pago_id)
+        )}
+        for p in sin_abono:
+            vid = por_concepto.get((p.Est_ID, p.Pago_ID))
+            if vid:
+                por_plan[p.Plan_ID] = vid
+
+    ventas = {v.Venta_ID: v for v in Venta.query.filter(Venta.Venta_ID.in_(set(por_plan.values())))} if por_plan else {}
+    return {plan_id: ventas[vid] for plan_id, vid in por_plan.items() if vid in ventas}
+
+
+def liquidar_planes_abiertos(
+    *,
+    metodo_norm: str,
+    referencia: Optional[str] = None,
+    hoy: Optional[Union[date, datetime]] = None,
+    desde_id: int = 0,
+    tamano_lote: int = 500,
+    limite: Optional[int] = None,
+    on_lote: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Liquida en lote los planes abiertos con saldo (Plan_ID > desde_id), en orden de Plan_ID.
+    Mismas reglas que la liquidación desde el modal de planes:
+      - Plan de PAGO: neto FULL con las reglas del concepto (compute_full_net, por lote),
+        abono final por lo que falte y fila de Liquidacion.
+      - Plan sin PAGO: abono por el saldo y Liquidacion sin ajuste (neto = total original).
+    El abono final y la Liquidacion se ligan a la venta que ya tiene el plan (_ventas_de_origen):
+    no se crean ventas vacías que aparecerían en consulta_ventas, la exportación y el resumen.
+    Un plan sin ninguna venta previa no se puede asentar; se cuenta en `sin_venta` y se deja abierto.
+    Cada lote es una transacción: abonos y liquidaciones con un solo flush y commit al final.
+    Si un lote falla se hace rollback y se relanza la excepción con `ultimo_id` (último
+    Plan_ID confirmado) para reanudar con desde_id=ultimo_id.
+    Los planes ya liquidados no vuelven a salir, así que re-ejecutar es seguro.
+    `on_lote(resumen)` recibe el avance acumulado tras cada commit.
+    """
+    db, PlanCobro, Abono, Pago, Venta, Liquidacion = _get_models()
+
+    ahora = hoy or _now()
+    if not isinstance(ahora, datetime):   # date suelta: inicio del día
+        ahora = datetime.combine(ahora, datetime.min.time())
+    metodo_norm = (metodo_norm or "").strip().lower()
+    ref = referencia if (referencia and requires_reference(metodo_norm)) else None
+    tamano_lote = max(1, int(tamano_lote or 500))
+
+    resumen = {'planes': 0, 'abonos': 0, 'liquidaciones': 0, 'sin_venta': 0,
+               'monto': 0.0, 'lotes': 0, 'ultimo_id': int(desde_id or 0)}
+
+    while limite is None or resumen['planes'] < limite:
+        n = tamano_lote if limite is None else min(tamano_lote, limite - resumen['planes'])
+        planes = (PlanCobro.query
+                  .options(joinedload(PlanCobro.pago))
+                  .filter(PlanCobro.Plan_ID > resumen['ultimo_id'],
+                          PlanCobro.Estado == ESTADO_ABIERTO,
+                          PlanCobro.Saldo_Actual > 0,
+                          ~PlanCobro.liquidacion.has())
+                  .order_by(PlanCobro.Plan_ID)
+                  .limit(n)
+                  .all())
+        if not planes:
+            break
+
+        try:
+            # Neto FULL de todos los planes de PAGO del lote en una llamada
+            de_pago = [p for p in planes if p.pago is not None]
+            netos = compute_full_net_batch_from_pagos(
+                [p.pago for p in de_pago], [_qty_plan(p) for p in de_pago],
+                method_norm=metodo_norm, today=ahora.date(),
+            )['neto'] if de_pago else []
+            neto_por_plan = {p.Plan_ID: money(nt) for p, nt in zip(de_pago, netos)}
+            ventas = _ventas_de_origen(planes)
+
+            nuevos = []
+            monto_lote = 0.0
+            sin_venta = 0
+            for plan in planes:
+                venta = ventas.get(plan.Plan_ID)
+                if venta is None:
+                    sin_venta += 1
+                    continue
+
+                abonado = float(plan.Abonado_Acumulado or 0.0)
+                saldo = _saldo_plan(plan, abonado)
+                neto_full = neto_por_plan.get(plan.Plan_ID)
+                if neto_full is not None:
+                    monto = _monto_liquidacion(money(max(0.0, neto_full - abonado)), saldo)
+                else:
+                    monto = saldo
+                    neto_full = money(plan.Monto_Total_Original or 0.0)
+
+                if monto > 0:
+                    nuevos.append(Abono(
+                        Plan_ID=plan.Plan_ID,
+                        venta=venta,
+                        Monto_Abonado=monto,
+                        Saldo_Antes=saldo,
+                        Saldo_Despues=money(saldo - monto),
+                        Fecha_Abono=ahora,
+                        Metodo_Pago=metodo_norm or None,
+                        Referencia_Pago=ref,
+                        Observaciones="Liquidación de cierre de mes",
+                    ))
+                    resumen['abonos'] += 1
+                    monto_lote += monto
+
+                plan.Saldo_Actual = money(0.0)
+                plan.Fecha_Ultimo_Abono = ahora
+                nuevos.append(_nueva_liquidacion(plan, venta, neto_full,
+                                                 "Cierre de mes (lote)", fecha=ahora))
+                resumen['liquidaciones'] += 1
+
+            db.session.add_all(nuevos)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            e.ultimo_id = resumen['ultimo_id']
+            raise
+
+        resumen['planes'] += len(planes) - sin_venta
+        resumen['sin_venta'] += sin_venta
+        resumen['monto'] = money(resumen['monto'] + monto_lote)
+        resumen['lotes'] += 1
+        resumen['ultimo_id'] = planes[-1].Plan_ID
+        db.session.expunge_all()  # no acumular objetos de lotes ya confirmados
+        if on_lote:
+            on_lote(dict(resumen))
+
+    return resumen
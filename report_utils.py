@@ -0,0 +1,388 @@
+# report_utils.py
+from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, literal, not_, or_, select
+
+from billing_utils import pct_cents, to_cents
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.Venta, VentaLinea, Pago, Articulo, Estudiante, Instructor, venta_pago
+    """
+    from extensions import db
+    from models import Venta, VentaLinea, Pago, Articulo, Estudiante, Instructor, venta_pago
+    return db, Venta, VentaLinea, Pago, Articulo, Estudiante, Instructor, venta_pago
+
+
+# Mismo mapa de alias que app._normalize_method (el reporte siempre lo ha usado así)
+_REPORT_METHOD_ALIASES = {
+    "cash": "efectivo",
+    "tarjeta de crédito": "tarjeta",
+    "tarjeta de debito": "tarjeta",
+    "tarjeta de débito": "tarjeta",
+    "debito": "tarjeta",
+    "débito": "tarjeta",
+    "transferencia bancaria": "transferencia",
+    "depósito": "deposito",
+    "deposito bancario": "deposito",
+}
+
+_EMPTY_META = ("", "[]", "{}", "null", "None", "NULL")
+
+
+def _metodo_norm_expr(col):
+    """Equivalente SQL de _normalize_method: lower(trim(x)) + alias."""
+    base = func.lower(func.trim(func.coalesce(col, '')))
+    return case(
+        *[(base == alias, literal(canon)) for alias, canon in _REPORT_METHOD_ALIASES.items()],
+        else_=base,
+    )
+
+
+def _empty_meta_expr(col):
+    """Equivalente SQL de _is_empty_meta para columnas de texto."""
+    t = func.trim(col)
+    return or_(
+        col.is_(None),
+        t.in_(_EMPTY_META),
+        func.replace(t, ' ', '').in_(("[]", "{}")),
+    )
+
+
+def _conds_normalizadas_expr(col):
+    """
+    Lleva Pago_Condiciones (JSON '["a", "b"]' o CSV 'a; b | c') a la forma ',a,b,c,'
+    para poder preguntar por pertenencia con un LIKE. Mismo resultado que
+    billing_utils.parse_conditions: cada elemento sin espacios alrededor, aunque
+    vengan varios, tabuladores o saltos de línea (p.ej. 'efectivo ,  tarjeta').
+    """
+    s = func.lower(func.coalesce(col, ''))
+    for ch in ('[', ']', '"'):
+        s = func.replace(s, ch, '')
+    for sep in (';', '|'):
+        s = func.replace(s, sep, ',')
+    for blanco in ('\t', '\n', '\r'):
+        s = func.replace(s, blanco, ' ')
+    # SQL no tiene bucles: cada pasada reduce a la mitad las corridas de espacios,
+    # así que 6 pasadas colapsan hasta 64 espacios seguidos en uno solo
+    for _ in range(6):
+        s = func.replace(s, '  ', ' ')
+    s = func.replace(func.replace(s, ', ', ','), ' ,', ',')
+    return literal(',') + func.trim(s) + literal(',')
+
+
+def _round2(x: float) -> float:
+    return round(float(x or 0.0), 2)
+
+
+def _suma(valores) -> float:
+    """Suma en centavos enteros (half-up por valor), sin deriva de floats."""
+    return sum(to_cents(v) for v in valores) / 100
+
+
+_CURSOR_FMT = '%Y%m%d%H%M%S%f'
+
+
+# ---------------------------------------------
+# Piezas SQL del reporte
+# ---------------------------------------------
+def _subtotales_sq(ids_sq):
+    """Subtotal de artículos por venta (SUM(Cantidad * Precio_Unitario))."""
+    db, Venta, VentaLinea, *_ = _get_models()
+    return (select(
+                VentaLinea.Venta_ID.label('Venta_ID'),
+                func.sum(func.coalesce(VentaLinea.Cantidad, 0) * VentaLinea.Precio_Unitario).label('subtotal'),
+            )
+            .where(VentaLinea.Venta_ID.in_(select(ids_sq.c.Venta_ID)))
+            .group_by(VentaLinea.Venta_ID)
+            .subquery())
+
+
+def _pagos_validos_select(ids_sq, *columns):
+    """
+    SELECT sobre (venta, pago) ya filtrado por las reglas de _armar_reporte:
+      - ventas de instructor no cuentan pagos
+      - se excluye el autopago (mismo método, mismo monto ± tolerancia, sin promo ni restricciones)
+    Agrega la bandera `aplica` (descuento válido por método y vigencia a la fecha de la venta).
+    """
+    db, Venta, VentaLinea, Pago, Articulo, Estudiante, Instructor, venta_pago = _get_models()
+    sub = _subtotales_sq(ids_sq)
+    subtotal = func.coalesce(sub.c.subtotal, 0.0)
+
+    metodo = _metodo_norm_expr(Venta.Metodo_Pago)
+    pct = func.coalesce(Pago.Pago_Descuento_Porcentaje, 0)
+    sin_conds = _empty_meta_expr(Pago.Pago_Condiciones)
+
+    # Autopago (ver _is_autopago_unit)
+    tol = case((subtotal > 50, subtotal * 0.001), else_=0.05)
+    sin_desc = and_(_empty_meta_expr(Pago.Pago_Descuento_Tipo), pct == 0)
+    sin_restr = and_(sin_conds, Pago.Pago_Restricciones_Fecha.is_(None))
+    es_autopago = and_(
+        _metodo_norm_expr(Pago.Pago_Tipo) == metodo,
+        func.abs(func.coalesce(Pago.Pago_Monto, 0) - subtotal) <= tol,
+        sin_desc,
+        sin_restr,
+    )
+
+    # Descuento válido (condiciones de método + vigencia a la fecha de la venta)
+    condiciones_ok = or_(
+        sin_conds,
+        _conds_normalizadas_expr(Pago.Pago_Condiciones).like(literal('%,') + metodo + literal(',%')),
+    )
+    vigente = or_(
+        Pago.Pago_Restricciones_Fecha.is_(None),
+        func.date(Venta.Fecha_Venta) <= func.date(Pago.Pago_Restricciones_Fecha),
+    )
+    aplica = case((and_(pct > 0, condiciones_ok, vigente), 1), else_=0).label('aplica')
+
+    es_instructor = and_(Venta.Est_ID.is_(None), Venta.Instructor_ID.isnot(None))
+
+    return (select(*columns, aplica)
+            .select_from(Venta)
+            .join(venta_pago, venta_pago.c.venta_id == Venta.Venta_ID)
+            .join(Pago, Pago.Pago_ID == venta_pago.c.pago_id)
+            .outerjoin(sub, sub.c.Venta_ID == Venta.Venta_ID)
+            .where(Venta.Venta_ID.in_(select(ids_sq.c.Venta_ID)))
+            .where(not_(es_instructor))
+            .where(not_(es_autopago)))
+
+
+def _descuento_pago_cents(monto_bruto: float, pct: float, aplica: bool) -> Tuple[float, int, int]:
+    """Mismo redondeo que _armar_reporte (half-up en centavos): (pct_aplicado, desc_c, neto_c)."""
+    pct_aplicado = pct if (aplica and pct > 0) else 0.0
+    bruto_c = to_cents(monto_bruto)
+    desc_c = pct_cents(bruto_c, pct_aplicado)
+    return pct_aplicado, desc_c, bruto_c - desc_c
+
+
+def _descuento_pago(monto_bruto: float, pct: float, aplica: bool) -> Tuple[float, float, float]:
+    """(pct_aplicado, descuento, neto) en pesos."""
+    pct_aplicado, desc_c, neto_c = _descuento_pago_cents(monto_bruto, pct, aplica)
+    return pct_aplicado, desc_c / 100, neto_c / 100
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def kpis_ventas(ids_sq) -> Dict[str, Any]:
+    """
+    KPIs del reporte de ventas calculados en SQL (sin hidratar ventas):
+      - total_ventas, sum_items, sum_descuentos, sum_total
+    `ids_sq` es un subquery con columna Venta_ID (ya filtrado).
+    Los pagos se agrupan por (Pago_ID, aplica): el descuento se redondea igual que en
+    _armar_reporte y se multiplica por el número de ventas que lo comparten.
+    """
+    db, Venta, VentaLinea, Pago, *_ = _get_models()
+
+    total_ventas = db.session.execute(
+        select(func.count()).select_from(ids_sq)
+    ).scalar() or 0
+
+    sum_items = db.session.execute(
+        select(func.coalesce(func.sum(func.coalesce(VentaLinea.Cantidad, 0) * VentaLinea.Precio_Unitario), 0.0))
+        .where(VentaLinea.Venta_ID.in_(select(ids_sq.c.Venta_ID)))
+    ).scalar() or 0.0
+
+    grupos = _pagos_validos_select(
+        ids_sq,
+        Pago.Pago_ID,
+        Pago.Pago_Monto,
+        Pago.Pago_Descuento_Porcentaje,
+        func.count().label('n'),
+    ).group_by(Pago.Pago_ID, Pago.Pago_Monto, Pago.Pago_Descuento_Porcentaje, 'aplica')
+
+    sum_desc_c = 0
+    sum_neto_c = 0
+    for _pid, monto, pct, n, aplica in db.session.execute(grupos):
+        _pct, desc_c, neto_c = _descuento_pago_cents(float(monto or 0.0), float(pct or 0.0), bool(aplica))
+        sum_desc_c += desc_c * int(n)
+        sum_neto_c += neto_c * int(n)
+
+    items_c = to_cents(sum_items)
+    return {
+        'total_ventas': int(total_ventas),
+        'sum_items': items_c / 100,
+        'sum_descuentos': sum_desc_c / 100,
+        'sum_total': (items_c + sum_neto_c) / 100,
+    }
+
+
+def filas_ventas(ids_sq) -> List[Dict[str, Any]]:
+    """
+    Filas del reporte (mismo formato que _armar_reporte) para las ventas de `ids_sq`,
+    con tres consultas planas: encabezados, líneas y pagos válidos.
+    Orden: Fecha_Venta desc, Venta_ID desc.
+    """
+    db, Venta, VentaLinea, Pago, Articulo, Estudiante, Instructor, venta_pago = _get_models()
+    ids_in = Venta.Venta_ID.in_(select(ids_sq.c.Venta_ID))
+
+    # --- Encabezados ---
+    cab = db.session.execute(
+        select(Venta.Venta_ID, Venta.Fecha_Venta, Venta.Est_ID, Venta.Instructor_ID,
+               Venta.Metodo_Pago, Venta.Referencia_Pago,
+               Estudiante.Est_Nombre, Estudiante.Est_ApellidoP,
+               Instructor.Instructor_Nombre, Instructor.Instructor_ApellidoP)
+        .select_from(Venta)
+        .outerjoin(Estudiante, Estudiante.Est_ID == Venta.Est_ID)
+        .outerjoin(Instructor, Instructor.Instructor_ID == Venta.Instructor_ID)
+        .where(ids_in)
+        .order_by(Venta.Fecha_Venta.desc(), Venta.Venta_ID.desc())
+    ).all()
+
+    # --- Líneas (con nombre de artículo en el mismo SELECT) ---
+    items_por_venta = defaultdict(list)
+    lineas = db.session.execute(
+        select(VentaLinea.Venta_ID, VentaLinea.Articulo_ID, Articulo.Articulo_Nombre,
+               VentaLinea.Talla, VentaLinea.Cantidad, VentaLinea.Precio_Unitario)
+        .select_from(VentaLinea)
+        .outerjoin(Articulo, Articulo.Articulo_ID == VentaLinea.Articulo_ID)
+        .where(VentaLinea.Venta_ID.in_(select(ids_sq.c.Venta_ID)))
+        .order_by(VentaLinea.Venta_ID, VentaLinea.Linea_ID)
+    )
+    for vid, art_id, art_nombre, talla, cant, pu in lineas:
+        cantidad = int(cant or 0)
+        p_unit = float(pu or 0.0)
+        items_por_venta[vid].append({
+            'articulo': art_nombre or f"ID {art_id}",
+            'talla': talla,
+            'cantidad': cantidad,
+            'precio_unit': p_unit,
+            'total_linea': cantidad * p_unit,
+        })
+
+    # --- Pagos válidos (autopago ya excluido en SQL) ---
+    pagos_por_venta = defaultdict(list)
+    pagos = db.session.execute(
+        _pagos_validos_select(
+            ids_sq,
+            Venta.Venta_ID, Pago.Pago_Tipo, Pago.Pago_Monto, Pago.Pago_Descuento_Porcentaje,
+            Pago.Pago_Condiciones, Pago.Pago_Restricciones_Fecha,
+        ).order_by(Venta.Venta_ID, Pago.Pago_ID)
+    )
+    for vid, tipo, monto, pct, cond, vence, aplica in pagos:
+        monto_bruto = float(monto or 0.0)
+        pct_aplicado, desc_monto, monto_neto = _descuento_pago(monto_bruto, float(pct or 0.0), bool(aplica))
+        pagos_por_venta[vid].append({
+            'tipo': tipo or '',
+            'monto_bruto': monto_bruto,
+            'pct_aplicado': pct_aplicado,
+            'descuento_monto': desc_monto,
+            'monto_neto': monto_neto,
+            'cond': cond,
+            'vence': vence,
+        })
+
+    ventas = []
+    for (vid, fecha, est_id, ins_id, metodo, referencia,
+         est_nom, est_ap, ins_nom, ins_ap) in cab:
+        if est_id:
+            cli_tipo = 'estudiante'
+            cli_nombre = f"{est_nom or ''} {est_ap or ''}".strip()
+        elif ins_id:
+            cli_tipo = 'instructor'
+            cli_nombre = f"{ins_nom or ''} {ins_ap or ''}".strip()
+        else:
+            cli_tipo = '—'
+            cli_nombre = '—'
+
+        items = items_por_venta.get(vid, [])
+        pagos_view = pagos_por_venta.get(vid, [])
+        subtotal_items = _suma(i['total_linea'] for i in items)
+        pagos_subtotal = _suma(p['monto_bruto'] for p in pagos_view)
+        desc_total = _suma(p['descuento_monto'] for p in pagos_view)
+        neto_total = _suma(p['monto_neto'] for p in pagos_view)
+
+        ventas.append({
+            'id': vid,
+            'est_id': est_id,
+            'fecha': fecha,
+            'cliente_tipo': cli_tipo,
+            'cliente_nombre': cli_nombre or '—',
+            'metodo': metodo or '—',
+            'referencia': referencia,
+            'items': items,
+            'subtotal_items': _round2(subtotal_items),
+            'pagos': pagos_view,
+            'pagos_subtotal': _round2(pagos_subtotal),
+            'descuento_pagos': _round2(desc_total),
+            'total_venta': _round2(subtotal_items + neto_total),
+        })
+    return ventas
+
+
+def armar_reporte_sql(ids_sq) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Reemplazo de _armar_reporte para conjuntos grandes: recibe un subquery de Venta_ID
+    y devuelve (ventas, kpis) con el mismo formato, sin cargar objetos ORM.
+    """
+    return filas_ventas(ids_sq), kpis_ventas(ids_sq)
+
+
+# ---------------------------------------------
+# Paginación por cursor (keyset) sobre (Fecha_Venta, Venta_ID)
+# ---------------------------------------------
+def encode_cursor(fecha: datetime, venta_id: int) -> str:
+    """Cursor opaco y seguro para URL: 'AAAAMMDDhhmmssffffff-ID'."""
+    return f"{fecha.strftime(_CURSOR_FMT)}-{int(venta_id)}"
+
+
+def decode_cursor(raw: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Inverso de encode_cursor; None si viene vacío o mal formado (→ primera página)."""
+    if not raw:
+        return None
+    try:
+        fecha_str, vid = str(raw).strip().split('-', 1)
+        return datetime.strptime(fecha_str, _CURSOR_FMT), int(vid)
+    except Exception:
+        return None
+
+
+def pagina_ventas(query, cursor: Optional[str], per_page: int) -> Tuple[Any, Optional[str]]:
+    """
+    Recorta `query` (Venta.query ya filtrado) a una página ordenada por
+    Fecha_Venta desc, Venta_ID desc, empezando después de `cursor`.
+    Devuelve (ids_sq_pagina, next_cursor). Solo lee per_page + 1 IDs, así que
+    la página N cuesta lo mismo que la primera.
+    """
+    db, Venta, *_ = _get_models()
+
+    q = query.with_entities(Venta.Venta_ID, Venta.Fecha_Venta).distinct()
+    pos = decode_cursor(cursor)
+    if pos:
+        fecha, vid = pos
+        q = q.filter(or_(
+            Venta.Fecha_Venta < fecha,
+            and_(Venta.Fecha_Venta == fecha, Venta.Venta_ID < vid),
+        ))
+    claves = (q.order_by(Venta.Fecha_Venta.desc(), Venta.Venta_ID.desc())
+               .limit(per_page + 1)
+               .all())
+
+    next_cursor = None
+    if len(claves) > per_page:
+        claves = claves[:per_page]
+        ult_id, ult_fecha = claves[-1]
+        next_cursor = encode_cursor(ult_fecha, ult_id)
+
+    ids = [vid for vid, _f in claves]
+    ids_sq = select(Venta.Venta_ID.label('Venta_ID')).where(Venta.Venta_ID.in_(ids)).subquery()
+    return ids_sq, next_cursor
+
+
+def kpis_de_filas(ventas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """KPIs de una página ya armada (sin volver a la BD)."""
+    return {
+        'total_ventas': len(ventas),
+        'sum_items': _suma(v['subtotal_items'] for v in ventas),
+        'sum_descuentos': _suma(v['descuento_pagos'] for v in ventas),
+        'sum_total': _suma(v['total_venta'] for v in ventas),
+    }
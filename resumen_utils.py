@@ -0,0 +1,263 @@
+# resumen_utils.py
+from __future__ import annotations
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from report_utils import filas_ventas
+
+
+# ---------------------------------------------
+# Helpers internos
+# ---------------------------------------------
+def _get_models():
+    """
+    Import lazy para evitar ciclos:
+    - extensions.db
+    - models.Venta, VentaResumenDiario, VentaResumenCobertura
+    """
+    from extensions import db
+    from models import Venta, VentaResumenDiario, VentaResumenCobertura
+    return db, Venta, VentaResumenDiario, VentaResumenCobertura
+
+
+def _as_date(d: Any) -> Optional[date]:
+    if d is None:
+        return None
+    if isinstance(d, datetime):
+        return d.date()
+    if isinstance(d, date):
+        return d
+    return None
+
+
+def _rango_ids(desde: date, hasta: date):
+    """Subquery de Venta_ID con Fecha_Venta en [desde, hasta)."""
+    db, Venta, *_ = _get_models()
+    ini = datetime.combine(desde, datetime.min.time())
+    fin = datetime.combine(hasta, datetime.min.time())
+    return (select(Venta.Venta_ID.label('Venta_ID'))
+            .where(Venta.Fecha_Venta >= ini, Venta.Fecha_Venta < fin)
+            .subquery())
+
+
+Clave = Tuple[date, str, str]   # (Fecha, Metodo, Cliente_Tipo) = uq_resumen_dia_metodo_tipo
+
+
+def _acumular(ids_sq) -> Dict[Clave, List]:
+    """[ventas, items, descuento, total] por clave para las ventas de `ids_sq` (reglas de filas_ventas)."""
+    db, Venta, *_ = _get_models()
+    metodos = dict(db.session.execute(
+        select(Venta.Venta_ID, Venta.Metodo_Pago)
+        .where(Venta.Venta_ID.in_(select(ids_sq.c.Venta_ID)))
+    ).all())
+
+    acc = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    for row in filas_ventas(ids_sq):
+        key = (row['fecha'].date(), metodos.get(row['id']) or '', row['cliente_tipo'])
+        a = acc[key]
+        a[0] += 1
+        a[1] += row['subtotal_items']
+        a[2] += row['descuento_pagos']
+        a[3] += row['total_venta']
+    return dict(acc)
+
+
+def _sumar_al_resumen(deltas: Dict[Clave, List]) -> None:
+    """
+    Suma cada delta a su fila con un upsert (INSERT ... ON CONFLICT DO UPDATE SET x = x + d):
+    dos transacciones del mismo día no chocan en uq_resumen_dia_metodo_tipo, solo se
+    esperan en esa fila. Otros motores: UPDATE y, si no había fila, INSERT.
+    """
+    db, _, R, _ = _get_models()
+    T = R.__table__
+    ahora = datetime.now()
+    filas = [{'Fecha': f, 'Metodo': m, 'Cliente_Tipo': t, 'Num_Ventas': n,
+              'Subtotal_Items': round(items, 2), 'Descuento': round(desc, 2), 'Total': round(total, 2),
+              'Actualizado': ahora}
+             for (f, m, t), (n, items, desc, total) in deltas.items()
+             if n or round(items, 2) or round(desc, 2) or round(total, 2)]
+    if not filas:
+        return
+
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto in ('sqlite', 'postgresql'):
+        ins = (sqlite.insert if dialecto == 'sqlite' else postgresql.insert)(T)
+        ex = ins.excluded
+        db.session.execute(ins.on_conflict_do_update(
+            index_elements=[T.c.Fecha, T.c.Metodo, T.c.Cliente_Tipo],
+            set_={'Num_Ventas': T.c.Num_Ventas + ex.Num_Ventas,
+                  'Subtotal_Items': func.round(T.c.Subtotal_Items + ex.Subtotal_Items, 2),
+                  'Descuento': func.round(T.c.Descuento + ex.Descuento, 2),
+                  'Total': func.round(T.c.Total + ex.Total, 2),
+                  'Actualizado': ex.Actualizado},
+        ), filas)
+        return
+
+    for fila in filas:
+        clave = (T.c.Fecha == fila['Fecha'], T.c.Metodo == fila['Metodo'], T.c.Cliente_Tipo == fila['Cliente_Tipo'])
+        res = db.session.execute(T.update().where(*clave).values(
+            Num_Ventas=T.c.Num_Ventas + fila['Num_Ventas'],
+            Subtotal_Items=T.c.Subtotal_Items + fila['Subtotal_Items'],
+            Descuento=T.c.Descuento + fila['Descuento'],
+            Total=T.c.Total + fila['Total'],
+            Actualizado=ahora))
+        if not res.rowcount:
+            db.session.execute(T.insert(), fila)
+
+
+def _agregar_rango(desde: date, hasta: date) -> int:
+    """
+    Borra y vuelve a escribir las filas de resumen de [desde, hasta) (reconstrucción).
+    Usa filas_ventas (mismas reglas que el reporte). No hace commit.
+    """
+    db, Venta, VentaResumenDiario, _ = _get_models()
+
+    (VentaResumenDiario.query
+     .filter(VentaResumenDiario.Fecha >= desde, VentaResumenDiario.Fecha < hasta)
+     .delete(synchronize_session=False))
+
+    acc = _acumular(_rango_ids(desde, hasta))
+
+    ahora = datetime.now()
+    for (fecha, metodo, tipo), (n, items, desc, total) in acc.items():
+        db.session.add(VentaResumenDiario(
+            Fecha=fecha,
+            Metodo=metodo,
+            Cliente_Tipo=tipo,
+            Num_Ventas=n,
+            Subtotal_Items=round(items, 2),
+            Descuento=round(desc, 2),
+            Total=round(total, 2),
+            Actualizado=ahora,
+        ))
+    return len(acc)
+
+
+def _marcar_cobertura(desde: Optional[date], hasta: Optional[date]) -> None:
+    """Deja (o actualiza) la fila única que indica que el histórico ya está en el resumen. No hace commit."""
+    db, _, _, Cobertura = _get_models()
+    marca = db.session.get(Cobertura, 1) or Cobertura(Cobertura_ID=1)
+    marca.Desde, marca.Hasta, marca.Reconstruido = desde, hasta, datetime.now()
+    db.session.add(marca)
+
+
+# ---------------------------------------------
+# API pública
+# ---------------------------------------------
+def aportes_resumen(venta_ids: Iterable[Any]) -> Dict[Clave, List]:
+    """
+    Lo que aportan hoy al resumen las ventas indicadas (solo lee esas ventas).
+    Tomarlo ANTES de editar o borrar ventas y pasarlo como `antes` a ajustar_resumen.
+    """
+    db, Venta, *_ = _get_models()
+    ids = sorted({int(i) for i in venta_ids if i})
+    if not ids:
+        return {}
+    db.session.flush()
+    return _acumular(select(Venta.Venta_ID.label('Venta_ID')).where(Venta.Venta_ID.in_(ids)).subquery())
+
+
+def ajustar_resumen(venta_ids: Iterable[Any], antes: Optional[Dict[Clave, List]] = None) -> None:
+    """
+    Aplica al resumen la diferencia entre lo que aportan ahora `venta_ids` y `antes`
+    (aportes_resumen previo al cambio; None para ventas nuevas). Las ventas borradas
+    aportan cero. El costo depende de las ventas tocadas, no del volumen del día.
+    Llamarlo justo antes del commit de la operación (misma transacción). No hace commit.
+    """
+    despues = aportes_resumen(venta_ids)
+    deltas: Dict[Clave, List] = {}
+    for clave in set(despues) | set(antes or {}):
+        d = despues.get(clave, [0, 0.0, 0.0, 0.0])
+        a = (antes or {}).get(clave, [0, 0.0, 0.0, 0.0])
+        deltas[clave] = [x - y for x, y in zip(d, a)]
+    _sumar_al_resumen(deltas)
+
+
+def reconstruir_resumen(desde: Optional[date] = None, hasta: Optional[date] = None,
+                        *, dias_por_lote: int = 31, on_lote=None) -> int:
+    """
+    Reconstruye el resumen en [desde, hasta] (por defecto todo el histórico) en lotes
+    de `dias_por_lote`, con commit por lote. Devuelve el número de filas escritas.
+    `on_lote(desde, hasta, filas)` permite reportar avance.
+    Si el rango cubre de la primera a la última venta, al terminar marca el resumen
+    como completo (VentaResumenCobertura) y kpis_resumen empieza a usarlo; una
+    reconstrucción interrumpida o parcial no cambia esa marca. A partir de ahí cada
+    operación sobre ventas lo mantiene con ajustar_resumen.
+    """
+    db, Venta, VentaResumenDiario, _ = _get_models()
+
+    fmin, fmax = db.session.query(func.min(Venta.Fecha_Venta), func.max(Venta.Fecha_Venta)).one()
+    fmin, fmax = _as_date(fmin), _as_date(fmax)
+    desde = desde or fmin
+    hasta = hasta or fmax
+    if desde is None or hasta is None:
+        # Sin ventas: solo limpiar
+        VentaResumenDiario.query.delete(synchronize_session=False)
+        _marcar_cobertura(None, None)
+        db.session.commit()
+        return 0
+    completo = desde <= fmin and hasta >= fmax
+
+    total = 0
+    ini = desde
+    fin_total = hasta + timedelta(days=1)
+    while ini < fin_total:
+        fin = min(ini + timedelta(days=max(1, dias_por_lote)), fin_total)
+        filas = _agregar_rango(ini, fin)
+        db.session.commit()
+        total += filas
+        if on_lote:
+            on_lote(ini, fin - timedelta(days=1), filas)
+        ini = fin
+    if completo:
+        _marcar_cobertura(fmin, fmax)
+        db.session.commit()
+    return total
+
+
+def kpis_resumen(*, dt_ini: Optional[datetime] = None, dt_fin: Optional[datetime] = None,
+                 tipo: str = 'todos', metodo: str = '', estado: str = 'todas') -> Optional[Dict[str, Any]]:
+    """
+    KPIs de consulta_ventas leídos del resumen diario (mismos filtros salvo la búsqueda libre).
+    `dt_fin` es exclusivo, como en consulta_ventas.
+    Devuelve None mientras el histórico no se haya reconstruido completo (sin marca de
+    cobertura), para que el llamador use el cálculo directo: antes de eso el resumen
+    solo tiene los días tocados desde el despliegue.
+    """
+    db, Venta, R, Cobertura = _get_models()
+
+    if db.session.query(Cobertura.Cobertura_ID).first() is None:
+        return None
+
+    q = db.session.query(
+        func.coalesce(func.sum(R.Num_Ventas), 0),
+        func.coalesce(func.sum(R.Subtotal_Items), 0),
+        func.coalesce(func.sum(R.Descuento), 0),
+        func.coalesce(func.sum(R.Total), 0),
+    )
+    if tipo in ('estudiante', 'instructor'):
+        q = q.filter(R.Cliente_Tipo == tipo)
+    if metodo:
+        q = q.filter(R.Metodo == metodo)
+    if dt_ini:
+        q = q.filter(R.Fecha >= _as_date(dt_ini))
+    if dt_fin:
+        q = q.filter(R.Fecha < _as_date(dt_fin))
+
+    pendiente = or_(R.Metodo == '', func.lower(R.Metodo).in_(('__pendiente__', 'pendiente')))
+    if estado == 'pendientes':
+        q = q.filter(pendiente)
+    elif estado == 'cobradas':
+        q = q.filter(~pendiente)
+
+    n, items, desc, total = q.one()
+    return {
+        'total_ventas': int(n or 0),
+        'sum_items': round(float(items or 0), 2),
+        'sum_descuentos': round(float(desc or 0), 2),
+        'sum_total': round(float(total or 0), 2),
+    }
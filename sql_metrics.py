@@ -0,0 +1,129 @@
+# sql_metrics.py
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ---------------------------------------------
+# Configuración (app.config)
+# ---------------------------------------------
+# SQL_METRICAS         activa el conteo por request (default True)
+# SQL_N1_UMBRAL        avisa si una misma forma de sentencia se repite más de N veces (default 10)
+# SQL_METRICAS_PAGINA  expone /metrics con el agregado por endpoint (default False)
+_DEFAULTS = {'SQL_METRICAS': True, 'SQL_N1_UMBRAL': 10, 'SQL_METRICAS_PAGINA': False}
+
+# Agregado por endpoint (por proceso): requests, consultas, ms, máximo de consultas y avisos N+1
+_agregado: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+_RE_ESPACIOS = re.compile(r'\s+')
+_RE_LISTA = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_RE_NUM = re.compile(r'\b\d+\b')
+
+
+def forma_sentencia(sql: str) -> str:
+    """Normaliza el SQL para agrupar: espacios, listas IN de cualquier largo y literales numéricos."""
+    s = _RE_ESPACIOS.sub(' ', sql or '').strip()
+    s = _RE_LISTA.sub('(?)', s)
+    return _RE_NUM.sub('N', s)
+
+
+# ---------------------------------------------
+# Eventos del motor
+# ---------------------------------------------
+def _estado():
+    """Contadores del request en curso; None fuera de request o si no se inicializaron."""
+    if not has_request_context():
+        return None
+    return g.get('_sql_metricas')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _estado() is not None:
+        conn.info.setdefault('_sql_t0', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    st = _estado()
+    pila = conn.info.get('_sql_t0')
+    if st is None or not pila:
+        return
+    st['ms'] += (time.perf_counter() - pila.pop()) * 1000.0
+    st['n'] += 1
+    st['formas'][forma_sentencia(statement)] += 1
+
+
+# ---------------------------------------------
+# Hooks de Flask
+# ---------------------------------------------
+def _antes_request():
+    g._sql_metricas = {'n': 0, 'ms': 0.0, 'formas': Counter()}
+
+
+def _despues_request(response):
+    from flask import current_app
+    st = g.pop('_sql_metricas', None)
+    if st is None:
+        return response
+
+    endpoint = request.endpoint or '(sin ruta)'  # 404s en un solo renglón: el agregado no crece por URL
+    forma, repeticiones = st['formas'].most_common(1)[0] if st['formas'] else ('', 0)
+    duplicadas = sum(c - 1 for c in st['formas'].values() if c > 1)
+
+    response.headers['X-SQL-Queries'] = str(st['n'])
+    response.headers['X-SQL-Time-ms'] = f"{st['ms']:.1f}"
+    response.headers['X-SQL-Duplicates'] = str(duplicadas)
+
+    umbral = int(current_app.config.get('SQL_N1_UMBRAL') or 0)
+    n1 = bool(umbral) and repeticiones > umbral
+    if n1:
+        current_app.logger.warning("Posible N+1 en %s: %d ejecuciones de «%s»",
+                                   endpoint, repeticiones, forma[:200])
+    current_app.logger.debug("SQL %s: %d consultas, %.1f ms, %d repetidas",
+                             endpoint, st['n'], st['ms'], duplicadas)
+
+    with _lock:
+        a = _agregado.setdefault(endpoint, {'requests': 0, 'consultas': 0, 'ms': 0.0,
+                                            'max_consultas': 0, 'avisos_n1': 0})
+        a['requests'] += 1
+        a['consultas'] += st['n']
+        a['ms'] += st['ms']
+        a['max_consultas'] = max(a['max_consultas'], st['n'])
+        a['avisos_n1'] += int(n1)
+    return response
+
+
+def resumen_metricas() -> Dict[str, Dict[str, Any]]:
+    """Copia del agregado con promedios por request, ordenado por tiempo SQL total."""
+    with _lock:
+        filas = {k: dict(v) for k, v in _agregado.items()}
+    for v in filas.values():
+        v['ms'] = round(v['ms'], 1)
+        v['consultas_prom'] = round(v['consultas'] / v['requests'], 1) if v['requests'] else 0.0
+        v['ms_prom'] = round(v['ms'] / v['requests'], 1) if v['requests'] else 0.0
+    return dict(sorted(filas.items(), key=lambda kv: kv[1]['ms'], reverse=True))
+
+
+def _vista_metricas():
+    return jsonify({'endpoints': resumen_metricas()})
+
+
+def instalar_metricas(app) -> None:
+    """Activa el conteo por request (y /metrics si SQL_METRICAS_PAGINA) según app.config."""
+    for k, v in _DEFAULTS.items():
+        app.config.setdefault(k, v)
+    if not app.config['SQL_METRICAS']:
+        return
+    app.before_request(_antes_request)
+    app.after_request(_despues_request)
+    if app.config['SQL_METRICAS_PAGINA']:
+        app.add_url_rule('/metrics', 'metricas_sql', _vista_metricas)
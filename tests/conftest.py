@@ -0,0 +1,99 @@
+# tests/conftest.py
+"""
+Fixtures comunes: una app por prueba sobre un SQLite temporal (create_all), sin CSRF
+y con plantilla vacía de respaldo (el repo no trae templates/), y una escuela
+sintética (benchmarks.generador) compartida por módulo para pruebas de solo lectura.
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def _limpiar_caches():
+    """Cachés por proceso que dependen de la BD (cada prueba usa una BD nueva)."""
+    import busqueda_utils
+    import catalogo_utils
+    import idempotencia_utils
+    busqueda_utils._fts_ok = None
+    catalogo_utils._tabla_ok = None
+    catalogo_utils._cache.update(version=None, snapshot=None, version_existencias=None, con_existencias=None)
+    idempotencia_utils._tabla_ok = None
+
+
+def crear_app_prueba(ruta_bd, **config):
+    """create_app sobre `ruta_bd` (DATABASE_URL se lee en configurar_bd) con tablas creadas."""
+    from jinja2 import BaseLoader, ChoiceLoader
+    from app import create_app
+    from extensions import db
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(ruta_bd)
+    _limpiar_caches()
+    app = create_app(dict({'TESTING': True, 'WTF_CSRF_ENABLED': False, 'SQL_N1_UMBRAL': 0}, **config),
+                     migraciones=False)
+
+    class _PlantillaVacia(BaseLoader):
+        def get_source(self, environment, template):
+            return '', None, lambda: True
+
+    app.jinja_env.loader = ChoiceLoader([app.jinja_env.loader, _PlantillaVacia()])
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    from extensions import db
+    previa = os.environ.get('DATABASE_URL')
+    app = crear_app_prueba(tmp_path / 'ballet.db')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    if previa is None:
+        os.environ.pop('DATABASE_URL', None)
+    else:
+        os.environ['DATABASE_URL'] = previa
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='module')
+def escuela(tmp_path_factory):
+    """App con ~300 ventas sembradas (misma semilla → mismos datos). Solo lectura."""
+    from extensions import db
+    from benchmarks.generador import generar
+    previa = os.environ.get('DATABASE_URL')
+    app = crear_app_prueba(tmp_path_factory.mktemp('escuela') / 'escuela.db')
+    with app.app_context():
+        generar(300, semilla=7)
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    if previa is None:
+        os.environ.pop('DATABASE_URL', None)
+    else:
+        os.environ['DATABASE_URL'] = previa
+
+
+@pytest.fixture
+def plantillas():
+    """Contextos de render_template en orden (el HTML sale vacío, se prueba lo que recibe)."""
+    from flask import template_rendered
+    capturas = []
+
+    def _capturar(sender, template, context, **kw):
+        capturas.append(context)
+
+    template_rendered.connect(_capturar, weak=False)
+    yield capturas
+    template_rendered.disconnect(_capturar)
@@ -0,0 +1,86 @@
+# tests/datos.py
+"""Altas mínimas para las pruebas (ORM + flush; el commit lo decide cada prueba)."""
+from datetime import date, datetime
+
+
+def articulo(nombre='Leotardo', *, precio=100, existencia=0, tallas=None, tipo=None):
+    """Artículo con variantes {talla: existencia} (o sin talla si `tallas` es None)."""
+    from extensions import db
+    from models import Articulo
+    from inventario_utils import sincronizar_variantes
+    a = Articulo(Articulo_Nombre=nombre, Articulo_PrecioVenta=precio, Articulo_Existencia=existencia,
+                 Articulo_TipoTalla=tipo or ('talla' if tallas else None))
+    if tallas:
+        sincronizar_variantes(a, tallas)
+    db.session.add(a)
+    db.session.flush()
+    return a
+
+
+def tutor(nombre='Laura', celular='5512345678'):
+    from extensions import db
+    from models import Tutor
+    t = Tutor(Tutor_Nombre=nombre, Tutor_ApellidoP='Ríos', Tutor_Celular=celular, Tutor_Edad=35,
+              Tutor_Parentesco='Madre')
+    db.session.add(t)
+    db.session.flush()
+    return t
+
+
+def estudiante(nombre='Mía', *, tutor_obj=None, apellido='Ríos'):
+    from extensions import db
+    from models import Estudiante
+    t = tutor_obj or tutor()
+    e = Estudiante(Est_Nombre=nombre, Est_ApellidoP=apellido, Est_FechaNac=date(2015, 1, 1),
+                   Est_Sexo='F', Tutor_ID=t.Tutor_ID)
+    db.session.add(e)
+    db.session.flush()
+    return e
+
+
+def instructor(nombre='Clara', apellido='Soto'):
+    from extensions import db
+    from models import Instructor
+    i = Instructor(Instructor_Nombre=nombre, Instructor_ApellidoP=apellido)
+    db.session.add(i)
+    db.session.flush()
+    return i
+
+
+def pago(tipo='Mensualidad', monto=500, **extra):
+    from extensions import db
+    from models import Pago
+    p = Pago(Pago_Tipo=tipo, Pago_Monto=monto, **extra)
+    db.session.add(p)
+    db.session.flush()
+    return p
+
+
+def venta(*, est=None, instructor=None, metodo='efectivo', fecha=None, lineas=(), pagos=()):
+    """Venta (a estudiante o instructor) con líneas [(articulo, talla, cantidad, precio)] y conceptos de pago."""
+    from extensions import db
+    from models import Venta, VentaLinea
+    v = Venta(Est_ID=est.Est_ID if est else None,
+              Instructor_ID=instructor.Instructor_ID if instructor else None,
+              Metodo_Pago=metodo, Fecha_Venta=fecha or datetime.now())
+    for art, talla, cant, precio in lineas:
+        v.lineas.append(VentaLinea(Articulo_ID=art.Articulo_ID, Talla=talla, Cantidad=cant,
+                                   Precio_Unitario=precio))
+    for p in pagos:
+        v.pagos.append(p)
+    db.session.add(v)
+    db.session.flush()
+    return v
+
+
+def plan(est, *, concepto=None, total=500, saldo=None, estado='abierto'):
+    """PlanCobro sobre un concepto de pago (crea uno si no se pasa)."""
+    from extensions import db
+    from models import PlanCobro
+    p = concepto or pago('Colegiatura', total)
+    pl = PlanCobro(Est_ID=est.Est_ID, Pago_ID=p.Pago_ID, Precio_Base_Snapshot=total,
+                   Descripcion_Resumen=p.Pago_Tipo, Monto_Total_Original=total,
+                   Saldo_Actual=total if saldo is None else saldo, Estado=estado)
+    db.session.add(pl)
+    db.session.flush()
+    return pl
@@ -0,0 +1,87 @@
+# tests/test_app.py
+import subprocess
+import sys
+
+from flask import url_for
+
+from blueprints import BLUEPRINTS
+from tests.conftest import RAIZ
+
+# (endpoint del app.py monolítico, URL, métodos) antes de pasar a blueprints
+RUTAS_LEGACY = [
+    ('index', '/', 'GET'), ('registro', '/registro', 'GET'), ('consulta', '/consulta', 'GET'),
+    ('registro_tutor', '/registro/tutor', 'GET POST'), ('consulta_tutores', '/consulta/tutores', 'GET'),
+    ('editar_tutor', '/editar/tutor/1', 'GET POST'), ('eliminar_tutor', '/eliminar/tutor/1', 'POST'),
+    ('registro_instructor', '/registro/instructor', 'GET POST'),
+    ('consulta_instructores', '/consulta/instructores', 'GET'),
+    ('editar_instructor', '/editar/instructor/1', 'GET POST'),
+    ('eliminar_instructor', '/eliminar/instructor/1', 'POST'),
+    ('registro_grupo', '/registro/grupo', 'GET POST'), ('consulta_grupos', '/consulta/grupos', 'GET'),
+    ('editar_grupo', '/editar/grupo/1', 'GET POST'), ('eliminar_grupo', '/eliminar/grupo/1', 'POST'),
+    ('consulta_estudiantes', '/consulta/estudiantes', 'GET'),
+    ('editar_estudiante', '/editar/estudiante/1', 'GET POST'),
+    ('eliminar_estudiante', '/eliminar/estudiante/1', 'POST'),
+    ('registro_tutor_estudiante', '/registro/tutor-estudiante', 'GET POST'),
+    ('registro_articulo', '/registro/articulo', 'GET POST'), ('consulta_articulos', '/consulta_articulos', 'GET'),
+    ('editar_articulo', '/editar_articulo/1', 'GET POST'), ('eliminar_variante', '/eliminar_variante/1', 'POST'),
+    ('registro_paquete', '/registro/paquete', 'GET POST'),
+    ('editar_paquete', '/paquetes/1/editar', 'GET POST'), ('eliminar_paquete', '/paquetes/1/eliminar', 'POST'),
+    ('registro_pago', '/registro_pago', 'GET POST'), ('consulta_pagos', '/consulta_pagos', 'GET'),
+    ('editar_pago', '/editar_pago/1', 'GET POST'), ('eliminar_pago', '/eliminar_pago/1', 'POST'),
+    ('registro_venta', '/registro/venta', 'GET POST'), ('consulta_ventas', '/consulta/ventas', 'GET'),
+    ('eliminar_venta', '/ventas/1/eliminar', 'POST'),
+    ('historial_ventas_estudiante', '/estudiantes/1/historial-ventas', 'GET'),
+    ('api_ventas_pendientes', '/api/ventas/pendientes', 'GET'),
+    ('api_clientes_buscar', '/api/clientes/buscar', 'GET'),
+    ('registro_abonos', '/registro/abonos', 'GET POST'), ('api_planes_abiertos', '/api/planes_abiertos', 'GET'),
+    ('consulta_abonos', '/consulta/abonos', 'GET'), ('consulta_planes', '/consulta/planes', 'GET'),
+    ('eliminar_abono', '/abonos/1/eliminar', 'POST'), ('eliminar_plan', '/planes/1/eliminar', 'POST'),
+]
+
+
+# ---------------------------------------------
+# Rutas: mismas URLs y nombres viejos para url_for
+# ---------------------------------------------
+def test_endpoints_legacy_construyen_la_misma_url(app):
+    adaptador = app.url_map.bind('localhost')
+    reglas = {r.endpoint: r for r in app.url_map.iter_rules()}
+    with app.test_request_context():
+        for endpoint, url, metodos in RUTAS_LEGACY:
+            args = {k: 1 for k in reglas[endpoint].arguments}
+            assert url_for(endpoint, **args) == url, endpoint
+            for metodo in metodos.split():
+                destino, _ = adaptador.match(url, method=metodo)
+                assert destino.endswith('.' + endpoint), (url, metodo, destino)
+
+
+def test_alias_legacy_no_participan_en_el_matching(app):
+    adaptador = app.url_map.bind('localhost')
+    alias = [r for r in app.url_map.iter_rules() if r.build_only]
+    assert alias and all('.' not in r.endpoint for r in alias)
+    assert adaptador.match('/ventas/5')[0] == 'ventas.venta_detalle'     # orden de registro original
+
+
+def test_get_sin_parametros_responden(client):
+    for endpoint, url, metodos in RUTAS_LEGACY:
+        if 'GET' in metodos and '/1' not in url:
+            assert client.get(url).status_code < 500, url
+
+
+# ---------------------------------------------
+# Arranque
+# ---------------------------------------------
+def test_importar_app_no_carga_blueprints():
+    cargados = subprocess.run(
+        [sys.executable, '-c',
+         "import sys, app; print(sorted(m for m in sys.modules if m.split('.')[0] in ('blueprints', 'cli', 'flask_migrate')))"],
+        cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+    assert cargados == '[]'
+
+
+def test_tiempos_de_arranque_por_blueprint(app):
+    arranque = app.extensions['arranque']
+    assert list(arranque['blueprints_ms']) == list(BLUEPRINTS)
+    assert arranque['total_ms'] >= sum(arranque['blueprints_ms'].values())
+    assert 'migrate' not in app.extensions                             # migraciones=False
+    res = app.test_cli_runner().invoke(args=['arranque-tiempos'])
+    assert res.exit_code == 0 and 'ventas' in res.output
@@ -0,0 +1,183 @@
+# tests/test_billing_utils.py
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+from billing_utils import money, to_cents, pct_cents, sum_money, compute_full_net
+
+
+def _money_anterior(value):
+    """money() previo a to_cents (Decimal(str(x)) half-up), como referencia."""
+    if value is None:
+        return 0.0
+    try:
+        q = Decimal(str(value))
+    except Exception:
+        q = Decimal("0")
+    return float(q.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+# ---------------------------------------------
+# money(): mismo resultado que la versión anterior
+# ---------------------------------------------
+@pytest.mark.parametrize('valor', [
+    0.005, 0.015, 0.025, 1.005, 1.015, 2.675, 8.345, 10.005, 0.125, 0.135,
+    -0.005, -0.015, -2.675, -1.005,
+    12172.555, 1234567.895, 99999999.995, 0.0049999, 0.0050001,
+    1e-9, -1e-9, 0.1 + 0.2, 1.1 * 3,
+    '0.335', '2.675', '-2.675', Decimal('1.005'), Decimal('-0.125'),
+    0, 7, -3, None,
+])
+def test_money_igual_al_anterior_en_medios_centavos(valor):
+    assert money(valor) == _money_anterior(valor)
+
+
+def test_money_igual_al_anterior_en_barrido_de_milesimas():
+    for k in range(-200000, 200001, 7):
+        v = k / 1000
+        assert money(v) == _money_anterior(v), v
+
+
+def test_money_no_numericos():
+    # Antes: str inválido → Decimal('0'); NaN/inf no se podían cuantizar y ahora valen 0
+    assert money('abc') == _money_anterior('abc') == 0.0
+    assert money(float('nan')) == 0.0 and money(float('inf')) == 0.0
+
+
+# ---------------------------------------------
+# Porcentajes y sumas: half-up exacto (cambio intencional)
+# ---------------------------------------------
+def test_porcentaje_en_medio_centavo_redondea_hacia_arriba():
+    # compute_full_net anterior: money(subtotal * (pct / 100.0)) → 1217.2549999… → 1217.25
+    assert _money_anterior(12172.55 * (10 / 100.0)) == 1217.25
+    assert pct_cents(to_cents(12172.55), 10) == 121726
+    assert pct_cents(to_cents(0.05), 10) == 1          # 0.005 → 0.01
+    assert pct_cents(-105, 10) == -11                   # lejos de cero, como ROUND_HALF_UP
+
+
+@pytest.mark.parametrize('monto, pct', [(199.99, 15), (1250.5, 7.5), (0.99, 33.333), (350, 12.5)])
+def test_porcentaje_igual_a_decimal_exacto(monto, pct):
+    exacto = (Decimal(str(monto)) * Decimal(str(pct)) / 100).quantize(Decimal('0.01'), ROUND_HALF_UP)
+    assert pct_cents(to_cents(monto), pct) / 100 == float(exacto)
+
+
+def test_sumas_en_centavos_sin_deriva():
+    valores = [0.1] * 10 + [0.2] * 5
+    assert sum(valores) != 2.0 and sum_money(valores) == 2.0
+    assert sum_money([12.5, '0.335', None, 19.99]) == 32.83
+
+
+def test_subtotal_redondea_el_producto_no_el_unitario():
+    # Igual que antes: money(unit * q). Redondear el unitario primero daría 0.39 / 3.03
+    assert compute_full_net(0.125, 3)['subtotal'] == _money_anterior(0.125 * 3) == 0.38
+    assert compute_full_net(1.005, 3)['subtotal'] == _money_anterior(1.005 * 3) == 3.01
+    assert compute_full_net('0.125', 3)['neto'] == 0.38
+
+
+# ---------------------------------------------
+# compute_full_net_batch: idéntico al escalar fila por fila
+# ---------------------------------------------
+def _casos_lote(n=400, semilla=13):
+    import random
+    from datetime import date, timedelta
+    rnd = random.Random(semilla)
+    precios = [0.005, 0.015, 2.675, 12172.55, 199.99, 350, Decimal('1250.50'), '99.995', None, 0]
+    conds = [None, '', '[]', '["efectivo","tarjeta"]', 'transferencia; deposito', ['tarjeta'], 'null']
+    hoy = date(2026, 3, 15)
+    hastas = [None, hoy, hoy - timedelta(days=1), hoy + timedelta(days=1), '2026-03-20', '2026-03-01T10:00', 'x']
+    filas = []
+    for _ in range(n):
+        filas.append(dict(
+            unit_price=rnd.choice(precios + [round(rnd.uniform(0, 5000), rnd.choice([2, 3]))]),
+            qty=rnd.choice([1, 2, 3, 0, None]),
+            discount_pct=rnd.choice([0, 5, 10, 12.5, 33.333, 100, 150]),
+            discount_methods=rnd.choice(conds),
+            discount_valid_until=rnd.choice(hastas),
+            surcharge_pct=rnd.choice([0, 5, 7.5, 10]),
+            surcharge_day_cut=rnd.choice([0, 10, 15, 20]),
+            method_norm=rnd.choice(['efectivo', 'tarjeta', 'deposito', '', 'TARJETA']),
+        ))
+    return filas, hoy
+
+
+def _lote(filas, hoy, surcharge_on):
+    from billing_utils import compute_full_net_batch
+    col = lambda k: [f[k] for f in filas]
+    return compute_full_net_batch(
+        col('unit_price'), col('qty'),
+        discount_pcts=col('discount_pct'), discount_methods=col('discount_methods'),
+        discount_valid_until=col('discount_valid_until'), surcharge_pcts=col('surcharge_pct'),
+        surcharge_day_cuts=col('surcharge_day_cut'), method_norm=col('method_norm'),
+        today=hoy, surcharge_on=surcharge_on)
+
+
+@pytest.mark.parametrize('con_numpy', [True, False])
+@pytest.mark.parametrize('surcharge_on', ['post_discount', 'subtotal'])
+def test_lote_igual_al_escalar(monkeypatch, con_numpy, surcharge_on):
+    import billing_utils
+    from billing_utils import compute_full_net
+    if con_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(billing_utils, 'np', None)
+    filas, hoy = _casos_lote()
+
+    res = _lote(filas, hoy, surcharge_on)
+
+    for i, f in enumerate(filas):
+        esc = compute_full_net(**f, today=hoy, surcharge_on=surcharge_on)
+        for k in ('subtotal', 'descuento', 'recargo', 'neto', 'aplico_descuento', 'aplico_recargo'):
+            assert res[k][i] == esc[k], (i, k, f)
+
+
+def test_lote_escalares_se_difunden_y_longitud_se_valida():
+    from datetime import date
+    from billing_utils import compute_full_net_batch
+    res = compute_full_net_batch([100, 200.5], 2, discount_pcts=10, discount_methods='efectivo',
+                                 method_norm='efectivo', today=date(2026, 3, 15))
+    assert res['neto'] == [180.0, 360.9] and res['aplico_descuento'] == [True, True]
+    assert compute_full_net_batch([])['neto'] == []
+    with pytest.raises(ValueError):
+        compute_full_net_batch([100, 200], [1, 2, 3])
+
+
+# ---------------------------------------------
+# Condiciones: parseo memoizado por texto
+# ---------------------------------------------
+@pytest.mark.parametrize('crudo, esperado', [
+    ('["Efectivo", " tarjeta "]', ['efectivo', 'tarjeta']),
+    ('efectivo, tarjeta;transferencia|deposito', ['efectivo', 'tarjeta', 'transferencia', 'deposito']),
+    ('"tarjeta"', ['tarjeta']),
+    (['Tarjeta', ' '], ['tarjeta']),
+    (None, []), ('', []), ('[]', []), ('{}', []), ('null', []), ('None', []), ('{"a": 1}', []),
+])
+def test_parse_conditions_formatos(crudo, esperado):
+    from billing_utils import parse_conditions, conditions_set
+    assert parse_conditions(crudo) == esperado
+    assert conditions_set(crudo) == frozenset(esperado)
+
+
+def test_condiciones_se_parsean_una_vez_por_texto():
+    import billing_utils
+    from billing_utils import parse_conditions, method_allowed
+    billing_utils._conditions_from_text.cache_clear()
+    billing_utils._conditions_set_from_text.cache_clear()
+    crudo = '["efectivo","tarjeta"]'
+
+    primera = parse_conditions(crudo)
+    primera.append('mutada')                         # la lista devuelta es copia, no la del caché
+    assert parse_conditions(crudo) == ['efectivo', 'tarjeta']
+    assert method_allowed(crudo, 'TARJETA') and not method_allowed(crudo, 'deposito')
+    assert method_allowed('[]', 'deposito') and method_allowed(None, '')
+
+    info = billing_utils._conditions_from_text.cache_info()
+    assert info.misses == 2 and info.hits >= 2         # crudo y '[]'; el resto sale del caché
+
+
+def test_pago_usa_las_condiciones_cacheadas(app):
+    from tests import datos
+    p = datos.pago('Mensualidad', 500, Pago_Condiciones='efectivo; tarjeta')
+    assert p.condiciones_lista() == ['efectivo', 'tarjeta']
+    assert p.acepta_metodo('efectivo') and not p.acepta_metodo('transferencia')
+    p.Pago_Condiciones = 'transferencia'             # otro texto → otra llave, sin invalidar nada
+    assert p.acepta_metodo('transferencia') and not p.acepta_metodo('efectivo')
@@ -0,0 +1,131 @@
+# tests/test_busqueda.py
+from sqlalchemy import text
+
+from extensions import db
+from models import Estudiante
+from busqueda_utils import crear_fts, fts_disponible, ids_fts, buscar_clientes, choices_cliente
+from tests import datos
+
+
+def _ids(tipo, q, **kw):
+    return sorted(db.session.execute(ids_fts(tipo, q, **kw)).scalars())
+
+
+# ---------------------------------------------
+# Índice FTS5: triggers y columnas
+# ---------------------------------------------
+def test_triggers_mantienen_el_indice(app):
+    e = datos.estudiante('José', apellido='Núñez')
+    db.session.commit()
+    assert crear_fts() == 2 and fts_disponible()       # estudiante + su tutor
+    db.session.commit()
+
+    otra = datos.estudiante('Ana', tutor_obj=db.session.get(Estudiante, e.Est_ID).tutor, apellido='Pérez')
+    db.session.commit()
+    assert _ids('estudiante', 'nunez jo') == [e.Est_ID]
+    assert _ids('estudiante', 'perez') == [otra.Est_ID]
+
+    otra.Est_ApellidoP = 'Gómez'
+    db.session.commit()
+    assert _ids('estudiante', 'perez') == [] and _ids('estudiante', 'gomez') == [otra.Est_ID]
+
+    db.session.delete(otra)
+    db.session.commit()
+    assert _ids('estudiante', 'gomez') == []
+
+
+def test_colegio_solo_con_secundario(app):
+    e = datos.estudiante('Mía', apellido='Ríos')
+    e.Est_Colegio = 'Colegio Montessori'
+    db.session.commit()
+    crear_fts()
+    db.session.commit()
+
+    assert _ids('estudiante', 'montessori') == []
+    assert _ids('estudiante', 'montessori', secundario=True) == [e.Est_ID]
+    assert _ids('estudiante', 'rios', secundario=True) == [e.Est_ID]
+
+
+def test_indice_de_una_columna_se_ignora_hasta_reinicializar(app):
+    import busqueda_utils
+    db.session.execute(text("CREATE VIRTUAL TABLE busqueda_fts USING fts5(texto)"))
+    db.session.commit()
+    busqueda_utils._fts_ok = None
+    assert not fts_disponible() and ids_fts('estudiante', 'ana') is None
+
+    crear_fts()
+    db.session.commit()
+    assert fts_disponible()
+
+
+def test_indice_creado_por_otro_proceso_se_detecta(app):
+    from sqlalchemy import create_engine
+    import busqueda_utils
+    datos.estudiante('Mía', apellido='Ríos')
+    db.session.commit()
+    assert not fts_disponible()
+    db.session.commit()
+
+    otro = create_engine(db.engine.url)                  # p.ej. `flask busqueda-fts-init` aparte
+    with otro.begin() as conn:
+        for stmt in busqueda_utils._ddl_fts():
+            conn.execute(text(stmt))
+    otro.dispose()
+
+    assert fts_disponible()
+
+
+def test_consulta_ventas_no_busca_por_colegio(app):
+    from blueprints.ventas import _consulta_ventas_query
+    e = datos.estudiante('Mía', apellido='Ríos')
+    e.Est_Colegio = 'Colegio Ríos del Valle'
+    otra = datos.estudiante('Valle', apellido='Luna', tutor_obj=e.tutor)
+    v1 = datos.venta(est=e)
+    v2 = datos.venta(est=otra)
+    db.session.commit()
+    crear_fts()
+    db.session.commit()
+
+    with app.test_request_context('/consulta/ventas?q=valle'):
+        query, _ = _consulta_ventas_query()
+        assert [v.Venta_ID for v in query.all()] == [v2.Venta_ID]
+
+
+
+# ---------------------------------------------
+# Typeahead
+# ---------------------------------------------
+def test_buscar_clientes_por_prefijo_sin_acentos(app):
+    t = datos.tutor()
+    a = datos.estudiante('Ángela', tutor_obj=t, apellido='Ruiz')
+    b = datos.estudiante('Ana', tutor_obj=t, apellido='Zapata')
+    datos.estudiante('Bruno', tutor_obj=t, apellido='Ana')
+    db.session.commit()
+
+    res = buscar_clientes('an', tipo='estudiante')
+    assert [r['id'] for r in res] == [b.Est_ID, a.Est_ID]     # 'ana zapata' < 'angela ruiz'
+    assert res[1]['nombre'] == 'Ángela Ruiz'
+    assert len(buscar_clientes('', limit=2)) == 2
+
+
+def test_api_clientes_buscar_mezcla_tipos_con_limite(client):
+    est = datos.estudiante('Clara', apellido='Ríos')
+    inst = datos.instructor('Claudia', 'Núñez')
+    db.session.commit()
+
+    r = client.get('/api/clientes/buscar?q=CLA&limit=5')
+    assert r.status_code == 200
+    assert [(x['tipo'], x['id']) for x in r.json['resultados']] == [('estudiante', est.Est_ID),
+                                                                    ('instructor', inst.Instructor_ID)]
+    assert client.get('/api/clientes/buscar?q=cla&limit=1').json['resultados'] == [
+        {'id': est.Est_ID, 'tipo': 'estudiante', 'nombre': 'Clara Ríos'}]
+    assert client.get('/api/clientes/buscar?q=claudia nu&tipo=instructor').json['resultados'][0]['nombre'] == \
+        'Claudia Núñez'
+
+
+def test_choices_cliente_solo_el_seleccionado(app):
+    est = datos.estudiante('Mía', apellido='Ríos')
+    db.session.commit()
+
+    assert choices_cliente('estudiante', est.Est_ID) == [(0, '— Selecciona —'), (est.Est_ID, 'Mía Ríos')]
+    assert choices_cliente('estudiante', 'x') == [(0, '— Selecciona —')]
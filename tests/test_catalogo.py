@@ -0,0 +1,78 @@
+# tests/test_catalogo.py
+from extensions import db
+from models import Articulo
+from catalogo_utils import catalogo_ventas, version_actual, KEY_SEP
+from inventario_utils import aplicar_movimientos, reponer_stock
+from tests import datos
+
+
+def test_existencias_en_vivo_sin_subir_version(app):
+    a = datos.articulo(tallas={'CH': 2})
+    s = datos.articulo('Zapatilla', existencia=5)
+    db.session.commit()
+    v0 = version_actual()
+    snap = catalogo_ventas(existencias=False)
+
+    reponer_stock(s.Articulo_ID, None, 3)
+    aplicar_movimientos([(a.Articulo_ID, 'CH', 4)])
+    db.session.get(Articulo, s.Articulo_ID).Articulo_Existencia = 1   # edición ORM solo de existencia
+    db.session.commit()
+
+    assert version_actual() == v0
+    assert catalogo_ventas(existencias=False) is snap                 # el snapshot sigue vigente
+    arts = catalogo_ventas()['articulos_dict']
+    assert arts[f"{a.Articulo_ID}{KEY_SEP}CH"]['Existencia'] == 6
+    assert arts[f"{s.Articulo_ID}"]['Existencia'] == 1
+    assert 'Existencia' not in snap['articulos_dict'][f"{s.Articulo_ID}"]
+
+
+def test_cambios_de_definicion_suben_version(app):
+    a = datos.articulo(tallas={'CH': 2})
+    db.session.commit()
+    v0 = version_actual()
+
+    db.session.get(Articulo, a.Articulo_ID).Articulo_PrecioVenta = 150
+    db.session.commit()
+    v1 = version_actual()
+    assert v1 > v0
+    assert catalogo_ventas()['articulos_dict'][f"{a.Articulo_ID}{KEY_SEP}CH"]['Precio'] == 150.0
+
+    aplicar_movimientos([(a.Articulo_ID, 'G', 1)])   # talla nueva = opción nueva
+    db.session.commit()
+    assert version_actual() > v1
+    assert f"{a.Articulo_ID}{KEY_SEP}G" in catalogo_ventas()['articulos_dict']
+
+
+def test_existencias_cacheadas_hasta_el_siguiente_movimiento(app):
+    from sqlalchemy import event
+    a = datos.articulo(tallas={'CH': 2})
+    db.session.commit()
+    primero = catalogo_ventas()
+    sentencias = []
+
+    def _contar(conn, cursor, sql, params, context, executemany):
+        sentencias.append(sql)
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        assert catalogo_ventas() is primero
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+    assert len(sentencias) == 1                                   # solo las versiones
+
+    aplicar_movimientos([(a.Articulo_ID, 'CH', 3)])
+    db.session.commit()
+    segundo = catalogo_ventas()
+    assert segundo is not primero
+    assert segundo['articulos_dict'][f"{a.Articulo_ID}{KEY_SEP}CH"]['Existencia'] == 5
+    assert catalogo_ventas(existencias=False) is catalogo_ventas(existencias=False)
+
+
+def test_tabla_de_version_se_detecta_despues_de_migrar(app):
+    from models import CatalogoVersion
+    CatalogoVersion.__table__.drop(db.engine)
+    assert version_actual() is None
+    db.session.commit()
+
+    CatalogoVersion.__table__.create(db.engine)                   # la migración corre con el proceso vivo
+    assert version_actual() == 0
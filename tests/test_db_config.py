@@ -0,0 +1,106 @@
+# tests/test_db_config.py
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from extensions import db
+from models import Venta
+from db_config import DEFAULT_URL, database_url, engine_options, pragmas_sqlite, mantenimiento_sqlite
+from tests import datos
+
+
+# ---------------------------------------------
+# DATABASE_URL y opciones del motor
+# ---------------------------------------------
+def test_database_url():
+    assert database_url({}) == DEFAULT_URL == database_url({'DATABASE_URL': '  '})
+    assert database_url({'DATABASE_URL': 'postgres://u:p@h/ballet'}) == 'postgresql://u:p@h/ballet'
+    assert database_url({'DATABASE_URL': 'postgresql+psycopg2://h/b'}) == 'postgresql+psycopg2://h/b'
+
+
+def test_engine_options_por_backend():
+    assert engine_options('sqlite:///ballet.db', {'DB_POOL_SIZE': '20'}) == {}
+
+    opts = engine_options('postgresql://h/b', {'DB_POOL_SIZE': '20', 'DB_POOL_TIMEOUT': 'x',
+                                               'DB_STATEMENT_TIMEOUT_MS': '1500'})
+    assert opts == {'pool_size': 20, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 1800,
+                    'pool_pre_ping': True, 'connect_args': {'options': '-c statement_timeout=1500'}}
+    assert 'connect_args' not in engine_options('mysql://h/b', {'DB_STATEMENT_TIMEOUT_MS': '1500'})
+
+
+def test_configurar_bd_desde_el_entorno(app):
+    assert app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:///')
+    assert db.engine.dialect.name == 'sqlite'
+
+
+# ---------------------------------------------
+# Portabilidad a PostgreSQL
+# ---------------------------------------------
+def test_ddl_compila_para_postgresql(app):
+    dialecto = postgresql.dialect()
+    ddl = {t.name: str(CreateTable(t).compile(dialect=dialecto)) for t in db.metadata.sorted_tables}
+
+    assert 'CONSTRAINT ck_plan_estado_minusculas CHECK ("Estado" = lower("Estado"))' in ddl['plan_cobro']
+
+
+def test_filtro_por_metodo_con_exists_no_duplica(app):
+    from blueprints.comun import _aplicar_filtros_ventas
+    est = datos.estudiante()
+    p1 = datos.pago('Mensualidad', 500)
+    p2 = datos.pago('mensualidad', 300)
+    v1 = datos.venta(est=est, pagos=[p1, p2])
+    datos.venta(est=est, pagos=[datos.pago('Inscripción', 200)])
+    db.session.commit()
+
+    with app.test_request_context('/consulta/ventas?metodo=Mensualidad'):
+        q = _aplicar_filtros_ventas(Venta.query)
+        assert [v.Venta_ID for v in q.all()] == [v1.Venta_ID]
+        assert 'DISTINCT' not in str(q.statement.compile(dialect=postgresql.dialect()))
+
+
+# ---------------------------------------------
+# SQLite: PRAGMAs por conexión y mantenimiento
+# ---------------------------------------------
+def test_pragmas_sqlite_por_entorno():
+    assert pragmas_sqlite({}) == {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+                                  'cache_size': -20000, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY'}
+    p = pragmas_sqlite({'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_CACHE_KIB': '8000', 'SQLITE_MMAP_BYTES': '0'})
+    assert (p['journal_mode'], p['cache_size'], p['mmap_size']) == ('DELETE', -8000, 0)
+
+
+def test_conexiones_nuevas_llevan_los_pragmas(app):
+    with db.engine.connect() as conn:
+        leer = lambda nombre: conn.exec_driver_sql(f"PRAGMA {nombre}").scalar()
+        assert leer('journal_mode') == 'wal'
+        assert leer('synchronous') == 1                 # NORMAL
+        assert leer('busy_timeout') == 5000
+        assert leer('cache_size') == -20000
+        assert leer('temp_store') == 2                  # MEMORY
+
+
+def test_mantenimiento_al_devolver_conexion(app, monkeypatch):
+    import db_config
+    llamadas = []
+    monkeypatch.setattr(db_config, 'mantenimiento_sqlite',
+                        lambda conn, checkpoint: llamadas.append(checkpoint))
+    monkeypatch.setitem(db_config._sqlite_cfg, 'cada_s', 3600)
+    monkeypatch.setitem(db_config._sqlite_cfg, 'ultimo', -1e9)
+
+    for _ in range(3):
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+
+    assert llamadas == ['PASSIVE']                      # una vez por intervalo, no por conexión
+
+
+def test_mantenimiento_sqlite_y_comando(app):
+    datos.estudiante()
+    db.session.commit()
+    raw = db.engine.raw_connection()
+    try:
+        busy, wal, copiadas = mantenimiento_sqlite(raw.driver_connection, checkpoint='TRUNCATE')
+    finally:
+        raw.close()
+    assert busy == 0 and wal == copiadas == 0           # TRUNCATE deja vacío el -wal
+
+    res = app.test_cli_runner().invoke(args=['sqlite-mantenimiento'])
+    assert res.exit_code == 0 and 'journal_mode=wal' in res.output
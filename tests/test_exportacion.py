@@ -0,0 +1,95 @@
+# tests/test_exportacion.py
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from extensions import db
+from models import Abono, PlanCobro, Venta
+import export_utils
+from export_utils import stream_csv, respuesta_exportacion
+
+
+def _leer(resp):
+    texto = resp.get_data(as_text=True)
+    assert texto.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(texto[1:])))
+
+
+# ---------------------------------------------
+# Generadores
+# ---------------------------------------------
+def test_stream_csv_por_bloques(monkeypatch):
+    monkeypatch.setattr(export_utils, 'FILAS_POR_BLOQUE', 2)
+    filas = [(1, Decimal('10.50'), datetime(2026, 3, 1, 9, 5), date(2026, 3, 2), None, 'Ñandú, "A"')] * 5
+
+    bloques = list(stream_csv(('id', 'monto', 'fecha', 'dia', 'nada', 'texto'), iter(filas)))
+
+    assert len(bloques) == 3                              # 2 + 2 + 1 (+ encabezado en el primero)
+    renglones = list(csv.reader(io.StringIO(''.join(bloques)[1:])))
+    assert renglones[0] == ['id', 'monto', 'fecha', 'dia', 'nada', 'texto']
+    assert renglones[1] == ['1', '10.5', '2026-03-01 09:05', '2026-03-02', '', 'Ñandú, "A"']
+    assert len(renglones) == 6
+
+
+def test_filas_se_consumen_mientras_se_envia(app):
+    leidas = []
+
+    def _filas():
+        for i in range(3):
+            leidas.append(i)
+            yield (i,)
+
+    with app.test_request_context():
+        resp = respuesta_exportacion('x', 'csv', ('n',), _filas())
+        assert resp.is_streamed and leidas == []
+        assert resp.headers['Content-Disposition'].startswith('attachment; filename="x_')
+        assert ''.join(resp.response) == '\ufeffn\r\n0\r\n1\r\n2\r\n'
+    with pytest.raises(ValueError):
+        respuesta_exportacion('x', 'pdf', ('n',), iter(()))
+
+
+# ---------------------------------------------
+# Rutas de exportación sobre la escuela sembrada
+# ---------------------------------------------
+def test_exportar_ventas_cubre_todas_por_paginas(escuela, monkeypatch):
+    import blueprints.ventas
+    monkeypatch.setattr(blueprints.ventas, 'LOTE_EXPORTACION', 37)
+    c = escuela.test_client()
+
+    renglones = _leer(c.get('/consulta/ventas/exportar'))
+    ids = [int(r[0]) for r in renglones[1:]]
+    assert renglones[0][:2] == ['Venta', 'Fecha'] and len(set(ids)) == len(ids)
+    assert sorted(ids) == sorted(db.session.scalars(select(Venta.Venta_ID)))
+
+    con_filtro = [int(r[0]) for r in _leer(c.get('/consulta/ventas/exportar?tipo=estudiante'))[1:]]
+    assert sorted(con_filtro) == sorted(db.session.scalars(
+        select(Venta.Venta_ID).where(Venta.Est_ID.isnot(None))))
+
+
+def test_exportar_abonos_y_planes(escuela):
+    c = escuela.test_client()
+
+    abonos = _leer(c.get('/consulta/abonos/exportar'))[1:]
+    esperado = db.session.execute(select(Abono.Abono_ID, Abono.Monto_Abonado)
+                                  .order_by(Abono.Fecha_Abono.desc(), Abono.Abono_ID.desc())).all()
+    assert [(int(r[0]), float(r[5])) for r in abonos] == [(a, float(m)) for a, m in esperado]
+
+    planes = _leer(c.get('/consulta/planes/exportar'))[1:]
+    assert sorted(int(r[0]) for r in planes) == sorted(db.session.scalars(select(PlanCobro.Plan_ID)))
+
+
+def test_formato_no_disponible_regresa_a_la_consulta(escuela, monkeypatch):
+    monkeypatch.setattr(export_utils, 'xlsxwriter', None)
+    r = escuela.test_client().get('/consulta/ventas/exportar?formato=xlsx&tipo=estudiante')
+    assert r.status_code == 302
+    assert r.headers['Location'].endswith('/consulta/ventas?tipo=estudiante')
+
+
+def test_exportar_xlsx(escuela):
+    pytest.importorskip('xlsxwriter')
+    r = escuela.test_client().get('/consulta/planes/exportar?formato=xlsx')
+    assert r.status_code == 200 and r.get_data()[:2] == b'PK'
@@ -0,0 +1,83 @@
+# tests/test_generador.py
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Abono, PlanCobro, Venta
+from benchmarks.generador import generar, conteos_para
+from benchmarks.run import comparar, UMBRAL_REGRESION
+from tests.conftest import crear_app_prueba
+
+HOY = date(2026, 3, 15)
+# Tablas que guardan la hora en que se (re)construyeron
+CON_SELLO = {'venta_resumen_diario', 'venta_resumen_cobertura', 'catalogo_version'}
+
+
+def _volcado():
+    """Tablas del modelo ordenadas por PK, como tuplas (sin las que llevan sello de tiempo)."""
+    return {t.name: [tuple(r) for r in db.session.execute(select(t).order_by(*t.primary_key.columns))]
+            for t in db.metadata.sorted_tables if t.name not in CON_SELLO}
+
+
+def _sembrar(ruta, semilla):
+    app = crear_app_prueba(ruta)
+    with app.app_context():
+        filas = generar(200, semilla=semilla, hoy=HOY)
+        volcado = _volcado()
+        db.session.remove()
+        db.engine.dispose()
+    return filas, volcado
+
+
+# ---------------------------------------------
+# Generador: misma semilla + hoy ⇒ mismos datos
+# ---------------------------------------------
+def test_misma_semilla_mismos_datos(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', '')
+    filas_a, a = _sembrar(tmp_path / 'a.db', 7)
+    filas_b, b = _sembrar(tmp_path / 'b.db', 7)
+    _, c = _sembrar(tmp_path / 'c.db', 8)
+
+    assert filas_a == filas_b and a == b
+    assert a['venta'] != c['venta']
+    assert filas_a['tutor'] == conteos_para(200)['tutores']
+
+
+def test_fechas_y_saldos_consistentes(app):
+    generar(300, semilla=3, hoy=HOY)
+    tope = datetime.combine(HOY, datetime.min.time())
+
+    assert db.session.scalar(select(func.max(Venta.Fecha_Venta))) <= tope
+    assert db.session.scalar(select(func.max(Abono.Fecha_Abono))) <= tope
+    assert db.session.scalar(select(func.min(Venta.Fecha_Venta))) >= tope - timedelta(days=731)
+
+    abonado = dict(db.session.execute(select(Abono.Plan_ID, func.sum(Abono.Monto_Abonado))
+                                      .group_by(Abono.Plan_ID)).all())
+    for p in PlanCobro.query:
+        assert float(p.Abonado_Acumulado) == pytest.approx(float(abonado.get(p.Plan_ID, 0)))
+        assert float(p.Saldo_Actual) + float(p.Abonado_Acumulado) == pytest.approx(float(p.Monto_Total_Original))
+        assert p.Estado == ('abierto' if p.Saldo_Actual > 0 else 'liquidado')
+        assert p.Fecha_Ultimo_Abono is None or p.Fecha_Ultimo_Abono <= tope
+
+
+# ---------------------------------------------
+# Comparación de corridas
+# ---------------------------------------------
+def test_comparar_marca_regresiones():
+    previo = {'meta': {'version': 'aaa'},
+              'escalas': {'1000': {'casos': {'consulta_ventas': {'mediana_ms': 10.0, 'consultas': 5},
+                                            'consulta_planes': {'mediana_ms': 10.0, 'consultas': 3}}}}}
+    actual = {'meta': {'version': 'bbb'},
+              'escalas': {'1000': {'casos': {'consulta_ventas': {'mediana_ms': 10.0 * (1 + UMBRAL_REGRESION) + 1,
+                                                                 'consultas': 5},
+                                            'consulta_planes': {'mediana_ms': 9.0, 'consultas': 3},
+                                            'nuevo': {'mediana_ms': 1.0}}},
+                          '10000': {'casos': {}}}}
+
+    renglones = comparar(actual, previo)
+
+    assert renglones[0] == 'Comparando bbb contra aaa' and len(renglones) == 3
+    assert renglones[1].startswith('⚠') and 'consulta_ventas' in renglones[1]
+    assert renglones[2].startswith(' ') and '(-10%)' in renglones[2]
@@ -0,0 +1,96 @@
+# tests/test_idempotencia.py
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect
+
+from extensions import db
+from models import Estudiante, IdempotencyKey, Venta
+from idempotencia_utils import reservar_clave, purgar_vencidas, TTL_PAYLOAD
+from tests import datos
+
+AHORA = datetime(2026, 3, 15, 12, 0)
+
+
+# ---------------------------------------------
+# reservar_clave / purgar_vencidas
+# ---------------------------------------------
+def test_segunda_reserva_vigente_es_reenvio(app):
+    assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+    db.session.commit()
+
+    assert not reservar_clave('venta-form', 'abc', ahora=AHORA + timedelta(hours=1))
+    assert reservar_clave('abonos-form', 'abc', ahora=AHORA)      # otro ámbito, otra llave
+    assert reservar_clave('venta-form', '  ', ahora=AHORA)        # sin clave no se bloquea
+    db.session.commit()
+    assert IdempotencyKey.query.count() == 2
+
+
+def test_llave_vencida_no_bloquea(app):
+    assert reservar_clave('abonos-payload', 'k', ttl=TTL_PAYLOAD, ahora=AHORA)
+    db.session.commit()
+
+    assert reservar_clave('abonos-payload', 'k', ttl=TTL_PAYLOAD, ahora=AHORA + TTL_PAYLOAD)
+    db.session.commit()
+    assert IdempotencyKey.query.one().Expira == AHORA + 2 * TTL_PAYLOAD
+
+
+def test_reenvio_no_descarta_lo_pendiente_en_la_sesion(app):
+    assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+    db.session.commit()
+    est = datos.estudiante()                                   # flush: ya está en la transacción
+
+    assert not reservar_clave('venta-form', 'abc', ahora=AHORA)
+    assert est in db.session and not inspect(est).detached
+    db.session.commit()
+    assert db.session.get(Estudiante, est.Est_ID) is not None
+
+
+def test_sin_tabla_avisa_y_se_activa_al_migrar(app, caplog):
+    IdempotencyKey.__table__.drop(db.engine)
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+        assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+    assert sum('idempotency_key' in m for m in caplog.messages) == 2
+    db.session.commit()
+
+    IdempotencyKey.__table__.create(db.engine)
+    assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+    assert not reservar_clave('venta-form', 'abc', ahora=AHORA)
+
+
+def test_rollback_de_la_venta_libera_la_llave(app):
+    assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+    db.session.rollback()
+    assert reservar_clave('venta-form', 'abc', ahora=AHORA)
+
+
+def test_purgar_vencidas(app):
+    for i, ttl in enumerate([timedelta(minutes=5), timedelta(hours=1), timedelta(days=1)]):
+        reservar_clave('venta-form', f'k{i}', ttl=ttl, ahora=AHORA)
+    db.session.commit()
+
+    assert purgar_vencidas(AHORA + timedelta(hours=1)) == 2
+    db.session.commit()
+    assert IdempotencyKey.query.count() == 1
+
+
+# ---------------------------------------------
+# registro_venta: el mismo form_id no duplica
+# ---------------------------------------------
+def test_registro_venta_con_form_id_repetido(client):
+    est = datos.estudiante()
+    art = datos.articulo(existencia=5)
+    db.session.commit()
+    forma = {'form_id': 'f-123', 'tipo_cliente': 'estudiante', 'estudiante_id': est.Est_ID,
+             'metodo_pago': 'efectivo', 'articulos-0-id': str(art.Articulo_ID), 'articulos-0-qty': '1'}
+
+    r1 = client.post('/registro/venta', data=forma)
+    r2 = client.post('/registro/venta', data=forma)
+
+    assert r1.status_code == r2.status_code == 302
+    assert Venta.query.count() == 1
+    assert IdempotencyKey.query.count() == 1
+    forma['form_id'] = 'f-456'
+    client.post('/registro/venta', data=forma)
+    assert Venta.query.count() == 2
@@ -0,0 +1,85 @@
+# tests/test_importacion.py
+import io
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Tutor, Estudiante, ContactoEmergencia, Grupo
+from importacion_utils import importar_estudiantes, leer_csv
+from tests import datos
+
+ENCABEZADO = ('tutor_nombre,tutor_apellido_paterno,tutor_celular,tutor_edad,tutor_parentesco,'
+              'est_nombre,est_apellido_paterno,est_fecha_nacimiento,est_sexo,grupos,'
+              'contacto1_nombre,contacto1_apellido_paterno,contacto1_telefono,contacto1_parentesco\n')
+
+
+def _csv(*renglones):
+    return leer_csv(io.StringIO(ENCABEZADO + ''.join(r + '\n' for r in renglones)))
+
+
+def _fila(est, cel='5511111111', *, grupos='Baby', fnac='2016-03-01'):
+    return f"Laura,Ríos,{cel},35,Madre,{est},Ríos,{fnac},F,{grupos},Ana,López,5599999999,Tía"
+
+
+def _grupo(nombre='Baby'):
+    g = Grupo(Grupo_Nombre=nombre, Grupo_Horario='16:00', Grupo_Dias='L-M', Grupo_Nivel='Inicial')
+    db.session.add(g)
+    db.session.commit()
+    return g.Grupo_ID
+
+
+def test_lote_con_tutor_compartido_y_repetidos_en_el_archivo(app):
+    gid = _grupo()
+    res = importar_estudiantes(_csv(
+        _fila('Mía'),
+        _fila('Sofía', fnac='18/07/2018'),
+        _fila('Mía'),                                   # mismo renglón que la fila 2
+        _fila('Leo', cel='5522222222', grupos='Baby;Ballet II'),
+        _fila('Eva', cel='5522222222'),
+    ), lote=50)
+
+    assert [(r['fila'], r['estado']) for r in res['filas']] == [
+        (2, 'ok'), (3, 'ok'), (4, 'omitido'), (5, 'error'), (6, 'ok')]
+    assert res['filas'][2]['errores'] == ['repetido en el archivo (fila 2)']
+    assert res['filas'][0]['tutor_id'] == res['filas'][1]['tutor_id'] != res['filas'][4]['tutor_id']
+    assert Tutor.query.count() == 2 and Estudiante.query.count() == 3
+    assert ContactoEmergencia.query.count() == 3
+    mia = db.session.get(Estudiante, res['filas'][0]['est_id'])
+    assert [g.Grupo_ID for g in mia.grupos] == [gid]
+    assert mia.Est_NombreBusqueda == 'mia rios' and mia.Est_Status == 'Activo'
+
+    # Reimportar el mismo archivo no duplica
+    res2 = importar_estudiantes(_csv(_fila('Mía'), _fila('Sofía', fnac='2018-07-18')))
+    assert [r['estado'] for r in res2['filas']] == ['omitido', 'omitido']
+    assert res2['filas'][0]['errores'] == ['ya existe (mismo nombre, fecha y tutor)']
+
+
+def test_inserta_en_bloque_sin_consultas_por_fila(app):
+    _grupo()
+    datos.tutor(celular='5533333333')
+    db.session.commit()
+    sentencias = []
+
+    def _contar(conn, cursor, sql, params, context, executemany):
+        if sql.lstrip().upper().startswith('INSERT'):
+            sentencias.append(sql.split('(')[0].strip())
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        res = importar_estudiantes(_csv(*[_fila(f'Alumna{i}', cel=f'55000000{i:02d}') for i in range(30)],
+                                        _fila('Hermana', cel='5533333333')), lote=100)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+
+    assert res['resumen']['ok'] == 31
+    # tutor, estudiante, contacto, estudiante_grupo: un INSERT de varias filas cada uno
+    assert len(sentencias) == 4
+
+
+def test_validar_solo_no_deja_filas(app):
+    _grupo()
+    res = importar_estudiantes(_csv(_fila('Mía'), _fila('Leo', cel='123')), validar_solo=True)
+
+    assert [r['estado'] for r in res['filas']] == ['ok', 'error']
+    assert res['filas'][0]['est_id'] is None
+    assert Tutor.query.count() == 0 and Estudiante.query.count() == 0
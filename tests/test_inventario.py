@@ -0,0 +1,203 @@
+# tests/test_inventario.py
+import time
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from models import Articulo, MovimientoInventario, InventarioSnapshot
+from catalogo_utils import version_actual
+from inventario_utils import (
+    aplicar_movimientos, MovimientoInvalido, descontar_stock_lote, StockInsuficiente,
+    reponer_stock, tomar_snapshot, existencia_en, migrar_tallas_json, variantes_por_articulo,
+    sincronizar_variantes, existencia_disponible,
+)
+from tests import datos
+
+
+# ---------------------------------------------
+# Recepción / ajuste en lote
+# ---------------------------------------------
+def test_recepcion_suma_tallas_y_total_y_deja_bitacora(app):
+    a = datos.articulo(tallas={'CH': 2, 'M': 1})
+    s = datos.articulo('Zapatilla', existencia=5)
+    db.session.commit()
+
+    res = aplicar_movimientos([(a.Articulo_ID, 'CH', 3), (a.Articulo_ID, 'G', 4),
+                               (s.Articulo_ID, None, 10), (a.Articulo_ID, 'CH', 1)],
+                              referencia='F-1')
+    db.session.commit()
+
+    assert res['movimientos'] == 4 and res['articulos'] == 2 and res['piezas'] == 18
+    a = db.session.get(Articulo, a.Articulo_ID)
+    assert a.tallas_disponibles() == {'CH': 6, 'M': 1, 'G': 4}
+    assert a.Articulo_Existencia == 11
+    assert db.session.get(Articulo, s.Articulo_ID).Articulo_Existencia == 15
+    movs = MovimientoInventario.query.filter_by(Lote=res['lote']).all()
+    assert len(movs) == 4 and {m.Referencia for m in movs} == {'F-1'}
+
+
+def test_renglones_invalidos_no_escriben_nada(app):
+    a = datos.articulo(tallas={'CH': 2})
+    s = datos.articulo('Zapatilla', existencia=1)
+    db.session.commit()
+
+    with pytest.raises(MovimientoInvalido) as ex:
+        aplicar_movimientos([(a.Articulo_ID, 'CH', 5), (999, None, 1), (a.Articulo_ID, None, 1),
+                             (s.Articulo_ID, 'M', 1), (s.Articulo_ID, None, -2), (a.Articulo_ID, 'CH', 0)])
+    db.session.rollback()
+
+    assert [e['renglon'] for e in ex.value.errores] == [2, 3, 4, 5, 6]
+    assert db.session.get(Articulo, a.Articulo_ID).tallas_disponibles() == {'CH': 2}
+    assert MovimientoInventario.query.count() == 0
+
+
+def test_salida_con_talla_en_articulo_sin_variantes_es_error_por_renglon(app):
+    # Tipo de talla declarado pero sin variantes: la talla no existe y el total quedaría negativo
+    a = datos.articulo('Malla', existencia=1, tipo='talla')
+    db.session.commit()
+
+    with pytest.raises(MovimientoInvalido) as ex:
+        aplicar_movimientos([(a.Articulo_ID, 'M', -5)], tipo='ajuste')
+    db.session.rollback()
+
+    assert ex.value.errores == [{'renglon': 1, 'articulo_id': a.Articulo_ID, 'talla': 'M',
+                                 'error': 'la talla no existe'}]
+
+
+def test_api_movimientos_responde_422_con_errores(client):
+    a = datos.articulo('Malla', existencia=1, tipo='talla')
+    db.session.commit()
+
+    r = client.post('/api/inventario/movimientos',
+                    json={'tipo': 'ajuste', 'items': [{'articulo_id': a.Articulo_ID, 'talla': 'M', 'delta': -5},
+                                                      {'articulo_id': a.Articulo_ID, 'delta': -3}]})
+
+    assert r.status_code == 422
+    assert [(e['renglon'], e['error']) for e in r.json['errores']] == [
+        (1, 'la talla no existe'), (2, 'existencia insuficiente (1 disponibles)')]
+
+
+# ---------------------------------------------
+# Descuento en lote (registro_venta)
+# ---------------------------------------------
+def test_descuento_en_lote_suma_lineas_repetidas(app):
+    a = datos.articulo(tallas={'CH': 3, 'M': 1})
+    s = datos.articulo('Zapatilla', existencia=2)
+    db.session.commit()
+    v0 = version_actual()
+
+    descontar_stock_lote([(a.Articulo_ID, 'CH', 1), (a.Articulo_ID, 'CH', 2), (s.Articulo_ID, None, 2)])
+    db.session.commit()
+
+    a = db.session.get(Articulo, a.Articulo_ID)
+    assert a.tallas_disponibles() == {'CH': 0, 'M': 1} and a.Articulo_Existencia == 1
+    assert db.session.get(Articulo, s.Articulo_ID).Articulo_Existencia == 0
+    assert version_actual() == v0      # la venta no toca la fila de versión del catálogo
+
+
+def test_descuento_en_lote_sin_stock_reporta_faltantes(app):
+    a = datos.articulo(tallas={'CH': 1})
+    db.session.commit()
+
+    with pytest.raises(StockInsuficiente) as ex:
+        descontar_stock_lote([(a.Articulo_ID, 'CH', 1), (a.Articulo_ID, 'CH', 1)])
+    db.session.rollback()
+
+    assert [(f['talla'], f['solicitado'], f['disponible']) for f in ex.value.faltantes] == [('CH', 2, 1)]
+    assert db.session.get(Articulo, a.Articulo_ID).tallas_disponibles() == {'CH': 1}
+
+
+# ---------------------------------------------
+# Bitácora y existencia a una fecha pasada
+# ---------------------------------------------
+def _momento():
+    time.sleep(0.01)
+    t = datetime.now()
+    time.sleep(0.01)
+    return t
+
+
+def test_existencia_en_con_y_sin_snapshot(app):
+    a = datos.articulo(tallas={'CH': 10})
+    db.session.commit()
+    t0 = _momento()
+    aplicar_movimientos([(a.Articulo_ID, 'CH', 5)])
+    db.session.commit()
+    t1 = _momento()
+    tomar_snapshot()
+    db.session.commit()
+    descontar_stock_lote([(a.Articulo_ID, 'CH', 2)], venta_id=77)
+    db.session.commit()
+    t2 = _momento()
+    reponer_stock(a.Articulo_ID, 'CH', 1, venta_id=77)
+    db.session.commit()
+    t3 = _momento()
+
+    esperado = [10, 15, 13, 14]
+    assert [existencia_en(a.Articulo_ID, 'CH', t) for t in (t0, t1, t2, t3)] == esperado
+    # Sin snapshots: se reconstruye hacia atrás desde la existencia actual
+    db.session.execute(InventarioSnapshot.__table__.delete())
+    assert [existencia_en(a.Articulo_ID, 'CH', t) for t in (t0, t1, t2, t3)] == esperado
+    assert [m.Tipo for m in MovimientoInventario.query.filter_by(Venta_ID=77)] == ['venta', 'cancelacion']
+
+
+def test_borrar_articulo_conserva_bitacora(client):
+    # Sin FK no hay ON DELETE CASCADE posible en ningún motor
+    assert not MovimientoInventario.__table__.c.Articulo_ID.foreign_keys
+    assert not InventarioSnapshot.__table__.c.Articulo_ID.foreign_keys
+    a = datos.articulo('Zapatilla', existencia=4)
+    db.session.commit()
+    aid = a.Articulo_ID
+    aplicar_movimientos([(aid, None, 2)])
+    tomar_snapshot()
+    db.session.commit()
+    antes = _momento()
+
+    r = client.post(f'/eliminar_variante/{aid}', data={'talla_numero': '-'})
+
+    assert r.status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Articulo, aid) is None
+    assert [m.Cantidad for m in MovimientoInventario.query.filter_by(Articulo_ID=aid)] == [2, -6]
+    assert InventarioSnapshot.query.filter_by(Articulo_ID=aid).count() == 1
+    assert existencia_en(aid, None, antes) == 6
+    assert existencia_en(aid, None, datetime.now()) == 0
+
+
+# ---------------------------------------------
+# Variantes por talla (antes JSON en Articulo_Tallas)
+# ---------------------------------------------
+def test_migrar_tallas_json_a_variantes(app):
+    con_exist = Articulo(Articulo_Nombre='Leotardo', Articulo_PrecioVenta=100, Articulo_Existencia=0,
+                         Articulo_TipoTalla='talla', Articulo_Tallas='{"CH": 2, "M": 3}')
+    solo_lista = Articulo(Articulo_Nombre='Malla', Articulo_PrecioVenta=80, Articulo_Existencia=7,
+                          Articulo_TipoTalla='talla', Articulo_Tallas='["4", "6"]')
+    roto = Articulo(Articulo_Nombre='Falda', Articulo_PrecioVenta=90, Articulo_Existencia=1,
+                    Articulo_TipoTalla='talla', Articulo_Tallas='{CH: 1')
+    db.session.add_all([con_exist, solo_lista, roto])
+    db.session.commit()
+
+    stats = migrar_tallas_json()
+    db.session.commit()
+
+    assert stats == {'articulos': 2, 'variantes': 4, 'sin_existencias': 1, 'omitidos': 0, 'invalidos': 1}
+    assert variantes_por_articulo([con_exist.Articulo_ID, solo_lista.Articulo_ID]) == {
+        con_exist.Articulo_ID: [('CH', 2), ('M', 3)], solo_lista.Articulo_ID: [('4', 0), ('6', 0)]}
+    assert db.session.get(Articulo, con_exist.Articulo_ID).Articulo_Existencia == 5
+    assert db.session.get(Articulo, solo_lista.Articulo_ID).Articulo_Existencia == 7   # conserva el total
+    # Idempotente: la segunda corrida no toca lo ya migrado
+    assert migrar_tallas_json()['omitidos'] == 2
+
+
+def test_sincronizar_variantes_y_existencia_disponible(app):
+    a = datos.articulo(tallas={'CH': 2, 'M': 1})
+    db.session.commit()
+
+    sincronizar_variantes(a, {'M': 4, 'G': 1, ' ': 9})
+    db.session.commit()
+
+    a = db.session.get(Articulo, a.Articulo_ID)
+    assert a.tallas_disponibles() == {'M': 4, 'G': 1} and a.Articulo_Existencia == 5
+    assert existencia_disponible(a, 'G') == 1 and existencia_disponible(a, 'CH') == 0
+    assert existencia_disponible(a, None) == 5
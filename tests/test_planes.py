@@ -0,0 +1,270 @@
+# tests/test_planes.py
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlalchemy.exc import IntegrityError
+
+import plan_utils
+from extensions import db
+from models import PlanCobro, Abono, Liquidacion, Venta
+from plan_utils import (
+    find_open_plan, find_open_plans, normalizar_estados, liquidar_planes_abiertos,
+    registrar_abono, sum_abonos_plan, verificar_abonado_acumulado, get_or_create_plans, get_or_create_plan,
+)
+from tests import datos
+
+
+# ---------------------------------------------
+# Estado en minúsculas
+# ---------------------------------------------
+def test_estado_se_guarda_en_minusculas(app):
+    est = datos.estudiante()
+    pl = datos.plan(est, estado='Abierto ')
+    db.session.commit()
+
+    assert db.session.execute(text("SELECT Estado FROM plan_cobro")).scalar() == 'abierto'
+    assert find_open_plan(est.Est_ID, pago_id=pl.Pago_ID).Plan_ID == pl.Plan_ID
+
+    pl.Estado = 'LIQUIDADO'
+    db.session.commit()
+    assert db.session.get(PlanCobro, pl.Plan_ID).Estado == 'liquidado'
+    assert find_open_plan(est.Est_ID, pago_id=pl.Pago_ID) is None
+
+
+def test_check_rechaza_mayusculas_fuera_del_orm(app):
+    datos.plan(datos.estudiante())
+    db.session.commit()
+
+    with pytest.raises(IntegrityError):
+        db.session.execute(text("UPDATE plan_cobro SET Estado = 'Abierto'"))
+    db.session.rollback()
+
+
+def test_normalizar_estados_de_filas_previas(app):
+    est = datos.estudiante()
+    a = datos.plan(est)
+    b = datos.plan(est)
+    db.session.commit()
+    # Filas capturadas antes del CHECK
+    db.session.execute(text("PRAGMA ignore_check_constraints = ON"))
+    db.session.execute(text("UPDATE plan_cobro SET Estado = 'ABIERTO ' WHERE Plan_ID = :i"), {'i': a.Plan_ID})
+    db.session.execute(text("UPDATE plan_cobro SET Estado = 'Liquidado' WHERE Plan_ID = :i"), {'i': b.Plan_ID})
+    db.session.commit()
+    db.session.execute(text("PRAGMA ignore_check_constraints = OFF"))
+    assert find_open_plans([(est.Est_ID, 'pago', a.Pago_ID)]) == {}
+
+    assert normalizar_estados() == 2
+    db.session.commit()
+
+    assert sorted(db.session.execute(text("SELECT Estado FROM plan_cobro")).scalars()) == ['abierto', 'liquidado']
+    assert normalizar_estados() == 0
+    assert {k: p.Plan_ID for k, p in find_open_plans([(est.Est_ID, 'pago', a.Pago_ID),
+                                                      (est.Est_ID, 'pago', b.Pago_ID)]).items()} == {
+        (est.Est_ID, 'pago', a.Pago_ID): a.Plan_ID}
+
+
+# ---------------------------------------------
+# Planes por lote (registro_abonos con varias líneas)
+# ---------------------------------------------
+def test_get_or_create_plans_una_consulta_y_specs_repetidas_comparten_plan(app):
+    est = datos.estudiante()
+    otro = datos.estudiante('Leo', tutor_obj=est.tutor)
+    colegiatura = datos.pago('Colegiatura', 800)
+    vestuario = datos.pago('Vestuario', 350)
+    previo = datos.plan(est, concepto=colegiatura, total=800)
+    db.session.commit()
+    consultas = []
+
+    def _contar(conn, cursor, sql, params, context, executemany):
+        if sql.lstrip().upper().startswith('SELECT') and 'plan_cobro' in sql:
+            consultas.append(sql)
+
+    event.listen(db.engine, 'before_cursor_execute', _contar)
+    try:
+        res = get_or_create_plans([
+            {'est_id': est.Est_ID, 'pago_obj': colegiatura},
+            {'est_id': est.Est_ID, 'pago_obj': vestuario, 'qty': 2},
+            {'est_id': est.Est_ID, 'pago_obj': vestuario, 'qty': 2},
+            {'est_id': otro.Est_ID, 'pago_obj': colegiatura},
+        ])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _contar)
+
+    assert len(consultas) == 1
+    assert [creado for _p, creado in res] == [False, True, False, True]
+    assert res[0][0].Plan_ID == previo.Plan_ID and res[1][0] is res[2][0]
+    assert float(res[1][0].Monto_Total_Original) == 700.0 and res[1][0].Descripcion_Resumen == 'Vestuario x2'
+    assert res[3][0].Est_ID == otro.Est_ID
+    assert get_or_create_plan(est.Est_ID, pago_obj=vestuario) == (res[1][0], False)
+
+
+def test_registro_abonos_resuelve_planes_en_el_orden_capturado(client):
+    est = datos.estudiante()
+    primero_full = datos.pago('Colegiatura', 800)       # [full, parcial]: el full no tiene plan que liquidar
+    primero_parcial = datos.pago('Vestuario', 350)      # [parcial, full]: el full liquida el plan recién abierto
+    db.session.commit()
+    est_id, a_id, b_id = est.Est_ID, primero_full.Pago_ID, primero_parcial.Pago_ID
+
+    r = client.post('/registro/abonos', data={
+        'estudiante_id': est_id, 'metodo_pago': 'efectivo', 'form_id': 'orden-1',
+        'pagos-0-id': a_id, 'pagos-0-full': 'on',
+        'pagos-1-id': a_id, 'pagos-1-monto-parcial': '100',
+        'pagos-2-id': b_id, 'pagos-2-monto-parcial': '50',
+        'pagos-3-id': b_id, 'pagos-3-full': 'on',
+    })
+
+    assert r.status_code == 302
+    db.session.expire_all()
+    plan_a = PlanCobro.query.filter_by(Pago_ID=a_id).one()
+    plan_b = PlanCobro.query.filter_by(Pago_ID=b_id).one()
+    assert [float(x.Monto_Abonado) for x in plan_a.abonos] == [100.0]
+    assert plan_a.liquidacion is None and float(plan_a.Saldo_Actual) == 700.0
+    assert [float(x.Monto_Abonado) for x in plan_b.abonos] == [50.0, 300.0]
+    assert plan_b.liquidacion is not None and float(plan_b.Saldo_Actual) == 0.0
+
+
+# ---------------------------------------------
+# Cierre de mes por lotes
+# ---------------------------------------------
+def _cinco_planes():
+    t = datos.tutor()
+    ests = [datos.estudiante(n, tutor_obj=t) for n in ('Mía', 'Leo', 'Eva')]
+    planes = [datos.plan(ests[i % 3], total=100 * (i + 1)) for i in range(5)]
+    for pl in planes:                                       # venta donde se tomó el concepto
+        datos.venta(est=pl.estudiante, pagos=[pl.pago])
+    db.session.commit()
+    return [pl.Plan_ID for pl in planes]
+
+
+def _liquidados():
+    return sorted(pid for (pid,) in db.session.query(Liquidacion.Plan_ID))
+
+
+def test_liquidar_por_lotes_commit_por_lote(app):
+    ids = _cinco_planes()
+    avance = []
+
+    res = liquidar_planes_abiertos(metodo_norm='efectivo', tamano_lote=2, on_lote=avance.append)
+
+    assert (res['planes'], res['lotes'], res['liquidaciones'], res['abonos']) == (5, 3, 5, 5)
+    assert res['monto'] == 1500.0 and res['ultimo_id'] == ids[-1]
+    assert [a['ultimo_id'] for a in avance] == [ids[1], ids[3], ids[4]]
+    assert res['sin_venta'] == 0
+    assert _liquidados() == ids
+    assert {float(p.Saldo_Actual) for p in PlanCobro.query} == {0.0}
+    assert Abono.query.count() == 5 and Venta.query.count() == 5   # sin ventas nuevas
+
+
+def test_liquidar_liga_a_ventas_existentes_y_no_toca_reportes(app):
+    from report_utils import kpis_ventas
+    est, art = datos.estudiante(), datos.articulo(existencia=5)
+    con_abono = datos.plan(est, total=300)
+    v_abono = datos.venta(est=est, pagos=[con_abono.pago])
+    registrar_abono(con_abono, v_abono, monto=100, metodo_norm='efectivo')
+    v_art = datos.venta(est=est, lineas=[(art, None, 1, 200)])
+    de_articulo = PlanCobro(Est_ID=est.Est_ID, Articulo_ID=art.Articulo_ID, Precio_Base_Snapshot=200,
+                            Descripcion_Resumen='Zapatillas', Monto_Total_Original=200, Saldo_Actual=200)
+    db.session.add(de_articulo)
+    db.session.flush()
+    registrar_abono(de_articulo, v_art, monto=50, metodo_norm='efectivo')
+    huerfano = datos.plan(datos.estudiante('Leo'), total=100)   # sin ninguna venta
+    db.session.commit()
+    ids = (con_abono.Plan_ID, de_articulo.Plan_ID, huerfano.Plan_ID, v_abono.Venta_ID, v_art.Venta_ID)
+    ventas_antes = Venta.query.count()
+    kpis_antes = kpis_ventas(select(Venta.Venta_ID).subquery())
+
+    res = liquidar_planes_abiertos(metodo_norm='efectivo', hoy=date(2026, 1, 31))
+
+    assert (res['planes'], res['liquidaciones'], res['sin_venta']) == (2, 2, 1)
+    assert Venta.query.count() == ventas_antes
+    assert kpis_ventas(select(Venta.Venta_ID).subquery()) == kpis_antes
+    p_abono, p_art, p_huerfano, v_abono_id, v_art_id = ids
+    liq = {l.Plan_ID: l for l in Liquidacion.query}
+    assert liq[p_abono].Venta_Final_ID == v_abono_id
+    assert liq[p_art].Venta_Final_ID == v_art_id                # plan sin concepto también
+    assert float(liq[p_art].Descuento_Aplicado) == 0.0
+    assert p_huerfano not in liq
+    assert {a.Fecha_Abono for a in Abono.query.filter_by(Observaciones="Liquidación de cierre de mes")} \
+        == {datetime(2026, 1, 31)}
+    assert liquidar_planes_abiertos(metodo_norm='efectivo')['planes'] == 0
+
+
+def test_liquidar_reanuda_con_desde_id(app):
+    ids = _cinco_planes()
+
+    r1 = liquidar_planes_abiertos(metodo_norm='efectivo', tamano_lote=10, limite=2)
+    assert (r1['planes'], r1['ultimo_id']) == (2, ids[1]) and _liquidados() == ids[:2]
+
+    r2 = liquidar_planes_abiertos(metodo_norm='efectivo', desde_id=r1['ultimo_id'])
+    assert r2['planes'] == 3 and _liquidados() == ids
+    # Re-ejecutar desde el principio no vuelve a liquidar nada
+    assert liquidar_planes_abiertos(metodo_norm='efectivo')['planes'] == 0
+
+
+def test_liquidar_falla_en_un_lote_revierte_y_reporta_ultimo_id(app, monkeypatch):
+    ids = _cinco_planes()
+    original = plan_utils.compute_full_net_batch_from_pagos
+    llamadas = []
+
+    def _falla_en_el_segundo(*a, **kw):
+        llamadas.append(1)
+        if len(llamadas) == 2:
+            raise RuntimeError('sin conexión')
+        return original(*a, **kw)
+
+    monkeypatch.setattr(plan_utils, 'compute_full_net_batch_from_pagos', _falla_en_el_segundo)
+    with pytest.raises(RuntimeError) as ex:
+        liquidar_planes_abiertos(metodo_norm='efectivo', tamano_lote=2)
+
+    assert ex.value.ultimo_id == ids[1]
+    assert _liquidados() == ids[:2]                       # el primer lote quedó confirmado
+    assert [float(db.session.get(PlanCobro, i).Saldo_Actual) for i in ids[2:]] == [300.0, 400.0, 500.0]
+    assert Abono.query.count() == 2
+
+    res = liquidar_planes_abiertos(metodo_norm='efectivo', tamano_lote=2, desde_id=ex.value.ultimo_id)
+    assert res['planes'] == 3 and _liquidados() == ids
+
+
+# ---------------------------------------------
+# Abonado_Acumulado (total corrido por eventos de Abono)
+# ---------------------------------------------
+def test_abonado_acumulado_sigue_altas_cambios_y_bajas(app):
+    est = datos.estudiante()
+    pl = datos.plan(est, total=1000)
+    v = datos.venta(est=est)
+    db.session.commit()
+
+    a1 = registrar_abono(pl, v, monto=300.10, metodo_norm='efectivo')
+    a2 = registrar_abono(pl, v, monto=200.20, metodo_norm='efectivo')
+    assert float(pl.Abonado_Acumulado) == 500.30 and sum_abonos_plan(pl.Plan_ID) == 500.30
+    assert registrar_abono(pl, v, monto=900, metodo_norm='efectivo').Monto_Abonado == 499.70   # tope al saldo
+    db.session.commit()
+    assert sum_abonos_plan(pl.Plan_ID) == 1000.0
+
+    a1.Monto_Abonado = 250
+    db.session.flush()
+    assert sum_abonos_plan(pl.Plan_ID) == 949.90
+    otro = datos.plan(est, total=400)
+    a2.Plan_ID = otro.Plan_ID
+    db.session.flush()
+    assert (sum_abonos_plan(pl.Plan_ID), sum_abonos_plan(otro.Plan_ID)) == (749.70, 200.20)
+    db.session.delete(a1)
+    db.session.commit()
+    assert sum_abonos_plan(pl.Plan_ID) == 499.70
+    assert verificar_abonado_acumulado() == []
+
+
+def test_verificar_abonado_acumulado_repara_desfase(app):
+    est = datos.estudiante()
+    pl = datos.plan(est, total=1000)
+    registrar_abono(pl, datos.venta(est=est), monto=120, metodo_norm='efectivo')
+    db.session.commit()
+    # Un borrado masivo no pasa por los eventos
+    db.session.execute(Abono.__table__.delete())
+    db.session.commit()
+
+    assert verificar_abonado_acumulado() == [{'plan_id': pl.Plan_ID, 'acumulado': 120.0, 'ledger': 0.0}]
+    verificar_abonado_acumulado(reparar=True)
+    db.session.commit()
+    assert sum_abonos_plan(pl.Plan_ID) == 0.0 and verificar_abonado_acumulado() == []
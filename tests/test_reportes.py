@@ -0,0 +1,184 @@
+# tests/test_reportes.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from extensions import db
+from billing_utils import money, sum_money
+from models import Venta, VentaLinea, Abono, PlanCobro
+from report_utils import armar_reporte_sql, filas_ventas, pagina_ventas, encode_cursor, decode_cursor
+from blueprints.comun import _armar_reporte
+from tests import datos
+
+
+def _reporte_orm(ids=None):
+    q = (Venta.query
+         .options(joinedload(Venta.estudiante), joinedload(Venta.instructor),
+                  selectinload(Venta.lineas).joinedload(VentaLinea.articulo),
+                  selectinload(Venta.pagos)))
+    if ids is not None:
+        q = q.filter(Venta.Venta_ID.in_(ids))
+    return _armar_reporte(q.order_by(Venta.Fecha_Venta.desc(), Venta.Venta_ID.desc()).all())
+
+
+def _comparar(sql, orm):
+    (filas_sql, kpis_sql), (filas_orm, kpis_orm) = sql, orm
+    assert kpis_sql == kpis_orm
+    assert [f['id'] for f in filas_sql] == [f['id'] for f in filas_orm]
+    for fs, fo in zip(filas_sql, filas_orm):
+        assert {k: fs[k] for k in fo} == fo, fo['id']
+
+
+# ---------------------------------------------
+# SQL agrupado == _armar_reporte (mismas filas y KPIs)
+# ---------------------------------------------
+def test_reporte_sql_igual_al_orm_en_escuela_sembrada(escuela):
+    _comparar(armar_reporte_sql(select(Venta.Venta_ID).subquery()), _reporte_orm())
+
+
+def test_reporte_sql_reglas_de_descuento(app):
+    est = datos.estudiante()
+    art = datos.articulo(existencia=10)
+    hoy = datetime.now()
+    solo_tarjeta = datos.pago('Inscripción', 333.33, Pago_Descuento_Tipo='Promo', Pago_Descuento_Porcentaje=15,
+                              Pago_Condiciones='["tarjeta"]')
+    vencido = datos.pago('Vestuario', 250, Pago_Descuento_Tipo='Pronto pago', Pago_Descuento_Porcentaje=10,
+                         Pago_Restricciones_Fecha=(hoy - timedelta(days=3)).date())
+    mensual = datos.pago('Mensualidad', 12172.55, Pago_Descuento_Tipo='Beca', Pago_Descuento_Porcentaje=10)
+    ventas = [
+        datos.venta(est=est, metodo='Tarjeta de Débito', fecha=hoy, pagos=[solo_tarjeta, mensual]),
+        datos.venta(est=est, metodo='efectivo', fecha=hoy - timedelta(days=1), pagos=[solo_tarjeta]),
+        datos.venta(est=est, metodo='efectivo', fecha=hoy - timedelta(days=5), pagos=[vencido],
+                    lineas=[(art, None, 3, 99.99)]),
+        datos.venta(est=est, metodo='efectivo', fecha=hoy - timedelta(days=2), pagos=[vencido]),
+    ]
+    ventas.append(datos.venta(instructor=datos.instructor(), metodo=None, fecha=hoy - timedelta(hours=1),
+                              lineas=[(art, None, 1, 80)], pagos=[mensual]))
+    db.session.commit()
+    ids = [v.Venta_ID for v in ventas]
+
+    sql = armar_reporte_sql(select(Venta.Venta_ID).where(Venta.Venta_ID.in_(ids)).subquery())
+    _comparar(sql, _reporte_orm(ids))
+    por_id = {f['id']: f for f in sql[0]}
+    assert por_id[ids[0]]['descuento_pagos'] == 50.0 + 1217.26     # alias de método + half-up exacto
+    assert por_id[ids[1]]['descuento_pagos'] == 0.0                 # condición solo tarjeta
+    assert por_id[ids[2]]['descuento_pagos'] == 25.0                # vendida antes de la restricción
+    assert por_id[ids[3]]['descuento_pagos'] == 0.0                 # restricción vencida
+    assert por_id[ids[4]]['pagos'] == [] and por_id[ids[4]]['total_venta'] == 80.0   # instructor
+
+
+def test_condiciones_sql_igual_a_parse_conditions_con_espacios_irregulares(app):
+    from billing_utils import parse_conditions
+    from models import Pago
+    from report_utils import _conds_normalizadas_expr
+    crudos = ['efectivo ,  tarjeta', '  tarjeta;efectivo  ', 'efectivo |\ttarjeta', '[" efectivo ",  "tarjeta"]',
+              'transferencia ,' + ' ' * 20 + 'deposito', 'efectivo\n, tarjeta']
+    pagos = [datos.pago('Curso', 100, Pago_Condiciones=c) for c in crudos]
+    db.session.flush()
+
+    for p in pagos:
+        en_sql = db.session.execute(select(_conds_normalizadas_expr(Pago.Pago_Condiciones))
+                                    .where(Pago.Pago_ID == p.Pago_ID)).scalar()
+        assert [c for c in en_sql.split(',') if c] == parse_conditions(p.Pago_Condiciones), p.Pago_Condiciones
+
+    # Y el reporte aplica el descuento igual que _armar_reporte
+    est = datos.estudiante()
+    promo = datos.pago('Inscripción', 200, Pago_Descuento_Tipo='Promo', Pago_Descuento_Porcentaje=10,
+                       Pago_Condiciones='efectivo ,  tarjeta')
+    v = datos.venta(est=est, metodo='tarjeta', pagos=[promo])
+    db.session.commit()
+    sql = armar_reporte_sql(select(Venta.Venta_ID).where(Venta.Venta_ID == v.Venta_ID).subquery())
+    _comparar(sql, _reporte_orm([v.Venta_ID]))
+    assert sql[0][0]['descuento_pagos'] == 20.0
+
+
+# ---------------------------------------------
+# Paginación keyset (Fecha_Venta desc, Venta_ID desc)
+# ---------------------------------------------
+def _recorrer(query, per_page):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        ids_sq, cursor = pagina_ventas(query, cursor, per_page)
+        ids += [f['id'] for f in filas_ventas(ids_sq)]
+        paginas += 1
+        if cursor is None:
+            return ids, paginas
+
+
+def test_keyset_recorre_todo_sin_huecos_ni_repetidos(escuela):
+    orden = [vid for (vid,) in db.session.query(Venta.Venta_ID)
+             .order_by(Venta.Fecha_Venta.desc(), Venta.Venta_ID.desc())]
+
+    ids, paginas = _recorrer(Venta.query, 37)
+
+    assert ids == orden
+    assert paginas == -(-len(orden) // 37)
+
+
+def test_keyset_desempata_fechas_iguales_por_id(app):
+    est = datos.estudiante()
+    misma = datetime(2025, 5, 1, 10, 0)
+    vs = [datos.venta(est=est, fecha=misma) for _ in range(5)] + [datos.venta(est=est, fecha=misma - timedelta(1))]
+    db.session.commit()
+
+    ids, paginas = _recorrer(Venta.query, 2)
+
+    assert ids == [v.Venta_ID for v in reversed(vs[:5])] + [vs[5].Venta_ID] and paginas == 3
+    assert decode_cursor(encode_cursor(misma, 42)) == (misma, 42)
+    assert decode_cursor('basura') is None and decode_cursor('') is None
+
+
+def test_consulta_ventas_kpis_globales_no_dependen_de_la_pagina(escuela, plantillas):
+    total = db.session.query(Venta).count()
+    c = escuela.test_client()
+
+    r1 = c.get('/consulta/ventas?per_page=10')
+    r2 = c.get(f"/consulta/ventas?per_page=10&cursor={plantillas[-1]['paginacion']['next_cursor']}")
+
+    assert r1.status_code == r2.status_code == 200
+    p1, p2 = plantillas
+    assert p1['kpis']['total_ventas'] == p2['kpis']['total_ventas'] == total
+    assert p1['kpis_pagina']['total_ventas'] == p2['kpis_pagina']['total_ventas'] == 10
+    assert not {v['id'] for v in p1['ventas']} & {v['id'] for v in p2['ventas']}
+    assert p2['paginacion']['es_primera'] is False
+
+
+# ---------------------------------------------
+# consulta_abonos: un agregado para totales, páginas por cursor
+# ---------------------------------------------
+def _paginas_abonos(client, plantillas, filtros=''):
+    ids, cursor = [], ''
+    while True:
+        assert client.get(f'/consulta/abonos?per_page=40{filtros}&cursor={cursor}').status_code == 200
+        ctx = plantillas[-1]
+        ids += [r['Abono_ID'] for r in ctx['rows']]
+        assert ctx['total_monto_pagina'] == sum_money(r['Monto_Abonado'] for r in ctx['rows'])
+        cursor = ctx['pagination']['next_cursor']
+        if not cursor:
+            return ids, ctx
+
+
+def test_consulta_abonos_totales_y_cursor(escuela, plantillas):
+    orden = [aid for (aid,) in db.session.query(Abono.Abono_ID)
+             .order_by(Abono.Fecha_Abono.desc(), Abono.Abono_ID.desc())]
+    suma = db.session.query(func.sum(Abono.Monto_Abonado)).scalar()
+
+    ids, ctx = _paginas_abonos(escuela.test_client(), plantillas)
+
+    assert ids == orden and len(orden) > 40
+    assert ctx['total'] == len(orden) and ctx['total_monto_global'] == money(suma)
+
+
+def test_consulta_abonos_filtro_por_estudiante_y_fechas(escuela, plantillas):
+    est_id = (db.session.query(PlanCobro.Est_ID).join(Abono, Abono.Plan_ID == PlanCobro.Plan_ID)
+              .group_by(PlanCobro.Est_ID).order_by(func.count().desc()).limit(1).scalar())
+    ab = (Abono.query.join(PlanCobro, PlanCobro.Plan_ID == Abono.Plan_ID)
+          .filter(PlanCobro.Est_ID == est_id).order_by(Abono.Fecha_Abono).all())
+    desde, hasta = ab[0].Fecha_Abono.date(), ab[-1].Fecha_Abono.date()
+
+    ids, ctx = _paginas_abonos(escuela.test_client(), plantillas,
+                               f'&estudiante_id={est_id}&desde={desde}&hasta={hasta}')
+
+    assert sorted(ids) == sorted(a.Abono_ID for a in ab)
+    assert ctx['total_monto_global'] == sum_money(a.Monto_Abonado for a in ab)
@@ -0,0 +1,154 @@
+# tests/test_resumen.py
+from datetime import date, datetime, timedelta
+
+from flask import session
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import select
+
+from extensions import db
+from models import Venta, VentaResumenCobertura, VentaResumenDiario
+from report_utils import kpis_ventas
+from resumen_utils import aportes_resumen, ajustar_resumen, reconstruir_resumen, kpis_resumen
+from tests import datos
+
+
+def _kpis_directos():
+    return kpis_ventas(select(Venta.Venta_ID).subquery())
+
+
+def _dos_ventas():
+    est = datos.estudiante()
+    art = datos.articulo(existencia=10)
+    p = datos.pago('Mensualidad', 500, Pago_Descuento_Tipo='Pronto pago', Pago_Descuento_Porcentaje=10)
+    ayer = datetime.now() - timedelta(days=1)
+    v1 = datos.venta(est=est, fecha=ayer - timedelta(days=30), lineas=[(art, None, 1, 100)])
+    v2 = datos.venta(est=est, fecha=ayer, lineas=[(art, None, 2, 100)], pagos=[p])
+    db.session.commit()
+    return v1, v2, p
+
+
+# ---------------------------------------------
+# Cobertura: el resumen solo se lee tras reconstruir todo el histórico
+# ---------------------------------------------
+def test_resumen_con_dias_sueltos_no_sustituye_al_calculo_directo(app):
+    v1, v2, _ = _dos_ventas()
+    ajustar_resumen([v2.Venta_ID])                 # solo la venta tocada tras el despliegue
+    db.session.commit()
+
+    assert kpis_resumen() is None
+
+
+def test_reconstruccion_parcial_no_marca_cobertura(app):
+    v1, v2, _ = _dos_ventas()
+
+    reconstruir_resumen(v2.Fecha_Venta.date(), v2.Fecha_Venta.date())
+    assert kpis_resumen() is None
+
+    reconstruir_resumen(dias_por_lote=7)
+    marca = db.session.get(VentaResumenCobertura, 1)
+    assert (marca.Desde, marca.Hasta) == (v1.Fecha_Venta.date(), v2.Fecha_Venta.date())
+    assert kpis_resumen() == _kpis_directos()
+    assert kpis_resumen(dt_ini=datetime.combine(v2.Fecha_Venta.date(), datetime.min.time()))['total_ventas'] == 1
+
+
+def test_sin_ventas_el_resumen_vacio_es_valido(app):
+    assert reconstruir_resumen() == 0
+    assert kpis_resumen() == {'total_ventas': 0, 'sum_items': 0.0, 'sum_descuentos': 0.0, 'sum_total': 0.0}
+
+
+# ---------------------------------------------
+# Ajuste por venta (upsert de deltas)
+# ---------------------------------------------
+def test_ventas_del_mismo_dia_suman_en_una_fila(app):
+    _dos_ventas()
+    reconstruir_resumen()
+    est, art = datos.estudiante('Ana'), datos.articulo(existencia=10)
+    hoy = datetime.now()
+    nuevas = [datos.venta(est=est, fecha=hoy, lineas=[(art, None, 1, 80)]) for _ in range(2)]
+    ajustar_resumen([nuevas[0].Venta_ID])
+    ajustar_resumen([nuevas[1].Venta_ID])
+    db.session.commit()
+
+    fila = VentaResumenDiario.query.filter_by(Fecha=hoy.date()).one()
+    assert (fila.Num_Ventas, float(fila.Total)) == (2, 160.0)
+    assert kpis_resumen() == _kpis_directos()
+
+
+def test_ajuste_no_reconstruye_el_dia(app):
+    from sqlalchemy import event
+    _dos_ventas()
+    est, art = datos.estudiante('Ana'), datos.articulo(existencia=10)
+    for _ in range(20):
+        datos.venta(est=est, lineas=[(art, None, 1, 10)])
+    reconstruir_resumen()
+    nueva = datos.venta(est=est, lineas=[(art, None, 1, 10)])
+    db.session.flush()
+
+    sentencias = []
+    escuchar = lambda *a: sentencias.append(a[2])
+    event.listen(db.engine, 'before_cursor_execute', escuchar)
+    try:
+        ajustar_resumen([nueva.Venta_ID])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', escuchar)
+    db.session.commit()
+
+    assert not any(s.lstrip().upper().startswith('DELETE') for s in sentencias)
+    assert kpis_resumen() == _kpis_directos()
+
+
+def test_editar_un_pago_ajusta_sus_ventas(app):
+    _, v2, p = _dos_ventas()
+    reconstruir_resumen()
+    antes = aportes_resumen([v2.Venta_ID])
+    p.Pago_Monto = 700
+    ajustar_resumen([v2.Venta_ID], antes)
+    db.session.commit()
+
+    assert kpis_resumen() == _kpis_directos()
+    assert kpis_resumen()['sum_descuentos'] == 70.0
+
+
+def test_eliminar_estudiante_o_instructor_mantiene_el_resumen(client, app):
+    est, ins, art = datos.estudiante('Ana'), datos.instructor(), datos.articulo(existencia=10)
+    datos.venta(instructor=ins, lineas=[(art, None, 1, 40)])
+    compartida = datos.venta(est=est, lineas=[(art, None, 1, 60)])
+    compartida.Instructor_ID = ins.Instructor_ID       # venta con ambos clientes
+    db.session.commit()
+    reconstruir_resumen()
+    est_id, ins_id = est.Est_ID, ins.Instructor_ID
+
+    with app.test_request_context():
+        token = generate_csrf()
+        crudo = session['csrf_token']
+    with client.session_transaction() as s:
+        s['csrf_token'] = crudo
+    assert client.post(f'/eliminar/estudiante/{est_id}', data={'csrf_token': token}).status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Venta, compartida.Venta_ID).Est_ID is None   # pasó a ser venta de instructor
+    assert kpis_resumen() == _kpis_directos()
+    tipos = {f.Cliente_Tipo: f.Num_Ventas for f in VentaResumenDiario.query if f.Num_Ventas}
+    assert tipos == {'instructor': 2}
+
+    assert client.post(f'/eliminar/instructor/{ins_id}').status_code == 302
+    db.session.expire_all()
+    assert kpis_resumen() == _kpis_directos()
+
+
+# ---------------------------------------------
+# Mantenimiento desde cobranza
+# ---------------------------------------------
+def test_eliminar_pago_recalcula_dias_de_sus_ventas(client):
+    _dos_ventas()
+    reconstruir_resumen()
+    antes = kpis_resumen()
+    assert antes['sum_descuentos'] == 50.0
+
+    pid = db.session.execute(select(Venta).where(Venta.pagos.any())).scalar_one().pagos[0].Pago_ID
+    r = client.post(f'/eliminar_pago/{pid}')
+
+    assert r.status_code == 302
+    db.session.expire_all()
+    despues = kpis_resumen()
+    assert despues == _kpis_directos()
+    assert despues['sum_descuentos'] == 0.0 and despues['sum_total'] == antes['sum_total'] - 450.0
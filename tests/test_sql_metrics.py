@@ -0,0 +1,73 @@
+# tests/test_sql_metrics.py
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from sql_metrics import forma_sentencia, resumen_metricas
+from tests import datos
+from tests.conftest import crear_app_prueba
+
+
+@pytest.fixture
+def app_metricas(tmp_path, monkeypatch):
+    """App con umbral N+1 bajo, /metrics y una ruta que consulta fila por fila."""
+    monkeypatch.setenv('DATABASE_URL', '')
+    app = crear_app_prueba(tmp_path / 'metricas.db', SQL_N1_UMBRAL=3, SQL_METRICAS_PAGINA=True)
+
+    def fila_por_fila():
+        for i in range(5):
+            db.session.execute(text('SELECT :i'), {'i': i}).scalar()
+        return 'ok'
+
+    app.add_url_rule('/prueba/n1', 'prueba_n1', fila_por_fila)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_forma_sentencia_agrupa_listas_y_literales():
+    a = forma_sentencia('SELECT *  FROM venta\n WHERE id IN (?, ?, ?) LIMIT 50')
+    b = forma_sentencia('SELECT * FROM venta WHERE id IN (?) LIMIT 20')
+    assert a == b == 'SELECT * FROM venta WHERE id IN (?) LIMIT N'
+    assert forma_sentencia('x IN (%(p_1)s, %(p_2)s)') == forma_sentencia('x IN (:a)') == 'x IN (?)'
+
+
+def test_cabeceras_por_request(client):
+    datos.estudiante()
+    db.session.commit()
+
+    r = client.get('/consulta/estudiantes')
+
+    assert int(r.headers['X-SQL-Queries']) > 0
+    assert float(r.headers['X-SQL-Time-ms']) >= 0.0
+    assert int(r.headers['X-SQL-Duplicates']) >= 0
+
+
+def test_aviso_n1_y_agregado_por_endpoint(app_metricas, caplog):
+    cliente = app_metricas.test_client()
+    antes = resumen_metricas().get('prueba_n1', {'requests': 0, 'avisos_n1': 0})
+
+    with caplog.at_level(logging.WARNING, logger=app_metricas.logger.name):
+        r = cliente.get('/prueba/n1')
+
+    assert r.headers['X-SQL-Queries'] == '5' and r.headers['X-SQL-Duplicates'] == '4'
+    assert any('Posible N+1 en prueba_n1: 5 ejecuciones' in m for m in caplog.messages)
+
+    cliente.get('/prueba/n1')
+    agregado = cliente.get('/metrics').json['endpoints']['prueba_n1']
+    assert agregado['requests'] == antes['requests'] + 2
+    assert agregado['avisos_n1'] == antes['avisos_n1'] + 2
+    assert agregado['max_consultas'] == 5 and agregado['consultas_prom'] == 5.0
+
+
+def test_metricas_desactivadas(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', '')
+    app = crear_app_prueba(tmp_path / 'sin.db', SQL_METRICAS=False)
+    with app.app_context():
+        r = app.test_client().get('/consulta/estudiantes')
+        assert 'X-SQL-Queries' not in r.headers
+        assert app.test_client().get('/metrics').status_code == 404
+        db.engine.dispose()
@@ -0,0 +1,16 @@
+# wsgi.py
+"""
+Punto de entrada WSGI:  gunicorn -w 4 --preload wsgi:app
+
+Con --preload la app (modelos, blueprints, catálogo de rutas) se construye una vez en
+el proceso maestro y los workers la heredan por fork. Cada worker debe abrir su propio
+pool de conexiones; en gunicorn.conf.py:
+
+    def post_fork(server, worker):
+        from wsgi import app
+        from db_config import reiniciar_pool
+        reiniciar_pool(app)
+"""
+from app import create_app
+
+app = create_app(migraciones=False)